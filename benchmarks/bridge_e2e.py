@@ -0,0 +1,333 @@
+"""
+End-to-End Bridge Benchmark
+
+Runs the whole stack locally and measures it at several fleet sizes and rates:
+
+    loadgen (src/publisher/loadgen.py) -> MQTT broker -> src/bridge/bridge.py -> mock Twinzo API
+
+For every (robots, hz) combination a fresh bridge process is started, the
+load generator publishes for --seconds, and the run is scored over the
+steady window (after --warmup, which covers OAuth for every new device):
+
+    latency     MQTT receive -> localization POST complete, per sample. The bridge
+                stamps Timestamp when it handles the message; the mock records the
+                sample just before it responds. Time a message waits in the bridge's
+                MQTT client before on_message shows up as delivered/s falling below
+                the target, not as latency.
+    throughput  samples accepted by the mock per second vs. the target rate
+    resources   bridge CPU (% of one core) and RSS, sampled every second from /proc
+
+The broker is the one at --mqtt-host/--mqtt-port if it answers, otherwise a
+mosquitto on PATH is started on that port. The mock runs in-process, so
+--mock-latency / --mock-error-rate / --mock-rate-limit shape the upstream.
+
+Results are written as JSON to benchmarks/results/e2e-YYYYmmdd-HHMMSS.json
+(host, git commit, config, one entry per run) and --compare prints the
+change against an earlier report.
+
+Usage:
+    python benchmarks/bridge_e2e.py --fleets 10,50,200 --rates 1,5 --seconds 30
+    python benchmarks/bridge_e2e.py --fleets 100 --rates 10 --mock-latency lognormal:40,0.5
+    python benchmarks/bridge_e2e.py --compare benchmarks/results/e2e-20260101-120000.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'src', 'publisher'))
+from tests.mocks.twinzo_mock import MockTwinzo, LOC_PATH
+
+import loadgen
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+BRIDGE = os.path.join(ROOT, "src", "bridge", "bridge.py")
+TOPIC = "ati_fm/sherpa/status"
+DRAIN_S = 5.0
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    k = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+class ProcessSampler:
+    """CPU and RSS of one process, sampled from /proc once per interval (Linux only)"""
+
+    def __init__(self, pid, interval=1.0):
+        self.pid = pid
+        self.interval = interval
+        self.cpu_pct = []
+        self.rss_mb = []
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _read(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu_s = (int(fields[11]) + int(fields[12])) / CLK_TCK   # utime + stime
+        with open(f"/proc/{self.pid}/status") as f:
+            rss_kb = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+        return cpu_s, rss_kb / 1024.0
+
+    def start(self):
+        if os.path.exists(f"/proc/{self.pid}/stat"):
+            self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            last_cpu, _ = self._read()
+            last_t = time.monotonic()
+            while not self._stop.wait(self.interval):
+                cpu, rss = self._read()
+                now = time.monotonic()
+                self.cpu_pct.append(100.0 * (cpu - last_cpu) / (now - last_t))
+                self.rss_mb.append(rss)
+                last_cpu, last_t = cpu, now
+        except (OSError, StopIteration):
+            pass
+
+    def stop(self):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join(2)
+
+    def summary(self):
+        if not self.cpu_pct:
+            return {"cpu_pct_avg": None, "cpu_pct_max": None, "rss_mb_max": None}
+        return {
+            "cpu_pct_avg": round(sum(self.cpu_pct) / len(self.cpu_pct), 1),
+            "cpu_pct_max": round(max(self.cpu_pct), 1),
+            "rss_mb_max": round(max(self.rss_mb), 1),
+        }
+
+
+def broker_up(host, port):
+    try:
+        socket.create_connection((host, port), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+
+def ensure_broker(host, port):
+    """Return a started mosquitto process, or None if a broker is already listening"""
+    if broker_up(host, port):
+        print(f"OK Using MQTT broker at {host}:{port}")
+        return None
+    exe = shutil.which("mosquitto")
+    if not exe:
+        print(f"FAIL No MQTT broker at {host}:{port} and no mosquitto on PATH "
+              f"(start one with: docker compose up -d broker)")
+        sys.exit(1)
+    proc = subprocess.Popen([exe, "-p", str(port)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(50):
+        if broker_up(host, port):
+            print(f"OK Started mosquitto on port {port}")
+            return proc
+        time.sleep(0.1)
+    proc.kill()
+    print("FAIL mosquitto did not start")
+    sys.exit(1)
+
+
+def start_bridge(args, mock, workdir):
+    env = dict(os.environ)
+    env.update({
+        "MQTT_HOST": args.mqtt_host, "MQTT_PORT": str(args.mqtt_port), "MQTT_TOPIC": TOPIC,
+        "TWINZO_API_BASE": mock.url, "SECTOR_IDS": args.sectors, "DRY_RUN": "false",
+        "LOG_EVERY_N": "1000000", "PYTHONUNBUFFERED": "1",
+        # Recorders write under the repo's logs/; off unless asked for with --bridge-env
+        "TELEMETRY_ENABLED": "false", "FLIGHT_RECORDER_ENABLED": "false",
+    })
+    env.update(dict(kv.split("=", 1) for kv in args.bridge_env))
+    log = open(os.path.join(workdir, "bridge.log"), "w")
+    proc = subprocess.Popen([sys.executable, args.bridge], env=env, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+    return proc, log
+
+
+def score(mock, t_start, warmup, seconds):
+    """Latency and throughput over the steady window [t_start + warmup, t_start + seconds]"""
+    lo, hi = t_start + warmup, t_start + seconds
+    with mock.lock:
+        samples = [(received_at, item) for _, received_at, item in mock.samples]
+        counts = {str(status): n for (path, status), n in mock.counts.items() if path == LOC_PATH}
+    window = [(r, item) for r, item in samples if lo <= r <= hi]
+    latency = sorted(r * 1000.0 - item["Timestamp"] for r, item in window if "Timestamp" in item)
+    span = max(hi - lo, 1e-9)
+    return {
+        "samples_total": len(samples),
+        "samples_window": len(window),
+        "delivered_per_s": round(len(window) / span, 1),
+        "latency_p50_ms": _round(percentile(latency, 0.50)),
+        "latency_p90_ms": _round(percentile(latency, 0.90)),
+        "latency_p99_ms": _round(percentile(latency, 0.99)),
+        "latency_max_ms": _round(latency[-1] if latency else None),
+        "http_status": counts,
+    }
+
+
+def _round(v, n=2):
+    return None if v is None else round(v, n)
+
+
+def run_one(args, mock, robots, hz):
+    mock.reset()
+    workdir = tempfile.mkdtemp(prefix="bench-bridge-")
+    bridge, log = start_bridge(args, mock, workdir)
+    sampler = None
+    try:
+        time.sleep(args.bridge_startup)
+        if bridge.poll() is not None:
+            raise RuntimeError(f"bridge exited with {bridge.returncode}, see {workdir}/bridge.log")
+        sampler = ProcessSampler(bridge.pid).start()
+        config = {
+            "robots": robots, "hz": hz, "workers": min(args.workers, robots), "connections": 1,
+            "qos": args.qos, "shape": args.shape, "prefix": "bench", "topic": TOPIC,
+            "host": args.mqtt_host, "port": args.mqtt_port, "report_every": 5.0, "seconds": args.seconds,
+        }
+        t_start = time.time()
+        published = loadgen.run(config, report=False)
+        # Let the bridge work off its backlog; samples after the window do not count as throughput
+        last, deadline = -1, time.time() + DRAIN_S
+        while time.time() < deadline:
+            n = len(mock.samples)
+            if n == last:
+                break
+            last = n
+            time.sleep(0.5)
+        result = {"robots": robots, "hz": hz, "target_per_s": round(robots * hz * len(args.sectors.split(",")), 1)}
+        result.update(score(mock, t_start, args.warmup, args.seconds))
+        result.update(sampler.summary())
+        result["published"] = published
+        return result
+    finally:
+        if sampler:
+            sampler.stop()
+        bridge.terminate()
+        try:
+            bridge.wait(5)
+        except subprocess.TimeoutExpired:
+            bridge.kill()
+        log.close()
+        if not args.keep_logs:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_run(r):
+    lat = "n/a" if r["latency_p50_ms"] is None else (
+        f"p50 {r['latency_p50_ms']:.1f}ms p90 {r['latency_p90_ms']:.1f}ms p99 {r['latency_p99_ms']:.1f}ms")
+    cpu = "n/a" if r["cpu_pct_avg"] is None else f"{r['cpu_pct_avg']:.0f}% (max {r['cpu_pct_max']:.0f}%)"
+    rss = "n/a" if r["rss_mb_max"] is None else f"{r['rss_mb_max']:.0f}MB"
+    return (f"{r['robots']:>5} robots x {r['hz']:g} Hz: delivered {r['delivered_per_s']:.0f}/s "
+            f"of {r['target_per_s']:.0f}/s, latency {lat}, bridge CPU {cpu}, RSS {rss}")
+
+
+def compare(old_path, new):
+    with open(old_path) as f:
+        old = json.load(f)
+    before = {(r["robots"], r["hz"]): r for r in old["runs"]}
+    print(f"\nChange vs {old_path} (commit {old.get('git_commit')}):")
+    for r in new["runs"]:
+        o = before.get((r["robots"], r["hz"]))
+        if not o:
+            continue
+        parts = []
+        for key in ("delivered_per_s", "latency_p50_ms", "latency_p99_ms", "cpu_pct_avg", "rss_mb_max"):
+            if o.get(key) and r.get(key) is not None:
+                parts.append(f"{key} {o[key]} -> {r[key]} ({100.0 * (r[key] - o[key]) / o[key]:+.1f}%)")
+        print(f"  {r['robots']} x {r['hz']:g} Hz: " + (", ".join(parts) or "no comparable figures"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end bridge benchmark")
+    parser.add_argument("--fleets", default="10,50,200", help="Comma-separated robot counts")
+    parser.add_argument("--rates", default="1,5", help="Comma-separated Hz per robot")
+    parser.add_argument("--seconds", type=float, default=30.0, help="Publish time per run")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Seconds excluded from scoring (OAuth, connect)")
+    parser.add_argument("--workers", type=int, default=2, help="Load generator processes")
+    parser.add_argument("--qos", type=int, choices=[0, 1, 2], default=1)
+    parser.add_argument("--shape", default="mixed")
+    parser.add_argument("--sectors", default="1", help="SECTOR_IDS for the bridge (posts per message)")
+    parser.add_argument("--bridge", default=BRIDGE)
+    parser.add_argument("--bridge-startup", type=float, default=2.0)
+    parser.add_argument("--bridge-env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra bridge environment, e.g. TELEMETRY_ENABLED=true (repeatable)")
+    parser.add_argument("--mqtt-host", default="127.0.0.1")
+    parser.add_argument("--mqtt-port", type=int, default=1883)
+    parser.add_argument("--mock-latency", default="fixed:20", help="Mock Twinzo latency spec (see twinzo_mock.py)")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--mock-rate-limit", type=float, default=0.0)
+    parser.add_argument("--output", help="Report path (default benchmarks/results/e2e-<time>.json)")
+    parser.add_argument("--compare", help="Earlier report to compare against")
+    parser.add_argument("--keep-logs", action="store_true", help="Keep each run's bridge working directory")
+    args = parser.parse_args()
+    fleets = [int(v) for v in args.fleets.split(",")]
+    rates = [float(v) for v in args.rates.split(",")]
+    if any("=" not in kv for kv in args.bridge_env):
+        parser.error("--bridge-env takes KEY=VALUE")
+    if args.warmup >= args.seconds or min(fleets) <= 0 or min(rates) <= 0:
+        parser.error("--warmup must be shorter than --seconds; fleets and rates must be positive")
+
+    broker = ensure_broker(args.mqtt_host, args.mqtt_port)
+    mock = MockTwinzo(latency=args.mock_latency, error_rate=args.mock_error_rate,
+                      rate_limit=args.mock_rate_limit).start()
+    print(f"OK Mock Twinzo API at {mock.url} (latency {args.mock_latency})")
+
+    report = {
+        "benchmark": "bridge_e2e",
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(),
+                 "cpus": os.cpu_count()},
+        "config": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+        "runs": [],
+    }
+    try:
+        for robots in fleets:
+            for hz in rates:
+                try:
+                    r = run_one(args, mock, robots, hz)
+                except (RuntimeError, OSError) as e:
+                    print(f"FAIL {robots} robots x {hz:g} Hz: {e}")
+                    continue
+                report["runs"].append(r)
+                print(("OK   " if r["delivered_per_s"] >= 0.95 * r["target_per_s"] else "WARN ") + format_run(r))
+    finally:
+        mock.stop()
+        if broker:
+            broker.terminate()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"e2e-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"OK Report written to {output}")
+    if args.compare:
+        compare(args.compare, report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,318 @@
+"""
+Bridge Hot-Path Microbenchmarks
+
+Times the per-message primitives of src/bridge/bridge.py in-process, with
+no broker and no network:
+
+    extract_pose[list] / extract_pose[dict]   pose parsing for both payload formats
+    transform_xy                              affine transform
+    credentials[hit] / credentials[expired]   token cache hit; expired token -> re-auth (stubbed)
+    update_movement                           movement distance + position cache, 50 devices
+    build_localization / +json                Twinzo payload construction (and JSON encoding)
+    on_message                                whole handler, 50 devices, stubbed HTTP session
+
+Fixtures are fixed (seeded positions, pre-encoded messages); the stubbed
+session encodes the request body like requests does and returns a canned
+200. Each benchmark is warmed up, calibrated to --min-time per repeat and
+repeated --repeats times with the GC off. The fastest repeat (min ns/op) is
+the figure compared, as it is the least disturbed by other load on the
+machine; the median is reported alongside.
+
+Results are compared with benchmarks/micro_baseline.json: a benchmark whose
+min is more than --threshold slower than its baseline is flagged WARN (and
+fails the run with --fail-on-regression). Baselines only compare on the same
+machine; refresh it there with --save-baseline after an intended change.
+
+Usage:
+    python benchmarks/micro_bridge.py
+    python benchmarks/micro_bridge.py --filter credentials --repeats 11
+    python benchmarks/micro_bridge.py --save-baseline
+    python benchmarks/micro_bridge.py --json logs/micro.json --fail-on-regression
+"""
+import argparse
+import contextlib
+import gc
+import io
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+BASELINE = os.path.join(ROOT, "benchmarks", "micro_baseline.json")
+DEVICES = 50
+
+# The bridge reads its configuration at import; keep recorders off, egress inline and the network unreachable
+for key, value in {"TELEMETRY_ENABLED": "false", "FLIGHT_RECORDER_ENABLED": "false",
+                   "DEBUG_RING_ENABLED": "false", "LOG_EVERY_N": "1000000000", "EGRESS_WORKERS": "0",
+                   "TWINZO_API_BASE": "http://127.0.0.1:9/v3"}.items():
+    os.environ.setdefault(key, value)
+sys.path.insert(0, os.path.join(ROOT, "src", "bridge"))
+import bridge
+
+
+class StubResponse:
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self._body = body
+        self.text = json.dumps(body)
+
+    def json(self):
+        return self._body
+
+
+class StubAuth:
+    """OAuth endpoint stand-in for authenticate_device"""
+
+    def __init__(self):
+        self.expiration_ms = 0
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        return StubResponse(200, {"Token": "t" * 32, "Client": "client-guid", "Branch": "branch-guid",
+                                  "Expiration": self.expiration_ms})
+
+
+class StubSession:
+    """requests.Session stand-in: logins go to StubAuth, localization encodes the body and answers 200"""
+
+    def __init__(self):
+        self.response = StubResponse(200, {"Success": True})
+
+    def post(self, url, headers=None, json=None, timeout=None):
+        if url == bridge.TWINZO_AUTH_URL:
+            return auth.post(url, headers, json, timeout)
+        _encode(json)
+        return self.response
+
+
+_encode = json.dumps
+
+auth = StubAuth()
+bridge.session = StubSession()
+
+BENCHMARKS = {}
+
+
+def bench(name):
+    """Register setup() -> zero-argument callable under name"""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        return setup
+    return register
+
+
+def device_names():
+    return [f"tug-bench-{i:04d}" for i in range(DEVICES)]
+
+
+def cache_credentials(names, expires_ms):
+    for name in names:
+        bridge.oauth_cache["tokens"][name] = {"token": "t" * 32, "client": "client-guid",
+                                              "branch": "branch-guid", "expires": expires_ms}
+
+
+@bench("extract_pose[list]")
+def _extract_list():
+    payload = {"sherpa_name": "tug-bench-0000", "pose": [12345.6, 7890.1, 0.0, 0.0, 0.0, 1.5708]}
+    return lambda: bridge.extract_pose(payload)
+
+
+@bench("extract_pose[dict]")
+def _extract_dict():
+    payload = {"sherpa_name": "tug-bench-0000", "pose": {"x": 12345.6, "y": 7890.1, "z": 0.0, "theta": 1.5708}}
+    return lambda: bridge.extract_pose(payload)
+
+
+@bench("transform_xy")
+def _transform():
+    return lambda: bridge.transform_xy(12345.6, 7890.1)
+
+
+@bench("credentials[hit]")
+def _credentials_hit():
+    cache_credentials(["tug-bench-0000"], int((time.time() + 86400) * 1000))
+    bridge.oauth_cache["last_cleanup"] = time.time()
+    return lambda: bridge.get_device_credentials("tug-bench-0000")
+
+
+@bench("credentials[expired]")
+def _credentials_expired():
+    # Every lookup finds an expired token and re-authenticates (stubbed POST, expired again)
+    auth.expiration_ms = 0
+    cache_credentials(["tug-bench-0000"], 0)
+    bridge.oauth_cache["last_cleanup"] = time.time()
+    return lambda: bridge.get_device_credentials("tug-bench-0000")
+
+
+@bench("update_movement")
+def _movement():
+    rng = random.Random(42)
+    names = device_names()
+    steps = [(names[i % DEVICES], rng.uniform(0, 50000), rng.uniform(0, 30000)) for i in range(1000)]
+    it = itertools.cycle(steps)
+    update = bridge.update_movement
+    return lambda: update(*next(it))
+
+
+@bench("build_localization")
+def _payload():
+    return lambda: bridge.build_localization(1700000000000, 1, 12345.6, 7890.1, 0.0, 85, True)
+
+
+@bench("build_localization+json")
+def _payload_json():
+    return lambda: _encode(bridge.build_localization(1700000000000, 1, 12345.6, 7890.1, 0.0, 85, True))
+
+
+@bench("on_message")
+def _on_message():
+    rng = random.Random(42)
+    names = device_names()
+    cache_credentials(names, int((time.time() + 86400) * 1000))
+    bridge.oauth_cache["last_cleanup"] = time.time()
+    messages = []
+    for i in range(1000):
+        payload = {"sherpa_name": names[i % DEVICES], "mode": "Fleet", "error": None, "disabled": False,
+                   "pose": [rng.uniform(0, 50000), rng.uniform(0, 30000), 0.0, 0.0, 0.0, rng.uniform(0, 6.28)],
+                   "battery_status": 80.0, "trip_id": 1, "trip_leg_id": 1,
+                   "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.localtime())}
+        messages.append(SimpleNamespace(topic="ati_fm/sherpa/status", payload=json.dumps(payload).encode(),
+                                        qos=1, retain=False))
+    it = itertools.cycle(messages)
+    handler = bridge.on_message
+    return lambda: handler(None, None, next(it))
+
+
+def measure(fn, min_time=0.2, repeats=7, warmup=0.1):
+    """Minimum and median ns per call over repeats of a calibrated loop"""
+    end = time.perf_counter() + warmup
+    while time.perf_counter() < end:
+        fn()
+    number = 1
+    while True:
+        t0 = time.perf_counter_ns()
+        for _ in range(number):
+            fn()
+        if time.perf_counter_ns() - t0 >= min_time * 1e9 / 4:
+            break
+        number *= 2
+    number *= 4
+    samples = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            loop = range(number)
+            t0 = time.perf_counter_ns()
+            for _ in loop:
+                fn()
+            samples.append((time.perf_counter_ns() - t0) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return {"median_ns": round(statistics.median(samples), 1), "min_ns": round(min(samples), 1),
+            "loops": number, "repeats": repeats}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(names, min_time, repeats, warmup):
+    results = {}
+    for name in names:
+        fn = BENCHMARKS[name]()
+        # Handlers print on auth and every LOG_EVERY_N messages; keep that out of the terminal
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[name] = measure(fn, min_time, repeats, warmup)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Print one line per benchmark; returns the names that regressed beyond threshold"""
+    regressed = []
+    base = baseline.get("results", {}) if baseline else {}
+    width = max(len(n) for n in results)
+    for name, r in results.items():
+        line = f"{name:<{width}}  {r['min_ns']:>10.0f} ns/op (median {r['median_ns']:.0f})"
+        old = base.get(name)
+        tag = "OK  "
+        if old:
+            change = (r["min_ns"] - old["min_ns"]) / old["min_ns"]
+            line += f"  baseline {old['min_ns']:.0f}, {change:+.1%}"
+            if change > threshold:
+                tag = "WARN"
+                regressed.append(name)
+        else:
+            line += "  no baseline"
+        print(f"{tag} {line}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bridge hot-path microbenchmarks")
+    parser.add_argument("--filter", help="Only benchmarks whose name contains this")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Seconds per repeat")
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--warmup", type=float, default=0.1, help="Seconds of warmup per benchmark")
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--threshold", type=float, default=0.25, help="Slowdown flagged as regression (0.25 = 25%%)")
+    parser.add_argument("--save-baseline", action="store_true", help="Write these results as the new baseline")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    names = [n for n in BENCHMARKS if not args.filter or args.filter in n]
+    if not names:
+        parser.error(f"No benchmark matches {args.filter!r}; available: {', '.join(BENCHMARKS)}")
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Baseline: {args.baseline} (commit {baseline.get('git_commit')}, {baseline.get('host', {}).get('python')})")
+
+    results = run(names, args.min_time, args.repeats, args.warmup)
+    regressed = compare(results, baseline, args.threshold)
+
+    report = {
+        "benchmark": "micro_bridge",
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git_commit": git_commit(),
+        "host": {"platform": platform.platform(), "python": platform.python_version(),
+                 "machine": platform.machine()},
+        "results": results,
+    }
+    if args.json:
+        os.makedirs(os.path.dirname(args.json) or ".", exist_ok=True)
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"OK Results written to {args.json}")
+    if args.save_baseline:
+        if baseline and args.filter:
+            baseline["results"].update(results)
+            report["results"] = baseline["results"]
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"OK Baseline written to {args.baseline}")
+    if regressed:
+        print(f"WARN {len(regressed)} benchmark(s) more than {args.threshold:.0%} slower than baseline: "
+              f"{', '.join(regressed)}")
+        if args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
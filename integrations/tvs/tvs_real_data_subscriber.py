@@ -4,13 +4,19 @@ TVS Real Data Subscriber
 Connects to actual TVS MQTT broker to capture and analyze real AMR data
 """
 import json
+import os
+import sys
 import time
 import ssl
 from datetime import datetime
+from itertools import islice
 import paho.mqtt.client as mqtt
-from collections import defaultdict
+from collections import defaultdict, deque
 import statistics
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+from src.common.flight_recorder import FlightRecorder, FLIGHT_RECORDER_ENABLED
+
 # TVS MQTT Broker Configuration from email
 MQTT_HOST = "tvs-dev.ifactory.ai"
 MQTT_PORT = 8883  # TLS port
@@ -29,9 +35,10 @@ AMR_MACS = {
 # Data collection
 message_count = 0
 device_data = defaultdict(list)
-raw_messages = []
+raw_messages = deque(maxlen=1000)  # last 1000 for the summary; full capture goes to the recorder
 unique_topics = set()
 field_analysis = defaultdict(set)
+recorder = FlightRecorder("tvs_subscriber") if FLIGHT_RECORDER_ENABLED else None
 
 def analyze_message_structure(data, prefix=""):
     """Recursively analyze message structure and collect field types"""
@@ -101,6 +108,8 @@ def on_message(client, userdata, msg):
     """Callback for received MQTT messages"""
     global message_count
     message_count += 1
+    if recorder:
+        recorder.record(msg.topic, msg.payload, msg.qos, msg.retain)
 
     try:
         topic = msg.topic
@@ -177,10 +186,6 @@ def on_message(client, userdata, msg):
 
         print("-" * 70)
 
-        # Keep only last 1000 messages to avoid memory issues
-        if len(raw_messages) > 1000:
-            raw_messages.pop(0)
-
     except Exception as e:
         print(f"❌ Error processing message: {e}")
         print(f"   Topic: {msg.topic}")
@@ -224,7 +229,7 @@ def print_analysis_summary():
         print(f"\n📝 SAMPLE MESSAGES:")
         # Show first few messages of each type
         shown_topics = set()
-        for msg in raw_messages[:20]:
+        for msg in islice(raw_messages, 20):
             if msg['topic'] not in shown_topics:
                 shown_topics.add(msg['topic'])
                 print(f"\n   Topic: {msg['topic']}")
@@ -246,7 +251,7 @@ def print_analysis_summary():
                 'devices': list(device_data.keys()),
                 'field_analysis': {k: list(v) for k, v in field_analysis.items()}
             },
-            'raw_messages': raw_messages[-100:],  # Last 100 messages
+            'raw_messages': list(raw_messages)[-100:],  # Last 100 messages
             'device_data': {k: v[-10:] for k, v in device_data.items()}  # Last 10 per device
         }, f, indent=2, default=str)
 
@@ -286,12 +291,18 @@ def main():
         print("🔗 Connecting to TVS MQTT broker...")
         client.connect(MQTT_HOST, MQTT_PORT, 60)
 
+        if recorder:
+            recorder.start()
+            print(f"🎙️ Recording raw MQTT to {recorder.directory}")
+
         # Start the loop
         client.loop_forever()
 
     except KeyboardInterrupt:
         print("\n🛑 Stopping TVS data subscriber...")
         client.disconnect()
+        if recorder:
+            recorder.stop()
         print_analysis_summary()
 
     except Exception as e:
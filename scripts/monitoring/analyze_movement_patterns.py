@@ -11,12 +11,19 @@ Usage:
     python -X utf8 scripts/monitoring/analyze_movement_patterns.py [device_name] [hours]
 """
 
+import os
 import sqlite3
 import sys
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timezone
 from pathlib import Path
 import numpy as np
 
+# Add repo root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from src.common.history_archive import load_history
+
 # Database path
 DB_PATH = Path(__file__).parent.parent.parent / "logs" / "ati_data.db"
 
@@ -39,36 +46,29 @@ def analyze_movement(device_name, hours=24, coord_system='ati'):
         print("ERROR: matplotlib required. Install with: pip install matplotlib")
         return
 
-    conn = connect_db()
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT timestamp, ati_x, ati_y, twinzo_x, twinzo_y
-        FROM ati_messages
-        WHERE device_name = ?
-        AND timestamp > datetime('now', '-' || ? || ' hours')
-        ORDER BY timestamp ASC
-    """, (device_name, hours))
+    if not DB_PATH.exists():
+        print(f"Database not found at: {DB_PATH}")
+        sys.exit(1)
 
-    rows = cursor.fetchall()
-    conn.close()
+    # Archived days come from memory-mapped segments, today from SQLite
+    start_ms = int((time.time() - hours * 3600) * 1000)
+    history = load_history(DB_PATH, device_name, start_ms)
+    ts_ms = history["ts_ms"]
 
-    if not rows:
+    if not len(ts_ms):
         print(f"No data found for device: {device_name}")
         return
 
-    timestamps = np.array([datetime.fromisoformat(r[0]) for r in rows])
-
     # Select coordinate system
     if coord_system.lower() == 'ati':
-        x = np.array([r[1] for r in rows])
-        y = np.array([r[2] for r in rows])
+        x = history["ati_x"]
+        y = history["ati_y"]
         x_label = 'X (meters)'
         y_label = 'Y (meters)'
         title_prefix = 'ATI Coordinates'
     else:
-        x = np.array([r[3] for r in rows])
-        y = np.array([r[4] for r in rows])
+        x = history["twinzo_x"]
+        y = history["twinzo_y"]
         x_label = 'X (Twinzo units)'
         y_label = 'Y (Twinzo units)'
         title_prefix = 'Twinzo Coordinates'
@@ -82,8 +82,8 @@ def analyze_movement(device_name, hours=24, coord_system='ati'):
     total_distance = np.sum(distances)
 
     # Calculate time differences
-    time_diffs = np.diff(timestamps).astype('timedelta64[s]').astype(float)
-    velocities = np.where(time_diffs > 0, distances / time_diffs, 0)
+    time_diffs = np.diff(ts_ms) / 1000.0
+    velocities = np.divide(distances, time_diffs, out=np.zeros_like(distances), where=time_diffs > 0)
 
     # Identify stationary periods (velocity near zero)
     stationary_threshold = 0.01  # meters/second or units/second
@@ -94,8 +94,10 @@ def analyze_movement(device_name, hours=24, coord_system='ati'):
     print("\n" + "="*80)
     print(f"MOVEMENT PATTERN ANALYSIS: {device_name}")
     print("="*80)
-    print(f"\nData Range: {timestamps[0]} to {timestamps[-1]}")
-    print(f"Duration: {(timestamps[-1] - timestamps[0]).total_seconds() / 60:.1f} minutes")
+    first_seen = datetime.fromtimestamp(ts_ms[0] / 1000, timezone.utc)
+    last_seen = datetime.fromtimestamp(ts_ms[-1] / 1000, timezone.utc)
+    print(f"\nData Range: {first_seen} to {last_seen}")
+    print(f"Duration: {(ts_ms[-1] - ts_ms[0]) / 60000:.1f} minutes")
     print(f"\nPosition Statistics:")
     print(f"  Total data points: {total_points}")
     print(f"  Unique positions: {unique_positions}")
@@ -109,21 +111,21 @@ def analyze_movement(device_name, hours=24, coord_system='ati'):
         print(f"  Average velocity (when moving): {np.mean(moving_velocities):.3f} {x_label.split('(')[1].split(')')[0]}/s")
         print(f"  Max velocity: {np.max(velocities):.3f} {x_label.split('(')[1].split(')')[0]}/s")
 
-    # Identify distinct positions and dwell times
-    position_times = {}
-    for i, (px, py, ts) in enumerate(zip(x, y, timestamps)):
-        pos_key = (round(px, 2), round(py, 2))
-        if pos_key not in position_times:
-            position_times[pos_key] = []
-        position_times[pos_key].append(ts)
+    # Identify distinct positions and dwell times (first/last time at each rounded position)
+    rounded = np.stack([np.round(x, 2), np.round(y, 2)], axis=1)
+    positions, inverse, counts = np.unique(rounded, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.ravel()
+    first_ms = np.full(len(positions), np.iinfo(np.int64).max)
+    last_ms = np.full(len(positions), np.iinfo(np.int64).min)
+    np.minimum.at(first_ms, inverse, ts_ms)
+    np.maximum.at(last_ms, inverse, ts_ms)
 
     # Find positions where AMR spent significant time
     print(f"\nTop 5 Positions by Dwell Time:")
     position_durations = {}
-    for pos, times in position_times.items():
-        if len(times) > 1:
-            duration = (times[-1] - times[0]).total_seconds() / 60
-            position_durations[pos] = (len(times), duration)
+    for i in np.nonzero(counts > 1)[0]:
+        pos = (float(positions[i][0]), float(positions[i][1]))
+        position_durations[pos] = (int(counts[i]), (last_ms[i] - first_ms[i]) / 60000)
 
     sorted_positions = sorted(position_durations.items(), key=lambda x: x[1][1], reverse=True)[:5]
     for pos, (count, duration) in sorted_positions:
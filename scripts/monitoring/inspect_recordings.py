@@ -0,0 +1,117 @@
+"""
+Inspect MQTT Flight Recordings
+
+Reads the raw MQTT segments written by the bridges' flight recorder
+(src/common/flight_recorder.py, default logs/recordings/).
+
+Usage:
+    python -X utf8 scripts/monitoring/inspect_recordings.py [command] [options]
+
+Commands:
+    list                         List segments with time range, blocks and size
+    dump <from> [minutes] [topic]
+                                 Print messages starting at <from> (UTC, 'YYYY-MM-DD HH:MM')
+                                 for N minutes (default: 1)
+    stats [hours]                Messages per topic over the last N hours (default: 1)
+"""
+
+import os
+import sys
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+# Add repo root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from src.common.flight_recorder import FLIGHT_RECORDER_DIR, SegmentReader, iter_records, list_segments
+
+
+def _fmt_us(ts_us):
+    return datetime.fromtimestamp(ts_us / 1_000_000, timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3]
+
+
+def list_recordings():
+    """List segments with their time range"""
+    segments = list_segments()
+    if not segments:
+        print(f"No recordings found in {FLIGHT_RECORDER_DIR}")
+        return
+
+    print(f"\n{'Segment':<45} {'First (UTC)':<24} {'Last (UTC)':<24} {'Blocks':>7} {'Size':>10}")
+    print("-" * 114)
+    for path in segments:
+        reader = SegmentReader(path)
+        if not reader.entries:
+            print(f"{path.name:<45} {'(empty)':<24}")
+            continue
+        size_kb = path.stat().st_size / 1024
+        print(f"{path.name:<45} {_fmt_us(reader.first_us):<24} {_fmt_us(reader.last_us):<24} "
+              f"{len(reader.entries):>7} {size_kb:>8.0f}KB")
+
+
+def dump_messages(start, minutes=1, topic=None):
+    """Print raw messages in a time window"""
+    start_s = datetime.strptime(start, "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc).timestamp()
+    count = 0
+    for rec in iter_records(start_s=start_s, end_s=start_s + minutes * 60, topic=topic):
+        print(f"[{_fmt_us(rec.ts_us)}] {rec.topic} (QoS {rec.qos}{', retained' if rec.retain else ''})")
+        print(f"  {rec.payload[:500].decode('utf-8', errors='replace')}")
+        count += 1
+    print(f"\n{count} messages")
+
+
+def show_stats(hours=1):
+    """Messages and bytes per topic"""
+    start_s = time.time() - hours * 3600
+    counts, sizes = Counter(), Counter()
+    for rec in iter_records(start_s=start_s):
+        counts[rec.topic] += 1
+        sizes[rec.topic] += len(rec.payload)
+
+    if not counts:
+        print(f"No messages recorded in the last {hours} hours")
+        return
+
+    print(f"\nMessages in the last {hours} hours:")
+    print(f"{'Topic':<50} {'Messages':>10} {'Avg bytes':>10} {'Msg/s':>8}")
+    print("-" * 82)
+    for topic, count in counts.most_common():
+        print(f"{topic:<50} {count:>10} {sizes[topic] / count:>10.0f} {count / (hours * 3600):>8.2f}")
+
+
+def main():
+    if len(sys.argv) < 2:
+        print(__doc__)
+        return
+
+    command = sys.argv[1].lower()
+
+    try:
+        if command == 'list':
+            list_recordings()
+
+        elif command == 'dump':
+            if len(sys.argv) < 3:
+                print("Error: start time required for dump command (UTC, 'YYYY-MM-DD HH:MM')")
+                return
+            minutes = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+            topic = sys.argv[4] if len(sys.argv) > 4 else None
+            dump_messages(sys.argv[2], minutes, topic)
+
+        elif command == 'stats':
+            hours = int(sys.argv[2]) if len(sys.argv) > 2 else 1
+            show_stats(hours)
+
+        else:
+            print(f"Unknown command: {command}")
+            print(__doc__)
+
+    except Exception as e:
+        print(f"Error: {e}")
+        import traceback
+        traceback.print_exc()
+
+
+if __name__ == '__main__':
+    main()
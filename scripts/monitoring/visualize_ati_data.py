@@ -12,14 +12,22 @@ Commands:
     recent [device]    Show recent messages (default: all devices)
     plot [device]      Plot movement path for a device
     export [device]    Export data to CSV
-    cleanup [days]     Delete data older than N days (default: 30)
+    cleanup [days]     Drop day partitions older than N days (default: 30)
+    vacuum             One-off conversion of an old database to incremental vacuum
+    archive            Roll closed days into columnar segments (logs/archive/)
+    rollups            Rebuild the 1m/1h statistics rollups from raw messages
 """
 
+import os
 import sqlite3
 import sys
+import time
 from datetime import datetime, timedelta
 from pathlib import Path
 
+# Add repo root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
 # Database path
 DB_PATH = Path(__file__).parent.parent.parent / "logs" / "ati_data.db"
 
@@ -34,56 +42,41 @@ def connect_db():
 
 
 def show_stats(hours=24):
-    """Show statistics for all devices"""
+    """Show statistics for all devices (read from the 1m/1h rollup tables)"""
+    from src.common import rollups
+
     conn = connect_db()
-    cursor = conn.cursor()
+    conn.executescript(rollups.SCHEMA)
 
     print("="*80)
     print(f"ATI DATA STATISTICS (Last {hours} hours)")
     print("="*80)
 
     # Overall stats
-    cursor.execute("""
-        SELECT
-            COUNT(*) as total,
-            COUNT(CASE WHEN posted_to_api = 1 THEN 1 END) as posted,
-            COUNT(CASE WHEN error IS NOT NULL THEN 1 END) as errors,
-            MIN(timestamp) as first_seen,
-            MAX(timestamp) as last_seen
-        FROM ati_messages
-        WHERE timestamp > datetime('now', '-' || ? || ' hours')
-    """, (hours,))
-
-    row = cursor.fetchone()
+    total = rollups.fleet_stats(conn, hours)
+    msgs = total["total_messages"]
     print(f"\nOverall:")
-    print(f"  Total Messages: {row[0]}")
-    print(f"  Posted to API:  {row[1]} ({row[1]/row[0]*100 if row[0] > 0 else 0:.1f}%)")
-    print(f"  Errors:         {row[2]} ({row[2]/row[0]*100 if row[0] > 0 else 0:.1f}%)")
-    print(f"  First Seen:     {row[3]}")
-    print(f"  Last Seen:      {row[4]}")
+    print(f"  Total Messages: {msgs}")
+    print(f"  Posted to API:  {total['posted_count']} ({total['posted_count']/msgs*100 if msgs > 0 else 0:.1f}%)")
+    print(f"  Errors:         {total['error_count']} ({total['error_count']/msgs*100 if msgs > 0 else 0:.1f}%)")
+    print(f"  First Seen:     {total['first_seen']}")
+    print(f"  Last Seen:      {total['last_seen']}")
+
+    if msgs == 0 and conn.execute("SELECT 1 FROM ati_messages LIMIT 1").fetchone():
+        print("\n  Rollups are empty but raw messages exist.")
+        print("  Backfill them with: visualize_ati_data.py rollups")
 
     # Per-device stats
-    cursor.execute("""
-        SELECT
-            device_name,
-            COUNT(*) as message_count,
-            COUNT(CASE WHEN posted_to_api = 1 THEN 1 END) as posted_count,
-            COUNT(CASE WHEN error IS NOT NULL THEN 1 END) as error_count,
-            AVG(battery_status) as avg_battery,
-            MAX(timestamp) as last_seen
-        FROM ati_messages
-        WHERE timestamp > datetime('now', '-' || ? || ' hours')
-        GROUP BY device_name
-        ORDER BY last_seen DESC
-    """, (hours,))
-
-    print(f"\n{'Device':<40} {'Messages':<10} {'Posted':<10} {'Errors':<10} {'Battery':<10} {'Last Seen':<20}")
-    print("-"*120)
+    print(f"\n{'Device':<40} {'Messages':<10} {'Posted':<10} {'Errors':<10} {'Battery':<16} {'Distance':<12} {'Moving':<8} {'Last Seen':<20}")
+    print("-"*140)
 
-    for row in cursor.fetchall():
-        device, msgs, posted, errors, battery, last_seen = row
-        battery_str = f"{battery:.0f}%" if battery else "N/A"
-        print(f"{device:<40} {msgs:<10} {posted:<10} {errors:<10} {battery_str:<10} {last_seen:<20}")
+    for row in rollups.device_stats(conn, hours):
+        battery = row["avg_battery"]
+        battery_str = f"{battery:.0f}% ({row['min_battery']:.0f}-{row['max_battery']:.0f})" if battery is not None else "N/A"
+        moving = row["moving_fraction"] or 0
+        print(f"{row['device_name']:<40} {row['total_messages']:<10} {row['posted_count']:<10} "
+              f"{row['error_count']:<10} {battery_str:<16} {row['distance']:<12.0f} {moving*100:<7.1f}% "
+              f"{row['last_seen']:<20}")
 
     conn.close()
 
@@ -139,30 +132,24 @@ def plot_movement(device_name, hours=24):
         print("ERROR: matplotlib required for plotting. Install with: pip install matplotlib")
         return
 
-    conn = connect_db()
-    cursor = conn.cursor()
+    from src.common.history_archive import load_history
 
-    cursor.execute("""
-        SELECT timestamp, ati_x, ati_y, twinzo_x, twinzo_y, battery_status
-        FROM ati_messages
-        WHERE device_name = ?
-        AND timestamp > datetime('now', '-' || ? || ' hours')
-        ORDER BY timestamp ASC
-    """, (device_name, hours))
+    connect_db().close()  # exits with a hint if the database is missing
 
-    rows = cursor.fetchall()
-    conn.close()
+    # Archived days come from memory-mapped segments, today from SQLite
+    start_ms = int((time.time() - hours * 3600) * 1000)
+    history = load_history(DB_PATH, device_name, start_ms)
 
-    if not rows:
+    if not len(history["ts_ms"]):
         print(f"No data found for device: {device_name}")
         return
 
-    timestamps = [datetime.fromisoformat(r[0]) for r in rows]
-    ati_x = [r[1] for r in rows]
-    ati_y = [r[2] for r in rows]
-    twin_x = [r[3] for r in rows]
-    twin_y = [r[4] for r in rows]
-    battery = [r[5] if r[5] else 0 for r in rows]
+    timestamps = history["ts_ms"].astype('datetime64[ms]')
+    ati_x = history["ati_x"]
+    ati_y = history["ati_y"]
+    twin_x = history["twinzo_x"]
+    twin_y = history["twinzo_y"]
+    battery = np.nan_to_num(history["battery"], nan=0.0)
 
     # Create figure with 3 subplots
     fig, (ax1, ax2, ax3) = plt.subplots(1, 3, figsize=(18, 5))
@@ -199,7 +186,7 @@ def plot_movement(device_name, hours=24):
     output_file = f"logs/{device_name}_movement_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
     plt.savefig(output_file, dpi=150, bbox_inches='tight')
     print(f"\nPlot saved to: {output_file}")
-    print(f"Data points: {len(rows)}")
+    print(f"Data points: {len(timestamps)}")
     print(f"Time range: {timestamps[0]} to {timestamps[-1]}")
 
     plt.show()
@@ -250,20 +237,68 @@ def export_csv(device_name=None, hours=24):
 
 
 def cleanup_old_data(days=30):
-    """Delete data older than N days"""
+    """Drop day partitions older than N days, then vacuum freed pages in small steps"""
+    from src.common import partitions
+
     conn = connect_db()
-    cursor = conn.cursor()
+    partitions.setup(conn)  # moves a pre-partitioning table aside as ati_messages_legacy
+    dropped, rows = partitions.drop_expired(conn, days)
+    if not dropped:
+        print(f"No partitions older than {days} days")
+        conn.close()
+        return
+
+    freed = partitions.incremental_vacuum(conn)
+    conn.close()
+
+    print(f"Dropped {len(dropped)} partition(s) with {rows} records older than {days} days")
+    if freed:
+        print(f"Returned {freed} free pages to the OS (incremental vacuum)")
+    else:
+        print("Free pages are reused by new rows; run 'vacuum' once to enable incremental vacuum")
 
-    cursor.execute("""
-        DELETE FROM ati_messages
-        WHERE timestamp < datetime('now', '-' || ? || ' days')
-    """, (days,))
 
-    deleted = cursor.rowcount
-    conn.commit()
+def convert_to_incremental_vacuum():
+    """One-off full VACUUM so older databases can shrink incrementally after retention"""
+    conn = connect_db()
+    mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    if mode == 2:
+        print("Database already uses incremental vacuum")
+    else:
+        print("Running full VACUUM (stop the bridges first; this rewrites the whole file)...")
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        print("OK Database converted to auto_vacuum=INCREMENTAL")
     conn.close()
 
-    print(f"Deleted {deleted} records older than {days} days")
+
+def archive_closed_days():
+    """Roll closed days into columnar segments for fast history loading"""
+    try:
+        from src.common.history_archive import roll_closed_days, ARCHIVE_DIR
+    except ImportError:
+        print("ERROR: numpy required for archiving. Install with: pip install numpy")
+        return
+
+    connect_db().close()
+    result = roll_closed_days(DB_PATH)
+    if not result:
+        print("Nothing to archive (all closed days already archived)")
+        return
+    for day, rows in sorted(result.items()):
+        print(f"  {day}: {rows} records")
+    print(f"Archived {len(result)} day(s) to: {ARCHIVE_DIR}")
+
+
+def rebuild_rollups():
+    """Recompute the statistics rollups from ati_messages (one-off backfill)"""
+    from src.common import rollups
+
+    conn = connect_db()
+    conn.executescript(rollups.SCHEMA)
+    total = rollups.rebuild(conn)
+    conn.close()
+    print(f"Rebuilt rollups from {total} records")
 
 
 def main():
@@ -300,6 +335,15 @@ def main():
             days = int(sys.argv[2]) if len(sys.argv) > 2 else 30
             cleanup_old_data(days)
 
+        elif command == 'vacuum':
+            convert_to_incremental_vacuum()
+
+        elif command == 'archive':
+            archive_closed_days()
+
+        elif command == 'rollups':
+            rebuild_rollups()
+
         else:
             print(f"Unknown command: {command}")
             print(__doc__)
@@ -0,0 +1,255 @@
+"""
+Streaming parser for bridge logs (connection_past.log and friends).
+
+Reads the log line by line with precompiled patterns and groups lines into
+blocks, one per 'AMR: ' header printed by bridge_audit_feed.js:
+
+    AMR: tug-55-tvsmotor-hosur-09 -> tug-55-hosur-09
+    Time: 2025-01-12T06:30:00.123Z
+    ATI Raw Coordinates: X=12.34m, Y=56.78m, Heading=1.571rad
+    Twinzo Transformed: X=201234, Y=190456
+    Battery: 85%, Mode: fleet
+
+or one JSON line per pose from the structured logger (src/common/logger.js):
+
+    {"ts":"2025-01-12T06:30:00.123Z","level":"INFO","cat":"pose","sherpa":"tug-55-tvsmotor-hosur-09",
+     "ati_x":12.34,"ati_y":56.78,"heading":1.571,"twinzo_x":201234,"twinzo_y":190456,"battery":85,...}
+
+Parsed points are cached next to the log as <log>.points.npz (columnar,
+one array per field) together with the byte offset parsing stopped at.
+A re-run only parses the bytes appended since then; a truncated or
+replaced log (different size/head) is parsed again from the start.
+
+Usage (from scripts in this folder):
+    from log_parser import parse_log_file, load_points
+
+    tugger_data = parse_log_file("logs/connection_past.log")   # {tug: {'ati': [...], 'twinzo': [...]}}
+    points = load_points("logs/connection_past.log")           # {column: np.ndarray}
+"""
+import json
+import re
+import zlib
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+CACHE_VERSION = 2
+CACHE_SUFFIX = ".points.npz"
+HEAD_BYTES = 4096
+
+AMR_MARKER = "AMR: "
+AMR_RE = re.compile(r"(tug-\d+)-tvsmotor-hosur-\d+ -> (tug-\d+-hosur-\d+)")
+AMR_SHORT_RE = re.compile(r"(tug-\d+) -> (tug-\d+)")
+TIME_RE = re.compile(r"^Time: (\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d(?:\.\d+)?)Z?")
+ATI_RE = re.compile(r"ATI Raw Coordinates: X=([\d.-]+)m, Y=([\d.-]+)m(?:, Heading=([\d.-]+)rad)?")
+TWINZO_RE = re.compile(r"Twinzo Transformed: X=([\d.-]+), Y=([\d.-]+)")
+BATTERY_RE = re.compile(r"Battery: ([\d.-]+)%")
+JSON_POSE_MARKER = '"cat":"pose"'
+SHERPA_RE = re.compile(r"^(tug-\d+)")
+
+# Float columns in the cache; 'device' is an index into the 'devices' array
+FLOAT_COLUMNS = ("ati_x", "ati_y", "twinzo_x", "twinzo_y", "heading", "battery")
+COLUMNS = ("ts_ms", "device") + FLOAT_COLUMNS
+
+
+class _Block:
+    __slots__ = ("device", "ts_ms", "ati", "heading", "twinzo", "battery")
+
+    def __init__(self, device):
+        self.device = device
+        self.ts_ms = -1
+        self.ati = self.twinzo = None
+        self.heading = self.battery = np.nan
+
+    def point(self):
+        if self.device is None or self.ati is None or self.twinzo is None:
+            return None
+        return (self.ts_ms, self.device, self.ati[0], self.ati[1],
+                self.twinzo[0], self.twinzo[1], self.heading, self.battery)
+
+
+def _parse_time(text):
+    return int(np.datetime64(text, "ms").astype(np.int64))
+
+
+def _feed(block, line):
+    """Apply one non-header line to the current block"""
+    if block.ati is None and line.startswith("ATI Raw"):
+        m = ATI_RE.search(line)
+        if m:
+            block.ati = (float(m.group(1)), float(m.group(2)))
+            if m.group(3):
+                block.heading = float(m.group(3))
+    elif block.twinzo is None and line.startswith("Twinzo Transformed"):
+        m = TWINZO_RE.search(line)
+        if m:
+            block.twinzo = (float(m.group(1)), float(m.group(2)))
+    elif block.ts_ms < 0 and line.startswith("Time: "):
+        m = TIME_RE.match(line)
+        if m:
+            block.ts_ms = _parse_time(m.group(1))
+    elif line.startswith("Battery: "):
+        m = BATTERY_RE.match(line)
+        if m:
+            block.battery = float(m.group(1))
+
+
+def _device(line):
+    m = AMR_RE.search(line) or AMR_SHORT_RE.search(line)
+    return m.group(1) if m else None
+
+
+def _json_point(line):
+    """Point from a structured 'pose' record, or None"""
+    try:
+        rec = json.loads(line)
+        m = SHERPA_RE.match(rec["sherpa"])
+        ts = rec.get("ts")
+        return (_parse_time(ts.rstrip("Z")) if ts else -1, m.group(1) if m else rec["sherpa"],
+                float(rec["ati_x"]), float(rec["ati_y"]), float(rec["twinzo_x"]), float(rec["twinzo_y"]),
+                float(rec.get("heading", np.nan)), float(rec.get("battery", np.nan)))
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def parse_stream(f, start=0):
+    """
+    Parse a binary file object from byte offset `start`.
+
+    Returns (points, resume_offset, pending): points are tuples of complete
+    blocks; resume_offset is where the last, possibly still growing, block
+    starts (re-parsed next time); pending is that block's point, if any.
+    """
+    f.seek(start)
+    points = []
+    block = None
+    block_start = offset = start
+    for raw in f:
+        if not raw.endswith(b"\n"):
+            break  # partial line still being written
+        line_start = offset
+        offset += len(raw)
+        line = raw.decode("utf-8", errors="replace").strip()
+        if not line:
+            continue
+        if line[0] == "{" and JSON_POSE_MARKER in line:
+            # Self-contained record; closes any banner block before it
+            if block is not None:
+                point = block.point()
+                if point:
+                    points.append(point)
+                block = None
+            point = _json_point(line)
+            if point:
+                points.append(point)
+            continue
+        idx = line.find(AMR_MARKER)
+        if idx >= 0:
+            if block is not None:
+                point = block.point()
+                if point:
+                    points.append(point)
+            block = _Block(_device(line[idx + len(AMR_MARKER):]))
+            block_start = line_start
+        elif block is not None:
+            _feed(block, line)
+
+    if block is None:
+        return points, offset, None
+    return points, block_start, block.point()
+
+
+def _to_columns(points, devices):
+    index = {name: i for i, name in enumerate(devices)}
+    for p in points:
+        if p[1] not in index:
+            index[p[1]] = len(devices)
+            devices.append(p[1])
+    n = len(points)
+    cols = {
+        "ts_ms": np.fromiter((p[0] for p in points), dtype=np.int64, count=n),
+        "device": np.fromiter((index[p[1]] for p in points), dtype=np.int32, count=n),
+    }
+    for i, name in enumerate(FLOAT_COLUMNS, start=2):
+        cols[name] = np.fromiter((p[i] for p in points), dtype=np.float64, count=n)
+    return cols
+
+
+def _empty_columns():
+    return {name: np.empty(0, dtype=np.int64 if name == "ts_ms" else
+                           np.int32 if name == "device" else np.float64) for name in COLUMNS}
+
+
+def _head_crc(f, length):
+    f.seek(0)
+    return zlib.crc32(f.read(min(length, HEAD_BYTES)))
+
+
+def _load_cache(cache_path, f, size):
+    """Cached columns and resume offset, or None if the cache does not match the log"""
+    if not cache_path.exists():
+        return None
+    try:
+        with np.load(cache_path, allow_pickle=False) as data:
+            meta = data["meta"]
+            version, offset, head_len, head_crc = (int(v) for v in meta)
+            if version != CACHE_VERSION or offset > size:
+                return None
+            if _head_crc(f, head_len) != head_crc:
+                return None
+            cols = {name: data[name] for name in COLUMNS}
+            devices = [str(d) for d in data["devices"]]
+        return cols, devices, offset
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _save_cache(cache_path, f, cols, devices, offset):
+    head_len = min(offset, HEAD_BYTES)
+    meta = np.array([CACHE_VERSION, offset, head_len, _head_crc(f, head_len)], dtype=np.int64)
+    tmp = cache_path.with_name(cache_path.name + ".tmp.npz")
+    np.savez(tmp, meta=meta, devices=np.array(devices, dtype=str), **cols)
+    tmp.replace(cache_path)
+
+
+def load_points(log_path, use_cache=True):
+    """
+    Parse (or incrementally update) a log and return columns:
+    ts_ms (int64, -1 if unknown), device (int32 index), devices (list of names),
+    ati_x, ati_y, twinzo_x, twinzo_y, heading, battery (float64, NaN if unknown).
+    """
+    log_path = Path(log_path)
+    cache_path = log_path.with_name(log_path.name + CACHE_SUFFIX)
+    with open(log_path, "rb") as f:
+        size = log_path.stat().st_size
+        cached = _load_cache(cache_path, f, size) if use_cache else None
+        cols, devices, start = cached or (_empty_columns(), [], 0)
+
+        points, resume, pending = parse_stream(f, start)
+        if points:
+            new = _to_columns(points, devices)
+            cols = {name: np.concatenate([cols[name], new[name]]) for name in COLUMNS}
+        if use_cache and (points or cached is None or resume != start):
+            _save_cache(cache_path, f, cols, devices, resume)
+
+    # The last block may still grow; include it in results, not in the cache
+    if pending:
+        new = _to_columns([pending], devices)
+        cols = {name: np.concatenate([cols[name], new[name]]) for name in COLUMNS}
+    cols["devices"] = devices
+    return cols
+
+
+def parse_log_file(log_path, use_cache=True):
+    """Parse a log into {tugger: {'ati': [(x, y), ...], 'twinzo': [(x, y), ...]}}"""
+    cols = load_points(log_path, use_cache)
+    tugger_data = defaultdict(lambda: {'ati': [], 'twinzo': []})
+    for i, name in enumerate(cols["devices"]):
+        mask = cols["device"] == i
+        if not mask.any():
+            continue
+        tugger_data[name]['ati'] = list(zip(cols["ati_x"][mask].tolist(), cols["ati_y"][mask].tolist()))
+        tugger_data[name]['twinzo'] = list(zip(cols["twinzo_x"][mask].tolist(),
+                                               cols["twinzo_y"][mask].tolist()))
+    return tugger_data
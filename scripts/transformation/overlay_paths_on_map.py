@@ -1,55 +1,11 @@
 """
 Overlay tugger paths on actual Twinzo map to validate transformation.
 """
-import re
 import matplotlib.pyplot as plt
 import matplotlib.image as mpimg
-from collections import defaultdict
 import numpy as np
 
-
-def parse_log_file(log_path):
-    """Parse log file and extract tugger positions."""
-    tugger_data = defaultdict(lambda: {'ati': [], 'twinzo': []})
-
-    with open(log_path, 'r', encoding='utf-8') as f:
-        content = f.read()
-
-    # Split by tugger blocks
-    blocks = content.split('AMR: ')
-
-    for block in blocks[1:]:  # Skip first empty split
-        # Extract tugger name
-        tugger_match = re.search(r'(tug-\d+)-tvsmotor-hosur-\d+ -> (tug-\d+-hosur-\d+)', block)
-        if not tugger_match:
-            tugger_match = re.search(r'(tug-\d+) -> (tug-\d+)', block)
-
-        if not tugger_match:
-            continue
-
-        tugger_name = tugger_match.group(1)
-
-        # Extract ATI coordinates
-        ati_match = re.search(r'ATI Raw Coordinates: X=([\d.-]+)m, Y=([\d.-]+)m', block)
-        if ati_match:
-            x_ati = float(ati_match.group(1))
-            y_ati = float(ati_match.group(2))
-        else:
-            continue
-
-        # Extract Twinzo coordinates
-        twinzo_match = re.search(r'Twinzo Transformed: X=([\d.-]+), Y=([\d.-]+)', block)
-        if twinzo_match:
-            x_twinzo = float(twinzo_match.group(1))
-            y_twinzo = float(twinzo_match.group(2))
-        else:
-            continue
-
-        # Store data
-        tugger_data[tugger_name]['ati'].append((x_ati, y_ati))
-        tugger_data[tugger_name]['twinzo'].append((x_twinzo, y_twinzo))
-
-    return tugger_data
+from log_parser import parse_log_file
 
 
 def overlay_on_map(tugger_data, map_image_path):
@@ -1,8 +1,22 @@
-import os, json, time, math
+import os, sys, json, time, math
+from functools import partial
 import requests
+from requests.adapters import HTTPAdapter
 from paho.mqtt import client as mqtt
 from datetime import datetime, timezone
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+from src.common.telemetry import TelemetryWriter, TELEMETRY_ENABLED
+from src.common.flight_recorder import FlightRecorder, FLIGHT_RECORDER_ENABLED
+from src.common.debug_ring import DebugRing, DEBUG_RING_ENABLED
+from src.common.source_clock import SourceClock
+from src.common.device_watchdog import DeviceWatchdog, DEVICE_WATCHDOG_ENABLED, DEVICE_OFFLINE_SEND_STOP
+from src.common.sector_router import SectorRouter, SECTOR_GEOFENCE_FILE
+from src.common.egress import Delivery, Egress, Retry, StateChanges, PRIORITY_STATE
+from src.common.egress_control import THROTTLED
+from src.common.warmup import Warmup
+from src.common import admin_http, metrics, profiling
+
 MQTT_HOST = os.getenv("MQTT_HOST", "localhost")
 MQTT_PORT = int(os.getenv("MQTT_PORT", "1883"))
 MQTT_USER = os.getenv("MQTT_USERNAME") or None
@@ -14,9 +28,10 @@ TWINZO_CLIENT = os.getenv("TWINZO_CLIENT", "TVSMotor")
 TWINZO_PASSWORD = os.getenv("TWINZO_PASSWORD", "Tvs@Hosur$2025")
 TWINZO_API_KEY = os.getenv("TWINZO_API_KEY", "sq29vSdYEribAbJjPc93FwNvk8ndo53P2yoAsS6S")
 
-# API URLs - using working platform domain
-TWINZO_AUTH_URL = "https://api.platform.twinzo.com/v3/authorization/authenticate"
-TWINZO_LOCALIZATION_URL = "https://api.platform.twinzo.com/v3/localization"
+# API URLs - using working platform domain (TWINZO_API_BASE points at a mock server for local tests)
+TWINZO_API_BASE = os.getenv("TWINZO_API_BASE", "https://api.platform.twinzo.com/v3").rstrip("/")
+TWINZO_AUTH_URL = f"{TWINZO_API_BASE}/authorization/authenticate"
+TWINZO_LOCALIZATION_URL = f"{TWINZO_API_BASE}/localization"
 
 # OAuth token cache
 oauth_cache = {
@@ -46,13 +61,17 @@ def transform_xy(x, y):
     return xp, yp
 
 def extract_pose(payload):
-    # Supports {"pose":[x,y,z,roll,pitch,yaw]} format
+    # Supports {"pose":[x,y,z,roll,pitch,yaw]} and the lane fleet's {"pose":[x,y,heading]}
     x = y = z = theta = 0.0
     if "pose" in payload and isinstance(payload["pose"], (list, tuple)) and len(payload["pose"]) >= 6:
         x = float(payload["pose"][0])
         y = float(payload["pose"][1])
         z = float(payload["pose"][2])
         theta = float(payload["pose"][5])  # yaw/heading is the 6th element
+    elif "pose" in payload and isinstance(payload["pose"], (list, tuple)) and len(payload["pose"]) >= 3:
+        x = float(payload["pose"][0])
+        y = float(payload["pose"][1])
+        theta = float(payload["pose"][2])  # [x, y, heading], no z
     elif "pose" in payload and isinstance(payload["pose"], dict):
         # Legacy support for old dict format
         x = float(payload["pose"].get("x", 0))
@@ -75,7 +94,7 @@ def authenticate_device(device_login):
             "Accept": "application/json"
         }
         
-        response = requests.post(TWINZO_AUTH_URL, headers=auth_headers, json=auth_payload, timeout=10)
+        response = session.post(TWINZO_AUTH_URL, headers=auth_headers, json=auth_payload, timeout=10)
         
         if response.status_code == 200:
             auth_data = response.json()
@@ -86,13 +105,16 @@ def authenticate_device(device_login):
                 "branch": auth_data["Branch"],
                 "expires": auth_data["Expiration"]
             }
+            stats.token_refreshes.labels("ok").inc()
             print(f"✅ OAuth successful for {device_login}")
             return oauth_cache["tokens"][device_login]
         else:
+            stats.token_refreshes.labels("failed").inc()
             print(f"❌ OAuth failed for {device_login}: {response.status_code}")
             return None
             
     except Exception as e:
+        stats.token_refreshes.labels("error").inc()
         print(f"❌ OAuth error for {device_login}: {e}")
         return None
 
@@ -125,27 +147,148 @@ def get_device_credentials(device_login):
     # Authenticate if no valid cached credentials
     return authenticate_device(device_login)
 
+def update_movement(device_id, X, Y):
+    """True if the device moved since its cached position; refreshes the cache"""
+    device_key = f"{device_id}_last_pos"
+    if device_key not in oauth_cache:
+        oauth_cache[device_key] = {"x": X, "y": Y, "time": time.time()}
+        return True
+    last_pos = oauth_cache[device_key]
+    distance = ((X - last_pos["x"])**2 + (Y - last_pos["y"])**2)**0.5
+    time_diff = time.time() - last_pos["time"]
+
+    # Movement threshold: 10 units (0.01m if in mm) - very sensitive
+    # Consider moving if ANY position change detected
+    is_moving = distance > 10
+
+    # Update position cache every second or on significant movement
+    if distance > 100 or time_diff > 1.0:
+        oauth_cache[device_key] = {"x": X, "y": Y, "time": time.time()}
+    return is_moving
+
+def build_localization(timestamp, sector_id, X, Y, z, battery, is_moving):
+    """Twinzo localization payload (one sample) for one sector"""
+    return [
+        {
+            "Timestamp": timestamp,
+            "SectorId": sector_id,
+            "X": X,
+            "Y": Y,
+            "Z": z,
+            "Interval": 100,  # 100ms = 10Hz
+            "Battery": battery,
+            "IsMoving": is_moving,
+            "LocalizationAreas": [],
+            "NoGoAreas": []
+        }
+    ]
+
+def send_stop_sample(device_id, silent_for, context):
+    """Queue a final IsMoving=false sample for a device that went silent (called on the liveness thread)"""
+    if DRY_RUN or context is None:
+        return
+    # Read-only cache lookup: no OAuth from this thread
+    credentials = oauth_cache["tokens"].get(device_id)
+    if not credentials or credentials["expires"] <= time.time() * 1000:
+        return
+    X, Y, z, battery, sector_ids = context
+    if not sector_ids:
+        return      # not located yet, or outside every geofence under fallback "drop"
+    headers = {
+        "Content-Type": "application/json",
+        "Client": credentials["client"],
+        "Branch": credentials["branch"],
+        "Token": credentials["token"],
+        "Api-Key": TWINZO_API_KEY
+    }
+    egress.submit(device_id, partial(post_stop_sample, device_id, headers, int(time.time() * 1000),
+                                     X, Y, z, battery, sector_ids), PRIORITY_STATE, gate=credentials["branch"])
+
+def post_stop_sample(device_id, headers, timestamp, X, Y, z, battery, sector_ids):
+    r = throttled = None
+    for sector_id in sector_ids:
+        payload = build_localization(timestamp, sector_id, X, Y, z, battery, False)
+        r = session.post(TWINZO_LOCALIZATION_URL, headers=headers, json=payload, timeout=5)
+        if r.status_code in THROTTLED:
+            throttled = throttled or (r, [])
+            throttled[1].append(sector_id)
+        elif r.status_code >= 300:
+            print(f"WARN Stop sample for {device_id} to Sector {sector_id} failed: HTTP {r.status_code}")
+    if throttled:
+        # Retry only the sectors that throttled it
+        return Retry(throttled[0], partial(post_stop_sample, device_id, headers, timestamp, X, Y, z, battery,
+                                           throttled[1]))
+    return r
+
 counter = 0
 session = requests.Session()
+egress = Egress()
+# Logins and pooled connections before subscribing (WARMUP_DEVICES adds logins)
+warmup = Warmup(session, authenticate_device, (), TWINZO_API_BASE)
+states = StateChanges()
+# One pooled connection per egress worker
+session.mount("https://", HTTPAdapter(pool_maxsize=max(10, egress.workers)))
+session.mount("http://", HTTPAdapter(pool_maxsize=max(10, egress.workers)))
+telemetry = TelemetryWriter() if TELEMETRY_ENABLED else None
+recorder = FlightRecorder("bridge") if FLIGHT_RECORDER_ENABLED else None
+debug_ring = DebugRing(pose_fields=("x", "y", "z", "theta"),
+                       output_fields=("X", "Y", "battery", "moving")) if DEBUG_RING_ENABLED else None
+stats = metrics.BridgeMetrics()
+clock = SourceClock(default_offset="+05:30")  # ATI 'Z' timestamps are IST
+router = SectorRouter(SECTOR_IDS)
+if telemetry:
+    stats.queue("telemetry", telemetry.queue.qsize)
+if recorder:
+    stats.queue("flight_recorder", recorder.queue.qsize)
+stats.queue("egress", egress.scheduler.depth)
+stages = profiling.StageTimers()
+stages.add("credentials", globals(), "get_device_credentials")
+stages.add("extract_pose", globals(), "extract_pose")
+stages.add("transform", globals(), "transform_xy")
+stages.add("post", session, "post")
+stages.add("telemetry", telemetry, "record")
+stages.add("flight_recorder", recorder, "record")
+stages.add("debug_ring", debug_ring, "record")
+watchdog = profiling.Watchdog(stages=stages)
+liveness = DeviceWatchdog(on_offline=send_stop_sample if DEVICE_OFFLINE_SEND_STOP else None) \
+    if DEVICE_WATCHDOG_ENABLED else None
 
 def on_message(client, userdata, msg):
     global counter
+    received_at = time.time()
+    stats.received.inc()
+    if recorder:
+        recorder.record(msg.topic, msg.payload, msg.qos, msg.retain, received_at)
+    device_id = pose = output = status = response = None
+    queued = False
     try:
+        t0 = time.perf_counter()
         payload = json.loads(msg.payload.decode("utf-8"))
+        stats.parse_seconds.observe(time.perf_counter() - t0)
         device_id = payload.get("sherpa_name")
         if not device_id:
+            stats.filter("no_device")
             return
+        stats.last_seen[device_id] = received_at
+        source_ts = clock.ingest(device_id, payload, received_at)
 
         # Get OAuth credentials for this device
+        t0 = time.perf_counter()
         credentials = get_device_credentials(device_id)
+        stats.auth_seconds.observe(time.perf_counter() - t0)
         if not credentials:
+            status = "no_credentials"
+            stats.filter("no_credentials")
             if counter % LOG_EVERY_N == 0:
                 print(f"❌ No valid credentials for {device_id}")
             return
 
+        t0 = time.perf_counter()
         x, y, z, theta = extract_pose(payload)
         # Apply affine transform if configured
         X, Y = transform_xy(x, y)
+        stats.transform_seconds.observe(time.perf_counter() - t0)
+        pose = (x, y, z, theta)
 
         # Get device-specific battery levels
         device_batteries = {
@@ -154,23 +297,7 @@ def on_message(client, userdata, msg):
             "tugger-03": 75
         }
         
-        # Calculate movement based on coordinate changes
-        device_key = f"{device_id}_last_pos"
-        if device_key not in oauth_cache:
-            oauth_cache[device_key] = {"x": X, "y": Y, "time": time.time()}
-            is_moving = True
-        else:
-            last_pos = oauth_cache[device_key]
-            distance = ((X - last_pos["x"])**2 + (Y - last_pos["y"])**2)**0.5
-            time_diff = time.time() - last_pos["time"]
-
-            # Movement threshold: 10 units (0.01m if in mm) - very sensitive
-            # Consider moving if ANY position change detected
-            is_moving = distance > 10
-
-            # Update position cache every second or on significant movement
-            if distance > 100 or time_diff > 1.0:
-                oauth_cache[device_key] = {"x": X, "y": Y, "time": time.time()}
+        is_moving = update_movement(device_id, X, Y)
 
         # Create headers with OAuth credentials (used for all sectors)
         headers = {
@@ -182,41 +309,134 @@ def on_message(client, userdata, msg):
             "Api-Key": TWINZO_API_KEY
         }
 
-        # Post to all configured sectors (multi-plant support)
-        timestamp = int(time.time() * 1000)
+        # Post to the sector the pose is in (every SECTOR_ID without a geofence file)
+        timestamp = clock.timestamp_ms(source_ts, time.time())
         battery = device_batteries.get(device_id, 85)
+        sector_ids = router.route(device_id, X, Y)
+        if liveness:
+            liveness.touch(device_id, received_at, (X, Y, z, battery, sector_ids))
+        output = (X, Y, battery, is_moving)
+        if not sector_ids:
+            stats.filter("no_sector")
+        # Recorded on arrival, so a sample egress drops still gets its row; delivery fills in the outcome
+        sample = open_sample(device_id, received_at, msg.payload, pose, output, payload.get("mode"))
+        queued = True
+        # Errors and mode/disabled changes jump the queue of routine poses
+        egress.submit(device_id, Delivery(partial(deliver_sample, device_id, source_ts, headers, timestamp,
+                                                  sector_ids, output, z, sample),
+                                          partial(drop_sample, sample)),
+                      states.priority(device_id, payload), gate=credentials["branch"])
+        counter += 1
+    except Exception as e:
+        stats.errors.inc()
+        status = f"error: {e}"
+        print(f"Error processing message: {e}")
+    finally:
+        if debug_ring and not queued:
+            debug_ring.record(device_id, received_at, msg.payload, pose, output, status, response)
+
+def open_sample(device_id, received_at, raw, pose, output, mode):
+    """Debug ring slot and pending telemetry row of a queued sample; finish_sample() adds the outcome"""
+    slot = debug_ring.record(device_id, received_at, raw, pose, output, "queued") if debug_ring else None
+    row = None
+    if telemetry:
+        x, y, _, theta = pose
+        X, Y, battery, _ = output
+        row = telemetry.record(device_id, x, y, theta, X, Y, theta, battery, mode,
+                               received_at=received_at, pending=True)
+    return slot, row
+
+def finish_sample(sample, status, response, posted, api_response, error):
+    slot, row = sample
+    if slot:
+        debug_ring.update(slot, status, response)
+    if row:
+        telemetry.complete(row, posted, api_response, error)
 
-        for sector_id in SECTOR_IDS:
-            # Create Twinzo localization payload for this sector
-            twinzo_payload = [
-                {
-                    "Timestamp": timestamp,
-                    "SectorId": sector_id,
-                    "X": X,
-                    "Y": Y,
-                    "Z": z,
-                    "Interval": 100,  # 100ms = 10Hz
-                    "Battery": battery,
-                    "IsMoving": is_moving,
-                    "LocalizationAreas": [],
-                    "NoGoAreas": []
-                }
-            ]
+def drop_sample(sample, reason, posted=False, api_response=None):
+    """Egress gave up on the sample (superseded by a newer one, or out of retries)"""
+    finish_sample(sample, f"dropped: {reason}", None, posted, api_response, f"dropped: {reason}")
+
+def deliver_sample(device_id, source_ts, headers, timestamp, sector_ids, output, z, sample):
+    """POST one sample to its sectors (runs on an egress worker); returns the last response"""
+    X, Y, battery, is_moving = output
+    posted = False
+    api_response = error = response = r = throttled = None
+    status = "no_sector" if not sector_ids else "dry_run" if DRY_RUN else None
+    try:
+        for sector_id in sector_ids:
+            twinzo_payload = build_localization(timestamp, sector_id, X, Y, z, battery, is_moving)
 
             if DRY_RUN:
                 if counter % LOG_EVERY_N == 0:
                     print(f"[DRY] would POST for {device_id} to Sector {sector_id}:", twinzo_payload)
             else:
-                r = session.post(TWINZO_LOCALIZATION_URL, headers=headers, json=twinzo_payload, timeout=5)
+                t0 = time.perf_counter()
+                try:
+                    r = session.post(TWINZO_LOCALIZATION_URL, headers=headers, json=twinzo_payload, timeout=5)
+                except requests.RequestException as e:
+                    stats.fail(type(e).__name__)
+                    raise
+                finally:
+                    stats.post_seconds.observe(time.perf_counter() - t0)
+                api_response = f"HTTP {r.status_code}"
+                status, response = r.status_code, r.text[:200]
                 if r.status_code >= 300:
+                    stats.fail(str(r.status_code))
+                    if r.status_code in THROTTLED:
+                        throttled = throttled or (r, [])
+                        throttled[1].append(sector_id)
+                    error = f"HTTP {r.status_code} (Sector {sector_id}): {r.text[:200]}"
                     if counter % LOG_EVERY_N == 0:
                         print(f"POST failed {r.status_code} for {device_id} to Sector {sector_id}: {r.text}")
-                elif counter % LOG_EVERY_N == 0:
-                    print(f"POST ok {r.status_code} for {device_id} to Sector {sector_id} (X:{X:.1f}, Y:{Y:.1f}, Battery:{battery}%, Moving:{is_moving})")
-
-        counter += 1
+                else:
+                    stats.posted.inc()
+                    clock.posted(device_id, source_ts)
+                    posted = True
+                    if counter % LOG_EVERY_N == 0:
+                        print(f"POST ok {r.status_code} for {device_id} to Sector {sector_id} (X:{X:.1f}, Y:{Y:.1f}, Battery:{battery}%, Moving:{is_moving})")
     except Exception as e:
-        print(f"Error processing message: {e}")
+        stats.errors.inc()
+        status = f"error: {e}"
+        error = str(e)
+        print(f"Error posting sample for {device_id}: {e}")
+        r = e
+    finally:
+        if not throttled:
+            finish_sample(sample, status, response, posted, api_response, error)
+    if throttled:
+        # The retry re-sends only the throttled sectors; the outcome waits for it (or for egress to give up)
+        return retry_sample(throttled, device_id, source_ts, headers, timestamp, X, Y, z, battery, is_moving,
+                            sample, posted)
+    return r
+
+def retry_sample(throttled, device_id, source_ts, headers, timestamp, X, Y, z, battery, is_moving, sample, posted):
+    r, sector_ids = throttled
+    return Retry(r, Delivery(partial(resend_sample, device_id, source_ts, headers, timestamp, sector_ids,
+                                     X, Y, z, battery, is_moving, sample, posted),
+                             partial(drop_sample, sample, posted=posted, api_response=f"HTTP {r.status_code}")))
+
+def resend_sample(device_id, source_ts, headers, timestamp, sector_ids, X, Y, z, battery, is_moving, sample, posted):
+    """POST a throttled sample again to the sectors that throttled it; returns like deliver_sample"""
+    r = throttled = error = None
+    for sector_id in sector_ids:
+        payload = build_localization(timestamp, sector_id, X, Y, z, battery, is_moving)
+        r = session.post(TWINZO_LOCALIZATION_URL, headers=headers, json=payload, timeout=5)
+        if r.status_code >= 300:
+            stats.fail(str(r.status_code))
+            if r.status_code in THROTTLED:
+                throttled = throttled or (r, [])
+                throttled[1].append(sector_id)
+            error = f"HTTP {r.status_code} (Sector {sector_id}): {r.text[:200]}"
+        else:
+            stats.posted.inc()
+            clock.posted(device_id, source_ts)
+            posted = True
+    if throttled:
+        return retry_sample(throttled, device_id, source_ts, headers, timestamp, X, Y, z, battery, is_moving,
+                            sample, posted)
+    finish_sample(sample, r.status_code, r.text[:200], posted, f"HTTP {r.status_code}", error)
+    return r
 
 def main():
     print("🚀 Starting Twinzo Multi-Plant OAuth Bridge...")
@@ -225,11 +445,35 @@ def main():
     print(f"Client: {TWINZO_CLIENT}")
     print(f"DRY_RUN: {DRY_RUN}")
     print(f"Target Sectors: {SECTOR_IDS} (Sector 1=HiTech, Sector 2=Old Plant)")
+    if router.enabled:
+        print(f"Sector routing: geofences from {SECTOR_GEOFENCE_FILE} (hysteresis {router.hysteresis:g})")
+    else:
+        print("Sector routing: off, every sample goes to all target sectors")
+    if telemetry:
+        telemetry.start()
+        print(f"Telemetry: logging to {telemetry.db_path}")
+    if recorder:
+        recorder.start()
+        print(f"Flight recorder: raw MQTT to {recorder.directory}")
+    if debug_ring:
+        debug_ring.install()
+        print(f"Debug ring: last {debug_ring.size} messages per device (kill -USR2 {os.getpid()} to dump)")
+    egress.start()
+    if egress.workers:
+        print(f"Egress: up to {egress.workers} concurrent POSTs, fair across devices, state changes first")
+    if liveness:
+        liveness.install().start()
+        print(f"Device liveness: watching forwarded devices (IsMoving=false on offline: {DEVICE_OFFLINE_SEND_STOP})")
+    metrics.install()
+    profiling.install(stages, watchdog)
+    warmup.install()
+    admin_http.start()
+    warmup.run()
 
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
     if MQTT_USER:
         client.username_pw_set(MQTT_USER, MQTT_PASS or "")
-    client.on_message = on_message
+    client.on_message = watchdog.wrap(on_message)
     client.connect(MQTT_HOST, MQTT_PORT, keepalive=30)
     client.subscribe(MQTT_TOPIC, qos=1)
     print(f"Bridge subscribed to mqtt://{MQTT_HOST}:{MQTT_PORT} topic '{MQTT_TOPIC}'")
@@ -11,13 +11,18 @@
  * - Currently handling 3 AMRs: tug-55, tug-39, tug-133
  * - Uses affine transformation for coordinate mapping
  * - Logs all data to SQLite database (logs/ati_data.db)
+ * - Hot-path logging is one JSON line per record via src/common/logger.js
+ *   (LOG_LEVEL, LOG_SAMPLE, LOG_FORMAT=text for a readable console)
  *
  * IMPORTANT - ATI Timestamp Format:
  * - ATI includes a "timestamp" field in ISO 8601 format with 'Z' suffix
  * - Example: "timestamp": "2025-12-01T13:21:52Z"
  * - WARNING: Despite the 'Z' (UTC indicator), timestamps are actually in IST (UTC+5:30)
  * - This is a data formatting issue on ATI's side
- * - Bridge uses Date.now() for Twinzo API (real-time when received)
+ * - Bridge uses Date.now() for Twinzo API (real-time when received); with
+ *   SOURCE_TS_AS_TIMESTAMP=true it sends ATI's time corrected by SOURCE_TS_OFFSET
+ *   (default +05:30) instead. Staleness and skew are on /metrics either way
+ *   (src/common/source_clock.js)
  *
  * Usage:
  *     node src/bridge/bridge_audit_feed.js
@@ -27,6 +32,12 @@ import mqtt from 'mqtt';
 import 'dotenv/config';
 import fetch from 'node-fetch';
 import { logATIMessage } from '../common/database.js';
+import { getLogger, bufferedCount } from '../common/logger.js';
+import { BridgeMetrics, counter, since, startAdminServer } from '../common/metrics.js';
+import { SourceClock } from '../common/source_clock.js';
+import { DeviceWatchdog, DEVICE_OFFLINE_SEND_STOP, DEVICE_WATCHDOG_ENABLED } from '../common/device_watchdog.js';
+
+const log = getLogger('audit_feed');
 
 // ATI Audit Feed Configuration
 const ATI_HOST = process.env.AUDIT_MQTT_HOST || 'tvs-dev.ifactory.ai';
@@ -45,8 +56,9 @@ const SUBSCRIPTION_TOPICS = {
 const TWINZO_CLIENT = process.env.TWINZO_CLIENT || 'TVSMotor';
 const TWINZO_PASSWORD = process.env.TWINZO_PASSWORD;
 const TWINZO_API_KEY = process.env.TWINZO_API_KEY;
-const TWINZO_AUTH_URL = 'https://api.platform.twinzo.com/v3/authorization/authenticate';
-const TWINZO_LOC_URL = 'https://api.platform.twinzo.com/v3/localization';
+const TWINZO_API_BASE = (process.env.TWINZO_API_BASE || 'https://api.platform.twinzo.com/v3').replace(/\/+$/, '');
+const TWINZO_AUTH_URL = `${TWINZO_API_BASE}/authorization/authenticate`;
+const TWINZO_LOC_URL = `${TWINZO_API_BASE}/localization`;
 
 // Plant Configuration
 const OLD_PLANT_SECTOR = 2;
@@ -91,6 +103,31 @@ const stats = {
     lastUpdate: {}
 };
 
+// Prometheus metrics (GET /metrics when ADMIN_HTTP_PORT is set)
+const metrics = new BridgeMetrics();
+let inflight = 0;
+metrics.queue('log_buffer', bufferedCount);
+metrics.queue('inflight_messages', () => inflight);
+const clock = new SourceClock('+05:30');  // ATI 'Z' timestamps are IST
+// Twinzo backpressure: a 429/503 pauses the device it answered for its Retry-After
+const EGRESS_RETRY_AFTER_S = parseFloat(process.env.EGRESS_RETRY_AFTER_S || '1');
+const pausedUntil = new Map();
+const throttled = counter('bridge_egress_throttled_total', '429/503 responses, by branch', ['branch']);
+
+function retryAfterSeconds(value) {
+    if (!value) return EGRESS_RETRY_AFTER_S;
+    const seconds = Number(value);
+    if (Number.isFinite(seconds)) return Math.max(0, seconds);
+    const when = Date.parse(value);  // HTTP date
+    return Number.isNaN(when) ? EGRESS_RETRY_AFTER_S : Math.max(0, (when - Date.now()) / 1000);
+}
+// Offline detection; a silent device gets a final IsMoving=false sample at its last position
+const liveness = DEVICE_WATCHDOG_ENABLED ? new DeviceWatchdog({
+    onOffline: DEVICE_OFFLINE_SEND_STOP
+        ? (sherpa, silentMs, last) => last && sendToTwinzo(last.deviceLogin, last.x, last.y, last.heading, last.battery, null, false)
+        : null
+}).start() : null;
+
 function transformXY(x, y) {
     return [
         AFFINE_A * x + AFFINE_B * y + AFFINE_TX,
@@ -119,13 +156,16 @@ async function authenticateDevice(deviceLogin) {
                 branch: data.Branch,
                 expires: data.Expiration
             };
+            metrics.tokenRefreshes.labels('ok').inc();
             console.log(`OK OAuth successful for ${deviceLogin}`);
             return oauthCache[deviceLogin];
         } else {
+            metrics.tokenRefreshes.labels('failed').inc();
             console.log(`FAIL OAuth failed for ${deviceLogin}: ${response.status}`);
             return null;
         }
     } catch (error) {
+        metrics.tokenRefreshes.labels('error').inc();
         console.log(`FAIL OAuth error for ${deviceLogin}: ${error.message}`);
         return null;
     }
@@ -146,37 +186,48 @@ async function getDeviceCredentials(deviceLogin) {
     return await authenticateDevice(deviceLogin);
 }
 
-async function sendToTwinzo(deviceLogin, x, y, heading, battery = 0) {
+async function sendToTwinzo(deviceLogin, x, y, heading, battery = 0, sourceTs = null, isMoving = true) {
     try {
+        const authStart = process.hrtime.bigint();
         const creds = await getDeviceCredentials(deviceLogin);
+        metrics.authSeconds.observe(since(authStart));
         if (!creds) {
+            metrics.filter('no_credentials');
             return { success: false, error: 'Authentication failed' };
         }
 
         // Validate coordinates
         if (!isFinite(x) || !isFinite(y)) {
-            console.log(`FAIL Invalid coordinates for ${deviceLogin}: X=${x}, Y=${y}`);
+            metrics.filter('invalid_pose');
+            log.warn('post_fail', 'Invalid coordinates', { device: deviceLogin, x, y });
             return { success: false, error: `Invalid coordinates: X=${x}, Y=${y}` };
         }
 
+        // Paused by a 429/503: drop the sample rather than add to the overload
+        if (Date.now() < (pausedUntil.get(deviceLogin) || 0)) {
+            metrics.filter('throttled');
+            return { success: false, error: 'Throttled by Twinzo (Retry-After)' };
+        }
+
         // Get device-specific sector (default to Old Plant if not configured)
         const sectorId = DEVICE_SECTOR_MAP[deviceLogin] || OLD_PLANT_SECTOR;
 
         // Prepare localization data (MUST be an array, match Python bridge format)
         const data = [{
-            Timestamp: Date.now(),
+            Timestamp: clock.timestampMs(sourceTs, Date.now()),
             SectorId: sectorId,
             X: x,
             Y: y,
             Z: 0,
             Interval: 100,
             Battery: battery,
-            IsMoving: true,
+            IsMoving: isMoving,
             LocalizationAreas: [],
             NoGoAreas: []
         }];
 
         // Send to Twinzo (use exact header format from Python bridge)
+        const postStart = process.hrtime.bigint();
         const response = await fetch(TWINZO_LOC_URL, {
             method: 'POST',
             headers: {
@@ -189,21 +240,31 @@ async function sendToTwinzo(deviceLogin, x, y, heading, battery = 0) {
             body: JSON.stringify(data),
             timeout: 5000
         });
+        metrics.postSeconds.observe(since(postStart));
 
         if (response.ok || response.status === 204) {
             stats.messagesSent++;
+            metrics.posted.inc();
             return { success: true, response: `HTTP ${response.status}` };
         } else {
+            if (response.status === 429 || response.status === 503) {
+                const pause = retryAfterSeconds(response.headers.get('retry-after'));
+                pausedUntil.set(deviceLogin, Math.max(pausedUntil.get(deviceLogin) || 0, Date.now() + pause * 1000));
+                throttled.labels(creds.branch).inc();
+            }
             const errorText = await response.text();
-            console.log(`FAIL Twinzo API error for ${deviceLogin}: ${response.status}`);
-            console.log(`  Sector: ${sectorId}, X: ${x.toFixed(2)}, Y: ${y.toFixed(2)}, Battery: ${battery}`);
-            console.log(`  Response: ${errorText.substring(0, 200)}`);
+            log.error('post_fail', 'Twinzo API error', {
+                device: deviceLogin, status: response.status, sector: sectorId,
+                x: Math.round(x), y: Math.round(y), battery, response: errorText.substring(0, 200)
+            });
             stats.errors++;
+            metrics.fail(response.status);
             return { success: false, error: `HTTP ${response.status}: ${errorText.substring(0, 200)}` };
         }
     } catch (error) {
-        console.log(`FAIL Error sending to Twinzo for ${deviceLogin}: ${error.message}`);
+        log.error('post_fail', 'Error sending to Twinzo', { device: deviceLogin, error: error.message });
         stats.errors++;
+        metrics.fail(error.name || 'Error');
         return { success: false, error: error.message };
     }
 }
@@ -244,6 +305,8 @@ for (const [atiName, twinzoLogin] of Object.entries(DEVICE_MAP)) {
 }
 console.log('======================================================================\\n');
 
+startAdminServer();
+
 const client = mqtt.connect(connectionOptions);
 
 client.on('connect', () => {
@@ -262,22 +325,29 @@ client.on('connect', () => {
 });
 
 client.on('message', async (topic, messageBuffer) => {
+    inflight++;
     try {
         stats.messagesTotal++;
+        metrics.received.inc();
 
         // Log every 20 messages to show activity
         if (stats.messagesTotal % 20 === 0) {
-            console.log(`DEBUG: Total=${stats.messagesTotal}, Processed=${stats.messagesReceived}, Sent=${stats.messagesSent}, topic=${topic}`);
+            log.debug('activity', 'Message counters', {
+                total: stats.messagesTotal, processed: stats.messagesReceived, sent: stats.messagesSent, topic
+            });
         }
 
         // Only process sherpa status messages
         if (topic !== 'ati_fm/sherpa/status') {
+            metrics.filter('topic');
             return;
         }
 
         stats.messagesReceived++;
 
+        const parseStart = process.hrtime.bigint();
         const payload = JSON.parse(messageBuffer.toString());
+        metrics.parseSeconds.observe(since(parseStart));
         const sherpaName = payload.sherpa_name;
         const mode = payload.mode;
         const pose = payload.pose;
@@ -285,11 +355,16 @@ client.on('message', async (topic, messageBuffer) => {
 
         // Skip if not in our device map
         if (!DEVICE_MAP[sherpaName]) {
+            metrics.filter('unmapped');
             return;
         }
+        const receivedAt = Date.now();
+        metrics.lastSeen[sherpaName] = receivedAt;
+        const sourceTs = clock.ingest(sherpaName, payload, receivedAt);
 
         // Skip if disconnected or no position data
         if (mode !== 'fleet' || !pose || pose.length < 3) {
+            metrics.filter(mode !== 'fleet' ? 'not_fleet' : 'invalid_pose');
             return;
         }
 
@@ -297,22 +372,34 @@ client.on('message', async (topic, messageBuffer) => {
         const deviceLogin = DEVICE_MAP[sherpaName];
 
         // Extract position
+        const transformStart = process.hrtime.bigint();
         const [xRaw, yRaw, heading] = pose;
 
         // Apply coordinate transformation
         const [x, y] = transformXY(xRaw, yRaw);
-
-        // Log detailed data for every message
-        console.log(`\n${'='.repeat(70)}`);
-        console.log(`AMR: ${sherpaName} -> ${deviceLogin}`);
-        console.log(`Time: ${new Date().toISOString()}`);
-        console.log(`ATI Raw Coordinates: X=${xRaw.toFixed(2)}m, Y=${yRaw.toFixed(2)}m, Heading=${heading.toFixed(3)}rad`);
-        console.log(`Twinzo Transformed: X=${x.toFixed(0)}, Y=${y.toFixed(0)}`);
-        console.log(`Battery: ${battery}%, Mode: ${mode}`);
-        console.log(`${'='.repeat(70)}`);
+        metrics.transformSeconds.observe(since(transformStart));
+
+        // One record per pose (read by scripts/transformation/log_parser.py)
+        log.info('pose', 'AMR pose', {
+            sherpa: sherpaName,
+            device: deviceLogin,
+            ati_x: Number(xRaw.toFixed(3)),
+            ati_y: Number(yRaw.toFixed(3)),
+            heading: Number(heading.toFixed(3)),
+            twinzo_x: Math.round(x),
+            twinzo_y: Math.round(y),
+            battery,
+            mode
+        });
 
         // Send to Twinzo
-        const result = await sendToTwinzo(deviceLogin, x, y, heading, battery);
+        if (liveness) {
+            liveness.touch(sherpaName, receivedAt, { deviceLogin, x, y, heading, battery });
+        }
+        const result = await sendToTwinzo(deviceLogin, x, y, heading, battery, sourceTs);
+        if (result.success) {
+            clock.posted(sherpaName, sourceTs);
+        }
 
         // Log to database
         try {
@@ -331,7 +418,7 @@ client.on('message', async (topic, messageBuffer) => {
                 error: result.error || null
             });
         } catch (dbError) {
-            console.log(`WARN Database logging failed: ${dbError.message}`);
+            log.warn('db', 'Database logging failed', { error: dbError.message });
         }
 
         // Update stats
@@ -340,16 +427,20 @@ client.on('message', async (topic, messageBuffer) => {
         // Log periodically
         if (stats.messagesReceived % 50 === 0) {
             const now = Date.now();
-            const activeCount = Object.values(stats.lastUpdate).filter(t => now - t < 30000).length;
-            console.log(`\\nStats: Received=${stats.messagesReceived}, ` +
-                       `Sent=${stats.messagesSent}, Active=${activeCount}, ` +
-                       `Errors=${stats.errors}`);
-            console.log(`Recent updates: ${Object.keys(stats.lastUpdate).join(', ')}\\n`);
+            const activeCount = liveness ? liveness.online
+                : Object.values(stats.lastUpdate).filter(t => now - t < 30000).length;
+            log.info('stats', 'Bridge stats', {
+                received: stats.messagesReceived, sent: stats.messagesSent, active: activeCount,
+                errors: stats.errors, devices: Object.keys(stats.lastUpdate)
+            });
         }
 
     } catch (error) {
-        console.error('FAIL Error processing message:', error.message);
+        log.error('error', 'Error processing message', { topic, error: error.message });
         stats.errors++;
+        metrics.errors.inc();
+    } finally {
+        inflight--;
     }
 });
 
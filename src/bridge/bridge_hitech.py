@@ -6,10 +6,23 @@ Subscribes to HiveMQ Cloud MQTT broker and streams AMR data to HiTech tuggers.
 Device mapping:
   - HiveMQ AMR data → tugger-03, tugger-04 (and more as needed)
 """
-import os, json, time, ssl
+import os, sys, json, time, ssl
+from functools import partial
 import requests
+from requests.adapters import HTTPAdapter
 from paho.mqtt import client as mqtt
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+from src.common.telemetry import TelemetryWriter, TELEMETRY_ENABLED
+from src.common.flight_recorder import FlightRecorder, FLIGHT_RECORDER_ENABLED
+from src.common.debug_ring import DebugRing, DEBUG_RING_ENABLED
+from src.common.source_clock import SourceClock
+from src.common.device_watchdog import DeviceWatchdog, DEVICE_WATCHDOG_ENABLED, DEVICE_OFFLINE_SEND_STOP
+from src.common.egress import Delivery, Egress, Retry, PRIORITY_POSE, PRIORITY_STATE
+from src.common.egress_control import THROTTLED
+from src.common.warmup import Warmup
+from src.common import admin_http, metrics, profiling
+
 # HiveMQ Cloud Configuration
 HIVEMQ_CONFIG_PATH = os.getenv("HIVEMQ_CONFIG", "config/hivemq_config.json")
 with open(HIVEMQ_CONFIG_PATH, "r") as f:
@@ -26,8 +39,9 @@ TWINZO_CLIENT = os.getenv("TWINZO_CLIENT", "TVSMotor")
 TWINZO_PASSWORD = os.getenv("TWINZO_PASSWORD", "Tvs@Hosur$2025")
 TWINZO_API_KEY = os.getenv("TWINZO_API_KEY", "sq29vSdYEribAbJjPc93FwNvk8ndo53P2yoAsS6S")
 
-TWINZO_AUTH_URL = "https://api.platform.twinzo.com/v3/authorization/authenticate"
-TWINZO_LOC_URL = "https://api.platform.twinzo.com/v3/localization"
+TWINZO_API_BASE = os.getenv("TWINZO_API_BASE", "https://api.platform.twinzo.com/v3").rstrip("/")
+TWINZO_AUTH_URL = f"{TWINZO_API_BASE}/authorization/authenticate"
+TWINZO_LOC_URL = f"{TWINZO_API_BASE}/localization"
 
 # HiTech Plant Configuration
 HITECH_PLANT_SECTOR = 1
@@ -59,7 +73,7 @@ def transform_xy(x, y):
 def authenticate_device(device_login):
     """Authenticate Twinzo device"""
     try:
-        r = requests.post(TWINZO_AUTH_URL, json={
+        r = session.post(TWINZO_AUTH_URL, json={
             "client": TWINZO_CLIENT,
             "login": device_login,
             "password": TWINZO_PASSWORD
@@ -73,12 +87,15 @@ def authenticate_device(device_login):
                 "branch": d["Branch"],
                 "expires": d["Expiration"]
             }
+            stats.token_refreshes.labels("ok").inc()
             print(f"OK OAuth successful for {device_login}")
             return oauth_cache["tokens"][device_login]
         else:
+            stats.token_refreshes.labels("failed").inc()
             print(f"FAIL OAuth failed for {device_login}: {r.status_code}")
             return None
     except Exception as e:
+        stats.token_refreshes.labels("error").inc()
         print(f"FAIL OAuth error for {device_login}: {e}")
         return None
 
@@ -102,8 +119,70 @@ def get_device_credentials(device_login):
 
     return authenticate_device(device_login)
 
+def send_stop_sample(device, silent_for, context):
+    """Queue a final IsMoving=false sample for a device that went silent (called on the liveness thread)"""
+    if context is None:
+        return
+    tugger_login, X, Y, z, battery = context
+    # Read-only cache lookup: no OAuth from this thread
+    creds = oauth_cache["tokens"].get(tugger_login)
+    if not creds or creds["expires"] <= time.time() * 1000:
+        return
+    headers = {
+        "Content-Type": "application/json",
+        "Client": creds["client"],
+        "Branch": creds["branch"],
+        "Token": creds["token"],
+        "Api-Key": TWINZO_API_KEY
+    }
+    twinzo_payload = [{
+        "Timestamp": int(time.time() * 1000),
+        "SectorId": HITECH_PLANT_SECTOR,
+        "X": X,
+        "Y": Y,
+        "Z": z,
+        "Interval": 100,
+        "Battery": battery,
+        "IsMoving": False,
+        "LocalizationAreas": [],
+        "NoGoAreas": []
+    }]
+    egress.submit(device, partial(post_stop_sample, tugger_login, headers, twinzo_payload), PRIORITY_STATE,
+                  gate=creds["branch"])
+
+def post_stop_sample(tugger_login, headers, twinzo_payload):
+    r = session.post(TWINZO_LOC_URL, headers=headers, json=twinzo_payload, timeout=5)
+    if r.status_code != 200:
+        print(f"WARN Stop sample for {tugger_login} failed: HTTP {r.status_code}")
+    return r
+
 counter = 0
 session = requests.Session()
+egress = Egress()
+warmup = Warmup(session, authenticate_device, DEVICE_MAP.values(), TWINZO_API_BASE)
+# One pooled connection per egress worker
+session.mount("https://", HTTPAdapter(pool_maxsize=max(10, egress.workers)))
+telemetry = TelemetryWriter() if TELEMETRY_ENABLED else None
+recorder = FlightRecorder("bridge_hitech") if FLIGHT_RECORDER_ENABLED else None
+stats = metrics.BridgeMetrics()
+clock = SourceClock()
+if telemetry:
+    stats.queue("telemetry", telemetry.queue.qsize)
+if recorder:
+    stats.queue("flight_recorder", recorder.queue.qsize)
+stats.queue("egress", egress.scheduler.depth)
+debug_ring = DebugRing(pose_fields=("x", "y", "z"),
+                       output_fields=("device", "X", "Y", "battery", "moving")) if DEBUG_RING_ENABLED else None
+stages = profiling.StageTimers()
+stages.add("credentials", globals(), "get_device_credentials")
+stages.add("transform", globals(), "transform_xy")
+stages.add("post", session, "post")
+stages.add("telemetry", telemetry, "record")
+stages.add("flight_recorder", recorder, "record")
+stages.add("debug_ring", debug_ring, "record")
+watchdog = profiling.Watchdog(stages=stages)
+liveness = DeviceWatchdog(on_offline=send_stop_sample if DEVICE_OFFLINE_SEND_STOP else None) \
+    if DEVICE_WATCHDOG_ENABLED else None
 
 def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
@@ -116,31 +195,51 @@ def on_connect(client, userdata, flags, rc, properties=None):
 def on_message(client, userdata, msg):
     """Process HiveMQ AMR data and forward to HiTech Plant"""
     global counter
+    received_at = time.time()
+    stats.received.inc()
+    if recorder:
+        recorder.record(msg.topic, msg.payload, msg.qos, msg.retain, received_at)
+    hivemq_device_id = pose = output = status = response = None
+    queued = False
     try:
+        t0 = time.perf_counter()
         payload = json.loads(msg.payload.decode("utf-8"))
+        stats.parse_seconds.observe(time.perf_counter() - t0)
 
         # Extract HiveMQ device ID (adjust based on actual HiveMQ message format)
         hivemq_device_id = payload.get("device_id") or payload.get("amr_id") or payload.get("id")
         if not hivemq_device_id:
+            stats.filter("no_device")
             return
+        stats.last_seen[hivemq_device_id] = received_at
+        source_ts = clock.ingest(hivemq_device_id, payload, received_at)
 
         # Map to Twinzo tugger
         tugger_login = DEVICE_MAP.get(hivemq_device_id)
         if not tugger_login:
+            status = "unmapped"
+            stats.filter("unmapped")
             if counter % LOG_EVERY_N == 0:
                 print(f"WARN Unknown HiveMQ device: {hivemq_device_id} (add to DEVICE_MAP)")
             return
 
         # Get Twinzo credentials
+        t0 = time.perf_counter()
         creds = get_device_credentials(tugger_login)
+        stats.auth_seconds.observe(time.perf_counter() - t0)
         if not creds:
+            status = "no_credentials"
+            stats.filter("no_credentials")
             return
 
         # Extract position (adjust field names based on HiveMQ format)
+        t0 = time.perf_counter()
         x = float(payload.get("x", 0))
         y = float(payload.get("y", 0))
         z = float(payload.get("z", 0))
         X, Y = transform_xy(x, y)
+        stats.transform_seconds.observe(time.perf_counter() - t0)
+        pose = (x, y, z)
 
         # Extract other fields
         battery = int(payload.get("battery", 85))
@@ -158,6 +257,9 @@ def on_message(client, userdata, msg):
             if distance > 100 or time.time() - last_pos["time"] > 1.0:
                 oauth_cache[device_key] = {"x": X, "y": Y, "time": time.time()}
 
+        if liveness:
+            liveness.touch(hivemq_device_id, received_at, (tugger_login, X, Y, z, battery))
+
         # Post to Twinzo HiTech Plant
         headers = {
             "Content-Type": "application/json",
@@ -168,7 +270,7 @@ def on_message(client, userdata, msg):
         }
 
         twinzo_payload = [{
-            "Timestamp": int(time.time() * 1000),
+            "Timestamp": clock.timestamp_ms(source_ts, time.time()),
             "SectorId": HITECH_PLANT_SECTOR,
             "X": X,
             "Y": Y,
@@ -180,19 +282,106 @@ def on_message(client, userdata, msg):
             "NoGoAreas": []
         }]
 
-        r = session.post(TWINZO_LOC_URL, headers=headers, json=twinzo_payload, timeout=5)
+        output = (tugger_login, X, Y, battery, is_moving)
+        # Recorded on arrival, so a sample egress drops still gets its row; delivery fills in the outcome
+        sample = open_sample(hivemq_device_id, received_at, msg.payload, pose, output, payload.get("mode"))
+        queued = True
+        egress.submit(hivemq_device_id, Delivery(partial(deliver_sample, hivemq_device_id, source_ts, headers,
+                                                         twinzo_payload, output, sample),
+                                                 partial(drop_sample, sample)),
+                      PRIORITY_POSE, gate=creds["branch"])
+        counter += 1
+
+    except Exception as e:
+        stats.errors.inc()
+        status = f"error: {e}"
+        if counter % LOG_EVERY_N == 0:
+            print(f"FAIL Error: {e}")
+    finally:
+        if debug_ring and not queued:
+            debug_ring.record(hivemq_device_id, received_at, msg.payload, pose, output, status, response)
+
+def open_sample(hivemq_device_id, received_at, raw, pose, output, mode):
+    """Debug ring slot and pending telemetry row of a queued sample; finish_sample() adds the outcome"""
+    slot = debug_ring.record(hivemq_device_id, received_at, raw, pose, output, "queued") if debug_ring else None
+    row = None
+    if telemetry:
+        x, y, _ = pose
+        _, X, Y, battery, _ = output
+        row = telemetry.record(hivemq_device_id, x, y, None, X, Y, None, battery, mode,
+                               received_at=received_at, pending=True)
+    return slot, row
+
+def finish_sample(sample, status, response, posted, api_response, error):
+    slot, row = sample
+    if slot:
+        debug_ring.update(slot, status, response)
+    if row:
+        telemetry.complete(row, posted, api_response, error)
+
+def drop_sample(sample, reason, api_response=None):
+    """Egress gave up on the sample (superseded by a newer one, or out of retries)"""
+    finish_sample(sample, f"dropped: {reason}", None, False, api_response, f"dropped: {reason}")
+
+def deliver_sample(hivemq_device_id, source_ts, headers, twinzo_payload, output, sample):
+    """POST one sample to HiTech Plant (runs on an egress worker); returns the response"""
+    tugger_login, X, Y, battery, is_moving = output
+    status = response = r = api_response = error = None
+    try:
+        t0 = time.perf_counter()
+        try:
+            r = session.post(TWINZO_LOC_URL, headers=headers, json=twinzo_payload, timeout=5)
+        except requests.RequestException as e:
+            stats.fail(type(e).__name__)
+            raise
+        finally:
+            stats.post_seconds.observe(time.perf_counter() - t0)
+        if r.status_code == 200:
+            stats.posted.inc()
+            clock.posted(hivemq_device_id, source_ts)
+        else:
+            stats.fail(str(r.status_code))
+            error = r.text[:200]
+        status, response = r.status_code, r.text[:200]
+        api_response = f"HTTP {r.status_code}"
 
         if counter % LOG_EVERY_N == 0:
             if r.status_code == 200:
                 print(f"OK {tugger_login} (HiveMQ:{hivemq_device_id}) -> HiTech Plant: ({X:.0f}, {Y:.0f})")
             else:
                 print(f"FAIL POST failed for {tugger_login}: {r.status_code}")
-
-        counter += 1
-
     except Exception as e:
+        stats.errors.inc()
+        status = f"error: {e}"
+        error = str(e)
         if counter % LOG_EVERY_N == 0:
             print(f"FAIL Error: {e}")
+        r = e
+    finally:
+        if status not in THROTTLED:
+            finish_sample(sample, status, response, status == 200, api_response, error)
+    if status in THROTTLED:
+        # The outcome waits for the retry (or for egress to give up on it)
+        return retry_sample(r, hivemq_device_id, source_ts, headers, twinzo_payload, sample)
+    return r
+
+def retry_sample(r, hivemq_device_id, source_ts, headers, twinzo_payload, sample):
+    return Retry(r, Delivery(partial(resend_sample, hivemq_device_id, source_ts, headers, twinzo_payload, sample),
+                             partial(drop_sample, sample, api_response=f"HTTP {r.status_code}")))
+
+def resend_sample(hivemq_device_id, source_ts, headers, twinzo_payload, sample):
+    """POST a throttled sample again; returns like deliver_sample"""
+    r = session.post(TWINZO_LOC_URL, headers=headers, json=twinzo_payload, timeout=5)
+    if r.status_code == 200:
+        stats.posted.inc()
+        clock.posted(hivemq_device_id, source_ts)
+    else:
+        stats.fail(str(r.status_code))
+        if r.status_code in THROTTLED:
+            return retry_sample(r, hivemq_device_id, source_ts, headers, twinzo_payload, sample)
+    finish_sample(sample, r.status_code, r.text[:200], r.status_code == 200, f"HTTP {r.status_code}",
+                  None if r.status_code == 200 else r.text[:200])
+    return r
 
 def main():
     print("="*70)
@@ -205,13 +394,34 @@ def main():
         print(f"  {hivemq_id} -> {tugger}")
     print("="*70)
 
+    if telemetry:
+        telemetry.start()
+        print(f"Telemetry: logging to {telemetry.db_path}")
+    if recorder:
+        recorder.start()
+        print(f"Flight recorder: raw MQTT to {recorder.directory}")
+    if debug_ring:
+        debug_ring.install()
+        print(f"Debug ring: last {debug_ring.size} messages per device (kill -USR2 {os.getpid()} to dump)")
+    egress.start()
+    if egress.workers:
+        print(f"Egress: up to {egress.workers} concurrent POSTs, fair across devices, honoring Twinzo backpressure")
+    if liveness:
+        liveness.install().start()
+        print(f"Device liveness: watching forwarded devices (IsMoving=false on offline: {DEVICE_OFFLINE_SEND_STOP})")
+    metrics.install()
+    profiling.install(stages, watchdog)
+    warmup.install()
+    admin_http.start()
+    warmup.run()
+
     # Create MQTT client
     client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, "hivemq_hitech_bridge")
     client.username_pw_set(HIVEMQ_USERNAME, HIVEMQ_PASSWORD)
     client.tls_set(cert_reqs=ssl.CERT_REQUIRED, tls_version=ssl.PROTOCOL_TLSv1_2)
 
     client.on_connect = on_connect
-    client.on_message = on_message
+    client.on_message = watchdog.wrap(on_message)
 
     print("\nConnecting to HiveMQ Cloud...")
     client.connect(HIVEMQ_HOST, HIVEMQ_PORT, keepalive=60)
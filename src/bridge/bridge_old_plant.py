@@ -15,10 +15,23 @@ ATI Data Format (topic: ati_fm/sherpa/status):
 Device Mapping:
   - ATI sherpa names → tugger-05-old, tugger-06-old, tugger-07-old
 """
-import os, json, time, ssl
+import os, sys, json, time, ssl
+from functools import partial
 import requests
+from requests.adapters import HTTPAdapter
 from paho.mqtt import client as mqtt
 
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+from src.common.telemetry import TelemetryWriter, TELEMETRY_ENABLED
+from src.common.flight_recorder import FlightRecorder, FLIGHT_RECORDER_ENABLED
+from src.common import bridge_log, admin_http, metrics, profiling
+from src.common.debug_ring import DebugRing, DEBUG_RING_ENABLED
+from src.common.source_clock import SourceClock
+from src.common.device_watchdog import DeviceWatchdog, DEVICE_WATCHDOG_ENABLED, DEVICE_OFFLINE_SEND_STOP
+from src.common.egress import Delivery, Egress, Retry, StateChanges, PRIORITY_STATE
+from src.common.egress_control import THROTTLED
+from src.common.warmup import Warmup
+
 # ATI MQTTS Configuration
 ATI_HOST = os.getenv("ATI_MQTT_HOST", "tvs-dev.ifactory.ai")
 ATI_PORT = int(os.getenv("ATI_MQTT_PORT", "8883"))
@@ -32,8 +45,9 @@ TWINZO_CLIENT = os.getenv("TWINZO_CLIENT", "TVSMotor")
 TWINZO_PASSWORD = os.getenv("TWINZO_PASSWORD", "Tvs@Hosur$2025")
 TWINZO_API_KEY = os.getenv("TWINZO_API_KEY", "sq29vSdYEribAbJjPc93FwNvk8ndo53P2yoAsS6S")
 
-TWINZO_AUTH_URL = "https://api.platform.twinzo.com/v3/authorization/authenticate"
-TWINZO_LOC_URL = "https://api.platform.twinzo.com/v3/localization"
+TWINZO_API_BASE = os.getenv("TWINZO_API_BASE", "https://api.platform.twinzo.com/v3").rstrip("/")
+TWINZO_AUTH_URL = f"{TWINZO_API_BASE}/authorization/authenticate"
+TWINZO_LOC_URL = f"{TWINZO_API_BASE}/localization"
 
 # Old Plant Configuration
 OLD_PLANT_SECTOR = 2
@@ -67,7 +81,7 @@ def transform_xy(x, y):
 def authenticate_device(device_login):
     """Authenticate Twinzo device"""
     try:
-        r = requests.post(TWINZO_AUTH_URL, json={
+        r = session.post(TWINZO_AUTH_URL, json={
             "client": TWINZO_CLIENT,
             "login": device_login,
             "password": TWINZO_PASSWORD
@@ -81,12 +95,15 @@ def authenticate_device(device_login):
                 "branch": d["Branch"],
                 "expires": d["Expiration"]
             }
+            stats.token_refreshes.labels("ok").inc()
             print(f"✓ OAuth successful for {device_login}")
             return oauth_cache["tokens"][device_login]
         else:
+            stats.token_refreshes.labels("failed").inc()
             print(f"✗ OAuth failed for {device_login}: {r.status_code}")
             return None
     except Exception as e:
+        stats.token_refreshes.labels("error").inc()
         print(f"✗ OAuth error for {device_login}: {e}")
         return None
 
@@ -110,8 +127,72 @@ def get_device_credentials(device_login):
 
     return authenticate_device(device_login)
 
+def send_stop_sample(device, silent_for, context):
+    """Queue a final IsMoving=false sample for a device that went silent (called on the liveness thread)"""
+    if context is None:
+        return
+    tugger_login, X, Y, z, battery = context
+    # Read-only cache lookup: no OAuth from this thread
+    creds = oauth_cache["tokens"].get(tugger_login)
+    if not creds or creds["expires"] <= time.time() * 1000:
+        return
+    headers = {
+        "Content-Type": "application/json",
+        "Client": creds["client"],
+        "Branch": creds["branch"],
+        "Token": creds["token"],
+        "Api-Key": TWINZO_API_KEY
+    }
+    twinzo_payload = [{
+        "Timestamp": int(time.time() * 1000),
+        "SectorId": OLD_PLANT_SECTOR,
+        "X": X,
+        "Y": Y,
+        "Z": z,
+        "Interval": 100,
+        "Battery": battery,
+        "IsMoving": False,
+        "LocalizationAreas": [],
+        "NoGoAreas": []
+    }]
+    egress.submit(device, partial(post_stop_sample, tugger_login, headers, twinzo_payload), PRIORITY_STATE,
+                  gate=creds["branch"])
+
+def post_stop_sample(tugger_login, headers, twinzo_payload):
+    r = session.post(TWINZO_LOC_URL, headers=headers, json=twinzo_payload, timeout=5)
+    if r.status_code != 200:
+        log.warn("offline", "Stop sample failed", device=tugger_login, status=r.status_code)
+    return r
+
 counter = 0
 session = requests.Session()
+egress = Egress()
+warmup = Warmup(session, authenticate_device, DEVICE_MAP.values(), TWINZO_API_BASE)
+states = StateChanges()
+# One pooled connection per egress worker
+session.mount("https://", HTTPAdapter(pool_maxsize=max(10, egress.workers)))
+telemetry = TelemetryWriter() if TELEMETRY_ENABLED else None
+recorder = FlightRecorder("bridge_old_plant") if FLIGHT_RECORDER_ENABLED else None
+log = bridge_log.get_logger("bridge_old_plant")
+stats = metrics.BridgeMetrics()
+clock = SourceClock(default_offset="+05:30")  # ATI 'Z' timestamps are IST
+if telemetry:
+    stats.queue("telemetry", telemetry.queue.qsize)
+if recorder:
+    stats.queue("flight_recorder", recorder.queue.qsize)
+stats.queue("egress", egress.scheduler.depth)
+debug_ring = DebugRing(pose_fields=("x", "y", "z", "roll", "pitch", "yaw"),
+                       output_fields=("device", "X", "Y", "battery", "moving")) if DEBUG_RING_ENABLED else None
+stages = profiling.StageTimers()
+stages.add("credentials", globals(), "get_device_credentials")
+stages.add("transform", globals(), "transform_xy")
+stages.add("post", session, "post")
+stages.add("telemetry", telemetry, "record")
+stages.add("flight_recorder", recorder, "record")
+stages.add("debug_ring", debug_ring, "record")
+watchdog = profiling.Watchdog(stages=stages)
+liveness = DeviceWatchdog(on_offline=send_stop_sample if DEVICE_OFFLINE_SEND_STOP else None) \
+    if DEVICE_WATCHDOG_ENABLED else None
 
 def on_connect(client, userdata, flags, rc, properties=None):
     if rc == 0:
@@ -124,53 +205,64 @@ def on_connect(client, userdata, flags, rc, properties=None):
 def on_message(client, userdata, msg):
     """Process ATI AMR data and forward to Old Plant"""
     global counter
+    received_at = time.time()
+    stats.received.inc()
+    if recorder:
+        recorder.record(msg.topic, msg.payload, msg.qos, msg.retain, received_at)
+    sherpa_name = pose = output = status = response = None
+    queued = False
     try:
-        # Log raw incoming message
-        print(f"\n{'='*70}")
-        print(f"RAW MESSAGE RECEIVED")
-        print(f"{'='*70}")
-        print(f"Topic: {msg.topic}")
-        print(f"Payload (raw): {msg.payload[:500]}")
-        print(f"{'='*70}\n")
+        # Raw payloads are in the flight recorder; console copy only at DEBUG (no slice otherwise)
+        if log.enabled(bridge_log.DEBUG, "raw"):
+            log.debug("raw", "MQTT message received", topic=msg.topic, payload=msg.payload[:500])
 
+        t0 = time.perf_counter()
         payload = json.loads(msg.payload.decode("utf-8"))
-
-        # Log parsed JSON payload
-        print(f"PARSED JSON:")
-        print(json.dumps(payload, indent=2))
-        print(f"{'='*70}\n")
+        stats.parse_seconds.observe(time.perf_counter() - t0)
 
         # Extract ATI sherpa name (device identifier)
         sherpa_name = payload.get("sherpa_name")
         if not sherpa_name:
-            print(f"WARN No sherpa_name found in payload. Keys available: {list(payload.keys())}")
+            stats.filter("no_device")
+            log.warn("payload", "No sherpa_name in payload", keys=list(payload.keys()))
             return
+        stats.last_seen[sherpa_name] = received_at
+        source_ts = clock.ingest(sherpa_name, payload, received_at)
 
         # Map to Twinzo tugger
         tugger_login = DEVICE_MAP.get(sherpa_name)
         if not tugger_login:
-            print(f"WARN Unknown ATI sherpa: {sherpa_name} (add to DEVICE_MAP)")
-            print(f"Available mappings: {DEVICE_MAP}")
-            print(f"Add this line to DEVICE_MAP: \"{sherpa_name}\": \"tugger-XX-old\"")
+            status = "unmapped"
+            stats.filter("unmapped")
+            log.warn("unmapped", "Unknown ATI sherpa (add to DEVICE_MAP)", sherpa=sherpa_name,
+                     hint=f'"{sherpa_name}": "tugger-XX-old"')
             return
 
-        print(f"Mapped {sherpa_name} -> {tugger_login}")
+        log.debug("map", "Mapped sherpa to tugger", sherpa=sherpa_name, device=tugger_login)
 
         # Get Twinzo credentials
+        t0 = time.perf_counter()
         creds = get_device_credentials(tugger_login)
+        stats.auth_seconds.observe(time.perf_counter() - t0)
         if not creds:
+            status = "no_credentials"
+            stats.filter("no_credentials")
             return
 
         # Extract position from pose array [x, y, z, roll, pitch, yaw]
+        t0 = time.perf_counter()
         pose = payload.get("pose", [0, 0, 0, 0, 0, 0])
         if not isinstance(pose, list) or len(pose) < 3:
-            print(f"WARN Invalid pose format: {pose}")
+            stats.filter("invalid_pose")
+            log.warn("payload", "Invalid pose format", sherpa=sherpa_name, pose=pose)
             return
 
         x = float(pose[0])
         y = float(pose[1])
         z = float(pose[2])
         X, Y = transform_xy(x, y)
+        stats.transform_seconds.observe(time.perf_counter() - t0)
+        status = "transformed"
 
         # Extract battery status
         battery = int(payload.get("battery_status", 85))
@@ -191,6 +283,9 @@ def on_message(client, userdata, msg):
             if distance > 100 or time.time() - last_pos["time"] > 1.0:
                 oauth_cache[device_key] = {"x": X, "y": Y, "time": time.time()}
 
+        if liveness:
+            liveness.touch(sherpa_name, received_at, (tugger_login, X, Y, z, battery))
+
         # Post to Twinzo Old Plant
         headers = {
             "Content-Type": "application/json",
@@ -201,7 +296,7 @@ def on_message(client, userdata, msg):
         }
 
         twinzo_payload = [{
-            "Timestamp": int(time.time() * 1000),
+            "Timestamp": clock.timestamp_ms(source_ts, time.time()),
             "SectorId": OLD_PLANT_SECTOR,
             "X": X,
             "Y": Y,
@@ -213,24 +308,107 @@ def on_message(client, userdata, msg):
             "NoGoAreas": []
         }]
 
-        print(f"Posting to Twinzo: {json.dumps(twinzo_payload[0], indent=2)}")
+        log.debug("post", "Posting to Twinzo", device=tugger_login, body=twinzo_payload[0])
+
+        output = (tugger_login, X, Y, battery, is_moving)
+        # Recorded on arrival, so a sample egress drops still gets its row; delivery fills in the outcome
+        sample = open_sample(sherpa_name, received_at, msg.payload, pose, output, mode)
+        queued = True
+        # Errors and mode/disabled changes jump the queue of routine poses
+        egress.submit(sherpa_name, Delivery(partial(deliver_sample, sherpa_name, source_ts, headers,
+                                                    twinzo_payload, output, sample),
+                                            partial(drop_sample, sample)),
+                      states.priority(sherpa_name, payload), gate=creds["branch"])
+        counter += 1
 
-        r = session.post(TWINZO_LOC_URL, headers=headers, json=twinzo_payload, timeout=5)
+    except Exception as e:
+        stats.errors.inc()
+        status = f"error: {e}"
+        log.exception("error", f"Error processing message: {e}", topic=msg.topic)
+    finally:
+        if debug_ring and not queued:
+            debug_ring.record(sherpa_name, received_at, msg.payload, pose, output, status, response)
+
+def open_sample(sherpa_name, received_at, raw, pose, output, mode):
+    """Debug ring slot and pending telemetry row of a queued sample; finish_sample() adds the outcome"""
+    slot = debug_ring.record(sherpa_name, received_at, raw, pose, output, "queued") if debug_ring else None
+    row = None
+    if telemetry:
+        _, X, Y, battery, _ = output
+        x, y = float(pose[0]), float(pose[1])
+        heading = float(pose[5]) if len(pose) >= 6 else None
+        row = telemetry.record(sherpa_name, x, y, heading, X, Y, heading, battery, mode,
+                               received_at=received_at, pending=True)
+    return slot, row
+
+def finish_sample(sample, status, response, posted, api_response, error):
+    slot, row = sample
+    if slot:
+        debug_ring.update(slot, status, response)
+    if row:
+        telemetry.complete(row, posted, api_response, error)
+
+def drop_sample(sample, reason, api_response=None):
+    """Egress gave up on the sample (superseded by a newer one, or out of retries)"""
+    finish_sample(sample, f"dropped: {reason}", None, False, api_response, f"dropped: {reason}")
+
+def deliver_sample(sherpa_name, source_ts, headers, twinzo_payload, output, sample):
+    """POST one sample to Old Plant (runs on an egress worker); returns the response"""
+    tugger_login, X, Y, battery, is_moving = output
+    status = response = r = api_response = error = None
+    try:
+        t0 = time.perf_counter()
+        try:
+            r = session.post(TWINZO_LOC_URL, headers=headers, json=twinzo_payload, timeout=5)
+        except requests.RequestException as e:
+            stats.fail(type(e).__name__)
+            raise
+        finally:
+            stats.post_seconds.observe(time.perf_counter() - t0)
+        status, response = r.status_code, r.text[:200]
+        api_response = f"HTTP {r.status_code}"
 
         if r.status_code == 200:
-            print(f"OK {tugger_login} (Sherpa:{sherpa_name}) -> Old Plant: ({X:.0f}, {Y:.0f}) Battery:{battery}% Moving:{is_moving}")
-            print(f"Twinzo response: {r.status_code} {r.text[:200]}")
+            stats.posted.inc()
+            clock.posted(sherpa_name, source_ts)
+            log.info("post_ok", "Posted to Old Plant", device=tugger_login, sherpa=sherpa_name,
+                     x=round(X), y=round(Y), battery=battery, moving=is_moving)
         else:
-            print(f"FAIL POST failed for {tugger_login}: {r.status_code}")
-            print(f"Response: {r.text}")
-
-        counter += 1
-        print(f"Messages processed: {counter}\n")
-
+            stats.fail(str(r.status_code))
+            error = r.text[:200]
+            log.error("post_fail", "POST failed", device=tugger_login, status=r.status_code,
+                      response=r.text[:500])
     except Exception as e:
-        print(f"FAIL Error processing message: {e}")
-        import traceback
-        traceback.print_exc()
+        stats.errors.inc()
+        status = f"error: {e}"
+        error = str(e)
+        log.exception("error", f"Error posting sample: {e}", device=tugger_login)
+        r = e
+    finally:
+        if status not in THROTTLED:
+            finish_sample(sample, status, response, status == 200, api_response, error)
+    if status in THROTTLED:
+        # The outcome waits for the retry (or for egress to give up on it)
+        return retry_sample(r, sherpa_name, source_ts, headers, twinzo_payload, sample)
+    return r
+
+def retry_sample(r, sherpa_name, source_ts, headers, twinzo_payload, sample):
+    return Retry(r, Delivery(partial(resend_sample, sherpa_name, source_ts, headers, twinzo_payload, sample),
+                             partial(drop_sample, sample, api_response=f"HTTP {r.status_code}")))
+
+def resend_sample(sherpa_name, source_ts, headers, twinzo_payload, sample):
+    """POST a throttled sample again; returns like deliver_sample"""
+    r = session.post(TWINZO_LOC_URL, headers=headers, json=twinzo_payload, timeout=5)
+    if r.status_code == 200:
+        stats.posted.inc()
+        clock.posted(sherpa_name, source_ts)
+    else:
+        stats.fail(str(r.status_code))
+        if r.status_code in THROTTLED:
+            return retry_sample(r, sherpa_name, source_ts, headers, twinzo_payload, sample)
+    finish_sample(sample, r.status_code, r.text[:200], r.status_code == 200, f"HTTP {r.status_code}",
+                  None if r.status_code == 200 else r.text[:200])
+    return r
 
 def main():
     print("="*70)
@@ -243,6 +421,27 @@ def main():
         print(f"  {ati_id} → {tugger}")
     print("="*70)
 
+    if telemetry:
+        telemetry.start()
+        print(f"Telemetry: logging to {telemetry.db_path}")
+    if recorder:
+        recorder.start()
+        print(f"Flight recorder: raw MQTT to {recorder.directory}")
+    if debug_ring:
+        debug_ring.install()
+        print(f"Debug ring: last {debug_ring.size} messages per device (kill -USR2 {os.getpid()} to dump)")
+    egress.start()
+    if egress.workers:
+        print(f"Egress: up to {egress.workers} concurrent POSTs, fair across devices, state changes first")
+    if liveness:
+        liveness.install().start()
+        print(f"Device liveness: watching forwarded devices (IsMoving=false on offline: {DEVICE_OFFLINE_SEND_STOP})")
+    metrics.install()
+    profiling.install(stages, watchdog)
+    warmup.install()
+    admin_http.start()
+    warmup.run()
+
     if not ATI_USERNAME or not ATI_PASSWORD:
         print("\n⚠ WARNING: ATI credentials not configured!")
         print("Set ATI_MQTT_USERNAME and ATI_MQTT_PASSWORD environment variables")
@@ -260,7 +459,7 @@ def main():
     client.tls_insecure_set(True)
 
     client.on_connect = on_connect
-    client.on_message = on_message
+    client.on_message = watchdog.wrap(on_message)
 
     print(f"\nConnecting to ATI broker with client ID: {ATI_CLIENT_ID}")
     print(f"Protocol: MQTT v5, QoS: 2")
@@ -272,6 +471,9 @@ def main():
     except KeyboardInterrupt:
         print("\nShutting down bridge...")
         client.disconnect()
+        if recorder:
+            recorder.stop()
+        bridge_log.shutdown()
         print("OK Bridge stopped")
     except Exception as e:
         print(f"FAIL Bridge error: {e}")
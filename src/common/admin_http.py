@@ -0,0 +1,82 @@
+"""
+Admin HTTP Server for the Bridges
+
+A small, optional HTTP server on a background thread for operational
+endpoints (debug dumps and similar). Components register routes; the
+server is only started when ADMIN_HTTP_PORT is set.
+
+    ADMIN_HTTP_PORT=0          disabled (default)
+    ADMIN_HTTP_HOST=127.0.0.1  bind address (use 0.0.0.0 inside Docker)
+
+Usage:
+    from src.common import admin_http
+
+    admin_http.route("/debug/ring", handler)   # handler(query) -> (status, content_type, body)
+    admin_http.start()
+"""
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ADMIN_HTTP_PORT = int(os.getenv("ADMIN_HTTP_PORT", "0"))
+ADMIN_HTTP_HOST = os.getenv("ADMIN_HTTP_HOST", "127.0.0.1")
+
+_routes = {}
+_server = None
+
+
+def route(path, handler):
+    """Register handler(query: dict) -> (status, content_type, body) for GET path"""
+    _routes[path] = handler
+
+
+def routes():
+    return sorted(_routes)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        url = urlparse(self.path)
+        handler = _routes.get(url.path)
+        if handler is None:
+            self._send(404, "text/plain", "Not found. Routes: " + ", ".join(routes()) + "\n")
+            return
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        try:
+            status, content_type, body = handler(query)
+        except Exception as e:
+            status, content_type, body = 500, "text/plain", f"{type(e).__name__}: {e}\n"
+        self._send(status, content_type, body)
+
+    def _send(self, status, content_type, body):
+        data = body.encode("utf-8") if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # keep request logs out of the bridge console
+
+
+def start(port=None, host=None):
+    """Start the server if a port is configured; returns it (or None). Idempotent."""
+    global _server
+    port = ADMIN_HTTP_PORT if port is None else port
+    if _server is not None or not port:
+        return _server
+    _server = ThreadingHTTPServer((host or ADMIN_HTTP_HOST, port), _Handler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="admin-http", daemon=True).start()
+    print(f"Admin HTTP: http://{host or ADMIN_HTTP_HOST}:{_server.server_address[1]} ({', '.join(routes())})")
+    return _server
+
+
+def stop():
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
@@ -0,0 +1,287 @@
+"""
+Structured, Sampled, Asynchronous Logging for the Bridges
+
+Each call produces one JSON line:
+
+    {"ts": "2025-01-15T06:30:00.123Z", "level": "INFO", "logger": "bridge_old_plant",
+     "cat": "post", "msg": "Posted to Twinzo", "device": "tugger-05-old", "status": 200}
+
+The MQTT thread only checks the level and sample rate and puts the record on
+a bounded queue. Formatting and writing happen on a QueueListener thread, and
+when the queue is full records are dropped and counted instead of blocking.
+Disabled levels cost one integer comparison. Per-category sampling
+("log 1 in N") keeps high-rate categories cheap even when they are enabled.
+
+Runtime control:
+    kill -USR1 <pid>           toggle between LOG_LEVEL and DEBUG
+    set_level("DEBUG") / set_sample_rate("raw", 0.01) from code
+
+Configuration:
+    LOG_LEVEL=INFO             DEBUG | INFO | WARN | ERROR
+    LOG_FORMAT=json            json | text (human-readable, for local runs)
+    LOG_FILE=                  write to a file instead of stdout
+    LOG_SAMPLE=raw=0.01,post=0.1
+                               per-category sample rates (default 1.0)
+    LOG_QUEUE_SIZE=10000
+
+Usage:
+    from src.common.bridge_log import get_logger
+
+    log = get_logger("bridge_old_plant")
+    log.info("post", "Posted to Twinzo", device=tugger_login, status=r.status_code)
+    if log.enabled(DEBUG, "raw"):
+        log.debug("raw", "MQTT message", payload=msg.payload[:500])
+"""
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+
+DEBUG = logging.DEBUG
+INFO = logging.INFO
+WARN = logging.WARNING
+ERROR = logging.ERROR
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_FILE = os.getenv("LOG_FILE", "")
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+_LEVEL_NAMES = {"DEBUG": DEBUG, "INFO": INFO, "WARN": WARN, "WARNING": WARN, "ERROR": ERROR}
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def parse_level(name):
+    return _LEVEL_NAMES.get(str(name).upper(), INFO)
+
+
+def parse_sample_rates(spec):
+    """'raw=0.01,post=0.1' -> {'raw': 0.01, 'post': 0.1}"""
+    rates = {}
+    for part in spec.split(","):
+        if "=" in part:
+            category, rate = part.split("=", 1)
+            rates[category.strip()] = float(rate)
+    return rates
+
+
+def _json_default(value):
+    if isinstance(value, (bytes, bytearray)):
+        return value.decode("utf-8", errors="replace")
+    return str(value)
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One JSON object per record; extra fields follow the fixed keys"""
+
+    def format(self, record):
+        out = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+                  + f".{int(record.msecs):03d}Z",
+            "level": "WARN" if record.levelno == WARN else record.levelname,
+            "logger": record.name,
+            "cat": getattr(record, "cat", ""),
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and key != "cat":
+                out[key] = value
+        if record.exc_info:
+            out["exc"] = self.formatException(record.exc_info)
+        return json.dumps(out, default=_json_default, separators=(",", ":"))
+
+
+class TextFormatter(logging.Formatter):
+    """'OK/WARN/FAIL message key=value' lines, matching the bridges' console style"""
+
+    PREFIX = {DEBUG: "DEBUG", INFO: "OK", WARN: "WARN", ERROR: "FAIL"}
+
+    def format(self, record):
+        fields = " ".join(f"{k}={_json_default(v) if isinstance(v, (bytes, bytearray)) else v}"
+                          for k, v in record.__dict__.items() if k not in _RESERVED and k != "cat")
+        line = f"{self.PREFIX.get(record.levelno, record.levelname)} {record.getMessage()}"
+        if fields:
+            line += f" ({fields})"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that counts and drops records when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Formatting is deferred to the listener; keep the record as is
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class BridgeLogger:
+    """Category-aware front end over a stdlib logger"""
+
+    def __init__(self, logger, config):
+        self._logger = logger
+        self._config = config
+
+    def enabled(self, level, category=None):
+        """True if a record at this level/category would be emitted (ignores sampling)"""
+        return level >= self._config.level and (category is None or self._config.rate(category) > 0)
+
+    def log(self, level, category, msg, exc_info=None, **fields):
+        config = self._config
+        if level < config.level or not config.sample(category):
+            return False
+        if not _RESERVED.isdisjoint(fields):
+            # LogRecord attributes (name, args, module, ...) cannot be overwritten via extra
+            fields = {(k + "_" if k in _RESERVED else k): v for k, v in fields.items()}
+        fields["cat"] = category
+        self._logger.log(level, msg, extra=fields, exc_info=exc_info)
+        return True
+
+    def debug(self, category, msg, **fields):
+        return self.log(DEBUG, category, msg, **fields)
+
+    def info(self, category, msg, **fields):
+        return self.log(INFO, category, msg, **fields)
+
+    def warn(self, category, msg, **fields):
+        return self.log(WARN, category, msg, **fields)
+
+    def error(self, category, msg, **fields):
+        return self.log(ERROR, category, msg, **fields)
+
+    def exception(self, category, msg, **fields):
+        return self.log(ERROR, category, msg, exc_info=True, **fields)
+
+
+class _Config:
+    """Shared level and sampling state (mutable at runtime)"""
+
+    def __init__(self, level, rates):
+        self.base_level = level
+        self.level = level
+        self.rates = dict(rates)
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def rate(self, category):
+        return self.rates.get(category, 1.0)
+
+    def sample(self, category):
+        rate = self.rates.get(category)
+        if rate is None or rate >= 1.0:
+            return True
+        if rate <= 0:
+            return False
+        # Deterministic 1-in-N: no RNG on the hot path, evenly spaced records
+        every = round(1.0 / rate)
+        with self.lock:
+            n = self.counters.get(category, 0)
+            self.counters[category] = n + 1
+        return n % every == 0
+
+
+_config = _Config(parse_level(LOG_LEVEL), parse_sample_rates(LOG_SAMPLE))
+_handler = None
+_listener = None
+_setup_lock = threading.Lock()
+
+
+def setup(stream=None, fmt=None, level=None, sample=None, queue_size=None):
+    """
+    Start the background listener (idempotent). Called by get_logger();
+    call it directly to override the environment (e.g. in tests).
+    """
+    global _handler, _listener
+    with _setup_lock:
+        if _listener is not None:
+            return _handler
+        if level is not None:
+            _config.base_level = _config.level = parse_level(level)
+        if sample is not None:
+            _config.rates = parse_sample_rates(sample) if isinstance(sample, str) else dict(sample)
+
+        if stream is not None:
+            target = logging.StreamHandler(stream)
+        elif LOG_FILE:
+            target = logging.FileHandler(LOG_FILE, encoding="utf-8")
+        else:
+            target = logging.StreamHandler(sys.stdout)
+        target.setFormatter(TextFormatter() if (fmt or LOG_FORMAT) == "text" else JsonLinesFormatter())
+
+        _handler = DroppingQueueHandler(queue.Queue(maxsize=queue_size or LOG_QUEUE_SIZE))
+        _listener = logging.handlers.QueueListener(_handler.queue, target)
+        _listener.start()
+        _install_signal_toggle()
+        return _handler
+
+
+def shutdown():
+    """Flush queued records and stop the listener"""
+    global _handler, _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            for h in _listener.handlers:
+                h.flush()
+        _listener = None
+        _handler = None
+
+
+def get_logger(name):
+    """Logger for one component; all share the queue, level and sample rates"""
+    handler = setup()
+    logger = logging.getLogger(name)
+    logger.propagate = False
+    logger.setLevel(DEBUG)  # filtering happens in BridgeLogger before a record exists
+    if handler not in logger.handlers:
+        logger.handlers = [handler]
+    return BridgeLogger(logger, _config)
+
+
+def set_level(level):
+    _config.level = parse_level(level) if isinstance(level, str) else level
+
+
+def get_level():
+    return logging.getLevelName(_config.level)
+
+
+def set_sample_rate(category, rate):
+    _config.rates[category] = float(rate)
+
+
+def dropped():
+    """Records dropped because the queue was full"""
+    return _handler.dropped if _handler else 0
+
+
+def _toggle_debug(signum=None, frame=None):
+    _config.level = _config.base_level if _config.level == DEBUG else DEBUG
+    print(f"Log level now {get_level()} (SIGUSR1 toggles DEBUG)", flush=True)
+
+
+def _install_signal_toggle():
+    if not hasattr(signal, "SIGUSR1"):
+        return  # Windows
+    if threading.current_thread() is not threading.main_thread():
+        return
+    try:
+        signal.signal(signal.SIGUSR1, _toggle_debug)
+    except ValueError:
+        pass
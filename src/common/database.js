@@ -20,21 +20,23 @@ if (!fs.existsSync(logsDir)) {
 const dbPath = path.join(logsDir, 'ati_data.db');
 const db = new Database(dbPath);
 
+// Must precede the first table; only takes effect on a new database
+db.pragma('auto_vacuum = INCREMENTAL');
 // Enable WAL mode for better concurrent access
 db.pragma('journal_mode = WAL');
 
-// Check if table already exists (to log appropriate message)
-const tableExists = db.prepare("SELECT name FROM sqlite_master WHERE type='table' AND name='ati_messages'").get();
-if (tableExists) {
-    const count = db.prepare("SELECT COUNT(*) as count FROM ati_messages").get();
-    console.log(`Database: Using existing database with ${count.count} messages`);
-} else {
-    console.log('Database: Creating new database tables');
-}
+// Raw rows live in one table per UTC day (same layout as src/common/partitions.py);
+// ati_messages is a UNION ALL view over the partitions
+const PARTITION_PREFIX = 'ati_messages_';
+const LEGACY_TABLE = 'ati_messages_legacy';
+const VACUUM_PAGES_PER_STEP = parseInt(process.env.VACUUM_PAGES_PER_STEP || '256', 10);
+const VACUUM_STEP_PAUSE_MS = parseInt(process.env.VACUUM_STEP_PAUSE_MS || '50', 10);
+// Automatic retention (0 keeps everything), once a day in the off-peak UTC hour; 21 UTC = 02:30 IST
+const RETENTION_DAYS = parseInt(process.env.RETENTION_DAYS || '0', 10);
+const RETENTION_HOUR_UTC = parseInt(process.env.RETENTION_HOUR_UTC || '21', 10);
 
-// Create tables (safe: IF NOT EXISTS means no data loss)
-db.exec(`
-    CREATE TABLE IF NOT EXISTS ati_messages (
+const partitionSchema = (table) => `
+    CREATE TABLE IF NOT EXISTS ${table} (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
         timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
         device_name TEXT NOT NULL,
@@ -59,24 +61,196 @@ db.exec(`
         error TEXT
     );
 
-    CREATE INDEX IF NOT EXISTS idx_device_timestamp ON ati_messages(device_name, timestamp);
-    CREATE INDEX IF NOT EXISTS idx_timestamp ON ati_messages(timestamp);
-    CREATE INDEX IF NOT EXISTS idx_posted ON ati_messages(posted_to_api);
+    CREATE INDEX IF NOT EXISTS idx_${table}_device_ts ON ${table}(device_name, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_${table}_ts ON ${table}(timestamp);
+`;
+
+function partitionName(ms) {
+    return PARTITION_PREFIX + new Date(ms).toISOString().slice(0, 10).replace(/-/g, '');
+}
+
+function listPartitions() {
+    const tables = db.prepare("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?")
+        .all(PARTITION_PREFIX + '%').map(r => r.name);
+    const days = tables.filter(t => /^ati_messages_\d{8}$/.test(t)).sort();
+    return tables.includes(LEGACY_TABLE) ? [LEGACY_TABLE, ...days] : days;
+}
+
+function rebuildView(tables) {
+    db.exec('DROP VIEW IF EXISTS ati_messages');
+    db.exec(`CREATE VIEW ati_messages AS ${tables.map(t => `SELECT * FROM ${t}`).join(' UNION ALL ')}`);
+}
+
+// DDL in one transaction so readers never see the view missing
+const ensurePartitions = db.transaction((tables) => {
+    const existing = new Set(listPartitions());
+    const missing = tables.filter(t => !existing.has(t));
+    const view = db.prepare("SELECT type FROM sqlite_master WHERE name = 'ati_messages'").get();
+    if (missing.length === 0 && view && view.type === 'view') {
+        return;
+    }
+    for (const table of missing) {
+        db.exec(partitionSchema(table));
+    }
+    rebuildView(listPartitions());
+});
+
+const existing = db.prepare("SELECT type FROM sqlite_master WHERE name = 'ati_messages'").get();
+if (existing && existing.type === 'table') {
+    db.transaction(() => db.exec(`ALTER TABLE ati_messages RENAME TO ${LEGACY_TABLE}`))();
+    console.log(`Database: moved existing ati_messages table to ${LEGACY_TABLE} (kept until past retention)`);
+} else if (existing) {
+    console.log(`Database: Using existing database with ${listPartitions().length} partitions`);
+} else {
+    console.log('Database: Creating new database tables');
+}
+
+function ensureUpcomingPartitions() {
+    const now = Date.now();
+    ensurePartitions([partitionName(now), partitionName(now + 86400000)]);
+}
+
+// Tomorrow's partition always exists before midnight UTC
+ensureUpcomingPartitions();
+setInterval(ensureUpcomingPartitions, 3600 * 1000).unref();
+
+// Statistics rollups (same schema as src/common/rollups.py), updated on every insert
+db.exec(`
+    CREATE TABLE IF NOT EXISTS ati_rollup_1m (
+        device_name TEXT NOT NULL,
+        bucket_start INTEGER NOT NULL,          -- epoch seconds (UTC), start of minute
+        message_count INTEGER NOT NULL DEFAULT 0,
+        posted_count INTEGER NOT NULL DEFAULT 0,
+        error_count INTEGER NOT NULL DEFAULT 0,
+        battery_min REAL,
+        battery_max REAL,
+        battery_sum REAL NOT NULL DEFAULT 0,
+        battery_samples INTEGER NOT NULL DEFAULT 0,
+        distance REAL NOT NULL DEFAULT 0,       -- Twinzo units travelled
+        moving_count INTEGER NOT NULL DEFAULT 0,
+        first_seen TEXT,
+        last_seen TEXT,
+        PRIMARY KEY (device_name, bucket_start)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS ati_rollup_1h (
+        device_name TEXT NOT NULL,
+        bucket_start INTEGER NOT NULL,          -- epoch seconds (UTC), start of hour
+        message_count INTEGER NOT NULL DEFAULT 0,
+        posted_count INTEGER NOT NULL DEFAULT 0,
+        error_count INTEGER NOT NULL DEFAULT 0,
+        battery_min REAL,
+        battery_max REAL,
+        battery_sum REAL NOT NULL DEFAULT 0,
+        battery_samples INTEGER NOT NULL DEFAULT 0,
+        distance REAL NOT NULL DEFAULT 0,
+        moving_count INTEGER NOT NULL DEFAULT 0,
+        first_seen TEXT,
+        last_seen TEXT,
+        PRIMARY KEY (device_name, bucket_start)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_rollup_1m_bucket ON ati_rollup_1m(bucket_start);
+    CREATE INDEX IF NOT EXISTS idx_rollup_1h_bucket ON ati_rollup_1h(bucket_start);
+
+    CREATE TABLE IF NOT EXISTS ati_rollup_last_pos (
+        device_name TEXT PRIMARY KEY,
+        twinzo_x REAL NOT NULL,
+        twinzo_y REAL NOT NULL
+    );
 `);
 
+// Movement rule used by the bridges: moved more than 10 Twinzo units since last sample
+const MOVING_THRESHOLD = 10;
+const ROLLUP_RESOLUTIONS = { ati_rollup_1m: 60, ati_rollup_1h: 3600 };
+
+// Prepared once per day partition and reused for every message
+const insertStmts = new Map();
+
+function insertStmtFor(table) {
+    let stmt = insertStmts.get(table);
+    if (!stmt) {
+        ensurePartitions([table]);
+        stmt = db.prepare(`
+            INSERT INTO ${table} (
+                timestamp, device_name, ati_x, ati_y, ati_heading,
+                twinzo_x, twinzo_y, twinzo_heading,
+                battery_status, mode, posted_to_api, api_response, error
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        `);
+        insertStmts.clear();  // only today's (and briefly yesterday's) statement is live
+        insertStmts.set(table, stmt);
+    }
+    return stmt;
+}
+
+const rollupUpsertStmts = Object.keys(ROLLUP_RESOLUTIONS).map(table => [table, db.prepare(`
+    INSERT INTO ${table} (
+        device_name, bucket_start, message_count, posted_count, error_count,
+        battery_min, battery_max, battery_sum, battery_samples,
+        distance, moving_count, first_seen, last_seen
+    ) VALUES (?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(device_name, bucket_start) DO UPDATE SET
+        message_count = message_count + 1,
+        posted_count = posted_count + excluded.posted_count,
+        error_count = error_count + excluded.error_count,
+        battery_min = min(COALESCE(battery_min, excluded.battery_min), COALESCE(excluded.battery_min, battery_min)),
+        battery_max = max(COALESCE(battery_max, excluded.battery_max), COALESCE(excluded.battery_max, battery_max)),
+        battery_sum = battery_sum + excluded.battery_sum,
+        battery_samples = battery_samples + excluded.battery_samples,
+        distance = distance + excluded.distance,
+        moving_count = moving_count + excluded.moving_count,
+        first_seen = min(first_seen, excluded.first_seen),
+        last_seen = max(last_seen, excluded.last_seen)
+`)]);
+
+const lastPosSelectStmt = db.prepare('SELECT twinzo_x, twinzo_y FROM ati_rollup_last_pos WHERE device_name = ?');
+const lastPosUpsertStmt = db.prepare(`
+    INSERT INTO ati_rollup_last_pos (device_name, twinzo_x, twinzo_y) VALUES (?, ?, ?)
+    ON CONFLICT(device_name) DO UPDATE SET twinzo_x = excluded.twinzo_x, twinzo_y = excluded.twinzo_y
+`);
+
+// device_name -> {x, y}; loaded lazily from ati_rollup_last_pos
+const lastPositions = new Map();
+
+function updateRollups(data, nowMs) {
+    let prev = lastPositions.get(data.device_name);
+    if (prev === undefined) {
+        const row = lastPosSelectStmt.get(data.device_name);
+        prev = row ? { x: row.twinzo_x, y: row.twinzo_y } : null;
+    }
+    const step = prev ? Math.hypot(data.twinzo_x - prev.x, data.twinzo_y - prev.y) : 0;
+    const battery = data.battery_status ?? null;
+    const seen = new Date(nowMs).toISOString().replace('T', ' ').slice(0, 23);
+
+    for (const [table, stmt] of rollupUpsertStmts) {
+        const width = ROLLUP_RESOLUTIONS[table];
+        stmt.run(
+            data.device_name,
+            Math.floor(nowMs / 1000 / width) * width,
+            data.posted_to_api ? 1 : 0,
+            data.error ? 1 : 0,
+            battery,
+            battery,
+            battery ?? 0,
+            battery === null ? 0 : 1,
+            step,
+            step > MOVING_THRESHOLD ? 1 : 0,
+            seen,
+            seen
+        );
+    }
+    lastPosUpsertStmt.run(data.device_name, data.twinzo_x, data.twinzo_y);
+    lastPositions.set(data.device_name, { x: data.twinzo_x, y: data.twinzo_y });
+}
+
 /**
- * Log an ATI message to the database
+ * Log an ATI message to the database (raw row + rollups in one transaction)
  */
-function logATIMessage(data) {
-    const stmt = db.prepare(`
-        INSERT INTO ati_messages (
-            device_name, ati_x, ati_y, ati_heading,
-            twinzo_x, twinzo_y, twinzo_heading,
-            battery_status, mode, posted_to_api, api_response, error
-        ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    `);
-
-    return stmt.run(
+const logATIMessage = db.transaction((data) => {
+    const nowMs = Date.now();
+    const result = insertStmtFor(partitionName(nowMs)).run(
+        new Date(nowMs).toISOString().replace('T', ' ').slice(0, 23),
         data.device_name,
         data.ati_x,
         data.ati_y,
@@ -90,7 +264,9 @@ function logATIMessage(data) {
         data.api_response || null,
         data.error || null
     );
-}
+    updateRollups(data, nowMs);
+    return result;
+});
 
 /**
  * Get recent messages for a device
@@ -105,60 +281,173 @@ function getRecentMessages(deviceName, limit = 100) {
     return stmt.all(deviceName, limit);
 }
 
+// Rollup window: minute buckets for the partial first hour, hour buckets after
+const ROLLUP_WINDOW = `
+    SELECT * FROM ati_rollup_1m WHERE bucket_start >= @minuteStart AND bucket_start < @hourEdge
+    UNION ALL
+    SELECT * FROM ati_rollup_1h WHERE bucket_start >= @hourEdge
+`;
+
+function rollupWindow(hours) {
+    const start = Math.floor(Date.now() / 1000 - hours * 3600);
+    return {
+        minuteStart: Math.floor(start / 60) * 60,
+        hourEdge: Math.ceil(start / 3600) * 3600
+    };
+}
+
+const deviceStatsStmt = db.prepare(`
+    SELECT
+        COALESCE(SUM(message_count), 0) as total_messages,
+        COALESCE(SUM(posted_count), 0) as posted_count,
+        COALESCE(SUM(error_count), 0) as error_count,
+        SUM(battery_sum) / NULLIF(SUM(battery_samples), 0) as avg_battery,
+        MIN(battery_min) as min_battery,
+        MAX(battery_max) as max_battery,
+        COALESCE(SUM(distance), 0) as distance,
+        CAST(SUM(moving_count) AS REAL) / NULLIF(SUM(message_count), 0) as moving_fraction,
+        MIN(first_seen) as first_seen,
+        MAX(last_seen) as last_seen
+    FROM (${ROLLUP_WINDOW})
+    WHERE device_name = @deviceName
+`);
+
+const activeDevicesStmt = db.prepare(`
+    SELECT
+        device_name,
+        SUM(message_count) as message_count,
+        MAX(last_seen) as last_seen,
+        SUM(battery_sum) / NULLIF(SUM(battery_samples), 0) as avg_battery
+    FROM (${ROLLUP_WINDOW})
+    GROUP BY device_name
+    ORDER BY last_seen DESC
+`);
+
 /**
- * Get statistics for a device
+ * Get statistics for a device (read from rollups, constant time in retention)
  */
 function getDeviceStats(deviceName, hours = 24) {
-    const stmt = db.prepare(`
-        SELECT
-            COUNT(*) as total_messages,
-            COUNT(CASE WHEN posted_to_api = 1 THEN 1 END) as posted_count,
-            COUNT(CASE WHEN error IS NOT NULL THEN 1 END) as error_count,
-            AVG(battery_status) as avg_battery,
-            MIN(timestamp) as first_seen,
-            MAX(timestamp) as last_seen
-        FROM ati_messages
-        WHERE device_name = ?
-        AND timestamp > datetime('now', '-' || ? || ' hours')
-    `);
-    return stmt.get(deviceName, hours);
+    return deviceStatsStmt.get({ deviceName, ...rollupWindow(hours) });
 }
 
 /**
  * Get all devices seen in the last N hours
  */
 function getActiveDevices(hours = 24) {
-    const stmt = db.prepare(`
-        SELECT
-            device_name,
-            COUNT(*) as message_count,
-            MAX(timestamp) as last_seen,
-            AVG(battery_status) as avg_battery
-        FROM ati_messages
-        WHERE timestamp > datetime('now', '-' || ? || ' hours')
-        GROUP BY device_name
-        ORDER BY last_seen DESC
-    `);
-    return stmt.all(hours);
+    return activeDevicesStmt.all(rollupWindow(hours));
 }
 
 /**
- * Clean up old data (keep last N days)
+ * Return free pages to the OS one incremental_vacuum step per timer tick,
+ * VACUUM_STEP_PAUSE_MS apart, so MQTT ingest keeps the event loop and the
+ * write lock between steps. Resolves to the pages freed.
+ */
+let vacuuming = null;
+
+function vacuumInSteps() {
+    if (db.pragma('auto_vacuum', { simple: true }) !== 2) {
+        return Promise.resolve(0);
+    }
+    if (vacuuming) {
+        return vacuuming;
+    }
+    vacuuming = new Promise((resolve) => {
+        let freed = 0;
+        const step = () => {
+            try {
+                const free = db.pragma('freelist_count', { simple: true });
+                if (free > 0) {
+                    const pages = Math.min(free, VACUUM_PAGES_PER_STEP);
+                    db.pragma(`incremental_vacuum(${pages})`);
+                    freed += pages;
+                    setTimeout(step, VACUUM_STEP_PAUSE_MS);
+                    return;
+                }
+            } catch (error) {
+                console.error('Database: incremental vacuum failed:', error.message);
+            }
+            vacuuming = null;
+            resolve(freed);
+        };
+        setImmediate(step);
+    });
+    return vacuuming;
+}
+
+/**
+ * Clean up old data (keep last N days) by dropping whole day partitions,
+ * then vacuum in the background (vacuumInSteps)
  */
 function cleanupOldData(daysToKeep = 30) {
-    const stmt = db.prepare(`
-        DELETE FROM ati_messages
-        WHERE timestamp < datetime('now', '-' || ? || ' days')
-    `);
-    const result = stmt.run(daysToKeep);
-    return result.changes;
+    const cutoff = partitionName(Date.now() - daysToKeep * 86400000);
+    const cutoffDay = `${cutoff.slice(-8, -4)}-${cutoff.slice(-4, -2)}-${cutoff.slice(-2)}`;
+    const tables = listPartitions();
+    const expired = tables.filter(t => t !== LEGACY_TABLE && t < cutoff);
+    let rows = 0;
+
+    if (tables.includes(LEGACY_TABLE)) {
+        const legacy = db.prepare(`SELECT MAX(timestamp) as newest, COUNT(*) as count FROM ${LEGACY_TABLE}`).get();
+        if (legacy.newest === null || legacy.newest < cutoffDay) {
+            expired.unshift(LEGACY_TABLE);
+            rows += legacy.count;
+        }
+    }
+    if (expired.length === 0) {
+        return 0;
+    }
+
+    // O(1) row counts from the AUTOINCREMENT sequence
+    const seqStmt = db.prepare('SELECT seq FROM sqlite_sequence WHERE name = ?');
+    for (const table of expired) {
+        if (table !== LEGACY_TABLE) {
+            rows += seqStmt.get(table)?.seq ?? 0;
+        }
+    }
+
+    db.transaction(() => {
+        rebuildView(tables.filter(t => !expired.includes(t)));
+        for (const table of expired) {
+            db.exec(`DROP TABLE ${table}`);
+        }
+        // Minute rollups follow raw retention; hour rollups are kept
+        db.prepare('DELETE FROM ati_rollup_1m WHERE bucket_start < ?')
+            .run(Math.floor(Date.parse(cutoffDay + 'T00:00:00Z') / 1000));
+    })();
+    insertStmts.clear();
+    vacuumInSteps();
+    return rows;
+}
+
+/**
+ * With RETENTION_DAYS > 0: once a day, in the RETENTION_HOUR_UTC hour, drop
+ * expired partitions and vacuum (same schedule as partitions.RetentionScheduler)
+ */
+let lastRetentionDay = null;
+
+function retentionTick(now = new Date()) {
+    const today = now.toISOString().slice(0, 10);
+    if (RETENTION_DAYS <= 0 || now.getUTCHours() !== RETENTION_HOUR_UTC || lastRetentionDay === today) {
+        return;
+    }
+    lastRetentionDay = today;
+    try {
+        const rows = cleanupOldData(RETENTION_DAYS);
+        if (rows) {
+            vacuumInSteps().then(freed => console.log(`Database: retention dropped ${rows} rows, vacuumed ${freed} pages`));
+        }
+    } catch (error) {
+        console.error('Database: retention run failed:', error.message);
+    }
 }
 
+setInterval(retentionTick, 300 * 1000).unref();
+
 export {
     db,
     logATIMessage,
     getRecentMessages,
     getDeviceStats,
     getActiveDevices,
-    cleanupOldData
+    cleanupOldData,
+    vacuumInSteps
 };
@@ -0,0 +1,196 @@
+"""
+Per-Device Debug Ring Buffers
+
+Each device keeps its last N messages in preallocated slots: receive time,
+raw payload, decoded pose, transformed output and the Twinzo status/response.
+Recording overwrites one slot in place (no I/O and no per-message logging),
+so it can stay on permanently. Buffers are written to a JSON file only when
+asked:
+
+    kill -USR2 <pid>                               dump every device
+    curl 'localhost:$ADMIN_HTTP_PORT/debug/ring?device=tug-55'   one device
+    curl 'localhost:$ADMIN_HTTP_PORT/debug/ring?inline=1'        JSON in the response
+
+Dumps go to logs/debug/ring-<device|all>-YYYYMMDD-HHMMSS.json, oldest entry
+first.
+
+Usage:
+    from src.common.debug_ring import DebugRing
+
+    debug_ring = DebugRing(pose_fields=("x", "y", "z", "yaw"),
+                           output_fields=("X", "Y", "battery", "moving")).install()
+    debug_ring.record(sherpa_name, received_at, msg.payload, pose, output, status, response)
+
+    # Or record on arrival and fill in the outcome once the POST returns
+    slot = debug_ring.record(sherpa_name, received_at, msg.payload, pose, output, "queued")
+    debug_ring.update(slot, status, response)
+"""
+import json
+import os
+import signal
+import threading
+import time
+from pathlib import Path
+
+from src.common import admin_http
+
+DEFAULT_DUMP_DIR = Path(__file__).parent.parent.parent / "logs" / "debug"
+
+DEBUG_RING_ENABLED = os.getenv("DEBUG_RING_ENABLED", "true").lower() == "true"
+DEBUG_RING_SIZE = int(os.getenv("DEBUG_RING_SIZE", "256"))
+DEBUG_RING_MAX_DEVICES = int(os.getenv("DEBUG_RING_MAX_DEVICES", "512"))
+DEBUG_DUMP_DIR = os.getenv("DEBUG_DUMP_DIR", str(DEFAULT_DUMP_DIR))
+
+UNPARSED = "_unparsed"  # messages that failed before a device name was known
+
+
+class DeviceRing:
+    """Fixed-size ring for one device; parallel preallocated slot lists"""
+
+    __slots__ = ("size", "count", "pos", "received_at", "raw", "pose", "output", "status", "response")
+
+    def __init__(self, size):
+        self.size = size
+        self.count = 0
+        self.pos = 0
+        self.received_at = [0.0] * size
+        self.raw = [None] * size
+        self.pose = [None] * size
+        self.output = [None] * size
+        self.status = [None] * size
+        self.response = [None] * size
+
+    def put(self, received_at, raw, pose, output, status, response):
+        i = self.pos
+        self.received_at[i] = received_at
+        self.raw[i] = raw
+        self.pose[i] = pose
+        self.output[i] = output
+        self.status[i] = status
+        self.response[i] = response
+        self.pos = (i + 1) % self.size
+        self.count += 1
+
+    def indices(self):
+        """Slot indices, oldest first"""
+        if self.count < self.size:
+            return range(self.count)
+        return [(self.pos + k) % self.size for k in range(self.size)]
+
+
+def _text(value):
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode("utf-8", errors="replace")
+    return value
+
+
+class DebugRing:
+    """Ring buffers for all devices of one bridge"""
+
+    def __init__(self, size=None, pose_fields=None, output_fields=None, dump_dir=None,
+                 max_devices=None):
+        self.size = size or DEBUG_RING_SIZE
+        self.pose_fields = pose_fields
+        self.output_fields = output_fields
+        self.dump_dir = Path(dump_dir or DEBUG_DUMP_DIR)
+        self.max_devices = max_devices or DEBUG_RING_MAX_DEVICES
+        self.rings = {}
+        self.lock = threading.Lock()
+        self.overflow = 0  # messages from devices beyond max_devices
+
+    def record(self, device, received_at, raw, pose=None, output=None, status=None, response=None):
+        """Store one message in its device's ring (overwrites the oldest slot); returns the slot for update()"""
+        device = device or UNPARSED
+        with self.lock:
+            ring = self.rings.get(device)
+            if ring is None:
+                if len(self.rings) >= self.max_devices:
+                    self.overflow += 1
+                    return None
+                ring = self.rings[device] = DeviceRing(self.size)
+            i = ring.pos
+            ring.put(received_at, raw, pose, output, status, response)
+            return ring, i, ring.count
+
+    def update(self, slot, status, response=None):
+        """Set the status/response of a recorded message, unless newer messages have overwritten it"""
+        if slot is None:
+            return
+        ring, i, count = slot
+        with self.lock:
+            if ring.count - count < ring.size:
+                ring.status[i] = status
+                ring.response[i] = response
+
+    def _labelled(self, fields, values):
+        if values is None or fields is None or len(fields) != len(values):
+            return values
+        return dict(zip(fields, values))
+
+    def snapshot(self, device=None):
+        """{device: [entry, ...]} oldest first; copies under the lock, formats outside it"""
+        with self.lock:
+            names = [device] if device else sorted(self.rings)
+            copied = {}
+            for name in names:
+                ring = self.rings.get(name)
+                if ring is None:
+                    continue
+                copied[name] = [(ring.received_at[i], ring.raw[i], ring.pose[i], ring.output[i],
+                                 ring.status[i], ring.response[i]) for i in ring.indices()]
+        result = {}
+        for name, entries in copied.items():
+            result[name] = [{
+                "received_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(ts)) + f".{int(ts * 1000) % 1000:03d}Z",
+                "raw": _text(raw),
+                "pose": self._labelled(self.pose_fields, pose),
+                "output": self._labelled(self.output_fields, output),
+                "status": status,
+                "response": _text(response),
+            } for ts, raw, pose, output, status, response in entries]
+        return result
+
+    def dump(self, device=None):
+        """Write one device's (or every) buffer to a JSON file; returns the path"""
+        data = self.snapshot(device)
+        self.dump_dir.mkdir(parents=True, exist_ok=True)
+        label = (device or "all").replace("/", "_")
+        path = self.dump_dir / f"ring-{label}-{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}.json"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"dumped_at": time.time(), "size": self.size, "devices": data}, f, indent=1,
+                      default=str)
+        return path
+
+    def _dump_in_background(self, device=None):
+        # Signal handlers run on the main (MQTT) thread, which may hold the lock
+        def run():
+            try:
+                path = self.dump(device)
+                print(f"OK Debug ring dumped to {path}")
+            except OSError as e:
+                print(f"WARN Debug ring dump failed: {e}")
+        threading.Thread(target=run, name="debug-ring-dump", daemon=True).start()
+
+    def _http_dump(self, query):
+        device = query.get("device")
+        if device and device not in self.rings:
+            return 404, "application/json", json.dumps({"error": f"unknown device {device}"})
+        if query.get("inline"):
+            return 200, "application/json", json.dumps(self.snapshot(device), default=str)
+        return 200, "application/json", json.dumps({"path": str(self.dump(device))})
+
+    def _http_devices(self, query):
+        with self.lock:
+            body = {name: ring.count for name, ring in self.rings.items()}
+        return 200, "application/json", json.dumps(body)
+
+    def install(self):
+        """Dump on SIGUSR2 and expose /debug/ring and /debug/devices on the admin server"""
+        if hasattr(signal, "SIGUSR2") and threading.current_thread() is threading.main_thread():
+            try:
+                signal.signal(signal.SIGUSR2, lambda signum, frame: self._dump_in_background())
+            except ValueError:
+                pass
+        admin_http.route("/debug/ring", self._http_dump)
+        admin_http.route("/debug/devices", self._http_devices)
+        return self
@@ -0,0 +1,194 @@
+/**
+ * Device silence / offline detection on a hashed timing wheel for the Node
+ * bridges (same behaviour and environment variables as src/common/device_watchdog.py)
+ *
+ * touch() only stores the receive time (plus a new wheel entry when the
+ * deadline moves earlier). When a device's entry comes due it is either
+ * rescheduled to last message + silence limit or declared offline; superseded
+ * entries are dropped. No periodic scan over all devices.
+ *
+ * Silence limit: DEVICE_OFFLINE_S if > 0, else DEVICE_OFFLINE_FACTOR x the
+ * device's average message interval, clamped to DEVICE_OFFLINE_MIN_S ..
+ * DEVICE_OFFLINE_MAX_S (DEVICE_OFFLINE_DEFAULT_S until the interval is known).
+ *
+ * Usage:
+ *   import { DeviceWatchdog } from '../common/device_watchdog.js';
+ *   const liveness = new DeviceWatchdog({ onOffline: (device, silentMs, context) => ... });
+ *   liveness.touch(device, Date.now(), context);
+ *   liveness.start();
+ */
+
+import { counter, gaugeCallback } from './metrics.js';
+
+const env = (name, fallback) => parseFloat(process.env[name] || fallback);
+
+const DEVICE_WATCHDOG_ENABLED = (process.env.DEVICE_WATCHDOG_ENABLED || 'true').toLowerCase() === 'true';
+const DEVICE_OFFLINE_SEND_STOP = (process.env.DEVICE_OFFLINE_SEND_STOP || 'true').toLowerCase() === 'true';
+const INTERVAL_ALPHA = 0.2;
+
+class TimingWheel {
+    constructor(tickMs, slots, now) {
+        this.tickMs = tickMs;
+        this.slots = Array.from({ length: slots }, () => []);
+        this.current = Math.floor(now / tickMs);
+    }
+
+    schedule(key, deadline) {
+        const tick = Math.max(Math.ceil(deadline / this.tickMs), this.current + 1);
+        this.slots[tick % this.slots.length].push([tick, key]);
+        return tick;
+    }
+
+    expireSlot(index, upto, expired) {
+        const slot = this.slots[index];
+        if (!slot.length) {
+            return;
+        }
+        const keep = [];
+        for (const entry of slot) {
+            if (entry[0] <= upto) {
+                expired.push(entry);
+            } else {
+                keep.push(entry);
+            }
+        }
+        this.slots[index] = keep;
+    }
+
+    advance(now) {
+        const target = Math.floor(now / this.tickMs);
+        const expired = [];
+        if (target - this.current >= this.slots.length) {
+            for (let i = 0; i < this.slots.length; i++) {
+                this.expireSlot(i, target, expired);
+            }
+        } else {
+            while (this.current < target) {
+                this.current++;
+                this.expireSlot(this.current % this.slots.length, this.current, expired);
+            }
+        }
+        this.current = Math.max(this.current, target);
+        return expired;
+    }
+}
+
+class DeviceWatchdog {
+    constructor({ onOffline = null, onOnline = null, now = Date.now() } = {}) {
+        this.onOffline = onOffline;
+        this.onOnline = onOnline;
+        this.offlineMs = env('DEVICE_OFFLINE_S', '0') * 1000;
+        this.factor = env('DEVICE_OFFLINE_FACTOR', '5');
+        this.minMs = env('DEVICE_OFFLINE_MIN_S', '5') * 1000;
+        this.maxMs = env('DEVICE_OFFLINE_MAX_S', '300') * 1000;
+        this.defaultMs = env('DEVICE_OFFLINE_DEFAULT_S', '30') * 1000;
+        this.tickMs = env('DEVICE_WATCHDOG_TICK_S', '0.5') * 1000;
+        this.wheel = new TimingWheel(this.tickMs, parseInt(process.env.DEVICE_WATCHDOG_SLOTS || '1024', 10), now);
+        this.devices = new Map();
+        this.online = 0;
+        this.timer = null;
+        this.offlineTotal = counter('bridge_device_offline_total', 'Devices that went silent');
+        this.onlineTotal = counter('bridge_device_online_total', 'Silent devices that reported again');
+        gaugeCallback('bridge_devices', 'Tracked devices by liveness state', ['state'],
+            () => [[['online'], this.online], [['offline'], this.devices.size - this.online]]);
+    }
+
+    limit(device) {
+        if (this.offlineMs > 0) {
+            return this.offlineMs;
+        }
+        if (device.interval === null) {
+            return this.defaultMs;
+        }
+        return Math.min(Math.max(this.factor * device.interval, this.minMs), this.maxMs);
+    }
+
+    /** Record a message from key; context (if given) is passed to onOffline later */
+    touch(key, now = Date.now(), context = null) {
+        let device = this.devices.get(key);
+        let silentMs = null;
+        if (!device) {
+            device = { lastSeen: now, interval: null, context, online: true, due: null };
+            this.devices.set(key, device);
+            this.online++;
+        } else {
+            if (device.online) {
+                const gap = now - device.lastSeen;
+                if (gap > 0) {
+                    device.interval = device.interval === null ? gap : device.interval + INTERVAL_ALPHA * (gap - device.interval);
+                }
+            } else {
+                device.online = true;
+                this.online++;
+                silentMs = now - device.lastSeen;
+            }
+            device.lastSeen = now;
+            if (context !== null) {
+                device.context = context;
+            }
+        }
+        const deadline = now + this.limit(device);
+        if (device.due === null || deadline < (device.due - 1) * this.tickMs) {
+            device.due = this.wheel.schedule(key, deadline);
+        }
+        if (silentMs !== null) {
+            this.onlineTotal.inc();
+            console.log(`OK Device ${key} back online after ${Math.round(silentMs / 1000)}s silent`);
+            this.call(this.onOnline, key, silentMs, device.context);
+        }
+    }
+
+    /** Advance the wheel to now; returns the keys that went offline */
+    poll(now = Date.now()) {
+        const offline = [];
+        for (const [tick, key] of this.wheel.advance(now)) {
+            const device = this.devices.get(key);
+            if (!device || device.due !== tick) {
+                continue;  // superseded by an earlier entry
+            }
+            const deadline = device.lastSeen + this.limit(device);
+            if (deadline > now) {
+                device.due = this.wheel.schedule(key, deadline);
+                continue;
+            }
+            device.due = null;
+            device.online = false;
+            this.online--;
+            offline.push(key);
+            this.offlineTotal.inc();
+            const silentMs = now - device.lastSeen;
+            console.log(`WARN Device ${key} offline: no message for ${(silentMs / 1000).toFixed(1)}s`);
+            this.call(this.onOffline, key, silentMs, device.context);
+        }
+        return offline;
+    }
+
+    call(callback, key, silentMs, context) {
+        if (!callback) {
+            return;
+        }
+        Promise.resolve()
+            .then(() => callback(key, silentMs, context))
+            .catch(error => console.log(`WARN Liveness callback failed for ${key}: ${error.message}`));
+    }
+
+    start() {
+        if (!this.timer) {
+            this.timer = setInterval(() => this.poll(), this.tickMs);
+            this.timer.unref();
+        }
+        return this;
+    }
+
+    stop() {
+        clearInterval(this.timer);
+        this.timer = null;
+    }
+}
+
+export {
+    DEVICE_OFFLINE_SEND_STOP,
+    DEVICE_WATCHDOG_ENABLED,
+    DeviceWatchdog,
+    TimingWheel
+};
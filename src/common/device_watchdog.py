@@ -0,0 +1,228 @@
+"""
+Device Silence / Offline Detection on a Hashed Timing Wheel
+
+Each forwarded device gets a deadline of last message + its expected
+silence limit. Deadlines sit in a hashed timing wheel (DEVICE_WATCHDOG_SLOTS
+slots of DEVICE_WATCHDOG_TICK_S), so:
+
+    touch()   O(1): stores the receive time; the wheel entry is only replaced
+              when the deadline moves earlier (a shorter learned cadence)
+    tick      O(entries in the due slot): an expired entry whose device has
+              been heard from since is rescheduled to its real deadline,
+              otherwise the device goes offline; superseded entries are dropped
+
+A device therefore costs at most one reschedule per silence limit, however
+fast it reports, and there is never a scan over all devices.
+
+The silence limit is DEVICE_OFFLINE_S when set (> 0); otherwise
+DEVICE_OFFLINE_FACTOR x the device's average message interval, clamped to
+DEVICE_OFFLINE_MIN_S .. DEVICE_OFFLINE_MAX_S (DEVICE_OFFLINE_DEFAULT_S until
+the interval is known).
+
+Transitions are printed, counted in /metrics and passed to the bridge's
+callbacks, which can send Twinzo a final IsMoving=false sample. State is at
+GET /debug/liveness on the admin HTTP port.
+
+Usage:
+    from src.common.device_watchdog import DeviceWatchdog
+
+    liveness = DeviceWatchdog(on_offline=send_stop_sample)
+    liveness.touch(device, received_at, context=(login, X, Y))   # per forwarded message
+    liveness.install().start()
+"""
+import json
+import math
+import os
+import threading
+import time
+
+from src.common import admin_http, metrics
+
+DEVICE_WATCHDOG_ENABLED = os.getenv("DEVICE_WATCHDOG_ENABLED", "true").lower() == "true"
+DEVICE_OFFLINE_S = float(os.getenv("DEVICE_OFFLINE_S", "0"))  # 0 = derive from each device's cadence
+DEVICE_OFFLINE_FACTOR = float(os.getenv("DEVICE_OFFLINE_FACTOR", "5"))
+DEVICE_OFFLINE_MIN_S = float(os.getenv("DEVICE_OFFLINE_MIN_S", "5"))
+DEVICE_OFFLINE_MAX_S = float(os.getenv("DEVICE_OFFLINE_MAX_S", "300"))
+DEVICE_OFFLINE_DEFAULT_S = float(os.getenv("DEVICE_OFFLINE_DEFAULT_S", "30"))
+DEVICE_OFFLINE_SEND_STOP = os.getenv("DEVICE_OFFLINE_SEND_STOP", "true").lower() == "true"
+DEVICE_WATCHDOG_TICK_S = float(os.getenv("DEVICE_WATCHDOG_TICK_S", "0.5"))
+DEVICE_WATCHDOG_SLOTS = int(os.getenv("DEVICE_WATCHDOG_SLOTS", "1024"))
+
+INTERVAL_ALPHA = 0.2  # EWMA weight of the newest message interval
+
+
+class TimingWheel:
+    """Hashed timing wheel of keys: schedule O(1), advance O(due entries)"""
+
+    def __init__(self, tick_s, slots, now):
+        self.tick_s = tick_s
+        self.slots = [[] for _ in range(slots)]
+        self.current = int(now / tick_s)
+        self.size = 0
+
+    def schedule(self, key, deadline):
+        """Fire key at the first tick at or after deadline (never the current tick)"""
+        tick = max(math.ceil(deadline / self.tick_s), self.current + 1)
+        self.slots[tick % len(self.slots)].append((tick, key))
+        self.size += 1
+        return tick
+
+    def _expire_slot(self, index, upto, expired):
+        slot = self.slots[index]
+        if slot:
+            keep = [entry for entry in slot if entry[0] > upto]
+            if len(keep) != len(slot):
+                expired.extend(entry for entry in slot if entry[0] <= upto)
+                self.slots[index] = keep
+
+    def advance(self, now):
+        """(tick, key) entries whose tick has passed"""
+        target = int(now / self.tick_s)
+        expired = []
+        if target - self.current >= len(self.slots):
+            # Fell a whole revolution behind: one pass over every slot
+            for index in range(len(self.slots)):
+                self._expire_slot(index, target, expired)
+        else:
+            while self.current < target:
+                self.current += 1
+                self._expire_slot(self.current % len(self.slots), self.current, expired)
+        self.current = max(self.current, target)
+        self.size -= len(expired)
+        return expired
+
+
+class _Device:
+    __slots__ = ("last_seen", "interval", "context", "online", "due")
+
+    def __init__(self, now, context):
+        self.last_seen = now
+        self.interval = None
+        self.context = context
+        self.online = True
+        self.due = None         # tick of the live wheel entry; None while offline
+
+
+class DeviceWatchdog:
+    """Online/offline state per device, driven by a timing wheel"""
+
+    def __init__(self, on_offline=None, on_online=None, offline_s=None, factor=None, min_s=None, max_s=None,
+                 default_s=None, tick_s=None, slots=None, now=None):
+        self.on_offline = on_offline
+        self.on_online = on_online
+        self.offline_s = DEVICE_OFFLINE_S if offline_s is None else offline_s
+        self.factor = DEVICE_OFFLINE_FACTOR if factor is None else factor
+        self.min_s = DEVICE_OFFLINE_MIN_S if min_s is None else min_s
+        self.max_s = DEVICE_OFFLINE_MAX_S if max_s is None else max_s
+        self.default_s = DEVICE_OFFLINE_DEFAULT_S if default_s is None else default_s
+        self.tick_s = DEVICE_WATCHDOG_TICK_S if tick_s is None else tick_s
+        self.wheel = TimingWheel(self.tick_s, DEVICE_WATCHDOG_SLOTS if slots is None else slots,
+                                 time.time() if now is None else now)
+        self.devices = {}
+        self.lock = threading.Lock()
+        self.offline_total = metrics.counter("bridge_device_offline_total", "Devices that went silent")
+        self.online_total = metrics.counter("bridge_device_online_total", "Silent devices that reported again")
+        metrics.gauge_callback("bridge_devices", "Tracked devices by liveness state", ("state",), self._counts)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def limit(self, device):
+        """Silence limit in seconds for a _Device"""
+        if self.offline_s > 0:
+            return self.offline_s
+        if device.interval is None:
+            return self.default_s
+        return min(max(self.factor * device.interval, self.min_s), self.max_s)
+
+    def touch(self, key, now=None, context=None):
+        """Record a message from key; context (if given) is passed to on_offline later"""
+        now = time.time() if now is None else now
+        silent_for = None
+        with self.lock:
+            device = self.devices.get(key)
+            if device is None:
+                device = self.devices[key] = _Device(now, context)
+            else:
+                if device.online:
+                    gap = now - device.last_seen
+                    if gap > 0:
+                        device.interval = gap if device.interval is None else \
+                            device.interval + INTERVAL_ALPHA * (gap - device.interval)
+                else:
+                    device.online = True
+                    silent_for = now - device.last_seen
+                device.last_seen = now
+                if context is not None:
+                    device.context = context
+            deadline = now + self.limit(device)
+            if device.due is None or deadline < (device.due - 1) * self.tick_s:
+                device.due = self.wheel.schedule(key, deadline)
+        if silent_for is not None:
+            self.online_total.inc()
+            print(f"OK Device {key} back online after {silent_for:.0f}s silent")
+            self._call(self.on_online, key, silent_for, device.context)
+
+    def poll(self, now=None):
+        """Advance the wheel to now; returns the keys that went offline"""
+        now = time.time() if now is None else now
+        offline = []
+        with self.lock:
+            for tick, key in self.wheel.advance(now):
+                device = self.devices.get(key)
+                if device is None or device.due != tick:
+                    continue  # superseded by an earlier entry
+                deadline = device.last_seen + self.limit(device)
+                if deadline > now:
+                    device.due = self.wheel.schedule(key, deadline)
+                else:
+                    device.due = None
+                    device.online = False
+                    offline.append((key, now - device.last_seen, device.context))
+        for key, silent_for, context in offline:
+            self.offline_total.inc()
+            print(f"WARN Device {key} offline: no message for {silent_for:.1f}s")
+            self._call(self.on_offline, key, silent_for, context)
+        return [key for key, _, _ in offline]
+
+    def _call(self, callback, key, silent_for, context):
+        if callback is None:
+            return
+        try:
+            callback(key, silent_for, context)
+        except Exception as e:
+            print(f"WARN Liveness callback failed for {key}: {e}")
+
+    def _counts(self):
+        online = sum(1 for d in list(self.devices.values()) if d.online)
+        return {("online",): online, ("offline",): len(self.devices) - online}
+
+    def status(self, now=None):
+        """{device: state, silent_s, limit_s, interval_s} for /debug/liveness"""
+        now = time.time() if now is None else now
+        with self.lock:
+            return {key: {"state": "online" if d.online else "offline",
+                          "silent_s": round(now - d.last_seen, 1),
+                          "limit_s": round(self.limit(d), 1),
+                          "interval_s": round(d.interval, 3) if d.interval is not None else None}
+                    for key, d in self.devices.items()}
+
+    def install(self):
+        """Expose GET /debug/liveness on the admin server"""
+        admin_http.route("/debug/liveness",
+                         lambda query: (200, "application/json", json.dumps(self.status(), indent=1)))
+        return self
+
+    def start(self):
+        if self._thread is None:
+            def run():
+                while not self._stop.wait(self.tick_s):
+                    try:
+                        self.poll()
+                    except Exception as e:
+                        print(f"WARN Liveness tick failed: {e}")
+            self._thread = threading.Thread(target=run, name="device-liveness", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
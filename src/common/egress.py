@@ -0,0 +1,387 @@
+"""
+Fair, Priority-Aware Egress Scheduling
+
+The MQTT callback hands each outgoing sample to the scheduler instead of
+POSTing it inline; EGRESS_WORKERS threads take samples out and deliver them.
+Selection is:
+
+    1. strict priority between classes: "state" (errors, disable/enable,
+       mode changes, offline stop samples) always goes before "pose"
+    2. deficit round robin across devices within a class: each device with
+       queued samples gets EGRESS_QUANTUM cost units per round, so a chatty
+       device or a replay backlog cannot starve the others
+
+Each device keeps at most EGRESS_DEVICE_QUEUE pose samples; a newer pose
+pushes out the oldest (a twin only needs the latest position), so a
+device's wait is bounded by one round over the active devices times its
+queue depth. State samples get EGRESS_STATE_QUEUE slots per device.
+A device is handed to one worker at a time (its flow is busy until deliver
+returns), so its samples reach Twinzo and telemetry in order.
+
+With an EgressControl (egress_control.py) each flow carries a gate, the
+device's Twinzo branch: devices paused by a Retry-After or whose branch is
+out of tokens are skipped without losing their turn, pose samples are paced
+to spread ATI's bursts, and the workers in flight are capped by the
+adaptive concurrency limit. A throttled (429/503) sample is put back at the
+front of its device's queue, up to EGRESS_RETRIES times; a pose is dropped
+instead once the device has a newer sample queued. deliver may return
+Retry(response, item) so that only item (say, the throttled sectors) is
+sent again.
+
+An item that has a dropped(reason) method (see Delivery) is told when
+egress gives up on it without a delivery: pushed out of a full queue,
+superseded after a throttle, or out of retries.
+
+EGRESS_WORKERS=0 delivers inline on the MQTT thread (the old behaviour).
+
+Usage:
+    from src.common.egress import Egress, StateChanges
+
+    egress = Egress()                   # items are callables run by a worker
+    states = StateChanges()
+    # deliver returns the last response (or the exception that ended it), or a Retry
+    egress.submit(device, Delivery(partial(deliver, ...), partial(dropped, ...)),
+                  states.priority(device, payload), gate=branch)
+    egress.start()
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+
+from src.common import metrics
+from src.common.egress_control import AdaptiveLimit, EgressControl
+
+EGRESS_WORKERS = int(os.getenv("EGRESS_WORKERS", "16"))
+EGRESS_QUANTUM = int(os.getenv("EGRESS_QUANTUM", "1"))
+EGRESS_DEVICE_QUEUE = int(os.getenv("EGRESS_DEVICE_QUEUE", "4"))
+EGRESS_STATE_QUEUE = int(os.getenv("EGRESS_STATE_QUEUE", "64"))
+EGRESS_RETRIES = int(os.getenv("EGRESS_RETRIES", "2"))
+
+PRIORITY_STATE = 0
+PRIORITY_POSE = 1
+CLASS_NAMES = ("state", "pose")
+STATE_FIELDS = ("mode", "disabled", "error")  # ATI status fields whose changes go first
+
+
+class StateChanges:
+    """Priority class of an ATI sample: state if it carries an error or a state field changed"""
+
+    def __init__(self, fields=STATE_FIELDS):
+        self.fields = fields
+        self.last = {}
+
+    def priority(self, device, payload):
+        state = tuple(payload.get(f) for f in self.fields)
+        previous = self.last.get(device)
+        self.last[device] = state
+        if payload.get("error") or (previous is not None and previous != state):
+            return PRIORITY_STATE
+        return PRIORITY_POSE
+
+
+class Retry:
+    """Delivery result: response was throttled and only item needs sending again"""
+    __slots__ = ("response", "item")
+
+    def __init__(self, response, item):
+        self.response = response
+        self.item = item
+
+
+class Delivery:
+    """Egress item: calling it delivers the sample, dropped(reason) is called if egress gives up on it"""
+    __slots__ = ("send", "on_drop")
+
+    def __init__(self, send, on_drop):
+        self.send = send
+        self.on_drop = on_drop
+
+    def __call__(self):
+        return self.send()
+
+    def dropped(self, reason):
+        self.on_drop(reason)
+
+
+def _give_up(item, reason):
+    """Tell an item egress will not deliver, if it listens (see Delivery)"""
+    dropped = getattr(item, "dropped", None)
+    if dropped is None:
+        return
+    try:
+        dropped(reason)
+    except Exception as e:
+        print(f"WARN Egress drop callback failed: {e}")
+
+
+class _Flow:
+    __slots__ = ("queue", "deficit", "in_turn", "gate")
+
+    def __init__(self, gate):
+        self.queue = deque()      # (item, cost, enqueued_at, attempt)
+        self.deficit = 0
+        self.in_turn = False
+        self.gate = gate
+
+
+class DeficitRoundRobin:
+    """Per-key FIFOs served by deficit round robin, strict priority between classes"""
+
+    def __init__(self, quantum=None, limits=None, control=None):
+        self.quantum = EGRESS_QUANTUM if quantum is None else quantum
+        self.limits = limits or (EGRESS_STATE_QUEUE, EGRESS_DEVICE_QUEUE)
+        self.control = control
+        self.flows = [{} for _ in CLASS_NAMES]        # class -> key -> _Flow
+        self.active = [deque() for _ in CLASS_NAMES]  # class -> keys with queued items, in round order
+        self.size = 0
+        self.busy = set()                             # keys handed to a worker and not done yet
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def put(self, key, item, priority=PRIORITY_POSE, cost=1, gate=None, attempt=0, front=False, now=None):
+        """Queue item for key; returns the item pushed out of a full queue, else None
+
+        front=True puts a retry ahead of the key's newer items; when the queue
+        is full it is the retry that gets dropped."""
+        now = time.monotonic() if now is None else now
+        with self.cond:
+            flows = self.flows[priority]
+            flow = flows.get(key)
+            if flow is None:
+                flow = flows[key] = _Flow(gate)
+                self.active[priority].append(key)
+            flow.gate = gate
+            full = len(flow.queue) >= self.limits[priority]
+            if front:
+                if full:
+                    return item
+                flow.queue.appendleft((item, cost, now, attempt))
+            else:
+                dropped = flow.queue.popleft()[0] if full else None
+                flow.queue.append((item, cost, now, attempt))
+                if self.control is not None and priority == PRIORITY_POSE:
+                    self.control.arrived(now)
+                if full:
+                    self.cond.notify()
+                    return dropped
+            self.size += 1
+            self.cond.notify()
+        return None
+
+    def _pop(self, now):
+        """(entry, 0) for the next item, or (None, seconds until a gate may open)"""
+        control = self.control
+        wait = math.inf
+        for priority, active in enumerate(self.active):
+            paced = control is not None and priority == PRIORITY_POSE
+            if paced and active:
+                delay = control.pace_delay(now, self.size)
+                if delay > 0:
+                    wait = min(wait, delay)
+                    continue
+            flows = self.flows[priority]
+            blocked = 0
+            while blocked < len(active):
+                key = active[0]
+                flow = flows[key]
+                if key in self.busy:
+                    # One of its samples is being delivered: keep its order, come back on done()
+                    blocked += 1
+                    active.rotate(-1)
+                    continue
+                if control is not None:
+                    delay = control.delay(key, flow.gate, now)
+                    if delay > 0:
+                        # Paused or branch out of tokens: skip it, turn and deficit intact
+                        wait = min(wait, delay)
+                        blocked += 1
+                        active.rotate(-1)
+                        continue
+                if not flow.in_turn:
+                    flow.deficit += self.quantum
+                    flow.in_turn = True
+                item, cost, enqueued_at, attempt = flow.queue[0]
+                if cost <= flow.deficit:
+                    flow.queue.popleft()
+                    flow.deficit -= cost
+                    self.size -= 1
+                    if not flow.queue:
+                        active.popleft()
+                        del flows[key]    # idle flows keep no deficit
+                    if control is not None:
+                        control.take(key, flow.gate, paced, now)
+                    self.busy.add(key)
+                    return (key, item, priority, enqueued_at, flow.gate, attempt, cost), 0.0
+                flow.in_turn = False      # turn over: keep the deficit, go to the back
+                blocked = 0
+                active.rotate(-1)
+        return None, wait
+
+    def get(self, timeout=None):
+        """(key, item, priority, enqueued_at, gate, attempt, cost) of the next item; None on timeout or close
+
+        The key stays busy (none of its other items are handed out) until done(key)."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.cond:
+            while True:
+                wait = None
+                if self.size:
+                    entry, wait = self._pop(time.monotonic())
+                    if entry is not None:
+                        return entry
+                if self.closed:
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return None
+                if wait is not None and wait < math.inf and (remaining is None or wait < remaining):
+                    remaining = wait
+                self.cond.wait(remaining)
+
+    def done(self, key):
+        """The item last taken for key has been delivered (or given up)"""
+        with self.cond:
+            self.busy.discard(key)
+            self.cond.notify()
+
+    def queued(self, key):
+        """True if key has items waiting in any class"""
+        with self.cond:
+            return any(key in flows for flows in self.flows)
+
+    def depth(self, priority=None):
+        if priority is None:
+            return self.size
+        return sum(len(flow.queue) for flow in list(self.flows[priority].values()))
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+
+def _call(key, item):
+    return item()
+
+
+def _outcome(result):
+    """(status, Retry-After) of a delivery result; status None for an exception"""
+    if isinstance(result, Retry):
+        result = result.response
+    if isinstance(result, BaseException):
+        return None, None
+    headers = getattr(result, "headers", None) or {}
+    return result.status_code, headers.get("Retry-After")
+
+
+class Egress:
+    """DeficitRoundRobin plus the worker threads that call deliver(key, item)"""
+
+    def __init__(self, deliver=None, workers=None, scheduler=None, control=None, name="egress"):
+        self.deliver = deliver or _call
+        self.workers = EGRESS_WORKERS if workers is None else workers
+        self.control = control or EgressControl(limit=AdaptiveLimit(max_limit=max(1, self.workers)))
+        self.scheduler = scheduler or DeficitRoundRobin(control=self.control)
+        self.name = name
+        self.threads = []
+        self.inflight = 0         # workers holding a slot (taking or delivering an item)
+        self.busy = 0             # deliveries in progress
+        self.slots = threading.Condition()
+        self.wait_seconds = metrics.histogram("bridge_egress_wait_seconds", "Time samples spent queued for egress",
+                                              ("class",))
+        self.dropped = metrics.counter("bridge_egress_dropped_total",
+                                       "Samples pushed out of a full per-device egress queue", ("class",))
+        self.retries = metrics.counter("bridge_egress_retries_total", "Throttled samples queued again")
+        self._wait = [self.wait_seconds.labels(c) for c in CLASS_NAMES]
+        self._dropped = [self.dropped.labels(c) for c in CLASS_NAMES]
+        self.busy_gauge = metrics.gauge("bridge_egress_inflight", "POSTs in flight")
+
+    def submit(self, key, item, priority=PRIORITY_POSE, cost=1, gate=None):
+        if not self.workers:
+            result = self.deliver(key, item)
+            if isinstance(result, Retry):
+                _give_up(result.item, f"out of retries (HTTP {_outcome(result)[0]})")   # inline: no retries
+            return
+        dropped = self.scheduler.put(key, item, priority, cost, gate)
+        if dropped is not None:
+            self._dropped[priority].inc()
+            _give_up(dropped, "superseded")
+
+    def _run(self):
+        scheduler, limit = self.scheduler, self.control.limit
+        while True:
+            # A worker may only take work while the in-flight count is under the limit
+            with self.slots:
+                while self.inflight >= max(1, int(limit.limit)) and not scheduler.closed:
+                    self.slots.wait(0.5)
+                self.inflight += 1
+            try:
+                entry = scheduler.get()
+                if entry is None:
+                    return
+                key = entry[0]
+                try:
+                    self._deliver(*entry)
+                finally:
+                    scheduler.done(key)
+            finally:
+                with self.slots:
+                    self.inflight -= 1
+                    self.slots.notify()
+
+    def _deliver(self, key, item, priority, enqueued_at, gate, attempt, cost):
+        scheduler = self.scheduler
+        started = time.monotonic()
+        self._wait[priority].observe(started - enqueued_at)
+        with self.slots:
+            self.busy += 1
+            busy = self.busy
+            self.busy_gauge.set(busy)
+        try:
+            result = self.deliver(key, item)
+        except Exception as e:
+            print(f"WARN Egress delivery failed for {key}: {e}")
+            _give_up(item, f"error: {e}")
+            return
+        finally:
+            with self.slots:
+                self.busy -= 1
+                self.busy_gauge.set(self.busy)
+        if result is None:
+            return
+        status, retry_after = _outcome(result)
+        now = time.monotonic()
+        with scheduler.cond:
+            throttled = self.control.on_response(key, gate, status, retry_after, now - started, busy, now)
+        if not throttled:
+            if isinstance(result, Retry):
+                _give_up(result.item, f"not retried (HTTP {status})")
+            return
+        if isinstance(result, Retry):
+            item = result.item
+        if attempt >= EGRESS_RETRIES:
+            _give_up(item, f"out of retries (HTTP {status})")
+            return
+        if priority == PRIORITY_POSE and scheduler.queued(key):
+            self._dropped[priority].inc()     # a newer sample supersedes the throttled pose
+            _give_up(item, "superseded")
+            return
+        self.retries.inc()
+        # Still busy: the retry goes in ahead of anything the device queues after it
+        if scheduler.put(key, item, priority, cost, gate, attempt + 1, front=True) is not None:
+            self._dropped[priority].inc()
+            _give_up(item, "superseded")
+
+    def start(self):
+        for i in range(self.workers - len(self.threads)):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{len(self.threads)}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def stop(self):
+        self.scheduler.close()
+        with self.slots:
+            self.slots.notify_all()
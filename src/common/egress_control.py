@@ -0,0 +1,230 @@
+"""
+Egress Rate and Concurrency Control
+
+Backpressure for the egress workers (egress.py), so the bridges post as
+fast as Twinzo keeps up and no faster:
+
+    per-branch token bucket   EGRESS_BRANCH_RATE POSTs/s (0: unlimited) with
+                              EGRESS_BRANCH_BURST tokens
+    Retry-After               a 429/503 pauses the device it answered (each POST
+                              carries that device's token) for its Retry-After,
+                              EGRESS_RETRY_AFTER_S when the header is missing.
+                              The device then keeps at least that spacing
+                              between POSTs: x1.25 on every further 429, x
+                              EGRESS_SPACING_DECAY per success (AIMD on its rate)
+    adaptive concurrency      POSTs in flight are capped by a limit between
+                              EGRESS_LIMIT_MIN and the number of workers. It
+                              follows the gradient long_rtt / short_rtt (averages
+                              over EGRESS_RTT_LONG and EGRESS_RTT_SHORT samples):
+                              it grows while recent latency stays within
+                              EGRESS_RTT_TOLERANCE of the long-run level and
+                              shrinks as Twinzo queues up; 5xx (503 included)
+                              or timeouts cut it by EGRESS_LIMIT_BACKOFF (AIMD)
+    spreading                 ATI publishes every AMR at once every ~2 s. Pose
+                              samples are paced at EGRESS_SPREAD_HEADROOM x the
+                              measured arrival rate, so a burst goes out evenly
+                              over the interval instead of in one spike. Pacing
+                              stops while the backlog is more than half a window
+                              behind, so it never limits throughput. State
+                              samples are not paced.
+
+All methods are called with the scheduler's lock held.
+
+Usage:
+    from src.common.egress_control import EgressControl
+
+    control = EgressControl()
+    egress = Egress(control=control)
+    egress.submit(device, job, priority, gate=credentials["branch"])
+"""
+import math
+import os
+import time
+from email.utils import parsedate_to_datetime
+
+from src.common import metrics
+
+EGRESS_BRANCH_RATE = float(os.getenv("EGRESS_BRANCH_RATE", "0"))
+EGRESS_BRANCH_BURST = float(os.getenv("EGRESS_BRANCH_BURST", "20"))
+EGRESS_RETRY_AFTER_S = float(os.getenv("EGRESS_RETRY_AFTER_S", "1"))
+EGRESS_SPACING_DECAY = float(os.getenv("EGRESS_SPACING_DECAY", "0.98"))
+EGRESS_LIMIT_INITIAL = float(os.getenv("EGRESS_LIMIT_INITIAL", "2"))
+EGRESS_LIMIT_MIN = float(os.getenv("EGRESS_LIMIT_MIN", "1"))
+EGRESS_LIMIT_BACKOFF = float(os.getenv("EGRESS_LIMIT_BACKOFF", "0.7"))
+EGRESS_RTT_TOLERANCE = float(os.getenv("EGRESS_RTT_TOLERANCE", "1.5"))
+EGRESS_RTT_SHORT = int(os.getenv("EGRESS_RTT_SHORT", "10"))
+EGRESS_RTT_LONG = int(os.getenv("EGRESS_RTT_LONG", "600"))
+EGRESS_SPREAD = os.getenv("EGRESS_SPREAD", "true").lower() == "true"
+EGRESS_SPREAD_HEADROOM = float(os.getenv("EGRESS_SPREAD_HEADROOM", "1.25"))
+EGRESS_SPREAD_WINDOW_S = float(os.getenv("EGRESS_SPREAD_WINDOW_S", "4"))
+
+THROTTLED = (429, 503)
+
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date); None if unusable"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when - (time.time() if now is None else now))
+
+
+class TokenBucket:
+    """rate tokens/s up to burst; rate <= 0 never runs dry but can still be paused"""
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.stamp = now
+        self.paused_until = 0.0
+
+    def delay(self, now):
+        """Seconds until a token is available (0: now)"""
+        if now < self.paused_until:
+            return self.paused_until - now
+        if self.rate <= 0:
+            return 0.0
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        if self.rate > 0:
+            self.tokens -= 1
+
+    def pause(self, until):
+        self.paused_until = max(self.paused_until, until)
+
+
+class AdaptiveLimit:
+    """Concurrency limit from the latency gradient, with multiplicative decrease on overload"""
+
+    def __init__(self, initial=None, min_limit=None, max_limit=8, tolerance=None, backoff=None,
+                 short=None, long=None, smoothing=0.2):
+        self.min_limit = EGRESS_LIMIT_MIN if min_limit is None else min_limit
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = min(self.max_limit, max(self.min_limit, EGRESS_LIMIT_INITIAL if initial is None else initial))
+        self.tolerance = EGRESS_RTT_TOLERANCE if tolerance is None else tolerance
+        self.backoff = EGRESS_LIMIT_BACKOFF if backoff is None else backoff
+        self.short_alpha = 2.0 / ((EGRESS_RTT_SHORT if short is None else short) + 1)
+        self.long_alpha = 2.0 / ((EGRESS_RTT_LONG if long is None else long) + 1)
+        self.smoothing = smoothing
+        self.short_rtt = self.long_rtt = None
+        self.last_drop = -math.inf
+
+    def on_sample(self, rtt, inflight, overloaded, now):
+        if overloaded:
+            # Once per RTT: a burst of failures from one overload counts once
+            if now - self.last_drop >= max(rtt, 0.001):
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self.last_drop = now
+            return self.limit
+        if self.short_rtt is None:
+            self.short_rtt = self.long_rtt = rtt
+        self.short_rtt += self.short_alpha * (rtt - self.short_rtt)
+        self.long_rtt += self.long_alpha * (rtt - self.long_rtt)
+        if self.long_rtt > 2 * self.short_rtt:
+            self.long_rtt *= 0.95       # latency fell a lot: let the baseline follow
+        if inflight < self.limit / 2:
+            return self.limit           # not using the limit: latency says nothing about it
+        gradient = max(0.5, min(1.0, self.tolerance * self.long_rtt / self.short_rtt)) if self.short_rtt > 0 else 1.0
+        target = self.limit * gradient + math.sqrt(self.limit)
+        self.limit = min(self.max_limit, max(self.min_limit,
+                                              (1 - self.smoothing) * self.limit + self.smoothing * target))
+        return self.limit
+
+
+class EgressControl:
+    """Branch buckets, device Retry-After pauses, the adaptive limit and the pose pacer"""
+
+    def __init__(self, branch_rate=None, branch_burst=None, spread=None, headroom=None, spread_window_s=None,
+                 limit=None, now=time.monotonic):
+        self.branch_rate = EGRESS_BRANCH_RATE if branch_rate is None else branch_rate
+        self.branch_burst = EGRESS_BRANCH_BURST if branch_burst is None else branch_burst
+        self.spread = EGRESS_SPREAD if spread is None else spread
+        self.headroom = EGRESS_SPREAD_HEADROOM if headroom is None else headroom
+        self.spread_window_s = EGRESS_SPREAD_WINDOW_S if spread_window_s is None else spread_window_s
+        self.limit = limit or AdaptiveLimit()
+        self.now = now
+        self.branches = {}
+        self.paused = {}                # device -> monotonic time it may send again
+        self.spacing = {}               # throttled device -> seconds between its POSTs
+        self.pacer = TokenBucket(0.0, 1.0, now())
+        self.arrivals = 0
+        self.window_start = now()
+        self.arrival_rate = 0.0
+        self.throttled = metrics.counter("bridge_egress_throttled_total",
+                                         "429/503 responses, by branch", ("branch",))
+        self.limit_gauge = metrics.gauge("bridge_egress_concurrency_limit", "Adaptive limit on POSTs in flight")
+        self.pace_gauge = metrics.gauge("bridge_egress_pace_per_second", "Pose samples per second after spreading")
+        self.limit_gauge.set(round(self.limit.limit, 2))
+
+    def _bucket(self, branch):
+        bucket = self.branches.get(branch)
+        if bucket is None:
+            bucket = self.branches[branch] = TokenBucket(self.branch_rate, self.branch_burst, self.now())
+        return bucket
+
+    def arrived(self, now):
+        """Count a submitted sample toward the arrival rate the pacer follows"""
+        if not self.arrivals:
+            self.window_start = now     # windows start at an arrival, not after idle time
+        self.arrivals += 1
+        elapsed = now - self.window_start
+        if elapsed >= self.spread_window_s:
+            rate = self.arrivals / elapsed
+            self.arrival_rate = rate if not self.arrival_rate else 0.5 * (self.arrival_rate + rate)
+            self.arrivals = 0
+            self.window_start = now
+            if self.spread:
+                self.pacer.rate = self.arrival_rate * self.headroom
+                self.pace_gauge.set(round(self.pacer.rate, 2))
+
+    def pace_delay(self, now, backlog):
+        """Seconds until the next pose may go; no pacing once the backlog is behind the pace"""
+        if self.pacer.rate <= 0 or backlog > self.pacer.rate * self.spread_window_s / 2:
+            return 0.0
+        return self.pacer.delay(now)
+
+    def delay(self, key, branch, now):
+        """Seconds until key may send: its Retry-After pause, then its branch's bucket"""
+        until = self.paused.get(key)
+        if until is not None:
+            if now < until:
+                return until - now
+            del self.paused[key]
+        return self._bucket(branch).delay(now)
+
+    def take(self, key, branch, paced, now):
+        self._bucket(branch).take()
+        if paced:
+            self.pacer.take()
+        spacing = self.spacing.get(key)
+        if spacing is not None:
+            self.paused[key] = now + spacing
+
+    def on_response(self, key, branch, status, retry_after, rtt, inflight, now):
+        """Feed one delivery back; True if the sample was throttled and should be retried"""
+        throttled = status in THROTTLED
+        if throttled:
+            wait = parse_retry_after(retry_after)
+            wait = EGRESS_RETRY_AFTER_S if wait is None else wait
+            self.paused[key] = max(self.paused.get(key, 0.0), now + wait)
+            self.spacing[key] = max(wait, self.spacing.get(key, 0.0) * 1.25)
+            self.throttled.labels(branch).inc()
+        elif key in self.spacing and status is not None and status < 300:
+            self.spacing[key] *= EGRESS_SPACING_DECAY
+            if self.spacing[key] < 0.01:
+                del self.spacing[key]
+        # A 429 is the device's quota, handled by its pause; latency, 5xx and timeouts drive the limit
+        overloaded = status is None or status >= 500
+        self.limit_gauge.set(round(self.limit.on_sample(rtt, inflight, overloaded, now), 2))
+        return throttled
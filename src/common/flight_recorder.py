@@ -0,0 +1,378 @@
+"""
+MQTT Flight Recorder
+
+Appends every received MQTT message (receive time, topic, QoS, retain flag,
+payload bytes) to rotating segment files under logs/recordings/, so the
+exact broker input can be inspected or replayed later
+(src/publisher/replay.py).
+
+Segment layout (<name>-YYYYMMDD-HHMMSS.rec):
+
+    block*   := BLOCK_HEADER | compressed(record*)
+    record   := RECORD_HEADER | topic bytes | payload bytes
+
+Each block is compressed on its own (zstd when the `zstandard` package is
+installed, gzip otherwise), so a reader only decompresses the blocks it needs
+and a crash loses at most the block being written. Next to every segment a
+.idx file holds one fixed-size entry per block (first/last receive time and
+file offset): seeking to any minute is a bisect over the index, O(log n).
+A missing or short .idx is rebuilt by walking the block headers.
+
+record() only appends to a bounded queue; batching, compression and file I/O
+happen on a background thread. When the queue is full messages are dropped
+and counted, never blocking the MQTT loop.
+
+Usage:
+    from src.common.flight_recorder import FlightRecorder
+
+    recorder = FlightRecorder("bridge_old_plant").start()
+    recorder.record(msg.topic, msg.payload, msg.qos, msg.retain, received_at)
+
+    for rec in iter_records("logs/recordings", start_s, end_s):
+        rec.ts_us, rec.topic, rec.payload
+"""
+import bisect
+import gzip
+import os
+import queue
+import struct
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip is always available
+    zstandard = None
+
+DEFAULT_RECORDINGS_DIR = Path(__file__).parent.parent.parent / "logs" / "recordings"
+
+FLIGHT_RECORDER_ENABLED = os.getenv("FLIGHT_RECORDER_ENABLED", "true").lower() == "true"
+FLIGHT_RECORDER_DIR = os.getenv("FLIGHT_RECORDER_DIR", str(DEFAULT_RECORDINGS_DIR))
+FLIGHT_RECORDER_CODEC = os.getenv("FLIGHT_RECORDER_CODEC", "auto")  # auto | zstd | gzip
+FLIGHT_RECORDER_BLOCK_KB = int(os.getenv("FLIGHT_RECORDER_BLOCK_KB", "256"))
+FLIGHT_RECORDER_FLUSH_MS = int(os.getenv("FLIGHT_RECORDER_FLUSH_MS", "1000"))
+FLIGHT_RECORDER_SEGMENT_MB = int(os.getenv("FLIGHT_RECORDER_SEGMENT_MB", "64"))
+FLIGHT_RECORDER_SEGMENT_MINUTES = int(os.getenv("FLIGHT_RECORDER_SEGMENT_MINUTES", "60"))
+FLIGHT_RECORDER_KEEP_HOURS = int(os.getenv("FLIGHT_RECORDER_KEEP_HOURS", "72"))
+FLIGHT_RECORDER_QUEUE_SIZE = int(os.getenv("FLIGHT_RECORDER_QUEUE_SIZE", "100000"))
+
+CODEC_GZIP = 0
+CODEC_ZSTD = 1
+
+# magic, codec, compressed length, record count, first/last receive time (us)
+BLOCK_HEADER = struct.Struct("<4sBIIqq")
+BLOCK_MAGIC = b"FRB1"
+# receive time (us), qos, retain, topic length, payload length
+RECORD_HEADER = struct.Struct("<qBBHI")
+# first/last receive time (us), block offset
+INDEX_ENTRY = struct.Struct("<qqQ")
+
+SEGMENT_SUFFIX = ".rec"
+INDEX_SUFFIX = ".idx"
+
+Record = namedtuple("Record", "ts_us topic qos retain payload")
+
+_STOP = object()
+
+
+def _codec(name):
+    if name == "zstd" or (name == "auto" and zstandard is not None):
+        if zstandard is None:
+            raise RuntimeError("FLIGHT_RECORDER_CODEC=zstd requires: pip install zstandard")
+        return CODEC_ZSTD
+    return CODEC_GZIP
+
+
+def _compress(codec, data):
+    if codec == CODEC_ZSTD:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=1, mtime=0)
+
+
+def _decompress(codec, data):
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Segment is zstd-compressed; pip install zstandard to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def encode_records(records):
+    """Pack (ts_us, topic, qos, retain, payload) tuples into one uncompressed block body"""
+    parts = []
+    for ts_us, topic, qos, retain, payload in records:
+        topic_b = topic.encode("utf-8") if isinstance(topic, str) else topic
+        parts.append(RECORD_HEADER.pack(ts_us, qos, 1 if retain else 0, len(topic_b), len(payload)))
+        parts.append(topic_b)
+        parts.append(payload)
+    return b"".join(parts)
+
+
+def decode_records(body):
+    """Unpack a block body into Record tuples"""
+    records = []
+    pos, end = 0, len(body)
+    size = RECORD_HEADER.size
+    while pos < end:
+        ts_us, qos, retain, topic_len, payload_len = RECORD_HEADER.unpack_from(body, pos)
+        pos += size
+        topic = body[pos:pos + topic_len].decode("utf-8")
+        pos += topic_len
+        records.append(Record(ts_us, topic, qos, bool(retain), body[pos:pos + payload_len]))
+        pos += payload_len
+    return records
+
+
+class SegmentWriter:
+    """Appends compressed blocks to one segment file and its index"""
+
+    def __init__(self, path, codec):
+        self.path = Path(path)
+        self.codec = codec
+        self.data = open(self.path, "ab")
+        self.index = open(self.path.with_suffix(INDEX_SUFFIX), "ab")
+        self.size = self.data.tell()
+        self.opened_at = time.time()
+
+    def write_block(self, records):
+        body = _compress(self.codec, encode_records(records))
+        offset = self.size
+        first, last = records[0][0], records[-1][0]
+        self.data.write(BLOCK_HEADER.pack(BLOCK_MAGIC, self.codec, len(body), len(records), first, last))
+        self.data.write(body)
+        self.data.flush()
+        # Index entry only after its block is fully written
+        self.index.write(INDEX_ENTRY.pack(first, last, offset))
+        self.index.flush()
+        self.size += BLOCK_HEADER.size + len(body)
+        return len(body)
+
+    def close(self):
+        self.data.close()
+        self.index.close()
+
+
+class SegmentReader:
+    """Random access to one segment through its sparse time index"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.entries = self._load_index()
+        self.starts = [e[0] for e in self.entries]
+
+    def _load_index(self):
+        idx_path = self.path.with_suffix(INDEX_SUFFIX)
+        entries = []
+        if idx_path.exists():
+            raw = idx_path.read_bytes()
+            usable = len(raw) - len(raw) % INDEX_ENTRY.size
+            entries = [INDEX_ENTRY.unpack_from(raw, i) for i in range(0, usable, INDEX_ENTRY.size)]
+        # The index can trail the data after a crash; finish it from block headers
+        offset = entries[-1][2] if entries else 0
+        tail = self._scan(offset)
+        if entries and tail:
+            tail = tail[1:]  # first scanned block is the last indexed one
+        return entries + tail
+
+    def _scan(self, offset):
+        entries = []
+        size = self.path.stat().st_size
+        with open(self.path, "rb") as f:
+            while offset + BLOCK_HEADER.size <= size:
+                f.seek(offset)
+                magic, _, length, _, first, last = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+                if magic != BLOCK_MAGIC or offset + BLOCK_HEADER.size + length > size:
+                    break  # torn write at the end of the segment
+                entries.append((first, last, offset))
+                offset += BLOCK_HEADER.size + length
+        return entries
+
+    @property
+    def first_us(self):
+        return self.entries[0][0] if self.entries else None
+
+    @property
+    def last_us(self):
+        return max(e[1] for e in self.entries) if self.entries else None
+
+    def read_block(self, f, offset):
+        f.seek(offset)
+        _, codec, length, _, _, _ = BLOCK_HEADER.unpack(f.read(BLOCK_HEADER.size))
+        return decode_records(_decompress(codec, f.read(length)))
+
+    def records(self, start_us=None, end_us=None):
+        """Yield records with start_us <= ts_us < end_us (in file order)"""
+        first = 0
+        if start_us is not None:
+            # Blocks are time-ordered; start one block early in case it spans start_us
+            first = max(bisect.bisect_right(self.starts, start_us) - 1, 0)
+        with open(self.path, "rb") as f:
+            for block_first, block_last, offset in self.entries[first:]:
+                if end_us is not None and block_first >= end_us:
+                    return
+                if start_us is not None and block_last < start_us:
+                    continue
+                for rec in self.read_block(f, offset):
+                    if start_us is not None and rec.ts_us < start_us:
+                        continue
+                    if end_us is not None and rec.ts_us >= end_us:
+                        continue
+                    yield rec
+
+
+def list_segments(directory=None, name=None):
+    """Segment files in time order (optionally only one recorder's)"""
+    root = Path(directory or FLIGHT_RECORDER_DIR)
+    if not root.exists():
+        return []
+    pattern = f"{name}-*{SEGMENT_SUFFIX}" if name else f"*{SEGMENT_SUFFIX}"
+    return sorted(root.glob(pattern), key=lambda p: (p.name.rsplit("-", 2)[-2:], p.name))
+
+
+def iter_records(directory=None, start_s=None, end_s=None, name=None, topic=None):
+    """
+    Yield recorded messages in [start_s, end_s) (epoch seconds) across all
+    segments, skipping segments whose index does not overlap the window.
+    """
+    start_us = None if start_s is None else int(start_s * 1_000_000)
+    end_us = None if end_s is None else int(end_s * 1_000_000)
+    for path in list_segments(directory, name):
+        reader = SegmentReader(path)
+        if not reader.entries:
+            continue
+        if end_us is not None and reader.first_us >= end_us:
+            continue
+        if start_us is not None and reader.last_us < start_us:
+            continue
+        for rec in reader.records(start_us, end_us):
+            if topic is None or rec.topic == topic:
+                yield rec
+
+
+class FlightRecorder:
+    """Background recorder for raw MQTT messages; one instance per process"""
+
+    def __init__(self, name, directory=None, codec=None, block_kb=None, flush_ms=None,
+                 segment_mb=None, segment_minutes=None, keep_hours=None, queue_size=None):
+        self.name = name
+        self.directory = Path(directory or FLIGHT_RECORDER_DIR)
+        self.codec = _codec(codec or FLIGHT_RECORDER_CODEC)
+        self.block_bytes = (block_kb or FLIGHT_RECORDER_BLOCK_KB) * 1024
+        self.flush_interval = (flush_ms or FLIGHT_RECORDER_FLUSH_MS) / 1000.0
+        self.segment_bytes = (segment_mb or FLIGHT_RECORDER_SEGMENT_MB) * 1024 * 1024
+        self.segment_seconds = (segment_minutes or FLIGHT_RECORDER_SEGMENT_MINUTES) * 60
+        self.keep_seconds = (FLIGHT_RECORDER_KEEP_HOURS if keep_hours is None else keep_hours) * 3600
+        self.queue = queue.Queue(maxsize=queue_size or FLIGHT_RECORDER_QUEUE_SIZE)
+        self.thread = None
+        self.segment = None
+        self.stats = {"recorded": 0, "dropped": 0, "blocks": 0, "bytes_in": 0, "bytes_out": 0,
+                      "segments": 0, "errors": 0}
+        self._last_drop_report = 0
+
+    def start(self):
+        """Start the writer thread (no-op if already running)"""
+        if self.thread and self.thread.is_alive():
+            return self
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name="flight-recorder", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Flush buffered messages, close the segment and stop the thread"""
+        if not self.thread:
+            return
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self.thread.join(timeout)
+        self.thread = None
+
+    def record(self, topic, payload, qos=0, retain=False, received_at=None):
+        """Queue one message. Never blocks; returns False if it was dropped."""
+        ts = received_at if received_at is not None else time.time()
+        try:
+            self.queue.put_nowait((int(ts * 1_000_000), topic, qos, retain, bytes(payload)))
+        except queue.Full:
+            self.stats["dropped"] += 1
+            return False
+        return True
+
+    def _drain(self):
+        """Collect messages until the block is full or the flush window ends"""
+        first = self.queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        size = len(first[4]) + len(first[1])
+        deadline = time.monotonic() + self.flush_interval
+        while size < self.block_bytes:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+            size += len(item[4]) + len(item[1])
+        return batch, False
+
+    def _run(self):
+        try:
+            stopping = False
+            while not stopping:
+                batch, stopping = self._drain()
+                if batch:
+                    self._write(batch)
+                self._report_drops()
+        finally:
+            if self.segment:
+                self.segment.close()
+                self.segment = None
+
+    def _segment_for(self, ts_us):
+        seg = self.segment
+        if seg and (seg.size >= self.segment_bytes or time.time() - seg.opened_at >= self.segment_seconds):
+            seg.close()
+            seg = self.segment = None
+        if seg is None:
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.gmtime(ts_us / 1_000_000))
+            path = self.directory / f"{self.name}-{stamp}{SEGMENT_SUFFIX}"
+            seg = self.segment = SegmentWriter(path, self.codec)
+            self.stats["segments"] += 1
+            self._expire()
+        return seg
+
+    def _write(self, batch):
+        try:
+            seg = self._segment_for(batch[0][0])
+            self.stats["bytes_out"] += seg.write_block(batch)
+            self.stats["bytes_in"] += sum(len(r[4]) for r in batch)
+            self.stats["recorded"] += len(batch)
+            self.stats["blocks"] += 1
+        except OSError as e:
+            self.stats["errors"] += 1
+            print(f"WARN Flight recorder write failed ({len(batch)} messages): {e}")
+
+    def _expire(self):
+        """Delete this recorder's segments older than the retention window"""
+        if self.keep_seconds <= 0:
+            return
+        cutoff = time.time() - self.keep_seconds
+        for path in list_segments(self.directory, self.name):
+            if self.segment and path == self.segment.path:
+                continue
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+                path.with_suffix(INDEX_SUFFIX).unlink(missing_ok=True)
+
+    def _report_drops(self):
+        dropped = self.stats["dropped"]
+        if dropped != self._last_drop_report:
+            print(f"WARN Flight recorder queue full: {dropped - self._last_drop_report} messages dropped "
+                  f"(total {dropped})")
+            self._last_drop_report = dropped
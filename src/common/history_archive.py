@@ -0,0 +1,276 @@
+"""
+Columnar History Archive for ATI Telemetry
+
+Rolls closed (UTC) days out of logs/ati_data.db into per-device columnar
+segments, one .npy file per column:
+
+    logs/archive/<device>/<YYYY-MM-DD>/ts_ms.npy       int64 epoch milliseconds
+                                       ati_x.npy       float64 (meters)
+                                       ati_y.npy       float64
+                                       ati_heading.npy float32 (radians, NaN if unknown)
+                                       twinzo_x.npy    float64
+                                       twinzo_y.npy    float64
+                                       battery.npy     float32 (NaN if unknown)
+                                       posted.npy      uint8
+    logs/archive/<YYYY-MM-DD>_COMPLETE          the day is archived for every device
+
+Readers memory-map the segments (np.load(mmap_mode='r')) and slice them with
+searchsorted, so loading weeks of history is a handful of page-ins instead of
+a fetchall() plus one datetime.fromisoformat() per row. Rows for days that are
+not archived yet (normally just today) are read from SQLite with the epoch
+conversion done in SQL.
+
+Usage:
+    from src.common.history_archive import roll_closed_days, load_history
+
+    roll_closed_days("logs/ati_data.db")
+    data = load_history("logs/ati_data.db", "tug-55-tvsmotor-hosur-09", start_ms)
+    data["ts_ms"], data["ati_x"], data["ati_y"], ...
+"""
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+
+from src.common import partitions
+from src.common.telemetry import EPOCH_MS_SQL
+
+DEFAULT_ARCHIVE_DIR = Path(__file__).parent.parent.parent / "logs" / "archive"
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", str(DEFAULT_ARCHIVE_DIR))
+
+COLUMNS = {
+    "ts_ms": np.int64,
+    "ati_x": np.float64,
+    "ati_y": np.float64,
+    "ati_heading": np.float32,
+    "twinzo_x": np.float64,
+    "twinzo_y": np.float64,
+    "battery": np.float32,
+    "posted": np.uint8,
+}
+
+SELECT_COLUMNS_SQL = f"""
+    SELECT {EPOCH_MS_SQL}, ati_x, ati_y, ati_heading, twinzo_x, twinzo_y,
+           battery_status, posted_to_api
+    FROM ati_messages
+"""
+
+DONE_MARKER = "_COMPLETE"
+DAY_MS = 86400 * 1000
+
+
+def _device_dir(archive_dir, device_name):
+    # Sherpa names are plain ASCII; keep them readable on disk
+    return Path(archive_dir) / device_name.replace("/", "_").replace("\\", "_")
+
+
+def _day_start_ms(day):
+    return int(datetime(day.year, day.month, day.day, tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _rows_to_columns(rows):
+    """Convert SELECT_COLUMNS_SQL rows to typed column arrays (NULL -> NaN/0)"""
+    n = len(rows)
+    ts, ax, ay, ah, tx, ty, bat, posted = zip(*rows) if n else ([],) * 8
+    return {
+        "ts_ms": np.fromiter(ts, dtype=np.int64, count=n),
+        "ati_x": np.fromiter(ax, dtype=np.float64, count=n),
+        "ati_y": np.fromiter(ay, dtype=np.float64, count=n),
+        "ati_heading": np.array([np.nan if v is None else v for v in ah], dtype=np.float32),
+        "twinzo_x": np.fromiter(tx, dtype=np.float64, count=n),
+        "twinzo_y": np.fromiter(ty, dtype=np.float64, count=n),
+        "battery": np.array([np.nan if v is None else v for v in bat], dtype=np.float32),
+        "posted": np.array([1 if v else 0 for v in posted], dtype=np.uint8),
+    }
+
+
+def _day_marker(archive_dir, day):
+    return Path(archive_dir) / f"{day.isoformat()}{DONE_MARKER}"
+
+
+def archived_days(archive_dir=None):
+    """Return the set of days (date objects) archived for every device
+
+    The day marker is written only after the last device's segment, so a roll
+    that stopped partway through a day leaves it unarchived and it is redone."""
+    root = Path(archive_dir or ARCHIVE_DIR)
+    days = set()
+    if not root.exists():
+        return days
+    for marker in root.glob(f"*{DONE_MARKER}"):
+        if marker.is_file():
+            days.add(datetime.strptime(marker.name[:-len(DONE_MARKER)], "%Y-%m-%d").date())
+    return days
+
+
+def write_segment(archive_dir, device_name, day, columns):
+    """Write one device/day segment atomically (temp dir + rename)"""
+    final_dir = _device_dir(archive_dir, device_name) / day.isoformat()
+    tmp_dir = final_dir.with_name(final_dir.name + ".tmp")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    order = np.argsort(columns["ts_ms"], kind="stable")
+    for name, dtype in COLUMNS.items():
+        np.save(tmp_dir / f"{name}.npy", np.ascontiguousarray(columns[name][order], dtype=dtype))
+    (tmp_dir / DONE_MARKER).write_text(str(len(order)))
+
+    if final_dir.exists():
+        shutil.rmtree(final_dir)
+    os.replace(tmp_dir, final_dir)
+    return len(order)
+
+
+def roll_closed_days(db_path, archive_dir=None, before=None):
+    """
+    Archive every closed UTC day found in ati_messages that is not archived yet.
+
+    A day is closed once it is before `before` (default: today, UTC).
+    Returns {day: rows_archived}.
+    """
+    archive_dir = archive_dir or ARCHIVE_DIR
+    before = before or datetime.now(timezone.utc).date()
+    done = archived_days(archive_dir)
+
+    conn = sqlite3.connect(str(db_path))
+    try:
+        # Day partitions name their day; only the legacy table needs a scan
+        tables = partitions.list_partitions(conn)
+        sources = {partitions.partition_day(t): t for t in tables if partitions.partition_day(t)}
+        if partitions.LEGACY_TABLE in tables:
+            for r in conn.execute(f"SELECT DISTINCT date(timestamp) FROM {partitions.LEGACY_TABLE}"):
+                if r[0]:
+                    sources.setdefault(datetime.strptime(r[0], "%Y-%m-%d").date(), partitions.VIEW)
+
+        result = {}
+        for day in sorted(d for d in sources if d < before and d not in done):
+            source = sources[day]
+            lo = day.isoformat()
+            hi = (day + timedelta(days=1)).isoformat()
+            devices = [r[0] for r in conn.execute(
+                f"SELECT DISTINCT device_name FROM {source} WHERE timestamp >= ? AND timestamp < ?",
+                (lo, hi))]
+            total = 0
+            for device in devices:
+                rows = conn.execute(
+                    SELECT_COLUMNS_SQL.replace("FROM ati_messages", f"FROM {source}")
+                    + " WHERE device_name = ? AND timestamp >= ? AND timestamp < ?",
+                    (device, lo, hi)).fetchall()
+                total += write_segment(archive_dir, device, day, _rows_to_columns(rows))
+            _day_marker(archive_dir, day).write_text(str(total))
+            if total:
+                result[day] = total
+        return result
+    finally:
+        conn.close()
+
+
+def load_segment(segment_dir, columns=None):
+    """Memory-map one segment; returns {column: np.memmap}"""
+    names = columns or list(COLUMNS)
+    if "ts_ms" not in names:
+        names = ["ts_ms"] + list(names)
+    return {name: np.load(Path(segment_dir) / f"{name}.npy", mmap_mode="r") for name in names}
+
+
+def load_archive(device_name, start_ms=None, end_ms=None, columns=None, archive_dir=None, days=None):
+    """
+    Load archived columns for one device in [start_ms, end_ms).
+
+    Only days in `days` (default: archived_days()) are read. Single-segment
+    results are memory-mapped views; multi-day results are concatenated once.
+    """
+    archive_dir = archive_dir or ARCHIVE_DIR
+    days = archived_days(archive_dir) if days is None else days
+    device_dir = _device_dir(archive_dir, device_name)
+    names = list(columns or COLUMNS)
+    if "ts_ms" not in names:
+        names.insert(0, "ts_ms")
+
+    parts = []
+    if device_dir.exists():
+        for seg in sorted(device_dir.iterdir()):
+            if seg.suffix == ".tmp" or not (seg / DONE_MARKER).exists():
+                continue
+            day = datetime.strptime(seg.name, "%Y-%m-%d").date()
+            if day not in days:
+                continue          # day not finished for every device: SQLite still has it
+            day_ms = _day_start_ms(day)
+            if start_ms is not None and day_ms + DAY_MS <= start_ms:
+                continue
+            if end_ms is not None and day_ms >= end_ms:
+                break
+            data = load_segment(seg, names)
+            ts = data["ts_ms"]
+            lo = 0 if start_ms is None else int(np.searchsorted(ts, start_ms, "left"))
+            hi = len(ts) if end_ms is None else int(np.searchsorted(ts, end_ms, "left"))
+            if hi > lo:
+                parts.append({name: arr[lo:hi] for name, arr in data.items()})
+
+    if not parts:
+        return {name: np.empty(0, dtype=COLUMNS[name]) for name in names}
+    if len(parts) == 1:
+        return parts[0]
+    return {name: np.concatenate([p[name] for p in parts]) for name in names}
+
+
+def load_from_db(conn, device_name, start_ms=None, end_ms=None):
+    """Load rows from SQLite as column arrays (epoch conversion done in SQL)"""
+    sql = SELECT_COLUMNS_SQL + " WHERE device_name = ?"
+    params = [device_name]
+    if start_ms is not None:
+        sql += " AND timestamp >= ?"
+        params.append(_ms_to_sqlite(start_ms))
+    if end_ms is not None:
+        sql += " AND timestamp < ?"
+        params.append(_ms_to_sqlite(end_ms))
+    sql += " ORDER BY timestamp ASC"
+    return _rows_to_columns(conn.execute(sql, params).fetchall())
+
+
+def _ms_to_sqlite(ms):
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ms / 1000.0))
+
+
+def load_history(db_path, device_name, start_ms=None, end_ms=None, archive_dir=None):
+    """
+    Load a device's history as NumPy columns: archived days from memory-mapped
+    segments, everything after the last archived day from SQLite.
+    """
+    archive_dir = archive_dir or ARCHIVE_DIR
+    # Days are rolled in order and a failed roll stops at its day, so archived days never follow a gap
+    days = archived_days(archive_dir)
+    archived = load_archive(device_name, start_ms, end_ms, archive_dir=archive_dir, days=days)
+
+    live_start = start_ms
+    if days:
+        archived_until = _day_start_ms(max(days)) + DAY_MS
+        live_start = archived_until if start_ms is None else max(start_ms, archived_until)
+
+    live = {name: np.empty(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+    if end_ms is None or live_start is None or live_start < end_ms:
+        if Path(db_path).exists():
+            conn = sqlite3.connect(str(db_path))
+            try:
+                live = load_from_db(conn, device_name, live_start, end_ms)
+            finally:
+                conn.close()
+
+    if not len(live["ts_ms"]):
+        return archived
+    if not len(archived["ts_ms"]):
+        return live
+    return {name: np.concatenate([archived[name], live[name]]) for name in COLUMNS}
+
+
+def list_devices(archive_dir=None):
+    """Devices that have at least one archived segment"""
+    root = Path(archive_dir or ARCHIVE_DIR)
+    if not root.exists():
+        return []
+    return sorted(p.name for p in root.iterdir() if p.is_dir())
@@ -0,0 +1,167 @@
+/**
+ * Structured, sampled, buffered logging for the Node bridges
+ * (same record format as src/common/bridge_log.py)
+ *
+ * Each call produces one JSON line:
+ *   {"ts":"2025-01-15T06:30:00.123Z","level":"INFO","logger":"audit_feed","cat":"pose","msg":"...",...}
+ *
+ * Records are serialized into an in-memory buffer and written in one
+ * stream write per event-loop turn (setImmediate), so the message handler
+ * never does a synchronous stdout write per line. When the buffer is full
+ * records are dropped and counted. Disabled levels return after one
+ * comparison; per-category sampling keeps high-rate categories cheap.
+ *
+ * Configuration (environment):
+ *   LOG_LEVEL=INFO           DEBUG | INFO | WARN | ERROR
+ *   LOG_FORMAT=json          json | text
+ *   LOG_FILE=                append to a file instead of stdout
+ *   LOG_SAMPLE=pose=0.1      per-category sample rates (default 1.0)
+ *   LOG_QUEUE_SIZE=10000     max buffered records
+ *
+ * Runtime: kill -USR2 <pid> toggles between LOG_LEVEL and DEBUG
+ * (SIGUSR1 is reserved by Node for the inspector).
+ */
+
+import fs from 'fs';
+
+const LEVELS = { DEBUG: 10, INFO: 20, WARN: 30, ERROR: 40 };
+const LEVEL_NAMES = { 10: 'DEBUG', 20: 'INFO', 30: 'WARN', 40: 'ERROR' };
+const TEXT_PREFIX = { 10: 'DEBUG', 20: 'OK', 30: 'WARN', 40: 'FAIL' };
+
+function parseLevel(name) {
+    return LEVELS[String(name || 'INFO').toUpperCase()] ?? LEVELS.INFO;
+}
+
+function parseSampleRates(spec) {
+    const rates = {};
+    for (const part of (spec || '').split(',')) {
+        const [category, rate] = part.split('=');
+        if (rate !== undefined) {
+            rates[category.trim()] = parseFloat(rate);
+        }
+    }
+    return rates;
+}
+
+const config = {
+    baseLevel: parseLevel(process.env.LOG_LEVEL),
+    level: parseLevel(process.env.LOG_LEVEL),
+    format: (process.env.LOG_FORMAT || 'json').toLowerCase(),
+    rates: parseSampleRates(process.env.LOG_SAMPLE),
+    counters: {},
+    maxBuffered: parseInt(process.env.LOG_QUEUE_SIZE || '10000', 10)
+};
+
+const output = process.env.LOG_FILE
+    ? fs.createWriteStream(process.env.LOG_FILE, { flags: 'a' })
+    : process.stdout;
+
+let buffer = [];
+let flushScheduled = false;
+let dropped = 0;
+
+function flush() {
+    flushScheduled = false;
+    if (buffer.length === 0) {
+        return;
+    }
+    const chunk = buffer.join('\n') + '\n';
+    buffer = [];
+    output.write(chunk);
+}
+
+function sample(category) {
+    const rate = config.rates[category];
+    if (rate === undefined || rate >= 1) {
+        return true;
+    }
+    if (rate <= 0) {
+        return false;
+    }
+    // Deterministic 1-in-N, evenly spaced records
+    const every = Math.round(1 / rate);
+    const n = config.counters[category] || 0;
+    config.counters[category] = n + 1;
+    return n % every === 0;
+}
+
+function formatText(level, category, msg, fields) {
+    const extras = Object.entries(fields)
+        .map(([k, v]) => `${k}=${typeof v === 'object' ? JSON.stringify(v) : v}`)
+        .join(' ');
+    return `${TEXT_PREFIX[level]} ${msg}${extras ? ` (${extras})` : ''}`;
+}
+
+function emit(name, level, category, msg, fields) {
+    if (level < config.level || !sample(category)) {
+        return false;
+    }
+    if (buffer.length >= config.maxBuffered) {
+        dropped++;
+        return false;
+    }
+    const line = config.format === 'text'
+        ? formatText(level, category, msg, fields)
+        : JSON.stringify({
+            ts: new Date().toISOString(),
+            level: LEVEL_NAMES[level],
+            logger: name,
+            cat: category,
+            msg,
+            ...fields
+        });
+    buffer.push(line);
+    if (!flushScheduled) {
+        flushScheduled = true;
+        setImmediate(flush);
+    }
+    return true;
+}
+
+/**
+ * Logger for one component: log.info('post', 'Posted to Twinzo', { device, status })
+ */
+function getLogger(name) {
+    return {
+        enabled: (level, category) =>
+            parseLevel(level) >= config.level && (category === undefined || (config.rates[category] ?? 1) > 0),
+        debug: (category, msg, fields = {}) => emit(name, LEVELS.DEBUG, category, msg, fields),
+        info: (category, msg, fields = {}) => emit(name, LEVELS.INFO, category, msg, fields),
+        warn: (category, msg, fields = {}) => emit(name, LEVELS.WARN, category, msg, fields),
+        error: (category, msg, fields = {}) => emit(name, LEVELS.ERROR, category, msg, fields)
+    };
+}
+
+function setLevel(level) {
+    config.level = parseLevel(level);
+}
+
+function setSampleRate(category, rate) {
+    config.rates[category] = rate;
+}
+
+function droppedCount() {
+    return dropped;
+}
+
+function bufferedCount() {
+    return buffer.length;
+}
+
+process.on('SIGUSR2', () => {
+    config.level = config.level === LEVELS.DEBUG ? config.baseLevel : LEVELS.DEBUG;
+    flush();
+    process.stdout.write(`Log level now ${LEVEL_NAMES[config.level]} (SIGUSR2 toggles DEBUG)\n`);
+});
+
+// Write out whatever is buffered before the process exits
+process.on('exit', flush);
+
+export {
+    getLogger,
+    setLevel,
+    setSampleRate,
+    droppedCount,
+    bufferedCount,
+    flush
+};
@@ -0,0 +1,263 @@
+/**
+ * Prometheus-style metrics for the Node bridges
+ * (same metric names and text format as src/common/metrics.py)
+ *
+ * Counters and pre-bucketed histograms are plain numbers and arrays updated
+ * in place on the event loop, so recording on every message costs a few
+ * property writes. Values that are cheaper to compute at scrape time (queue
+ * depths, per-device last-seen age) are registered as callbacks.
+ *
+ * Served as GET /metrics on ADMIN_HTTP_PORT (default 0 = off), bound to
+ * ADMIN_HTTP_HOST (default 127.0.0.1; use 0.0.0.0 inside Docker).
+ *
+ * Usage:
+ *   import { BridgeMetrics, startAdminServer } from '../common/metrics.js';
+ *   const metrics = new BridgeMetrics();
+ *   metrics.received.inc();
+ *   metrics.postSeconds.observe(seconds);
+ *   startAdminServer();
+ */
+
+import http from 'http';
+
+// Latency buckets in seconds, 0.5 ms .. 10 s
+const LATENCY_BUCKETS = [0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10];
+
+const registry = new Map();
+
+function escapeLabel(value) {
+    return String(value).replace(/\\/g, '\\\\').replace(/\n/g, '\\n').replace(/"/g, '\\"');
+}
+
+function labelText(names, values, extra) {
+    const parts = names.map((n, i) => `${n}="${escapeLabel(values[i])}"`);
+    if (extra) {
+        parts.push(extra);
+    }
+    return parts.length ? `{${parts.join(',')}}` : '';
+}
+
+function formatValue(v) {
+    if (v === Infinity) {
+        return '+Inf';
+    }
+    return String(v);
+}
+
+class Counter {
+    constructor(name, help, labelNames = []) {
+        this.name = name;
+        this.help = help;
+        this.kind = 'counter';
+        this.labelNames = labelNames;
+        this.value = 0;
+        this.children = new Map();
+        if (!labelNames.length) {
+            this.children.set('', { values: [], metric: this });
+        }
+    }
+
+    labels(...values) {
+        const key = values.join('\u0000');
+        let child = this.children.get(key);
+        if (!child) {
+            child = { values: values.map(String), metric: this.makeChild() };
+            this.children.set(key, child);
+        }
+        return child.metric;
+    }
+
+    makeChild() {
+        return new Counter(this.name, this.help);
+    }
+
+    inc(amount = 1) {
+        this.value += amount;
+    }
+
+    samples(labelNames, values) {
+        return [`${this.name}${labelText(labelNames, values)} ${formatValue(this.value)}`];
+    }
+
+    render() {
+        const lines = [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} ${this.kind}`];
+        for (const { values, metric } of this.children.values()) {
+            lines.push(...metric.samples(this.labelNames, values));
+        }
+        return lines;
+    }
+}
+
+class Histogram extends Counter {
+    constructor(name, help, labelNames = [], buckets = LATENCY_BUCKETS) {
+        super(name, help, labelNames);
+        this.kind = 'histogram';
+        this.bounds = [...buckets].sort((a, b) => a - b);
+        this.counts = new Array(this.bounds.length + 1).fill(0);
+        this.sum = 0;
+    }
+
+    makeChild() {
+        return new Histogram(this.name, this.help, [], this.bounds);
+    }
+
+    observe(value) {
+        // Linear scan: 15 buckets, cheaper than a binary search at this size
+        let i = 0;
+        const bounds = this.bounds;
+        while (i < bounds.length && value > bounds[i]) {
+            i++;
+        }
+        this.counts[i]++;
+        this.sum += value;
+    }
+
+    samples(labelNames, values) {
+        const lines = [];
+        let cumulative = 0;
+        const bounds = [...this.bounds, Infinity];
+        for (let i = 0; i < bounds.length; i++) {
+            cumulative += this.counts[i];
+            lines.push(`${this.name}_bucket${labelText(labelNames, values, `le="${formatValue(bounds[i])}"`)} ${cumulative}`);
+        }
+        lines.push(`${this.name}_sum${labelText(labelNames, values)} ${this.sum}`);
+        lines.push(`${this.name}_count${labelText(labelNames, values)} ${cumulative}`);
+        return lines;
+    }
+}
+
+class GaugeCallback {
+    constructor(name, help, labelNames, fn) {
+        this.name = name;
+        this.help = help;
+        this.labelNames = labelNames;
+        this.fn = fn;
+    }
+
+    render() {
+        const lines = [`# HELP ${this.name} ${this.help}`, `# TYPE ${this.name} gauge`];
+        let samples;
+        try {
+            samples = this.fn();
+        } catch (error) {
+            return [...lines, `# ${this.name} callback failed: ${error.name}`];
+        }
+        for (const [values, value] of samples) {
+            lines.push(`${this.name}${labelText(this.labelNames, values)} ${formatValue(value)}`);
+        }
+        return lines;
+    }
+}
+
+function register(metric) {
+    const existing = registry.get(metric.name);
+    if (existing) {
+        return existing;
+    }
+    registry.set(metric.name, metric);
+    return metric;
+}
+
+function counter(name, help, labelNames = []) {
+    return register(new Counter(name, help, labelNames));
+}
+
+function histogram(name, help, labelNames = [], buckets = LATENCY_BUCKETS) {
+    return register(new Histogram(name, help, labelNames, buckets));
+}
+
+/** fn() -> array of [labelValues, value] pairs, evaluated at scrape time */
+function gaugeCallback(name, help, labelNames, fn) {
+    const metric = new GaugeCallback(name, help, labelNames, fn);
+    registry.set(name, metric);
+    return metric;
+}
+
+function render() {
+    const lines = [];
+    for (const name of [...registry.keys()].sort()) {
+        lines.push(...registry.get(name).render());
+    }
+    return lines.join('\n') + '\n';
+}
+
+/** The standard metric set every bridge updates per message */
+class BridgeMetrics {
+    constructor() {
+        this.received = counter('bridge_messages_received_total', 'MQTT messages received');
+        this.filtered = counter('bridge_messages_filtered_total', 'Messages not forwarded, by reason', ['reason']);
+        this.posted = counter('bridge_posts_ok_total', 'Localization POSTs accepted by Twinzo');
+        this.failed = counter('bridge_posts_failed_total', 'Localization POSTs that failed, by HTTP status or error', ['status']);
+        this.errors = counter('bridge_errors_total', 'Exceptions while handling a message');
+        this.tokenRefreshes = counter('bridge_token_refreshes_total', 'OAuth authentications, by result', ['result']);
+        this.parseSeconds = histogram('bridge_parse_seconds', 'JSON decode time per message');
+        this.transformSeconds = histogram('bridge_transform_seconds', 'Pose extraction + transform time');
+        this.authSeconds = histogram('bridge_auth_seconds', 'Credential lookup time (cache hit or OAuth)');
+        this.postSeconds = histogram('bridge_post_seconds', 'Localization POST round trip');
+        this.lastSeen = {};
+        gaugeCallback('bridge_device_last_seen_age_seconds', 'Seconds since the last message per device', ['device'],
+            () => {
+                const now = Date.now();
+                return Object.entries(this.lastSeen).map(([device, t]) => [[device], (now - t) / 1000]);
+            });
+        this.queues = {};
+        gaugeCallback('bridge_queue_depth', 'Items waiting in internal queues', ['queue'],
+            () => Object.entries(this.queues).map(([name, fn]) => [[name], fn()]));
+    }
+
+    filter(reason) {
+        this.filtered.labels(reason).inc();
+    }
+
+    fail(status) {
+        this.failed.labels(String(status)).inc();
+    }
+
+    /** Report depthFn() as bridge_queue_depth{queue=name} */
+    queue(name, depthFn) {
+        this.queues[name] = depthFn;
+    }
+}
+
+/** Seconds since a process.hrtime.bigint() start */
+function since(start) {
+    return Number(process.hrtime.bigint() - start) / 1e9;
+}
+
+let server = null;
+
+/** Serve GET /metrics if ADMIN_HTTP_PORT is set; returns the server or null. Idempotent. */
+function startAdminServer(port = parseInt(process.env.ADMIN_HTTP_PORT || '0', 10),
+                          host = process.env.ADMIN_HTTP_HOST || '127.0.0.1') {
+    if (server || !port) {
+        return server;
+    }
+    server = http.createServer((req, res) => {
+        const path = req.url.split('?')[0];
+        if (req.method === 'GET' && path === '/metrics') {
+            const body = render();
+            res.writeHead(200, { 'Content-Type': 'text/plain; version=0.0.4; charset=utf-8',
+                                 'Content-Length': Buffer.byteLength(body) });
+            res.end(body);
+            return;
+        }
+        res.writeHead(404, { 'Content-Type': 'text/plain' });
+        res.end('Not found. Routes: /metrics\n');
+    });
+    server.listen(port, host, () => {
+        console.log(`Admin HTTP: http://${host}:${server.address().port} (/metrics)`);
+    });
+    server.unref();
+    return server;
+}
+
+export {
+    BridgeMetrics,
+    LATENCY_BUCKETS,
+    counter,
+    histogram,
+    gaugeCallback,
+    render,
+    since,
+    startAdminServer
+};
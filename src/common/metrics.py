@@ -0,0 +1,341 @@
+"""
+Prometheus-Style Metrics for the Bridges
+
+Counters, gauges and pre-bucketed histograms that are cheap enough to
+update on every MQTT message, served in the Prometheus text format on the
+admin HTTP port (GET /metrics, see admin_http.py).
+
+Writers are the MQTT network thread and the egress workers (egress.py).
+Counters and histograms take no lock on update: each thread adds into its
+own cell (a threading.local list), so no two threads ever update the same
+value, and a scrape sums the cells. Gauges are set with a single store;
+their inc()/dec() take a lock. Histograms find their bucket with bisect
+and bump one slot of the thread's cell. Values that are cheaper to compute
+at scrape time (queue depths, per-device last-seen age) are registered as
+callbacks.
+
+Usage:
+    from src.common import metrics
+
+    RECEIVED = metrics.counter("bridge_messages_received_total", "MQTT messages received")
+    POST_SECONDS = metrics.histogram("bridge_post_seconds", "Localization POST latency")
+    FAILED = metrics.counter("bridge_posts_failed_total", "Failed POSTs", ("status",))
+
+    RECEIVED.inc()
+    POST_SECONDS.observe(elapsed)
+    FAILED.labels("429").inc()
+    metrics.gauge_callback("bridge_queue_depth", "Queued items", ("queue",),
+                           lambda: {("telemetry",): telemetry.queue.qsize()})
+
+    metrics.install()   # GET /metrics on the admin HTTP server
+"""
+import math
+import threading
+import time
+from bisect import bisect_left
+
+from src.common import admin_http
+
+# Latency buckets in seconds, 0.5 ms .. 10 s
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = {}
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Family:
+    """A metric name with optional labels; unlabelled families act as their own child"""
+
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.children = {}
+        if not self.labelnames:
+            self.children[()] = self
+
+    def labels(self, *values):
+        """Child for these label values (cache it in the caller for the hot path)"""
+        values = tuple(str(v) for v in values)
+        child = self.children.get(values)
+        if child is None:
+            # setdefault: two threads creating the same child end up sharing one
+            child = self.children.setdefault(values, self._child())
+        return child
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self.children.items()):
+            lines.extend(child._samples(self.name, self.labelnames, values))
+        return lines
+
+
+class _Cells:
+    """One list per writing thread; only its thread updates it, readers sum them"""
+
+    def __init__(self, size):
+        self.size = size
+        self.local = threading.local()
+        self.all = []
+        self.lock = threading.Lock()
+
+    def new(self):
+        cell = [0] * self.size
+        with self.lock:
+            self.all.append(cell)     # kept after the thread exits: its counts still count
+        self.local.cell = cell
+        return cell
+
+    def total(self, i):
+        return sum(cell[i] for cell in list(self.all))
+
+
+class Counter(_Family):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        self._cells = _Cells(1)
+        self._local = self._cells.local
+        super().__init__(name, help, labelnames)
+
+    def _child(self):
+        return Counter(self.name, self.help)
+
+    def inc(self, amount=1):
+        try:
+            self._local.cell[0] += amount
+        except AttributeError:
+            self._cells.new()[0] += amount
+
+    @property
+    def value(self):
+        return self._cells.total(0)
+
+    def _samples(self, name, labelnames, values):
+        return [f"{name}{_label_text(labelnames, values)} {_format_value(self.value)}"]
+
+
+class Gauge(_Family):
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=()):
+        self.value = 0
+        self._lock = threading.Lock()
+        super().__init__(name, help, labelnames)
+
+    def _child(self):
+        return Gauge(self.name, self.help)
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def _samples(self, name, labelnames, values):
+        return [f"{name}{_label_text(labelnames, values)} {_format_value(self.value)}"]
+
+
+class Histogram(_Family):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        # A cell is the bucket counts followed by the sum
+        self._cells = _Cells(len(self.bounds) + 2)
+        self._local = self._cells.local
+        super().__init__(name, help, labelnames)
+
+    def _child(self):
+        return Histogram(self.name, self.help, buckets=self.bounds)
+
+    def observe(self, value):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._cells.new()
+        cell[bisect_left(self.bounds, value)] += 1
+        cell[-1] += value
+
+    @property
+    def counts(self):
+        return [self._cells.total(i) for i in range(len(self.bounds) + 1)]
+
+    @property
+    def sum(self):
+        return float(self._cells.total(-1))
+
+    def time(self):
+        """Context manager observing the elapsed seconds of its block"""
+        return _Timer(self)
+
+    def _samples(self, name, labelnames, values):
+        counts = self.counts
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.bounds + (math.inf,), counts):
+            cumulative += n
+            le = 'le="' + _format_value(float(bound)) + '"'
+            lines.append(f"{name}_bucket{_label_text(labelnames, values, le)} {cumulative}")
+        lines.append(f"{name}_sum{_label_text(labelnames, values)} {_format_value(self.sum)}")
+        lines.append(f"{name}_count{_label_text(labelnames, values)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
+
+
+class GaugeCallback:
+    """Gauge family whose samples come from fn() -> {label_values_tuple: value} at scrape time"""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames, fn):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.fn = fn
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        try:
+            samples = self.fn()
+        except Exception as e:
+            return lines + [f"# {self.name} callback failed: {type(e).__name__}"]
+        for values, value in samples.items():
+            lines.append(f"{self.name}{_label_text(self.labelnames, values)} {_format_value(value)}")
+        return lines
+
+
+def _register(metric):
+    existing = _metrics.get(metric.name)
+    if existing is not None:
+        if type(existing) is not type(metric):
+            raise ValueError(f"Metric {metric.name} already registered as {existing.kind}")
+        return existing
+    _metrics[metric.name] = metric
+    return metric
+
+
+def counter(name, help, labelnames=()):
+    return _register(Counter(name, help, labelnames))
+
+
+def gauge(name, help, labelnames=()):
+    return _register(Gauge(name, help, labelnames))
+
+
+def histogram(name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+    return _register(Histogram(name, help, labelnames, buckets))
+
+
+def gauge_callback(name, help, labelnames, fn):
+    """Register fn as the source of a gauge family; a name can only have one callback"""
+    if name in _metrics:
+        raise ValueError(f"Metric {name} already registered")
+    metric = GaugeCallback(name, help, labelnames, fn)
+    _metrics[name] = metric
+    return metric
+
+
+def last_seen_gauge(name, help, last_seen, label="device"):
+    """Per-key age in seconds of a {key: unix_time} dict the bridge updates on every message"""
+    return gauge_callback(name, help, (label,),
+                          lambda: {(k,): round(time.time() - t, 3) for k, t in list(last_seen.items())})
+
+
+class BridgeMetrics:
+    """The standard metric set every bridge updates per message"""
+
+    def __init__(self):
+        self.received = counter("bridge_messages_received_total", "MQTT messages received")
+        self.filtered = counter("bridge_messages_filtered_total", "Messages not forwarded, by reason", ("reason",))
+        self.posted = counter("bridge_posts_ok_total", "Localization POSTs accepted by Twinzo")
+        self.failed = counter("bridge_posts_failed_total", "Localization POSTs that failed, by HTTP status or error",
+                              ("status",))
+        self.errors = counter("bridge_errors_total", "Exceptions while handling a message")
+        self.token_refreshes = counter("bridge_token_refreshes_total", "OAuth authentications, by result",
+                                       ("result",))
+        self.parse_seconds = histogram("bridge_parse_seconds", "JSON decode time per message")
+        self.transform_seconds = histogram("bridge_transform_seconds", "Pose extraction + transform time")
+        self.auth_seconds = histogram("bridge_auth_seconds", "Credential lookup time (cache hit or OAuth)")
+        self.post_seconds = histogram("bridge_post_seconds", "Localization POST round trip")
+        self.last_seen = {}
+        last_seen_gauge("bridge_device_last_seen_age_seconds", "Seconds since the last message per device",
+                        self.last_seen)
+        self._queues = {}
+        gauge_callback("bridge_queue_depth", "Items waiting in internal queues", ("queue",),
+                       lambda: {(name,): fn() for name, fn in list(self._queues.items())})
+        self._filtered = {}
+        self._failed = {}
+
+    def filter(self, reason):
+        child = self._filtered.get(reason)
+        if child is None:
+            child = self._filtered[reason] = self.filtered.labels(reason)
+        child.inc()
+
+    def fail(self, status):
+        child = self._failed.get(status)
+        if child is None:
+            child = self._failed[status] = self.failed.labels(status)
+        child.inc()
+
+    def queue(self, name, depth_fn):
+        """Report depth_fn() as bridge_queue_depth{queue=name}"""
+        self._queues[name] = depth_fn
+
+
+def render():
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for name in sorted(_metrics):
+        lines.extend(_metrics[name].render())
+    return "\n".join(lines) + "\n"
+
+
+def clear():
+    """Forget every metric (tests)"""
+    _metrics.clear()
+
+
+def install():
+    """Serve GET /metrics on the admin HTTP server"""
+    admin_http.route("/metrics", lambda query: (200, "text/plain; version=0.0.4; charset=utf-8", render()))
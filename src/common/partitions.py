@@ -0,0 +1,264 @@
+"""
+Day Partitions and Retention for ATI Telemetry
+
+Raw rows live in one table per UTC day (ati_messages_YYYYMMDD) inside
+logs/ati_data.db. `ati_messages` is a UNION ALL view over all partitions, so
+readers (visualize_ati_data.py, database.js queries, sqlite3 CLI) keep working
+unchanged. Writers insert directly into the partition for the row's day.
+
+Retention drops whole partitions instead of running
+DELETE ... WHERE timestamp < ?, so it never rewrites live pages or holds the
+write lock for long. Freed pages go to the freelist and are returned to the
+OS by PRAGMA incremental_vacuum in small steps (auto_vacuum = INCREMENTAL).
+
+A database created before partitioning keeps its old table as
+ati_messages_legacy (included in the view); it is dropped in one go once all
+of its rows are past retention.
+
+Usage:
+    from src.common import partitions
+
+    partitions.setup(conn)                       # on open, by every writer
+    partitions.drop_expired(conn, days_to_keep=30)
+    partitions.incremental_vacuum(conn)
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+PREFIX = "ati_messages_"
+LEGACY_TABLE = "ati_messages_legacy"
+VIEW = "ati_messages"
+
+# Automatic retention for long-running writers; 0 keeps everything
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+# Off-peak window for retention + vacuum (UTC hour); 21 UTC = 02:30 IST
+RETENTION_HOUR_UTC = int(os.getenv("RETENTION_HOUR_UTC", "21"))
+VACUUM_PAGES_PER_STEP = int(os.getenv("VACUUM_PAGES_PER_STEP", "256"))
+VACUUM_STEP_PAUSE_MS = int(os.getenv("VACUUM_STEP_PAUSE_MS", "50"))
+
+PARTITION_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        device_name TEXT NOT NULL,
+
+        -- ATI raw data
+        ati_x REAL NOT NULL,
+        ati_y REAL NOT NULL,
+        ati_heading REAL,
+
+        -- Transformed Twinzo data
+        twinzo_x REAL NOT NULL,
+        twinzo_y REAL NOT NULL,
+        twinzo_heading REAL,
+
+        -- Status data
+        battery_status INTEGER,
+        mode TEXT,
+
+        -- Metadata
+        posted_to_api BOOLEAN DEFAULT 0,
+        api_response TEXT,
+        error TEXT
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_{table}_device_ts ON {table}(device_name, timestamp);
+    CREATE INDEX IF NOT EXISTS idx_{table}_ts ON {table}(timestamp);
+"""
+
+
+def partition_name(day):
+    """Table name for a UTC date"""
+    return f"{PREFIX}{day:%Y%m%d}"
+
+
+def partition_day(table):
+    """UTC date of a partition table (None for the legacy table)"""
+    suffix = table[len(PREFIX):]
+    if len(suffix) != 8 or not suffix.isdigit():
+        return None
+    return datetime.strptime(suffix, "%Y%m%d").date()
+
+
+def utc_today():
+    return datetime.now(timezone.utc).date()
+
+
+def list_partitions(conn):
+    """All partition tables (legacy first, then by day)"""
+    tables = [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ?", (PREFIX + "%",))]
+    legacy = [t for t in tables if t == LEGACY_TABLE]
+    days = sorted(t for t in tables if partition_day(t))
+    return legacy + days
+
+
+def _rebuild_view(conn, tables):
+    conn.execute(f"DROP VIEW IF EXISTS {VIEW}")
+    union = "\n    UNION ALL\n    ".join(f"SELECT * FROM {t}" for t in tables)
+    conn.execute(f"CREATE VIEW {VIEW} AS\n    {union}")
+
+
+def _ddl(conn, fn):
+    """Run DDL atomically so readers never see the view missing"""
+    conn.execute("SAVEPOINT partition_ddl")
+    try:
+        fn()
+    except Exception:
+        conn.execute("ROLLBACK TO partition_ddl")
+        conn.execute("RELEASE partition_ddl")
+        raise
+    conn.execute("RELEASE partition_ddl")
+
+
+def ensure_partitions(conn, days):
+    """Create missing partitions for the given days and refresh the view"""
+    existing = set(list_partitions(conn))
+    missing = [d for d in days if partition_name(d) not in existing]
+    view = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (VIEW,)).fetchone()
+    if not missing and view and view[0] == "view":
+        return []
+
+    def create():
+        for day in missing:
+            for stmt in PARTITION_SCHEMA.format(table=partition_name(day)).split(";"):
+                if stmt.strip():
+                    conn.execute(stmt)
+        _rebuild_view(conn, list_partitions(conn))
+
+    _ddl(conn, create)
+    return [partition_name(d) for d in missing]
+
+
+def setup(conn):
+    """
+    Prepare a database for partitioned writes: move a pre-partitioning
+    ati_messages table aside and make sure today's and tomorrow's
+    partitions exist (so writers never create tables at midnight).
+    """
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (VIEW,)).fetchone()
+    if row and row[0] == "table":
+        def migrate():
+            conn.execute(f"ALTER TABLE {VIEW} RENAME TO {LEGACY_TABLE}")
+        _ddl(conn, migrate)
+        print(f"Database: moved existing {VIEW} table to {LEGACY_TABLE} (kept until past retention)")
+    today = utc_today()
+    ensure_partitions(conn, [today, today + timedelta(days=1)])
+
+
+def row_count(conn, table):
+    """Rows ever inserted into a partition, O(1) via the AUTOINCREMENT sequence"""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    return row[0] if row else 0
+
+
+def drop_expired(conn, days_to_keep, today=None):
+    """
+    Drop partitions entirely older than the retention window.
+    Returns (dropped_tables, rows_dropped).
+    """
+    cutoff = (today or utc_today()) - timedelta(days=days_to_keep)
+    tables = list_partitions(conn)
+
+    expired = [t for t in tables if partition_day(t) and partition_day(t) < cutoff]
+    if LEGACY_TABLE in tables:
+        newest = conn.execute(f"SELECT MAX(timestamp) FROM {LEGACY_TABLE}").fetchone()[0]
+        if newest is None or newest < cutoff.isoformat():
+            expired.insert(0, LEGACY_TABLE)
+    if not expired:
+        return [], 0
+
+    rows = sum(row_count(conn, t) for t in expired if t != LEGACY_TABLE)
+    if LEGACY_TABLE in expired:
+        rows += conn.execute(f"SELECT COUNT(*) FROM {LEGACY_TABLE}").fetchone()[0]
+
+    def drop():
+        keep = [t for t in tables if t not in expired]
+        if not keep:
+            keep = [partition_name(utc_today())]
+            for stmt in PARTITION_SCHEMA.format(table=keep[0]).split(";"):
+                if stmt.strip():
+                    conn.execute(stmt)
+        _rebuild_view(conn, keep)
+        for table in expired:
+            conn.execute(f"DROP TABLE {table}")
+        # Minute rollups follow raw retention; hour rollups are kept
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'ati_rollup_1m'").fetchone():
+            cutoff_s = int(datetime(cutoff.year, cutoff.month, cutoff.day, tzinfo=timezone.utc).timestamp())
+            conn.execute("DELETE FROM ati_rollup_1m WHERE bucket_start < ?", (cutoff_s,))
+
+    _ddl(conn, drop)
+    return expired, rows
+
+
+def incremental_vacuum(conn, pages_per_step=None, pause_ms=None, max_steps=None):
+    """
+    Return free pages to the OS in small steps so each step holds the write
+    lock only briefly. No-op unless the database uses auto_vacuum=INCREMENTAL.
+    Returns pages freed.
+    """
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    pages_per_step = pages_per_step or VACUUM_PAGES_PER_STEP
+    pause = (VACUUM_STEP_PAUSE_MS if pause_ms is None else pause_ms) / 1000.0
+    freed = steps = 0
+    while True:
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free == 0 or (max_steps is not None and steps >= max_steps):
+            return freed
+        conn.execute(f"PRAGMA incremental_vacuum({min(free, pages_per_step)})").fetchall()
+        freed += min(free, pages_per_step)
+        steps += 1
+        time.sleep(pause)
+
+
+class RetentionScheduler:
+    """
+    Background thread with its own connection: keeps tomorrow's partition
+    created ahead of time and, if RETENTION_DAYS > 0, drops expired
+    partitions and vacuums once a day in the off-peak hour.
+    """
+
+    def __init__(self, db_path, days_to_keep=None, hour_utc=None):
+        self.db_path = db_path
+        self.days_to_keep = RETENTION_DAYS if days_to_keep is None else days_to_keep
+        self.hour_utc = RETENTION_HOUR_UTC if hour_utc is None else hour_utc
+        self.last_run_day = None
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="telemetry-retention", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def _run(self):
+        from src.common.telemetry import open_db
+
+        conn = open_db(self.db_path)
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    self.tick(conn)
+                except Exception as e:
+                    print(f"WARN Retention run failed: {e}")
+                self.stop_event.wait(300)
+        finally:
+            conn.close()
+
+    def tick(self, conn, now=None):
+        now = now or datetime.now(timezone.utc)
+        today = now.date()
+        ensure_partitions(conn, [today, today + timedelta(days=1)])
+        if self.days_to_keep > 0 and now.hour == self.hour_utc and self.last_run_day != today:
+            self.last_run_day = today
+            dropped, rows = drop_expired(conn, self.days_to_keep, today)
+            if dropped:
+                freed = incremental_vacuum(conn)
+                print(f"OK Retention: dropped {len(dropped)} partition(s) ({rows} rows), "
+                      f"vacuumed {freed} pages")
@@ -0,0 +1,367 @@
+"""
+Runtime Profiling Hooks for the Bridges
+
+Three tools for finding where time goes inside paho's on_message, all safe
+to leave installed on a production bridge:
+
+    Stage timers      Wrap named functions (credential lookup, transform, the
+                      HTTP POST, telemetry/recorder calls) with timers, only
+                      while switched on. Off, the original functions are in
+                      place and cost nothing.
+                          curl 'localhost:$ADMIN_HTTP_PORT/debug/stages?enable=1'
+                          curl 'localhost:$ADMIN_HTTP_PORT/debug/stages'          count/mean/max per stage
+                          curl 'localhost:$ADMIN_HTTP_PORT/debug/stages?enable=0'
+
+    Slow callbacks    A watchdog thread checks the running MQTT callback every
+                      SLOW_CALLBACK_MS/4; once one has run longer than
+                      SLOW_CALLBACK_MS it prints that thread's stack (once per
+                      callback, at most one per SLOW_CALLBACK_COOLDOWN_S).
+
+    Sampling profile  A background thread samples every thread's stack at
+                      PROFILE_HZ for N seconds and writes collapsed stacks
+                      ("thread;file:func;file:func count"), the input format of
+                      flamegraph.pl, speedscope and inferno.
+                          kill -PROF <pid>                                        PROFILE_SECONDS
+                          curl 'localhost:$ADMIN_HTTP_PORT/debug/profile?seconds=20&hz=97'
+                          curl 'localhost:$ADMIN_HTTP_PORT/debug/stacks'          one snapshot, as text
+
+The profiler only reads frames (sys._current_frames), runs one profile at a
+time and caps duration at PROFILE_MAX_SECONDS, so the bridge keeps working
+while it is profiled.
+
+Usage:
+    from src.common import profiling
+
+    stages = profiling.StageTimers()
+    stages.add("credentials", globals(), "get_device_credentials")
+    stages.add("post", session, "post")
+    watchdog = profiling.Watchdog(stages=stages)
+
+    profiling.install(stages, watchdog)
+    client.on_message = watchdog.wrap(on_message)
+"""
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+
+from src.common import admin_http
+
+DEFAULT_PROFILE_DIR = Path(__file__).parent.parent.parent / "logs" / "profile"
+
+SLOW_CALLBACK_MS = float(os.getenv("SLOW_CALLBACK_MS", "1000"))  # 0 disables the watchdog
+SLOW_CALLBACK_COOLDOWN_S = float(os.getenv("SLOW_CALLBACK_COOLDOWN_S", "10"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", str(DEFAULT_PROFILE_DIR))
+PROFILE_HZ = float(os.getenv("PROFILE_HZ", "97"))  # off 100 so sampling does not lock step with 10 Hz work
+PROFILE_SECONDS = float(os.getenv("PROFILE_SECONDS", "30"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "300"))
+MAX_STACK_DEPTH = 128
+MAX_STACKS = 20000  # distinct stacks kept per profile; further ones are counted as [truncated]
+
+
+def _frame_label(code):
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def collapse(frame, thread_name):
+    """'thread;root_func;...;leaf_func' for one frame chain"""
+    labels = []
+    while frame is not None and len(labels) < MAX_STACK_DEPTH:
+        labels.append(_frame_label(frame.f_code))
+        frame = frame.f_back
+    labels.append(thread_name.replace(";", ":"))
+    return ";".join(reversed(labels))
+
+
+def _thread_names():
+    return {t.ident: t.name for t in threading.enumerate()}
+
+
+class StageTimers:
+    """Timers around named functions, patched in only while enabled"""
+
+    def __init__(self):
+        self.targets = []        # (stage, owner, attr, original, owned)
+        self.enabled = False
+        self.since = None
+        self.stats = {}          # stage -> [count, total_s, max_s]
+        self.lock = threading.Lock()
+
+    def add(self, stage, owner, attr):
+        """Time owner.attr (or owner[attr] for a module's globals()) as stage; None owners are skipped"""
+        if owner is not None:
+            original = owner[attr] if isinstance(owner, dict) else getattr(owner, attr)
+            # A method looked up on the class is shadowed while enabled and deleted again on disable
+            owned = isinstance(owner, dict) or attr in getattr(owner, "__dict__", {})
+            self.targets.append((stage, owner, attr, original, owned))
+        return self
+
+    def _set(self, owner, attr, value):
+        if isinstance(owner, dict):
+            owner[attr] = value
+        else:
+            setattr(owner, attr, value)
+
+    def _timed(self, stage, fn):
+        stats = self.stats.setdefault(stage, [0, 0.0, 0.0])
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            t0 = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                dt = perf_counter() - t0
+                stats[0] += 1
+                stats[1] += dt
+                if dt > stats[2]:
+                    stats[2] = dt
+        return timed
+
+    def observe(self, stage, seconds):
+        stats = self.stats.setdefault(stage, [0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += seconds
+        if seconds > stats[2]:
+            stats[2] = seconds
+
+    def enable(self):
+        with self.lock:
+            if not self.enabled:
+                for stage, owner, attr, original, owned in self.targets:
+                    self._set(owner, attr, self._timed(stage, original))
+                self.enabled = True
+                self.since = time.time()
+
+    def disable(self):
+        with self.lock:
+            if self.enabled:
+                for stage, owner, attr, original, owned in self.targets:
+                    if owned:
+                        self._set(owner, attr, original)
+                    else:
+                        delattr(owner, attr)
+                self.enabled = False
+
+    def reset(self):
+        with self.lock:
+            for stats in self.stats.values():
+                stats[:] = [0, 0.0, 0.0]
+            self.since = time.time() if self.enabled else None
+
+    def report(self):
+        """{stage: count, total_ms, mean_ms, max_ms}; 'callback' is the whole on_message"""
+        stages = {}
+        for stage, (count, total, peak) in list(self.stats.items()):
+            stages[stage] = {
+                "count": count,
+                "total_ms": round(total * 1000, 3),
+                "mean_ms": round(total * 1000 / count, 3) if count else None,
+                "max_ms": round(peak * 1000, 3),
+            }
+        return {"enabled": self.enabled, "since": self.since, "stages": stages}
+
+    def _http(self, query):
+        if query.get("enable") in ("1", "true", "on"):
+            self.enable()
+        elif query.get("enable") in ("0", "false", "off"):
+            self.disable()
+        if query.get("reset"):
+            self.reset()
+        return 200, "application/json", json.dumps(self.report())
+
+
+class Watchdog:
+    """Reports the stack of any MQTT callback that runs longer than threshold_ms"""
+
+    def __init__(self, threshold_ms=None, cooldown_s=None, stages=None, log=print):
+        self.threshold_s = (SLOW_CALLBACK_MS if threshold_ms is None else threshold_ms) / 1000.0
+        self.cooldown_s = SLOW_CALLBACK_COOLDOWN_S if cooldown_s is None else cooldown_s
+        self.stages = stages
+        self.log = log
+        self.slow = 0           # callbacks that crossed the threshold
+        self.suppressed = 0     # slow callbacks not printed because of the cooldown
+        self.last_stack = None
+        self._start = None      # (monotonic start, thread ident, sequence) of the running callback
+        self._seq = 0
+        self._reported = -1
+        self._last_print = 0.0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def wrap(self, callback):
+        """Callback that registers each invocation with the watchdog (and the 'callback' stage)"""
+        monotonic = time.monotonic
+        get_ident = threading.get_ident
+        stages = self.stages
+
+        def watched(*args, **kwargs):
+            self._seq += 1
+            t0 = monotonic()
+            self._start = (t0, get_ident(), self._seq)
+            try:
+                return callback(*args, **kwargs)
+            finally:
+                self._start = None
+                if stages is not None and stages.enabled:
+                    stages.observe("callback", monotonic() - t0)
+        return watched
+
+    def check(self, now=None):
+        """One watchdog pass; returns the formatted stack if a slow callback was reported"""
+        running = self._start
+        if running is None:
+            return None
+        started, ident, seq = running
+        now = time.monotonic() if now is None else now
+        if now - started < self.threshold_s or seq == self._reported:
+            return None
+        self._reported = seq
+        self.slow += 1
+        if now - self._last_print < self.cooldown_s:
+            self.suppressed += 1
+            return None
+        frame = sys._current_frames().get(ident)
+        if frame is None:
+            return None
+        stack = "".join(traceback.format_stack(frame))
+        self.last_stack = stack
+        self._last_print = now
+        extra = f", {self.suppressed} more since the last report" if self.suppressed else ""
+        self.suppressed = 0
+        self.log(f"WARN Slow MQTT callback: running {(now - started) * 1000:.0f}ms "
+                 f"(threshold {self.threshold_s * 1000:.0f}ms{extra})\n{stack.rstrip()}")
+        return stack
+
+    def start(self):
+        if self.threshold_s <= 0 or self._thread is not None:
+            return self
+        interval = max(self.threshold_s / 4, 0.01)
+
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.check()
+                except Exception as e:  # never let the watchdog take the bridge down
+                    self.log(f"WARN Watchdog check failed: {e}")
+        self._thread = threading.Thread(target=run, name="slow-callback-watchdog", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+class SamplingProfiler:
+    """Samples all thread stacks in a background thread; writes collapsed stacks"""
+
+    def __init__(self, directory=None, hz=None, max_seconds=None):
+        self.directory = Path(directory or PROFILE_DIR)
+        self.hz = PROFILE_HZ if hz is None else hz
+        self.max_seconds = PROFILE_MAX_SECONDS if max_seconds is None else max_seconds
+        self.running = None       # path of the profile in progress
+        self.last = None          # summary of the last finished profile
+        self.lock = threading.Lock()
+
+    def start(self, seconds=None, hz=None):
+        """Begin a profile in the background; returns its path, or None if one is running"""
+        seconds = min(max(PROFILE_SECONDS if seconds is None else seconds, 0.1), self.max_seconds)
+        hz = min(max(self.hz if hz is None else hz, 1.0), 1000.0)
+        with self.lock:
+            if self.running:
+                return None
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"profile-{time.strftime('%Y%m%d-%H%M%S', time.gmtime())}.folded"
+            self.running = path
+        threading.Thread(target=self._run, args=(path, seconds, hz), name="sampling-profiler", daemon=True).start()
+        return path
+
+    def sample(self, seconds, hz):
+        """Collapsed stack -> sample count, for every thread except this one"""
+        counts = {}
+        me = threading.get_ident()
+        interval = 1.0 / hz
+        names = _thread_names()
+        names_at = time.monotonic()
+        deadline = time.monotonic() + seconds
+        next_at = time.monotonic()
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            if now - names_at > 1.0:
+                names, names_at = _thread_names(), now
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack = collapse(frame, names.get(ident, f"thread-{ident}"))
+                if stack not in counts and len(counts) >= MAX_STACKS:
+                    stack = "[truncated]"
+                counts[stack] = counts.get(stack, 0) + 1
+            del frame
+            next_at += interval
+            delay = next_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_at = time.monotonic()  # fell behind: do not burst to catch up
+        return counts
+
+    def _run(self, path, seconds, hz):
+        try:
+            t0 = time.monotonic()
+            counts = self.sample(seconds, hz)
+            with open(path, "w", encoding="utf-8") as f:
+                for stack, n in sorted(counts.items(), key=lambda kv: -kv[1]):
+                    f.write(f"{stack} {n}\n")
+            self.last = {"path": str(path), "seconds": round(time.monotonic() - t0, 1), "hz": hz,
+                         "samples": sum(counts.values()), "stacks": len(counts)}
+            print(f"OK Profile written to {path} ({self.last['samples']} samples; "
+                  f"view with flamegraph.pl or https://www.speedscope.app)")
+        except OSError as e:
+            print(f"WARN Profile failed: {e}")
+        finally:
+            with self.lock:
+                self.running = None
+
+    def _http(self, query):
+        try:
+            seconds = float(query["seconds"]) if "seconds" in query else None
+            hz = float(query["hz"]) if "hz" in query else None
+        except ValueError:
+            return 400, "application/json", json.dumps({"error": "seconds and hz must be numbers"})
+        path = self.start(seconds, hz)
+        if path is None:
+            return 409, "application/json", json.dumps({"error": "profile already running",
+                                                        "path": str(self.running)})
+        return 202, "application/json", json.dumps({"path": str(path), "last": self.last})
+
+
+def stacks_text():
+    """Current stack of every thread, as text"""
+    names = _thread_names()
+    parts = []
+    for ident, frame in sys._current_frames().items():
+        parts.append(f"--- {names.get(ident, ident)} ---\n" + "".join(traceback.format_stack(frame)))
+    return "\n".join(parts)
+
+
+def install(stages=None, watchdog=None, profiler=None):
+    """Routes /debug/stages, /debug/profile, /debug/stacks; SIGPROF starts a profile; starts the watchdog"""
+    profiler = profiler or SamplingProfiler()
+    admin_http.route("/debug/profile", profiler._http)
+    admin_http.route("/debug/stacks", lambda query: (200, "text/plain", stacks_text()))
+    if stages is not None:
+        admin_http.route("/debug/stages", stages._http)
+    if watchdog is not None:
+        watchdog.start()
+    if hasattr(signal, "SIGPROF") and threading.current_thread() is threading.main_thread():
+        try:
+            signal.signal(signal.SIGPROF, lambda signum, frame: profiler.start())
+        except ValueError:
+            pass
+    return profiler
@@ -0,0 +1,227 @@
+"""
+Fleet Statistics Rollups for ATI Telemetry
+
+Per-device aggregates at 1-minute and 1-hour resolution, maintained
+incrementally by the writers (src/common/telemetry.py and
+src/common/database.js) in the same transaction as the raw rows:
+
+    ati_rollup_1m / ati_rollup_1h
+        message_count, posted_count, error_count,
+        battery_min / battery_max / battery_sum / battery_samples,
+        distance (Twinzo units), moving_count, first_seen, last_seen
+
+Stats readers combine minute buckets for the partial first hour with hour
+buckets for the rest of the window, so a stats query touches at most
+~60 + hours rows per device no matter how much raw history is kept.
+
+Movement uses the same rule as the bridges: a sample is moving when it is
+more than MOVING_THRESHOLD Twinzo units from the device's previous sample.
+"""
+import math
+import time
+
+MOVING_THRESHOLD = 10.0  # Twinzo units, matches the bridges' movement detection
+
+RESOLUTIONS = {"ati_rollup_1m": 60, "ati_rollup_1h": 3600}
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS ati_rollup_1m (
+        device_name TEXT NOT NULL,
+        bucket_start INTEGER NOT NULL,          -- epoch seconds (UTC), start of minute
+        message_count INTEGER NOT NULL DEFAULT 0,
+        posted_count INTEGER NOT NULL DEFAULT 0,
+        error_count INTEGER NOT NULL DEFAULT 0,
+        battery_min REAL,
+        battery_max REAL,
+        battery_sum REAL NOT NULL DEFAULT 0,
+        battery_samples INTEGER NOT NULL DEFAULT 0,
+        distance REAL NOT NULL DEFAULT 0,       -- Twinzo units travelled
+        moving_count INTEGER NOT NULL DEFAULT 0,
+        first_seen TEXT,
+        last_seen TEXT,
+        PRIMARY KEY (device_name, bucket_start)
+    ) WITHOUT ROWID;
+
+    CREATE TABLE IF NOT EXISTS ati_rollup_1h (
+        device_name TEXT NOT NULL,
+        bucket_start INTEGER NOT NULL,          -- epoch seconds (UTC), start of hour
+        message_count INTEGER NOT NULL DEFAULT 0,
+        posted_count INTEGER NOT NULL DEFAULT 0,
+        error_count INTEGER NOT NULL DEFAULT 0,
+        battery_min REAL,
+        battery_max REAL,
+        battery_sum REAL NOT NULL DEFAULT 0,
+        battery_samples INTEGER NOT NULL DEFAULT 0,
+        distance REAL NOT NULL DEFAULT 0,
+        moving_count INTEGER NOT NULL DEFAULT 0,
+        first_seen TEXT,
+        last_seen TEXT,
+        PRIMARY KEY (device_name, bucket_start)
+    ) WITHOUT ROWID;
+
+    CREATE INDEX IF NOT EXISTS idx_rollup_1m_bucket ON ati_rollup_1m(bucket_start);
+    CREATE INDEX IF NOT EXISTS idx_rollup_1h_bucket ON ati_rollup_1h(bucket_start);
+
+    -- Last Twinzo position per device, so distance carries across batches and restarts
+    CREATE TABLE IF NOT EXISTS ati_rollup_last_pos (
+        device_name TEXT PRIMARY KEY,
+        twinzo_x REAL NOT NULL,
+        twinzo_y REAL NOT NULL
+    );
+"""
+
+_UPSERT_SQL = """
+    INSERT INTO {table} (
+        device_name, bucket_start, message_count, posted_count, error_count,
+        battery_min, battery_max, battery_sum, battery_samples,
+        distance, moving_count, first_seen, last_seen
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(device_name, bucket_start) DO UPDATE SET
+        message_count = message_count + excluded.message_count,
+        posted_count = posted_count + excluded.posted_count,
+        error_count = error_count + excluded.error_count,
+        battery_min = min(COALESCE(battery_min, excluded.battery_min), COALESCE(excluded.battery_min, battery_min)),
+        battery_max = max(COALESCE(battery_max, excluded.battery_max), COALESCE(excluded.battery_max, battery_max)),
+        battery_sum = battery_sum + excluded.battery_sum,
+        battery_samples = battery_samples + excluded.battery_samples,
+        distance = distance + excluded.distance,
+        moving_count = moving_count + excluded.moving_count,
+        first_seen = min(first_seen, excluded.first_seen),
+        last_seen = max(last_seen, excluded.last_seen)
+"""
+
+UPSERT_SQL = {table: _UPSERT_SQL.format(table=table) for table in RESOLUTIONS}
+
+LAST_POS_SQL = """
+    INSERT INTO ati_rollup_last_pos (device_name, twinzo_x, twinzo_y) VALUES (?, ?, ?)
+    ON CONFLICT(device_name) DO UPDATE SET twinzo_x = excluded.twinzo_x, twinzo_y = excluded.twinzo_y
+"""
+
+
+class RollupAccumulator:
+    """Folds raw rows into per-bucket aggregates; one instance per writer"""
+
+    def __init__(self):
+        self.last_pos = {}  # device_name -> (twinzo_x, twinzo_y)
+
+    def _previous(self, conn, device_name):
+        if device_name not in self.last_pos:
+            row = conn.execute(
+                "SELECT twinzo_x, twinzo_y FROM ati_rollup_last_pos WHERE device_name = ?",
+                (device_name,)).fetchone()
+            self.last_pos[device_name] = row
+        return self.last_pos[device_name]
+
+    def apply(self, conn, rows):
+        """
+        Update rollups for a batch of rows inside the caller's transaction.
+
+        rows: iterable of (epoch_s, timestamp_text, device_name, twinzo_x, twinzo_y,
+                           battery_status, posted_to_api, error)
+        """
+        buckets = {table: {} for table in RESOLUTIONS}
+        touched = set()
+
+        for epoch_s, ts_text, device, tx, ty, battery, posted, error in rows:
+            prev = self._previous(conn, device)
+            step = math.hypot(tx - prev[0], ty - prev[1]) if prev else 0.0
+            moving = 1 if step > MOVING_THRESHOLD else 0
+            self.last_pos[device] = (tx, ty)
+            touched.add(device)
+
+            for table, width in RESOLUTIONS.items():
+                key = (device, int(epoch_s) // width * width)
+                agg = buckets[table].get(key)
+                if agg is None:
+                    agg = buckets[table][key] = [0, 0, 0, None, None, 0.0, 0, 0.0, 0, ts_text, ts_text]
+                agg[0] += 1
+                agg[1] += 1 if posted else 0
+                agg[2] += 1 if error is not None else 0
+                if battery is not None:
+                    agg[3] = battery if agg[3] is None else min(agg[3], battery)
+                    agg[4] = battery if agg[4] is None else max(agg[4], battery)
+                    agg[5] += battery
+                    agg[6] += 1
+                agg[7] += step
+                agg[8] += moving
+                agg[9] = min(agg[9], ts_text)
+                agg[10] = max(agg[10], ts_text)
+
+        for table, aggs in buckets.items():
+            conn.executemany(UPSERT_SQL[table], [key + tuple(agg) for key, agg in aggs.items()])
+        conn.executemany(LAST_POS_SQL, [(d,) + self.last_pos[d] for d in touched])
+
+
+def _window_sql(group_by_device):
+    select = "device_name," if group_by_device else ""
+    group = "GROUP BY device_name ORDER BY last_seen DESC" if group_by_device else ""
+    return f"""
+        SELECT {select}
+            COALESCE(SUM(message_count), 0),
+            COALESCE(SUM(posted_count), 0),
+            COALESCE(SUM(error_count), 0),
+            SUM(battery_sum) / NULLIF(SUM(battery_samples), 0),
+            MIN(battery_min),
+            MAX(battery_max),
+            COALESCE(SUM(distance), 0),
+            CAST(SUM(moving_count) AS REAL) / NULLIF(SUM(message_count), 0),
+            MIN(first_seen),
+            MAX(last_seen) AS last_seen
+        FROM (
+            SELECT * FROM ati_rollup_1m WHERE bucket_start >= ? AND bucket_start < ?
+            UNION ALL
+            SELECT * FROM ati_rollup_1h WHERE bucket_start >= ?
+        )
+        {group}
+    """
+
+
+STAT_FIELDS = ("total_messages", "posted_count", "error_count", "avg_battery", "min_battery",
+               "max_battery", "distance", "moving_fraction", "first_seen", "last_seen")
+
+
+def _window_params(hours, now=None):
+    start = int((now or time.time()) - hours * 3600)
+    hour_edge = -(-start // 3600) * 3600  # first full hour inside the window
+    return (start // 60 * 60, hour_edge, hour_edge)
+
+
+def fleet_stats(conn, hours=24, now=None):
+    """Totals over the last N hours for the whole fleet"""
+    row = conn.execute(_window_sql(False), _window_params(hours, now)).fetchone()
+    return dict(zip(STAT_FIELDS, row))
+
+
+def device_stats(conn, hours=24, now=None):
+    """Per-device stats over the last N hours, most recently seen first"""
+    rows = conn.execute(_window_sql(True), _window_params(hours, now)).fetchall()
+    return [dict(zip(("device_name",) + STAT_FIELDS, row)) for row in rows]
+
+
+def rebuild(conn, chunk_size=5000):
+    """
+    Recompute all rollups from ati_messages (one-off backfill for databases
+    created before rollups existed). Runs in one transaction.
+    """
+    from src.common.telemetry import EPOCH_MS_SQL
+
+    with conn:
+        for table in list(RESOLUTIONS) + ["ati_rollup_last_pos"]:
+            conn.execute(f"DELETE FROM {table}")
+        acc = RollupAccumulator()
+        cursor = conn.execute(f"""
+            SELECT {EPOCH_MS_SQL} / 1000.0, timestamp, device_name, twinzo_x, twinzo_y,
+                   battery_status, posted_to_api, error
+            FROM ati_messages ORDER BY device_name, timestamp
+        """)
+        total = 0
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            # Devices seen for the first time during a rebuild have no previous position
+            for device in {r[2] for r in rows}:
+                acc.last_pos.setdefault(device, None)
+            acc.apply(conn, rows)
+            total += len(rows)
+    return total
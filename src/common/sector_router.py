@@ -0,0 +1,222 @@
+"""
+Geofence Sector Routing
+
+Decides which Twinzo sector a sample belongs to instead of posting it to
+every sector in SECTOR_IDS. Sectors are read from SECTOR_GEOFENCE_FILE
+(default config/mappings/sector_geofences.json, see the .example.json next
+to it); without that file every sample still goes to all SECTOR_IDS.
+
+    {
+      "hysteresis": 2000,          # stay in the current sector until this far outside it
+      "fallback": "last",          # outside every sector: "last" sector, "drop" or "broadcast"
+      "cell_size": 5000,           # grid index cell (optional; default bbox / 64)
+      "devices": {"tug-55-tvsmotor-hosur-09": 2},  # ATI sherpa_name -> fixed sector, checked first
+      "sectors": [
+        {"id": 1, "name": "HiTech", "polygon": [[0, 46000], [265000, 46000], ...]},
+        {"id": 2, "name": "Old Plant", "polygons": [[...], [...]]}
+      ]
+    }
+
+Polygons are in the bridge's output (Twinzo) coordinates; earlier sectors
+win where they overlap. Lookups use a uniform grid precomputed at load:
+each cell lists only the polygons that touch it and marks those covering
+it completely, so most samples resolve without a point-in-polygon test.
+Results are restricted to the sectors in SECTOR_IDS.
+
+Usage:
+    from src.common.sector_router import SectorRouter
+
+    router = SectorRouter(SECTOR_IDS)
+    for sector_id in router.route(device_id, X, Y):
+        ...
+"""
+import json
+import math
+import os
+from pathlib import Path
+
+from src.common import metrics
+
+DEFAULT_GEOFENCE_FILE = Path(__file__).parent.parent.parent / "config" / "mappings" / "sector_geofences.json"
+
+SECTOR_GEOFENCE_FILE = os.getenv("SECTOR_GEOFENCE_FILE", str(DEFAULT_GEOFENCE_FILE))
+SECTOR_HYSTERESIS = os.getenv("SECTOR_HYSTERESIS")  # overrides the file's "hysteresis"
+
+FALLBACKS = ("last", "drop", "broadcast")
+GRID_CELLS = 64  # cells along the longer side when the file has no cell_size
+
+
+class Polygon:
+    """Simple polygon (x, y vertex list) with containment and edge distance"""
+
+    def __init__(self, sector, points):
+        if len(points) < 3:
+            raise ValueError(f"Sector {sector}: polygon needs at least 3 points")
+        self.sector = sector
+        self.points = [(float(x), float(y)) for x, y in points]
+        self.edges = list(zip(self.points, self.points[1:] + self.points[:1]))
+        xs = [p[0] for p in self.points]
+        ys = [p[1] for p in self.points]
+        self.bbox = (min(xs), min(ys), max(xs), max(ys))
+
+    def contains(self, x, y):
+        """Even-odd ray cast; points on the boundary may fall either way"""
+        inside = False
+        for (x1, y1), (x2, y2) in self.edges:
+            if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        return inside
+
+    def distance(self, x, y):
+        """Distance from (x, y) to the nearest edge"""
+        best = math.inf
+        for (x1, y1), (x2, y2) in self.edges:
+            dx, dy = x2 - x1, y2 - y1
+            length2 = dx * dx + dy * dy
+            t = 0.0 if length2 == 0 else max(0.0, min(1.0, ((x - x1) * dx + (y - y1) * dy) / length2))
+            best = min(best, math.hypot(x - x1 - t * dx, y - y1 - t * dy))
+        return best
+
+    def crosses_box(self, x0, y0, x1, y1):
+        """True if any edge intersects the axis-aligned box (Liang-Barsky clip)"""
+        for (ax, ay), (bx, by) in self.edges:
+            t0, t1 = 0.0, 1.0
+            dx, dy = bx - ax, by - ay
+            for p, q in ((-dx, ax - x0), (dx, x1 - ax), (-dy, ay - y0), (dy, y1 - ay)):
+                if p == 0:
+                    if q < 0:
+                        break
+                else:
+                    t = q / p
+                    if p < 0:
+                        t0 = max(t0, t)
+                    else:
+                        t1 = min(t1, t)
+                    if t0 > t1:
+                        break
+            else:
+                return True
+        return False
+
+
+class GridIndex:
+    """Uniform grid: cell -> ((polygon, covers_cell), ...) in sector priority order"""
+
+    def __init__(self, polygons, cell_size=None):
+        self.cells = {}
+        if not polygons:
+            self.origin, self.cell = (0.0, 0.0), 1.0
+            return
+        x0 = min(p.bbox[0] for p in polygons)
+        y0 = min(p.bbox[1] for p in polygons)
+        x1 = max(p.bbox[2] for p in polygons)
+        y1 = max(p.bbox[3] for p in polygons)
+        self.origin = (x0, y0)
+        self.cell = float(cell_size or max(x1 - x0, y1 - y0, 1.0) / GRID_CELLS)
+        for polygon in polygons:
+            px0, py0, px1, py1 = polygon.bbox
+            for ix in range(self._ix(px0), self._ix(px1) + 1):
+                for iy in range(self._iy(py0), self._iy(py1) + 1):
+                    cx0, cy0 = x0 + ix * self.cell, y0 + iy * self.cell
+                    cx1, cy1 = cx0 + self.cell, cy0 + self.cell
+                    # No edge inside the cell: it is entirely in or entirely out
+                    crosses = polygon.crosses_box(cx0, cy0, cx1, cy1)
+                    covers = not crosses and polygon.contains(cx0, cy0)
+                    if covers or crosses:
+                        self.cells[(ix, iy)] = self.cells.get((ix, iy), ()) + ((polygon, covers),)
+
+    def _ix(self, x):
+        return int((x - self.origin[0]) // self.cell)
+
+    def _iy(self, y):
+        return int((y - self.origin[1]) // self.cell)
+
+    def lookup(self, x, y):
+        return self.cells.get((self._ix(x), self._iy(y)), ())
+
+
+class SectorRouter:
+    """Sector(s) for each sample: device registry, then geofences with hysteresis"""
+
+    def __init__(self, sector_ids, path=None, config=None):
+        self.sector_ids = tuple(sector_ids)
+        self.broadcast = self.sector_ids
+        self.current = {}      # device -> sector it was last routed to
+        self.devices = {}
+        self.polygons = {}     # sector -> [Polygon]
+        self.index = GridIndex([])
+        self.hysteresis = 0.0
+        self.fallback = "last"
+        self.enabled = False
+        self._routes = {s: (s,) for s in self.sector_ids}
+        self.routed = metrics.counter("bridge_sector_routed_total", "Samples routed per sector", ("sector",))
+        self.switches = metrics.counter("bridge_sector_switches_total", "Devices that moved to another sector")
+        if config is None:
+            path = Path(path or SECTOR_GEOFENCE_FILE)
+            if not path.exists():
+                return
+            with open(path, encoding="utf-8") as f:
+                config = json.load(f)
+        self.load(config)
+
+    def load(self, config):
+        allowed = set(self.sector_ids)
+        polygons = []
+        for sector in config.get("sectors", []):
+            sid = int(sector["id"])
+            if sid not in allowed:
+                continue
+            shapes = sector.get("polygons") or [sector["polygon"]]
+            self.polygons[sid] = [Polygon(sid, shape) for shape in shapes]
+            polygons.extend(self.polygons[sid])
+        self.devices = {d: self._routes[int(s)] for d, s in config.get("devices", {}).items() if int(s) in allowed}
+        hysteresis = SECTOR_HYSTERESIS if SECTOR_HYSTERESIS is not None else config.get("hysteresis", 0)
+        self.hysteresis = float(hysteresis)
+        self.fallback = config.get("fallback", "last")
+        if self.fallback not in FALLBACKS:
+            raise ValueError(f"fallback must be one of {', '.join(FALLBACKS)}, not {self.fallback!r}")
+        self.index = GridIndex(polygons, config.get("cell_size"))
+        self._children = {s: self.routed.labels(s) for s in self.sector_ids}
+        self.enabled = True
+
+    def route(self, device, x, y):
+        """Tuple of sector ids for this sample (empty: drop it)"""
+        if not self.enabled:
+            return self.broadcast
+        routes = self.devices.get(device)
+        if routes is None:
+            sector = self._locate(device, x, y)
+            if sector is None:
+                return self.broadcast if self.fallback == "broadcast" else ()
+            routes = self._routes[sector]
+        self._children[routes[0]].inc()
+        return routes
+
+    def _locate(self, device, x, y):
+        current = self.current.get(device)
+        matched = None
+        for polygon, covers in self.index.lookup(x, y):
+            if covers or polygon.contains(x, y):
+                if polygon.sector == current:
+                    return current
+                if matched is None:
+                    matched = polygon.sector
+        if current is not None and self.hysteresis > 0 and \
+                min(p.distance(x, y) for p in self.polygons[current]) <= self.hysteresis:
+            return current
+        if matched is None:
+            return current if self.fallback == "last" else None
+        if current is not None:
+            self.switches.inc()
+        self.current[device] = matched
+        return matched
+
+    def sectors_for(self, device):
+        """Sectors the device's last sample went to (for follow-up samples)"""
+        if not self.enabled:
+            return self.broadcast
+        routes = self.devices.get(device)
+        if routes is not None:
+            return routes
+        current = self.current.get(device)
+        return self._routes[current] if current is not None else ()
@@ -0,0 +1,141 @@
+/**
+ * Source timestamps, clock skew and end-to-end staleness for the Node bridges
+ * (same metrics and environment variables as src/common/source_clock.py)
+ *
+ * Reads the source's own timestamp from each payload and records per device:
+ *   bridge_source_to_ingest_seconds{device}   source time -> MQTT receive
+ *   bridge_source_to_post_seconds{device}     source time -> localization POST done
+ *   bridge_source_clock_skew_seconds{device}  min(receive - source) over the last two windows
+ *   bridge_source_timestamp_invalid_total     missing / unparseable timestamps
+ *
+ * ATI's ISO timestamps carry 'Z' but are IST wall time: SOURCE_TS_OFFSET is the
+ * zone 'Z' and naive strings are really in, subtracted to get UTC. Explicit
+ * offsets and numeric epochs (s or ms) are used as they are.
+ * SOURCE_TS_AS_TIMESTAMP=true sends the corrected source time as the Twinzo
+ * Timestamp (clamped to receive time; ignored beyond SOURCE_TS_MAX_SKEW_S).
+ *
+ * Usage:
+ *   import { SourceClock } from '../common/source_clock.js';
+ *   const clock = new SourceClock('+05:30');
+ *   const sourceTs = clock.ingest(device, payload, Date.now());
+ *   ... Timestamp: clock.timestampMs(sourceTs, Date.now()) ...
+ *   clock.posted(device, sourceTs);
+ */
+
+import { counter, gaugeCallback, histogram } from './metrics.js';
+
+const SOURCE_TS_FIELD = process.env.SOURCE_TS_FIELD || 'timestamp';
+const SOURCE_TS_AS_TIMESTAMP = (process.env.SOURCE_TS_AS_TIMESTAMP || 'false').toLowerCase() === 'true';
+const SOURCE_TS_MAX_SKEW_S = parseFloat(process.env.SOURCE_TS_MAX_SKEW_S || '300');
+const SOURCE_SKEW_WINDOW_S = parseFloat(process.env.SOURCE_SKEW_WINDOW_S || '60');
+
+// Staleness buckets in seconds, 10 ms .. 10 min
+const STALENESS_BUCKETS = [0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 600];
+
+const EXPLICIT_OFFSET = /[+-]\d{2}:?\d{2}$/;
+
+/** '+05:30', '-0800', '5', '0' -> milliseconds east of UTC */
+function parseOffset(text) {
+    const match = /^([+-])?(\d{1,2})(?::?(\d{2}))?$/.exec(String(text).trim());
+    if (!match) {
+        throw new Error(`Invalid offset ${text} (expected e.g. +05:30)`);
+    }
+    const ms = (parseInt(match[2], 10) * 3600 + parseInt(match[3] || '0', 10) * 60) * 1000;
+    return match[1] === '-' ? -ms : ms;
+}
+
+/** Source timestamp -> UTC epoch ms, or null ('Z' / naive strings are wall time at offsetMs) */
+function parseTimestamp(value, offsetMs = 0) {
+    if (typeof value === 'number') {
+        return Number.isFinite(value) ? (value > 1e11 ? value : value * 1000) : null;
+    }
+    if (typeof value !== 'string') {
+        return null;
+    }
+    let text = value.trim();
+    if (EXPLICIT_OFFSET.test(text) && text.includes('T')) {
+        const ms = Date.parse(text);
+        return Number.isNaN(ms) ? null : ms;
+    }
+    text = text.replace(/[Zz]$/, '');
+    const ms = Date.parse(`${text}Z`);
+    return Number.isNaN(ms) ? null : ms - offsetMs;
+}
+
+class SourceClock {
+    constructor(defaultOffset = '0') {
+        this.offsetMs = parseOffset(process.env.SOURCE_TS_OFFSET || defaultOffset);
+        this.field = SOURCE_TS_FIELD;
+        this.windowMs = SOURCE_SKEW_WINDOW_S * 1000;
+        this.asTimestamp = SOURCE_TS_AS_TIMESTAMP;
+        this.maxSkewMs = SOURCE_TS_MAX_SKEW_S * 1000;
+        this.ingestSeconds = histogram('bridge_source_to_ingest_seconds',
+            'Source timestamp to MQTT receive, per device', ['device'], STALENESS_BUCKETS);
+        this.postSeconds = histogram('bridge_source_to_post_seconds',
+            'Source timestamp to localization POST complete, per device', ['device'], STALENESS_BUCKETS);
+        this.invalid = counter('bridge_source_timestamp_invalid_total',
+            'Messages without a parseable source timestamp');
+        this.skews = {};
+        gaugeCallback('bridge_source_clock_skew_seconds',
+            'Estimated source clock skew (min receive - source over the window)', ['device'],
+            () => Object.keys(this.skews)
+                .filter(device => this.skew(device) !== null)
+                .map(device => [[device], this.skew(device)]));
+    }
+
+    /** Corrected source time (epoch ms) of payload, or null; records ingest staleness and skew */
+    ingest(device, payload, receivedAt) {
+        const sourceTs = parseTimestamp(payload[this.field], this.offsetMs);
+        if (sourceTs === null) {
+            this.invalid.inc();
+            return null;
+        }
+        const delay = receivedAt - sourceTs;
+        this.ingestSeconds.labels(device).observe(Math.max(delay, 0) / 1000);
+        let skew = this.skews[device];
+        if (!skew) {
+            skew = this.skews[device] = { windowStart: receivedAt, current: null, previous: null };
+        }
+        if (receivedAt - skew.windowStart >= this.windowMs) {
+            skew.previous = skew.current;
+            skew.current = null;
+            skew.windowStart = receivedAt;
+        }
+        if (skew.current === null || delay < skew.current) {
+            skew.current = delay;
+        }
+        return sourceTs;
+    }
+
+    /** Record source -> POST complete staleness for a message ingest() accepted */
+    posted(device, sourceTs, postedAt = Date.now()) {
+        if (sourceTs !== null && sourceTs !== undefined) {
+            this.postSeconds.labels(device).observe(Math.max(postedAt - sourceTs, 0) / 1000);
+        }
+    }
+
+    /** Estimated skew in seconds, or null before the device's first timestamp */
+    skew(device) {
+        const skew = this.skews[device];
+        if (!skew) {
+            return null;
+        }
+        const values = [skew.current, skew.previous].filter(v => v !== null);
+        return values.length ? Math.min(...values) / 1000 : null;
+    }
+
+    /** Twinzo Timestamp: corrected source time if enabled and plausible, else receive time */
+    timestampMs(sourceTs, receivedAt) {
+        if (this.asTimestamp && sourceTs !== null && Math.abs(receivedAt - sourceTs) <= this.maxSkewMs) {
+            return Math.min(sourceTs, receivedAt);
+        }
+        return receivedAt;
+    }
+}
+
+export {
+    SourceClock,
+    STALENESS_BUCKETS,
+    parseOffset,
+    parseTimestamp
+};
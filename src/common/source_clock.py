@@ -0,0 +1,176 @@
+"""
+Source Timestamps, Clock Skew and End-to-End Staleness
+
+Bridges stamp Twinzo samples with their own receive time, so nothing shows
+how old a position already was when it arrived. This module reads the
+source's own timestamp from each payload and records, per device:
+
+    bridge_source_to_ingest_seconds{device}   source time -> MQTT receive
+    bridge_source_to_post_seconds{device}     source time -> localization POST done
+    bridge_source_clock_skew_seconds{device}  estimated skew (see below)
+    bridge_source_timestamp_invalid_total     missing / unparseable timestamps
+
+Timestamp correction: ATI sends ISO 8601 with a 'Z' suffix that is really
+IST wall time (see bridge_audit_feed.js). SOURCE_TS_OFFSET is the zone such
+'Z' and naive strings are actually in ("+05:30" for ATI); it is subtracted
+to get UTC. Strings with an explicit non-Z offset and numeric epochs (s or
+ms) are taken as they are.
+
+Skew: receive - source = skew + network delay, and the delay is never
+negative, so the minimum over the last two SOURCE_SKEW_WINDOW_S windows is
+the skew estimate (plus the smallest delay seen). It is reported, not
+subtracted from the histograms: a large value usually means a wrong
+SOURCE_TS_OFFSET or an unsynchronised robot clock.
+
+With SOURCE_TS_AS_TIMESTAMP=true the corrected source time becomes the
+Twinzo Timestamp, clamped to the receive time and ignored (receive time
+used) when it is more than SOURCE_TS_MAX_SKEW_S away from it.
+
+Usage:
+    from src.common.source_clock import SourceClock
+
+    clock = SourceClock(default_offset="+05:30")
+    source_ts = clock.ingest(device, payload, received_at)
+    ... "Timestamp": clock.timestamp_ms(source_ts, received_at) ...
+    clock.posted(device, source_ts)
+"""
+import os
+import re
+import time
+from datetime import datetime
+
+from src.common import metrics
+
+SOURCE_TS_FIELD = os.getenv("SOURCE_TS_FIELD", "timestamp")
+SOURCE_TS_AS_TIMESTAMP = os.getenv("SOURCE_TS_AS_TIMESTAMP", "false").lower() == "true"
+SOURCE_TS_MAX_SKEW_S = float(os.getenv("SOURCE_TS_MAX_SKEW_S", "300"))
+SOURCE_SKEW_WINDOW_S = float(os.getenv("SOURCE_SKEW_WINDOW_S", "60"))
+
+# Staleness buckets in seconds, 10 ms .. 10 min (source clocks are coarser than the bridge's)
+STALENESS_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 600.0)
+
+_EPOCH = datetime(1970, 1, 1)
+_OFFSET_RE = re.compile(r"^([+-])?(\d{1,2})(?::?(\d{2}))?$")
+
+
+def parse_offset(text):
+    """'+05:30', '-0800', '5', '0' -> seconds east of UTC"""
+    match = _OFFSET_RE.match(str(text).strip())
+    if not match:
+        raise ValueError(f"Invalid offset {text!r} (expected e.g. +05:30)")
+    sign, hours, minutes = match.groups()
+    seconds = int(hours) * 3600 + int(minutes or 0) * 60
+    return -seconds if sign == "-" else seconds
+
+
+def parse_timestamp(value, offset_s=0):
+    """Source timestamp -> UTC epoch seconds, or None
+
+    Numbers are epoch seconds, or milliseconds when above 1e11. Strings are
+    ISO 8601; 'Z' and naive ones are wall time at offset_s east of UTC.
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value / 1000.0 if value > 1e11 else float(value)
+    if not isinstance(value, str):
+        return None
+    text = value.strip()
+    if text.endswith(("Z", "z")):
+        text = text[:-1]
+    try:
+        parsed = datetime.fromisoformat(text)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        return (parsed - _EPOCH).total_seconds() - offset_s
+    return parsed.timestamp()
+
+
+class _Skew:
+    """Minimum of (receive - source) over the current and previous window"""
+
+    __slots__ = ("window_start", "current", "previous")
+
+    def __init__(self, now):
+        self.window_start = now
+        self.current = None
+        self.previous = None
+
+    def add(self, now, delay, window_s):
+        if now - self.window_start >= window_s:
+            self.previous = self.current
+            self.current = None
+            self.window_start = now
+        if self.current is None or delay < self.current:
+            self.current = delay
+
+    def value(self):
+        if self.previous is None:
+            return self.current
+        if self.current is None:
+            return self.previous
+        return min(self.current, self.previous)
+
+
+class SourceClock:
+    """Parses source timestamps and records staleness and skew per device"""
+
+    def __init__(self, default_offset="0", field=None, window_s=None, as_timestamp=None, max_skew_s=None):
+        self.offset_s = parse_offset(os.getenv("SOURCE_TS_OFFSET", default_offset))
+        self.field = field or SOURCE_TS_FIELD
+        self.window_s = SOURCE_SKEW_WINDOW_S if window_s is None else window_s
+        self.as_timestamp = SOURCE_TS_AS_TIMESTAMP if as_timestamp is None else as_timestamp
+        self.max_skew_s = SOURCE_TS_MAX_SKEW_S if max_skew_s is None else max_skew_s
+        self.ingest_seconds = metrics.histogram("bridge_source_to_ingest_seconds",
+                                                "Source timestamp to MQTT receive, per device", ("device",),
+                                                buckets=STALENESS_BUCKETS)
+        self.post_seconds = metrics.histogram("bridge_source_to_post_seconds",
+                                              "Source timestamp to localization POST complete, per device",
+                                              ("device",), buckets=STALENESS_BUCKETS)
+        self.invalid = metrics.counter("bridge_source_timestamp_invalid_total",
+                                       "Messages without a parseable source timestamp")
+        self.skews = {}
+        metrics.gauge_callback("bridge_source_clock_skew_seconds",
+                               "Estimated source clock skew (min receive - source over the window)", ("device",),
+                               lambda: {(d,): round(s.value(), 3) for d, s in list(self.skews.items())
+                                        if s.value() is not None})
+        self._children = {}
+
+    def _device(self, device):
+        children = self._children.get(device)
+        if children is None:
+            children = self._children[device] = (self.ingest_seconds.labels(device),
+                                                 self.post_seconds.labels(device))
+        return children
+
+    def ingest(self, device, payload, received_at):
+        """Corrected source time (epoch s) of payload, or None; records ingest staleness and skew"""
+        source_ts = parse_timestamp(payload.get(self.field), self.offset_s)
+        if source_ts is None:
+            self.invalid.inc()
+            return None
+        delay = received_at - source_ts
+        self._device(device)[0].observe(delay if delay > 0 else 0.0)
+        skew = self.skews.get(device)
+        if skew is None:
+            skew = self.skews[device] = _Skew(received_at)
+        skew.add(received_at, delay, self.window_s)
+        return source_ts
+
+    def posted(self, device, source_ts, posted_at=None):
+        """Record source -> POST complete staleness for a message ingest() accepted"""
+        if source_ts is not None:
+            delay = (time.time() if posted_at is None else posted_at) - source_ts
+            self._device(device)[1].observe(delay if delay > 0 else 0.0)
+
+    def skew(self, device):
+        """Estimated skew in seconds for device, or None before its first timestamp"""
+        skew = self.skews.get(device)
+        return skew.value() if skew else None
+
+    def timestamp_ms(self, source_ts, received_at):
+        """Twinzo Timestamp: corrected source time if enabled and plausible, else receive time"""
+        if self.as_timestamp and source_ts is not None and abs(received_at - source_ts) <= self.max_skew_s:
+            return int(min(source_ts, received_at) * 1000)
+        return int(received_at * 1000)
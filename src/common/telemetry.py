@@ -0,0 +1,267 @@
+"""
+Telemetry Writer for ATI History (logs/ati_data.db)
+
+Python counterpart of src/common/database.js. Bridges call record() from the
+MQTT callback; rows go onto a bounded queue and a background thread writes
+them in batches (one executemany transaction per batch, WAL journal) so the
+ingest path never waits on SQLite. Rows land in the day partition for their
+receive time (see src/common/partitions.py).
+
+Backpressure: when the queue is full record() drops the row, counts it and
+returns False instead of blocking the MQTT loop.
+
+A bridge that delivers through egress records each sample on arrival with
+pending=True and calls complete() with the delivery outcome (or the reason
+egress dropped it). A device's rows are held until the rows before them are
+complete, so they reach the table - and the rollups' distance - in arrival
+order; stop() writes rows still waiting with a "no delivery outcome" error.
+
+Usage:
+    from src.common.telemetry import TelemetryWriter
+
+    telemetry = TelemetryWriter()
+    telemetry.start()
+    telemetry.record("tug-55", ati_x, ati_y, heading, twinzo_x, twinzo_y, ...)
+
+    row = telemetry.record("tug-55", ati_x, ati_y, ..., pending=True)
+    telemetry.complete(row, posted_to_api, api_response, error)
+"""
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from src.common import partitions, rollups
+
+DEFAULT_DB_PATH = Path(__file__).parent.parent.parent / "logs" / "ati_data.db"
+
+TELEMETRY_ENABLED = os.getenv("TELEMETRY_ENABLED", "true").lower() == "true"
+TELEMETRY_DB = os.getenv("TELEMETRY_DB", str(DEFAULT_DB_PATH))
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "500"))
+TELEMETRY_FLUSH_MS = int(os.getenv("TELEMETRY_FLUSH_MS", "250"))
+TELEMETRY_QUEUE_SIZE = int(os.getenv("TELEMETRY_QUEUE_SIZE", "50000"))
+TELEMETRY_MAX_PENDING = int(os.getenv("TELEMETRY_MAX_PENDING", "256"))  # per device, awaiting an outcome
+
+# One constant SQL string per day partition: sqlite3 keeps it in the
+# connection's statement cache, so every batch reuses the prepared statement.
+INSERT_SQL = """
+    INSERT INTO {table} (
+        timestamp, device_name, ati_x, ati_y, ati_heading,
+        twinzo_x, twinzo_y, twinzo_heading,
+        battery_status, mode, posted_to_api, api_response, error
+    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+# SQLite timestamps are UTC text ('YYYY-MM-DD HH:MM:SS[.SSS]'); epoch ms in SQL
+EPOCH_MS_SQL = "CAST(ROUND((julianday(timestamp) - 2440587.5) * 86400000) AS INTEGER)"
+
+_STOP = object()
+NO_OUTCOME = "no delivery outcome"
+
+
+class _Pending:
+    """A row recorded before its delivery outcome is known"""
+    __slots__ = ("row", "done")
+
+    def __init__(self, row):
+        self.row = row
+        self.done = False
+
+    def settle(self, posted_to_api, api_response, error):
+        self.row = self.row[:10] + (1 if posted_to_api else 0, api_response, error)
+        self.done = True
+
+
+def format_timestamp(epoch_s):
+    """Format epoch seconds like SQLite CURRENT_TIMESTAMP (UTC), with milliseconds"""
+    ms = int(epoch_s * 1000) % 1000
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(epoch_s)) + f".{ms:03d}"
+
+
+def open_db(db_path):
+    """Open the telemetry database with the pragmas used by every writer"""
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path), timeout=5.0, cached_statements=256)
+    # Only takes effect on a new database (see visualize_ati_data.py vacuum)
+    conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    partitions.setup(conn)
+    conn.executescript(rollups.SCHEMA)
+    return conn
+
+
+class TelemetryWriter:
+    """Background, batching writer for the ati_messages table"""
+
+    def __init__(self, db_path=None, batch_size=None, flush_ms=None, queue_size=None):
+        self.db_path = db_path or TELEMETRY_DB
+        self.batch_size = batch_size or TELEMETRY_BATCH_SIZE
+        self.flush_interval = (flush_ms or TELEMETRY_FLUSH_MS) / 1000.0
+        self.queue = queue.Queue(maxsize=queue_size or TELEMETRY_QUEUE_SIZE)
+        self.thread = None
+        self.stats = {"queued": 0, "written": 0, "dropped": 0, "batches": 0, "errors": 0}
+        # record() runs on the MQTT thread and the egress workers; the writer thread owns the other counts
+        self._stats_lock = threading.Lock()
+        self._pending = {}  # device_name -> deque of _Pending, arrival order
+        self._pending_lock = threading.Lock()
+        self.rollups = rollups.RollupAccumulator()
+        self._partitions = set()
+        self.retention = None
+        self._last_drop_report = 0
+
+    def start(self):
+        """Start the writer thread (no-op if already running)"""
+        if self.thread and self.thread.is_alive():
+            return self
+        self.thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Flush queued and pending rows and stop the writer thread"""
+        if not self.thread:
+            return
+        with self._pending_lock:
+            for device, rows in list(self._pending.items()):
+                for handle in rows:
+                    if not handle.done:
+                        handle.settle(False, None, NO_OUTCOME)
+                self._flush(device)
+        try:
+            self.queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self.thread.join(timeout)
+        self.thread = None
+        if self.retention:
+            self.retention.stop()
+            self.retention = None
+
+    def record(self, device_name, ati_x, ati_y, ati_heading, twinzo_x, twinzo_y,
+               twinzo_heading=None, battery_status=None, mode=None,
+               posted_to_api=False, api_response=None, error=None, received_at=None, pending=False):
+        """Queue one row. Never blocks; returns False if the row was dropped.
+
+        pending=True holds the row (and the device's later rows) until
+        complete() is called with the handle it returns."""
+        row = (
+            received_at if received_at is not None else time.time(),
+            device_name, ati_x, ati_y, ati_heading,
+            twinzo_x, twinzo_y, twinzo_heading,
+            battery_status, mode, 1 if posted_to_api else 0, api_response, error
+        )
+        if pending:
+            handle = _Pending(row)
+            with self._pending_lock:
+                rows = self._pending.get(device_name)
+                if rows is None:
+                    rows = self._pending[device_name] = deque()
+                rows.append(handle)
+                if len(rows) > TELEMETRY_MAX_PENDING:
+                    # An outcome that never came must not hold back the device's rows for good
+                    rows[0].settle(False, None, NO_OUTCOME)
+                    self._flush(device_name)
+            return handle
+        return self._put(row)
+
+    def complete(self, handle, posted_to_api, api_response=None, error=None):
+        """Fill in the outcome of a pending row; later calls for the same row are ignored"""
+        with self._pending_lock:
+            if handle.done:
+                return
+            handle.settle(posted_to_api, api_response, error)
+            self._flush(handle.row[1])
+
+    def _flush(self, device_name):
+        """Queue the device's completed rows up to the first pending one (caller holds _pending_lock)"""
+        rows = self._pending[device_name]
+        while rows and rows[0].done:
+            self._put(rows.popleft().row)
+        if not rows:
+            del self._pending[device_name]
+
+    def _put(self, row):
+        try:
+            self.queue.put_nowait(row)
+        except queue.Full:
+            with self._stats_lock:
+                self.stats["dropped"] += 1
+            return False
+        with self._stats_lock:
+            self.stats["queued"] += 1
+        return True
+
+    def _drain(self):
+        """Block for the first row, then collect up to batch_size within the flush window"""
+        first = self.queue.get()
+        if first is _STOP:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        conn = open_db(self.db_path)
+        # Started after open_db so only one connection migrates/creates partitions
+        if self.retention is None:
+            self.retention = partitions.RetentionScheduler(self.db_path).start()
+        try:
+            stopping = False
+            while not stopping:
+                batch, stopping = self._drain()
+                if batch:
+                    self._write(conn, batch)
+                self._report_drops()
+        finally:
+            conn.close()
+
+    def _partition_rows(self, conn, rows):
+        """Group rows by the day partition they belong to (creating it if needed)"""
+        by_table = {}
+        for r in rows:
+            table = partitions.PREFIX + r[0][:10].replace("-", "")
+            by_table.setdefault(table, []).append(r)
+        missing = [t for t in by_table if t not in self._partitions]
+        if missing:
+            partitions.ensure_partitions(conn, [partitions.partition_day(t) for t in missing])
+            self._partitions.update(missing)
+        return by_table
+
+    def _write(self, conn, batch):
+        rows = [(format_timestamp(r[0]),) + r[1:] for r in batch]
+        try:
+            by_table = self._partition_rows(conn, rows)
+            with conn:
+                for table, table_rows in by_table.items():
+                    conn.executemany(INSERT_SQL.format(table=table), table_rows)
+                # Rollups commit atomically with the raw rows
+                self.rollups.apply(conn, [
+                    (b[0], r[0], r[1], r[5], r[6], r[8], r[10], r[12])
+                    for b, r in zip(batch, rows)
+                ])
+            self.stats["written"] += len(rows)
+            self.stats["batches"] += 1
+        except sqlite3.Error as e:
+            self.rollups.last_pos.clear()  # rolled back; reload positions from the table
+            self.stats["errors"] += 1
+            print(f"WARN Telemetry write failed ({len(rows)} rows): {e}")
+
+    def _report_drops(self):
+        dropped = self.stats["dropped"]
+        if dropped != self._last_drop_report:
+            print(f"WARN Telemetry queue full: {dropped - self._last_drop_report} rows dropped "
+                  f"(total {dropped})")
+            self._last_drop_report = dropped
@@ -0,0 +1,115 @@
+"""
+Startup Warm-Up and Readiness
+
+Without a warm-up the first pose of every device pays for DNS, the TCP+TLS
+handshake to Twinzo and an OAuth round-trip inside the MQTT callback. The
+bridges run this before they subscribe:
+
+    1. log in every mapped device in parallel (WARMUP_CONCURRENCY at a time)
+       through the shared requests session, so the tokens are cached and
+       the logins themselves open pooled keep-alive connections
+    2. if there are fewer devices than WARMUP_CONNECTIONS, open the rest
+       with HEAD requests to the API base (any HTTP status will do)
+
+GET /ready on the admin server answers 503 until the warm-up is done,
+then 200, with per-step detail as JSON. A warm-up that takes longer than
+WARMUP_TIMEOUT_S is abandoned: the bridge goes ready and the remaining
+devices log in on their first message as before.
+
+    WARMUP_ENABLED=true
+    WARMUP_CONCURRENCY=8
+    WARMUP_CONNECTIONS=4
+    WARMUP_TIMEOUT_S=30
+    WARMUP_DEVICES=tug-55,tug-39   extra logins (bridge.py has no device map)
+
+Usage:
+    from src.common.warmup import Warmup
+
+    warmup = Warmup(session, authenticate_device, DEVICE_MAP.values(), TWINZO_API_BASE).install()
+    admin_http.start()
+    warmup.run()          # blocks; subscribe to MQTT afterwards
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from src.common import admin_http
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "8"))
+WARMUP_CONNECTIONS = int(os.getenv("WARMUP_CONNECTIONS", "4"))
+WARMUP_TIMEOUT_S = float(os.getenv("WARMUP_TIMEOUT_S", "30"))
+WARMUP_DEVICES = [d.strip() for d in os.getenv("WARMUP_DEVICES", "").split(",") if d.strip()]
+
+
+class Warmup:
+    """Parallel device logins and connection pre-opening, with a readiness flag"""
+
+    def __init__(self, session, authenticate, devices, url, concurrency=None, connections=None, timeout_s=None,
+                 enabled=None):
+        self.session = session
+        self.authenticate = authenticate
+        self.devices = list(dict.fromkeys(list(devices) + WARMUP_DEVICES))
+        self.url = url
+        self.concurrency = WARMUP_CONCURRENCY if concurrency is None else concurrency
+        self.connections = WARMUP_CONNECTIONS if connections is None else connections
+        self.timeout_s = WARMUP_TIMEOUT_S if timeout_s is None else timeout_s
+        self.enabled = WARMUP_ENABLED if enabled is None else enabled
+        self.ready = threading.Event()
+        self.authenticated = []
+        self.failed = []
+        self.opened = 0
+        self.seconds = None
+        self.timed_out = False
+
+    def _login(self, device):
+        if self.authenticate(device):
+            self.authenticated.append(device)
+        else:
+            self.failed.append(device)
+
+    def _connect(self):
+        try:
+            self.session.head(self.url, timeout=5)
+            self.opened += 1
+        except Exception as e:
+            print(f"WARN Warm-up connection to {self.url} failed: {e}")
+
+    def run(self):
+        """Warm up (unless disabled) and mark the bridge ready"""
+        started = time.monotonic()
+        if self.enabled:
+            extra = max(0, self.connections - len(self.devices))
+            workers = max(1, min(self.concurrency, len(self.devices) + extra))
+            pool = ThreadPoolExecutor(workers, thread_name_prefix="warmup")
+            futures = [pool.submit(self._login, d) for d in self.devices]
+            futures += [pool.submit(self._connect) for _ in range(extra)]
+            done, pending = wait(futures, timeout=self.timeout_s)
+            self.timed_out = bool(pending)
+            pool.shutdown(wait=False, cancel_futures=True)
+            self.seconds = round(time.monotonic() - started, 3)
+            if self.timed_out:
+                print(f"WARN Warm-up timed out after {self.timeout_s:g}s: "
+                      f"{len(self.authenticated)}/{len(self.devices)} devices logged in")
+            else:
+                print(f"OK Warm-up: {len(self.authenticated)}/{len(self.devices)} devices logged in, "
+                      f"{self.opened} extra connection(s) in {self.seconds:g}s")
+            if self.failed:
+                print(f"WARN Warm-up login failed for: {', '.join(sorted(self.failed))}")
+        self.ready.set()
+        return self
+
+    def status(self):
+        return {"ready": self.ready.is_set(), "enabled": self.enabled, "devices": len(self.devices),
+                "authenticated": len(self.authenticated), "failed": sorted(self.failed),
+                "connections_opened": self.opened, "seconds": self.seconds, "timed_out": self.timed_out}
+
+    def _http(self, query):
+        return (200 if self.ready.is_set() else 503), "application/json", json.dumps(self.status(), indent=1)
+
+    def install(self):
+        """Expose GET /ready on the admin server"""
+        admin_http.route("/ready", self._http)
+        return self
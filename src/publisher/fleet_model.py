@@ -0,0 +1,176 @@
+"""
+Vectorized motion model for simulated fleets
+
+Every robot's state lives in NumPy arrays and the whole fleet is stepped
+with one call per tick, so thousands of poses per tick cost a few array
+operations instead of a Python loop.
+
+Path shapes (per robot, may be mixed in one fleet):
+    loop       Lissajous loop across the region (~60 s per lap)
+    line       back and forth along a horizontal line
+    rectangle  corner to corner around the region's edge
+    waypoints  along a closed polyline (WAYPOINTS or a default route), robots spread along it
+    random     random-waypoint model: drive to a random point, then pick another
+
+Heading follows the publisher convention: measured from +Y, clockwise, in
+[0, 2pi). A robot that did not move this tick keeps its last heading.
+
+Usage:
+    fleet = FleetModel(500, shapes="mixed", region=(RMINX, RMINY, RMAXX, RMAXY))
+    x, y, theta = fleet.step(t, dt)    # arrays of length 500
+"""
+import numpy as np
+
+SHAPES = ("loop", "line", "rectangle", "waypoints", "random")
+LOOP_PERIOD_S = 60.0
+ARRIVE_EPS = 0.2  # same units as the region; closer than this counts as arrived
+EDGE = 2.0        # line/rectangle keep this far from the region border
+
+
+def parse_waypoints(spec):
+    """'x1,y1;x2,y2;...' -> (M, 2) array, or None for an empty spec"""
+    points = [tuple(float(v) for v in part.split(",")) for part in spec.split(";") if part.strip()]
+    return np.array(points, dtype=np.float64) if points else None
+
+
+def default_route(region):
+    """Closed zig-zag through the region, inset by 10%"""
+    minx, miny, maxx, maxy = region
+    w, h = maxx - minx, maxy - miny
+    xs = [0.1, 0.9, 0.9, 0.1, 0.1, 0.9, 0.9, 0.1]
+    ys = [0.1, 0.1, 0.37, 0.37, 0.63, 0.63, 0.9, 0.9]
+    return np.column_stack([minx + np.array(xs) * w, miny + np.array(ys) * h])
+
+
+def shape_codes(shapes, n):
+    """'loop' | 'mixed' | ['loop', 'line', ...] -> int array of SHAPES indices"""
+    if isinstance(shapes, str):
+        if shapes == "mixed":
+            return np.arange(n) % len(SHAPES)
+        shapes = [shapes] * n
+    unknown = set(shapes) - set(SHAPES)
+    if unknown:
+        raise ValueError(f"Unknown path shape(s) {sorted(unknown)}; expected one of {SHAPES} or 'mixed'")
+    return np.array([SHAPES.index(s) for s in shapes], dtype=np.int64)
+
+
+class FleetModel:
+    """Positions, headings and per-shape state for n robots"""
+
+    def __init__(self, n, shapes="loop", region=(0.0, 0.0, 100.0, 100.0), speeds=None,
+                 waypoints=None, seed=42):
+        self.n = n
+        self.region = region
+        minx, miny, maxx, maxy = region
+        idx = np.arange(n)
+        self.rng = np.random.default_rng(seed)
+        self.shape = shape_codes(shapes, n)
+        self.masks = {name: np.flatnonzero(self.shape == code) for code, name in enumerate(SHAPES)}
+
+        self.x = self.rng.uniform(minx + 5, maxx - 5, n)
+        self.y = self.rng.uniform(miny + 5, maxy - 5, n)
+        self.theta = np.zeros(n)
+        self.speed = (np.asarray(speeds, dtype=np.float64) if speeds is not None
+                      else 800.0 + 200.0 * (idx % 3))  # units/sec
+
+        # loop
+        self.phase = idx * 0.6
+        # line: start at the left edge on one of three lanes
+        self.direction = np.ones(n)
+        m = self.masks["line"]
+        self.x[m] = minx + EDGE
+        self.y[m] = miny + (maxy - miny) * (0.2 + 0.15 * (idx[m] % 3))
+        # rectangle: corners (xmin,ymin) -> (xmax,ymin) -> (xmax,ymax) -> (xmin,ymax)
+        margin = EDGE + 2.0 * (idx % 2)
+        self.rect = np.column_stack([minx + margin, miny + margin, maxx - margin, maxy - margin])
+        self.corner = np.zeros(n, dtype=np.int64)
+        # random: current targets
+        self.target_x = self.rng.uniform(minx, maxx, n)
+        self.target_y = self.rng.uniform(miny, maxy, n)
+        # waypoints: arc-length position along the closed route, robots spread evenly
+        route = default_route(region) if waypoints is None else np.asarray(waypoints, dtype=np.float64)
+        self.route = np.vstack([route, route[:1]])
+        seg = np.hypot(*np.diff(self.route, axis=0).T)
+        self.route_cum = np.concatenate([[0.0], np.cumsum(seg)])
+        self.route_len = self.route_cum[-1]
+        m = self.masks["waypoints"]
+        self.arc = np.zeros(n)
+        self.arc[m] = self.route_len * np.arange(len(m)) / max(len(m), 1)
+        self._place_on_route(m)
+
+    def _rect_corner(self, m):
+        c = self.corner[m]
+        r = self.rect[m]
+        tx = np.where((c == 1) | (c == 2), r[:, 2], r[:, 0])
+        ty = np.where(c >= 2, r[:, 3], r[:, 1])
+        return tx, ty
+
+    def _seek(self, m, tx, ty, dt):
+        """Move robots m toward (tx, ty); returns the boolean 'arrived' mask (robots did not move)"""
+        dx = tx - self.x[m]
+        dy = ty - self.y[m]
+        dist = np.hypot(dx, dy)
+        arrived = dist < ARRIVE_EPS
+        step = np.minimum(self.speed[m] * dt, dist)
+        scale = np.where(arrived, 0.0, step / np.where(arrived, 1.0, dist))
+        self.x[m] += dx * scale
+        self.y[m] += dy * scale
+        return arrived
+
+    def _place_on_route(self, m):
+        seg = np.searchsorted(self.route_cum, self.arc[m], side="right") - 1
+        seg = np.clip(seg, 0, len(self.route) - 2)
+        length = self.route_cum[seg + 1] - self.route_cum[seg]
+        frac = (self.arc[m] - self.route_cum[seg]) / np.where(length > 0, length, 1.0)
+        p0 = self.route[seg]
+        p1 = self.route[seg + 1]
+        self.x[m] = p0[:, 0] + frac * (p1[:, 0] - p0[:, 0])
+        self.y[m] = p0[:, 1] + frac * (p1[:, 1] - p0[:, 1])
+
+    def step(self, t, dt):
+        """Advance every robot by dt (loop robots are placed by absolute time t); returns (x, y, theta)"""
+        minx, miny, maxx, maxy = self.region
+        old_x = self.x.copy()
+        old_y = self.y.copy()
+
+        m = self.masks["loop"]
+        if len(m):
+            w = 2 * np.pi / LOOP_PERIOD_S
+            ph = self.phase[m]
+            self.x[m] = (maxx + minx) / 2.0 + (maxx - minx) / 2.5 * np.sin(w * t + ph)
+            self.y[m] = (maxy + miny) / 2.0 + (maxy - miny) / 3.0 * np.cos(0.8 * w * t + 0.5 * ph)
+
+        m = self.masks["line"]
+        if len(m):
+            x = self.x[m] + self.direction[m] * self.speed[m] * dt
+            over = x > maxx - EDGE
+            under = x < minx + EDGE
+            self.direction[m[over]] = -1.0
+            self.direction[m[under]] = 1.0
+            self.x[m] = np.clip(x, minx + EDGE, maxx - EDGE)
+
+        m = self.masks["rectangle"]
+        if len(m):
+            tx, ty = self._rect_corner(m)
+            arrived = self._seek(m, tx, ty, dt)
+            self.corner[m[arrived]] = (self.corner[m[arrived]] + 1) % 4
+
+        m = self.masks["random"]
+        if len(m):
+            arrived = self._seek(m, self.target_x[m], self.target_y[m], dt)
+            k = m[arrived]
+            if len(k):
+                self.target_x[k] = self.rng.uniform(minx, maxx, len(k))
+                self.target_y[k] = self.rng.uniform(miny, maxy, len(k))
+
+        m = self.masks["waypoints"]
+        if len(m) and self.route_len > 0:
+            self.arc[m] = (self.arc[m] + self.speed[m] * dt) % self.route_len
+            self._place_on_route(m)
+
+        dx = self.x - old_x
+        dy = self.y - old_y
+        moved = (dx != 0) | (dy != 0)
+        heading = np.mod(np.arctan2(dx, dy), 2 * np.pi)
+        self.theta = np.where(moved, heading, self.theta)
+        return self.x, self.y, self.theta
@@ -0,0 +1,334 @@
+"""
+Lane-following fleet simulator on the ATI map (movement_images/grid_map_attributes.json)
+
+Builds an undirected lane graph from terminal_lines_info (lanes are split
+where another lane's end point lies on them, so T-junctions connect) and
+snaps every station in stations_info to its graph node. AMRs then run
+trips the way tuggers do:
+
+    leg 1: drive to a pickup station, dwell (loading)
+    leg 2: drive to a drop station, dwell (unloading)
+    battery below LANE_LOW_BATTERY: drive to the charging station, charge, continue
+
+Routes are shortest paths (Dijkstra), cached per station pair. Speeds,
+dwell times and battery drain are per-robot randomized around realistic
+values. Each robot's state renders as an ATI sherpa/status payload:
+
+    {"sherpa_name": ..., "mode": "fleet", "error": "", "disabled": false, "disabled_reason": "",
+     "pose": [x_m, y_m, heading_rad], "battery_status": 78.4, "trip_id": 1042, "trip_leg_id": 2085,
+     "timestamp": 1705172345000}
+
+mode is "fleet" while working and "disconnected" while charging (ATI reports
+idle AMRs as disconnected). trip_id/trip_leg_id are null outside a trip.
+
+Usage:
+    lanes = LaneMap.load()
+    fleet = LaneFleet(lanes, ["tug-01", "tug-02"])
+    fleet.step(now, dt)
+    payload = fleet.payload(0, now)
+"""
+import heapq
+import json
+import math
+import os
+import random
+from bisect import bisect_right
+from pathlib import Path
+
+DEFAULT_MAP = Path(__file__).parent.parent.parent / "movement_images" / "grid_map_attributes.json"
+
+LANE_MAP = os.getenv("LANE_MAP", str(DEFAULT_MAP))
+LANE_SPEED = float(os.getenv("LANE_SPEED", "1.2"))            # m/s, tugger cruise speed
+LANE_DWELL_MIN = float(os.getenv("LANE_DWELL_MIN", "20"))     # s at a pickup/drop station
+LANE_DWELL_MAX = float(os.getenv("LANE_DWELL_MAX", "90"))
+LANE_LOW_BATTERY = float(os.getenv("LANE_LOW_BATTERY", "25"))  # % that sends an AMR to charge
+LANE_CHARGE_TO = float(os.getenv("LANE_CHARGE_TO", "95"))
+LANE_DRAIN_PER_KM = float(os.getenv("LANE_DRAIN_PER_KM", "3.0"))  # % per km driven
+LANE_DRAIN_PER_HOUR = float(os.getenv("LANE_DRAIN_PER_HOUR", "2.0"))  # % per hour, idle load
+LANE_CHARGE_PER_HOUR = float(os.getenv("LANE_CHARGE_PER_HOUR", "60.0"))
+
+JUNCTION_TOL = 0.05  # m; a lane end this close to another lane splits it there
+
+MODE_ACTIVE = "fleet"
+MODE_IDLE = "disconnected"
+
+DRIVE, DWELL, CHARGE = "drive", "dwell", "charge"
+
+
+def _project(p, a, b):
+    """(t, distance) of point p projected onto segment a-b"""
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return 0.0, math.dist(p, a)
+    t = ((p[0] - a[0]) * dx + (p[1] - a[1]) * dy) / length2
+    return t, math.dist(p, (a[0] + t * dx, a[1] + t * dy))
+
+
+class Route:
+    """Polyline from one node to another with cumulative arc length"""
+
+    __slots__ = ("points", "cum", "length")
+
+    def __init__(self, points):
+        self.points = points
+        self.cum = [0.0]
+        for p, q in zip(points, points[1:]):
+            self.cum.append(self.cum[-1] + math.dist(p, q))
+        self.length = self.cum[-1]
+
+    def at(self, s):
+        """(x, y, heading) at arc length s"""
+        if len(self.points) == 1:
+            x, y = self.points[0]
+            return x, y, None
+        i = min(max(bisect_right(self.cum, s) - 1, 0), len(self.points) - 2)
+        (x0, y0), (x1, y1) = self.points[i], self.points[i + 1]
+        seg = self.cum[i + 1] - self.cum[i]
+        f = min(max((s - self.cum[i]) / seg, 0.0), 1.0) if seg > 0 else 1.0
+        return x0 + f * (x1 - x0), y0 + f * (y1 - y0), math.atan2(y1 - y0, x1 - x0)
+
+
+class LaneMap:
+    """Lane graph, stations and cached shortest routes"""
+
+    def __init__(self, lanes, stations):
+        # lanes: [((x1, y1), (x2, y2)), ...]; stations: [{"name", "pose", "tags"}, ...]
+        self.nodes = []
+        self.index = {}
+        for a, b in lanes:
+            self._node(a)
+            self._node(b)
+        self.adj = [[] for _ in self.nodes]
+        for a, b in lanes:
+            cuts = [(0.0, a), (1.0, b)]
+            for p in self.nodes:
+                if p != a and p != b:
+                    t, d = _project(p, a, b)
+                    if 0.0 < t < 1.0 and d < JUNCTION_TOL:
+                        cuts.append((t, p))
+            cuts.sort()
+            for (_, p), (_, q) in zip(cuts, cuts[1:]):
+                if p != q:
+                    i, j = self.index[p], self.index[q]
+                    d = math.dist(p, q)
+                    self.adj[i].append((j, d))
+                    self.adj[j].append((i, d))
+
+        self.stations = []
+        for st in stations:
+            x, y = st["pose"][0], st["pose"][1]
+            node = min(range(len(self.nodes)), key=lambda i: math.dist(self.nodes[i], (x, y)))
+            self.stations.append({"name": st["name"], "node": node, "heading": st["pose"][2],
+                                  "tags": st.get("tags", [])})
+        self._routes = {}
+        self._dist = {}
+
+    def _node(self, p):
+        if p not in self.index:
+            self.index[p] = len(self.nodes)
+            self.nodes.append(p)
+        return self.index[p]
+
+    @classmethod
+    def load(cls, path=None):
+        with open(path or LANE_MAP, "r") as f:
+            data = json.load(f)
+        lanes = [(tuple(lane["t1"]), tuple(lane["t2"])) for lane in data["terminal_lines_info"].values()]
+        stations = [{"name": st["station_name"], "pose": st["pose"], "tags": st.get("station_tags") or []}
+                    for st in data["stations_info"].values()]
+        return cls(lanes, stations)
+
+    def _dijkstra(self, source):
+        dist = [math.inf] * len(self.nodes)
+        prev = [-1] * len(self.nodes)
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > dist[u]:
+                continue
+            for v, w in self.adj[u]:
+                nd = d + w
+                if nd < dist[v]:
+                    dist[v] = nd
+                    prev[v] = u
+                    heapq.heappush(heap, (nd, v))
+        return dist, prev
+
+    def route(self, a, b):
+        """Shortest Route between node indices (cached; one Dijkstra per source node)"""
+        key = (a, b)
+        route = self._routes.get(key)
+        if route is None:
+            if a not in self._dist:
+                self._dist[a] = self._dijkstra(a)
+            dist, prev = self._dist[a]
+            if math.isinf(dist[b]):
+                raise ValueError(f"No lane path between nodes {a} and {b}")
+            path = [b]
+            while path[-1] != a:
+                path.append(prev[path[-1]])
+            route = self._routes[key] = Route([self.nodes[i] for i in reversed(path)])
+        return route
+
+    def reachable(self, a, b):
+        if a not in self._dist:
+            self._dist[a] = self._dijkstra(a)
+        return not math.isinf(self._dist[a][0][b])
+
+    def stations_where(self, predicate):
+        return [i for i, st in enumerate(self.stations) if predicate(st)]
+
+
+def _is_pickup(st):
+    return "pic" in st["name"].lower()
+
+
+def _is_drop(st):
+    return "drop" in st["name"].lower()
+
+
+def _is_charger(st):
+    return "charging" in st["name"].lower()
+
+
+class AMR:
+    __slots__ = ("name", "x", "y", "heading", "state", "route", "s", "speed", "until", "station",
+                 "legs", "leg", "trip_id", "trip_leg_id", "battery", "dwell", "rng")
+
+
+class LaneFleet:
+    """Trip-running AMRs on a LaneMap"""
+
+    # Fields that change between messages, in slot_values() order (see payload_template.py)
+    SLOTS = [("mode",), ("pose", 0), ("pose", 1), ("pose", 2), ("battery_status",),
+             ("trip_id",), ("trip_leg_id",), ("timestamp",)]
+
+    def __init__(self, lanes, names, seed=42, speed=None, now=0.0):
+        self.lanes = lanes
+        self.rng = random.Random(seed)
+        self.pickups = lanes.stations_where(_is_pickup)
+        self.drops = lanes.stations_where(_is_drop)
+        chargers = lanes.stations_where(_is_charger)
+        self.charger = chargers[0] if chargers else None
+        if not self.pickups or not self.drops:
+            raise ValueError("Lane map needs pickup and drop stations")
+        self.next_trip_id = 1000
+        self.next_leg_id = 5000
+        self.amrs = []
+        speed = speed or LANE_SPEED
+        for name in names:
+            amr = AMR()
+            amr.name = name
+            amr.rng = random.Random(self.rng.random())
+            amr.speed = speed * amr.rng.uniform(0.85, 1.1)
+            amr.dwell = amr.rng.uniform(0.8, 1.2)  # per-robot dwell scale
+            amr.battery = amr.rng.uniform(40.0, 100.0)
+            amr.station = amr.rng.choice(self.pickups + self.drops)
+            amr.x, amr.y = lanes.nodes[lanes.stations[amr.station]["node"]]
+            amr.heading = lanes.stations[amr.station]["heading"]
+            amr.route = None
+            amr.s = 0.0
+            amr.legs = []
+            amr.leg = None
+            amr.trip_id = amr.trip_leg_id = None
+            # Staggered start: everyone begins mid-dwell
+            amr.state = DWELL
+            amr.until = now + amr.rng.uniform(0.0, LANE_DWELL_MAX)
+            self.amrs.append(amr)
+
+    def _plan_trip(self, amr):
+        """Next legs: charge if low, else pickup -> drop"""
+        if amr.battery < LANE_LOW_BATTERY and self.charger is not None:
+            amr.legs = [("charge", self.charger)]
+            amr.trip_id = None
+            return
+        here = self.lanes.stations[amr.station]["node"]
+        pickups = [i for i in self.pickups if self.lanes.reachable(here, self.lanes.stations[i]["node"])]
+        pickup = amr.rng.choice(pickups or self.pickups)
+        family = self.lanes.stations[pickup]["name"].split()[0].lower()
+        drops = [i for i in self.drops if i != pickup
+                 and self.lanes.stations[i]["name"].lower().startswith(family)]
+        drop = amr.rng.choice(drops or [i for i in self.drops if i != pickup])
+        amr.legs = [("pickup", pickup), ("drop", drop)]
+        amr.trip_id = self.next_trip_id
+        self.next_trip_id += 1
+
+    def _start_leg(self, amr, now):
+        purpose, station = amr.legs.pop(0)
+        amr.leg = (purpose, station)
+        a = self.lanes.stations[amr.station]["node"]
+        b = self.lanes.stations[station]["node"]
+        amr.route = self.lanes.route(a, b)
+        amr.s = 0.0
+        amr.state = DRIVE
+        if purpose == "charge":
+            amr.trip_leg_id = None
+        else:
+            amr.trip_leg_id = self.next_leg_id
+            self.next_leg_id += 1
+
+    def _arrive(self, amr, now):
+        purpose, station = amr.leg
+        amr.station = station
+        st = self.lanes.stations[station]
+        amr.x, amr.y = self.lanes.nodes[st["node"]]
+        amr.heading = st["heading"]
+        amr.route = None
+        if purpose == "charge":
+            amr.state = CHARGE
+        else:
+            amr.state = DWELL
+            amr.until = now + amr.dwell * amr.rng.uniform(LANE_DWELL_MIN, LANE_DWELL_MAX)
+
+    def step(self, now, dt):
+        """Advance every AMR by dt seconds"""
+        idle_drain = LANE_DRAIN_PER_HOUR / 3600.0 * dt
+        for amr in self.amrs:
+            if amr.state == DRIVE:
+                travel = amr.speed * dt
+                amr.s += travel
+                amr.battery -= LANE_DRAIN_PER_KM * travel / 1000.0 + idle_drain
+                if amr.s >= amr.route.length:
+                    self._arrive(amr, now)
+                else:
+                    x, y, heading = amr.route.at(amr.s)
+                    amr.x, amr.y = x, y
+                    if heading is not None:
+                        amr.heading = heading
+            elif amr.state == DWELL:
+                amr.battery -= idle_drain
+                if now >= amr.until:
+                    if not amr.legs:
+                        amr.trip_id = amr.trip_leg_id = None
+                        self._plan_trip(amr)
+                    self._start_leg(amr, now)
+            else:  # CHARGE
+                amr.battery += LANE_CHARGE_PER_HOUR / 3600.0 * dt
+                if amr.battery >= LANE_CHARGE_TO:
+                    self._plan_trip(amr)
+                    self._start_leg(amr, now)
+            amr.battery = min(max(amr.battery, 0.0), 100.0)
+
+    def slot_values(self, i, now):
+        """Values for SLOTS without building the payload dict"""
+        amr = self.amrs[i]
+        return (MODE_IDLE if amr.state == CHARGE else MODE_ACTIVE, round(amr.x, 3), round(amr.y, 3),
+                round(amr.heading, 4), round(amr.battery, 1), amr.trip_id, amr.trip_leg_id, int(now * 1000))
+
+    def payload(self, i, now):
+        """ATI sherpa/status payload for AMR i"""
+        amr = self.amrs[i]
+        return {
+            "sherpa_name": amr.name,
+            "mode": MODE_IDLE if amr.state == CHARGE else MODE_ACTIVE,
+            "error": "",
+            "disabled": False,
+            "disabled_reason": "",
+            "pose": [round(amr.x, 3), round(amr.y, 3), round(amr.heading, 4)],
+            "battery_status": round(amr.battery, 1),
+            "trip_id": amr.trip_id,
+            "trip_leg_id": amr.trip_leg_id,
+            "timestamp": int(now * 1000),
+        }
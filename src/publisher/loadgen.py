@@ -0,0 +1,428 @@
+"""
+Sharded MQTT load generator: find the publish ceiling of broker + bridge
+
+publisher.py pushes every robot through one paho client and one socket,
+so the generator tops out before the system under test. loadgen shards
+robots across --workers processes (robot i -> worker i % workers), each
+with --connections MQTT clients of its own, a Scheduler and a fleet model
+for its shard, and template-rendered payloads (payload_template.py).
+
+Every worker measures publish -> broker acknowledgement latency (PUBACK
+for QoS 1, PUBCOMP for QoS 2, socket write for QoS 0) into a log-bucket
+histogram and reports to the parent each interval. The parent merges the
+histograms and prints achieved send/ack rates, latency percentiles,
+in-flight messages and errors (publish refused, disconnects, never acked).
+
+Usage:
+    python src/publisher/loadgen.py --robots 2000 --hz 10 --workers 4 --connections 2 --qos 1 --seconds 60
+    python src/publisher/loadgen.py --robots 500 --shape lanes --qos 2 --json --output logs/loadgen.json
+
+Pair with DRY_RUN=true on the bridge to load MQTT ingest without posting to Twinzo.
+"""
+import argparse
+import json
+import math
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+
+from paho.mqtt import client as mqtt
+
+import publisher
+from lane_sim import LaneFleet
+from payload_template import PayloadTemplate
+from scheduler import Scheduler
+
+HOST = os.getenv("MQTT_HOST", "localhost")
+PORT = int(os.getenv("MQTT_PORT", "1883"))
+USER = os.getenv("MQTT_USERNAME", "") or None
+PASS = os.getenv("MQTT_PASSWORD", "") or None
+TOPIC = os.getenv("MQTT_TOPIC", "ati_fm/sherpa/status")
+
+MAX_INFLIGHT = int(os.getenv("LOADGEN_MAX_INFLIGHT", "1000"))
+MAX_QUEUED = int(os.getenv("LOADGEN_MAX_QUEUED", "20000"))  # beyond this publish() is refused (counted)
+DRAIN_TIMEOUT_S = 10.0
+
+
+class LatencyHistogram:
+    """Log-spaced buckets (20 per decade, 10 us .. 100 s); mergeable across processes"""
+
+    PER_DECADE = 20
+    MIN_S = 1e-5
+    BUCKETS = 7 * PER_DECADE + 2  # underflow, 7 decades, overflow
+
+    def __init__(self):
+        self.counts = [0] * self.BUCKETS
+        self.max = 0.0
+
+    def add(self, seconds):
+        if seconds > self.max:
+            self.max = seconds
+        if seconds < self.MIN_S:
+            i = 0
+        else:
+            i = min(int(math.log10(seconds / self.MIN_S) * self.PER_DECADE) + 1, self.BUCKETS - 1)
+        self.counts[i] += 1
+
+    def merge(self, counts, max_s):
+        for i, c in enumerate(counts):
+            self.counts[i] += c
+        self.max = max(self.max, max_s)
+
+    def total(self):
+        return sum(self.counts)
+
+    def upper(self, i):
+        """Upper edge of bucket i in seconds"""
+        return self.MIN_S * 10 ** (i / self.PER_DECADE)
+
+    def percentile(self, q):
+        total = self.total()
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                return min(self.upper(i), self.max)
+        return self.max
+
+
+def shard_indices(robots, workers):
+    """Robot indices per worker (round robin, so every worker gets a mix of shapes)"""
+    return [list(range(w, robots, workers)) for w in range(workers)]
+
+
+def make_client(client_id):
+    if hasattr(mqtt, "CallbackAPIVersion"):
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+    return mqtt.Client(client_id=client_id)
+
+
+class AckTracker:
+    """Matches publish() mids with on_publish callbacks for one connection"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = {}   # mid -> send time
+        self.early = {}     # mid -> ack time, when the ack beat publish() returning
+        self.hist = LatencyHistogram()
+        self.acked = 0
+        self.disconnects = 0
+
+    def sent(self, mid, t):
+        with self.lock:
+            acked_at = self.early.pop(mid, None)
+            if acked_at is None:
+                self.pending[mid] = t
+            else:
+                self.hist.add(max(acked_at - t, 0.0))
+                self.acked += 1
+
+    def on_publish(self, client, userdata, mid, *args):
+        now = time.monotonic()
+        with self.lock:
+            t = self.pending.pop(mid, None)
+            if t is None:
+                self.early[mid] = now
+            else:
+                self.hist.add(now - t)
+                self.acked += 1
+
+    def on_disconnect(self, client, userdata, *args):
+        self.disconnects += 1
+
+    def take(self):
+        """(acked, histogram) since the last call"""
+        with self.lock:
+            acked, hist = self.acked, self.hist
+            self.acked = 0
+            self.hist = LatencyHistogram()
+        return acked, hist
+
+
+class ShardPublisher:
+    """One worker's robots, connections and counters"""
+
+    def __init__(self, worker_id, indices, config, clients):
+        self.worker_id = worker_id
+        self.config = config
+        self.clients = clients
+        self.trackers = [AckTracker() for _ in clients]
+        for client, tracker in zip(clients, self.trackers):
+            client.on_publish = tracker.on_publish
+            client.on_disconnect = tracker.on_disconnect
+        self.sent = 0
+        self.refused = 0
+        self.sched = Scheduler()
+
+        hz = config["hz"]
+        dt = 1.0 / hz
+        names = [f"{config['prefix']}-{i + 1:04d}" for i in indices]
+        seed = 42 + worker_id
+        if config["shape"] == "lanes":
+            traffic = publisher.LaneTraffic(names, dt=dt, seed=seed)
+            self.sched.add("_fleet", hz, traffic.step, report=False)
+            fleet = traffic.fleet
+            renders = []
+            for k in range(len(names)):
+                sample = fleet.payload(k, time.time())
+                tpl = PayloadTemplate(sample, LaneFleet.SLOTS)
+                if tpl.matches(sample):
+                    renders.append(lambda k=k, render=tpl.render: render(*fleet.slot_values(k, time.time())))
+                else:
+                    print(f"WARN Payload template mismatch for {names[k]}; using json.dumps")
+                    renders.append(lambda k=k: json.dumps(fleet.payload(k, time.time())).encode())
+        else:
+            poses = publisher.FleetPoses(len(names), shape=config["shape"], dt=dt, seed=seed)
+            self.sched.add("_fleet", hz, poses.step, report=False)
+            renders = []
+            for k, idx in enumerate(indices):
+                state = publisher.make_robot(idx)
+                sample = publisher.build_payload(names[k], k, state, poses)
+                tpl = PayloadTemplate(sample, publisher.POSE_SLOTS)
+                if tpl.matches(sample):
+                    renders.append(lambda k=k, state=state, render=tpl.render: render(
+                        poses.x[k], poses.y[k], poses.theta[k], round(state["battery"], 2)))
+                else:
+                    print(f"WARN Payload template mismatch for {names[k]}; using json.dumps")
+                    renders.append(lambda k=k, state=state: json.dumps(
+                        publisher.build_payload(names[k], k, state, poses)).encode())
+        for k, name in enumerate(names):
+            c = k % len(clients)
+            self.sched.add(name, hz, self._publisher(clients[c], self.trackers[c], renders[k]),
+                           offset=dt * k / max(len(names), 1))
+
+    def _publisher(self, client, tracker, render):
+        topic, qos = self.config["topic"], self.config["qos"]
+
+        def publish(due):
+            data = render()
+            t = time.monotonic()
+            info = client.publish(topic, data, qos=qos)
+            if info.rc == mqtt.MQTT_ERR_SUCCESS:
+                self.sent += 1
+                tracker.sent(info.mid, t)
+            else:
+                self.refused += 1
+        return publish
+
+    def inflight(self):
+        return sum(len(t.pending) for t in self.trackers)
+
+    def snapshot(self, final=False):
+        """Counters since the last snapshot, as a plain dict for the parent"""
+        acked = 0
+        hist = LatencyHistogram()
+        for tracker in self.trackers:
+            a, h = tracker.take()
+            acked += a
+            hist.merge(h.counts, h.max)
+        late = [s["late_ms_p99"] for s in self.sched.report().values()]
+        snap = {
+            "worker": self.worker_id,
+            "sent": self.sent,
+            "refused": self.refused,
+            "acked": acked,
+            "counts": hist.counts,
+            "max_s": hist.max,
+            "inflight": self.inflight(),
+            "disconnects": sum(t.disconnects for t in self.trackers),
+            "sched_late_p99_ms": max(late) if late else 0.0,
+            "final": final,
+        }
+        self.sent = self.refused = 0
+        return snap
+
+
+def worker_main(worker_id, indices, config, results, go, stop):
+    """Process entry point: connect, wait for the start signal, publish until stopped"""
+    clients = []
+    try:
+        for c in range(config["connections"]):
+            client = make_client(f"loadgen-{os.getpid()}-{c}")
+            if USER:
+                client.username_pw_set(USER, PASS or "")
+            client.max_inflight_messages_set(MAX_INFLIGHT)
+            client.max_queued_messages_set(MAX_QUEUED)
+            client.connect(config["host"], config["port"], keepalive=30)
+            client.loop_start()
+            clients.append(client)
+        shard = ShardPublisher(worker_id, indices, config, clients)
+    except Exception as e:
+        results.put({"worker": worker_id, "error": f"{type(e).__name__}: {e}"})
+        return
+    results.put({"worker": worker_id, "ready": True})
+    go.wait()
+
+    shard.sched.every(config["report_every"], lambda due: results.put(shard.snapshot()))
+    shard.sched.every(0.2, lambda due: stop.is_set() and shard.sched.stop())
+    shard.sched.run(duration=config["seconds"])
+
+    # Let outstanding acknowledgements arrive before the final count
+    deadline = time.monotonic() + DRAIN_TIMEOUT_S
+    while shard.inflight() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    results.put(shard.snapshot(final=True))
+    for client in clients:
+        client.loop_stop()
+        client.disconnect()
+
+
+class Aggregate:
+    """Totals and per-interval figures across workers"""
+
+    def __init__(self):
+        self.sent = self.refused = self.acked = 0
+        self.hist = LatencyHistogram()
+        self.inflight = {}
+        self.disconnects = {}
+        self.sched_late = {}
+
+    def add(self, snap):
+        self.sent += snap["sent"]
+        self.refused += snap["refused"]
+        self.acked += snap["acked"]
+        self.hist.merge(snap["counts"], snap["max_s"])
+        self.inflight[snap["worker"]] = snap["inflight"]
+        self.disconnects[snap["worker"]] = snap["disconnects"]
+        self.sched_late[snap["worker"]] = snap["sched_late_p99_ms"]
+
+    def summary(self, duration):
+        duration = max(duration, 1e-9)
+        inflight = sum(self.inflight.values())
+        return {
+            "duration_s": round(duration, 3),
+            "sent": self.sent,
+            "acked": self.acked,
+            "sent_per_s": round(self.sent / duration, 1),
+            "acked_per_s": round(self.acked / duration, 1),
+            "ack_p50_ms": round(self.hist.percentile(0.50) * 1000, 3),
+            "ack_p90_ms": round(self.hist.percentile(0.90) * 1000, 3),
+            "ack_p99_ms": round(self.hist.percentile(0.99) * 1000, 3),
+            "ack_max_ms": round(self.hist.max * 1000, 3),
+            "refused": self.refused,
+            "unacked": inflight,
+            "disconnects": sum(self.disconnects.values()),
+            "sched_late_p99_ms": round(max(self.sched_late.values(), default=0.0), 3),
+        }
+
+
+def format_summary(s, prefix=None):
+    prefix = prefix or f"OK {s['duration_s']:.0f}s"
+    return (f"{prefix}: sent {s['sent_per_s']:.0f}/s acked {s['acked_per_s']:.0f}/s, "
+            f"ack p50 {s['ack_p50_ms']:.2f}ms p90 {s['ack_p90_ms']:.2f}ms p99 {s['ack_p99_ms']:.2f}ms "
+            f"max {s['ack_max_ms']:.1f}ms, in flight {s['unacked']}, refused {s['refused']}, "
+            f"disconnects {s['disconnects']}, scheduler p99 late {s['sched_late_p99_ms']:.1f}ms")
+
+
+def run(config, report=True):
+    """Start workers, publish for config["seconds"], return the overall summary dict"""
+    workers = config["workers"]
+    results = mp.Queue()
+    go = mp.Event()
+    stop = mp.Event()
+    procs = []
+    for w, indices in enumerate(shard_indices(config["robots"], workers)):
+        p = mp.Process(target=worker_main, args=(w, indices, config, results, go, stop), daemon=True)
+        p.start()
+        procs.append(p)
+
+    ready = 0
+    while ready < workers:
+        msg = results.get(timeout=60)
+        if "error" in msg:
+            stop.set()
+            go.set()
+            raise RuntimeError(f"worker {msg['worker']}: {msg['error']}")
+        ready += 1
+
+    total = Aggregate()
+    interval = Aggregate()
+    t0 = last = time.monotonic()
+    go.set()
+    finals = 0
+    try:
+        while finals < workers:
+            try:
+                snap = results.get(timeout=0.5)
+            except queue.Empty:
+                if not any(p.is_alive() for p in procs):
+                    break
+                continue
+            total.add(snap)
+            finals += snap["final"]
+            if snap["final"]:
+                continue
+            interval.add(snap)
+            # One snapshot per worker per interval; print once all of them are in
+            if len(interval.inflight) == workers:
+                now = time.monotonic()
+                if report:
+                    print(format_summary(interval.summary(now - last), prefix=f"  t={now - t0:.0f}s"))
+                interval = Aggregate()
+                last = now
+    except KeyboardInterrupt:
+        stop.set()
+        print("\nStopping workers ...")
+        for p in procs:
+            p.join(DRAIN_TIMEOUT_S + 5)
+    for p in procs:
+        p.join(5)
+    # Workers stop publishing at t0 + seconds; the drain time is not part of the rate
+    return total.summary(min(time.monotonic() - t0, config["seconds"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded MQTT load generator")
+    parser.add_argument("--robots", type=int, default=1000)
+    parser.add_argument("--hz", type=float, default=10.0, help="Messages per second per robot")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    parser.add_argument("--connections", type=int, default=1, help="MQTT connections per worker")
+    parser.add_argument("--qos", type=int, choices=[0, 1, 2], default=1)
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--shape", default="mixed",
+                        help="loop | line | rectangle | waypoints | random | mixed | lanes")
+    parser.add_argument("--prefix", default="load")
+    parser.add_argument("--topic", default=TOPIC)
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--report-every", type=float, default=5.0)
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    parser.add_argument("--output", help="Also write the summary (with the config) to this JSON file")
+    args = parser.parse_args()
+    if args.hz <= 0 or args.robots <= 0 or args.workers <= 0 or args.connections <= 0:
+        parser.error("--robots, --hz, --workers and --connections must be positive")
+
+    config = {
+        "robots": args.robots, "hz": args.hz, "workers": min(args.workers, args.robots),
+        "connections": args.connections, "qos": args.qos, "shape": args.shape, "prefix": args.prefix,
+        "topic": args.topic, "host": args.host, "port": args.port, "report_every": args.report_every,
+        "seconds": args.seconds,
+    }
+    print(f"Load: {args.robots} robots x {args.hz:g} Hz = {args.robots * args.hz:.0f} msg/s target, "
+          f"{config['workers']} workers x {args.connections} connection(s), QoS {args.qos}, "
+          f"mqtt://{args.host}:{args.port}")
+    try:
+        summary = run(config)
+    except (RuntimeError, queue.Empty) as e:
+        print(f"FAIL Load generator did not start: {e}")
+        sys.exit(1)
+
+    summary["target_per_s"] = round(args.robots * args.hz, 1)
+    if args.json:
+        print(json.dumps(summary))
+    else:
+        print(format_summary(summary))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": config, "summary": summary}, f, indent=2)
+        print(f"OK Summary written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,11 @@
-import os, json, time, math, random, threading
+import os, json, time
 from paho.mqtt import client as mqtt
 
+from fleet_model import FleetModel, parse_waypoints
+from lane_sim import LaneFleet, LaneMap
+from payload_template import PayloadTemplate
+from scheduler import Scheduler
+
 HOST = os.getenv("MQTT_HOST", "localhost")
 PORT = int(os.getenv("MQTT_PORT", "1883"))
 USER = os.getenv("MQTT_USERNAME", "") or None
@@ -10,7 +15,8 @@ NUM_ROBOTS = int(os.getenv("NUM_ROBOTS", "3"))
 ROBOT_PREFIX = os.getenv("ROBOT_PREFIX", "tugger")
 HZ = float(os.getenv("HZ", "10"))
 DT = 1.0 / HZ if HZ > 0 else 1.0
-PATH_SHAPE = os.getenv("PATH_SHAPE", "loop")
+PATH_SHAPE = os.getenv("PATH_SHAPE", "loop")  # loop | line | rectangle | waypoints | random | mixed | lanes
+WAYPOINTS = os.getenv("WAYPOINTS", "")  # "x1,y1;x2,y2;..." route for PATH_SHAPE=waypoints
 
 # Real-world coordinates for Twinzo visualization
 RMINX = float(os.getenv("REGION_MIN_X", "195630.16"))  # Top left X
@@ -19,116 +25,87 @@ RMAXX = float(os.getenv("REGION_MAX_X", "223641.36"))  # Bottom right X
 RMAXY = float(os.getenv("REGION_MAX_Y", "213782.93"))  # Bottom right Y
 
 INCLUDE_TRIPS = os.getenv("INCLUDE_TRIPS", "true").lower() == "true"
+REPORT_EVERY_S = float(os.getenv("REPORT_EVERY_S", "10"))
+# template: patch pose/battery/timestamp into pre-serialized bytes (identical to json.dumps); json: dumps per message
+PAYLOAD_MODE = os.getenv("PAYLOAD_MODE", "template")
 
-def yaw_from_y_clockwise(dx, dy):
-    """
-    theta measured from +Y axis, clockwise, in [0, 2pi).
-    Using atan2(dx, dy) (note the swapped order).
-    """
-    theta = math.atan2(dx, dy)
-    if theta < 0:
-        theta += 2*math.pi
-    return theta
-
-def make_path(shape, idx):
-    if shape == "line":
-        y = RMINY + (RMAXY - RMINY) * (0.2 + 0.15 * (idx % 3))
-        return {"type":"line", "y":y}
-    elif shape == "rectangle":
-        margin = 2 + 2*(idx%2)
-        return {"type":"rectangle", "xmin":RMINX+margin, "xmax":RMAXX-margin, "ymin":RMINY+margin, "ymax":RMAXY-margin}
-    else:
-        return {"type":"loop", "phase": (idx * 0.6)}
-
-def step_position(state):
-    t = time.time()
-    path = state["path"]
-    speed = state["speed"]
-    x, y = state["x"], state["y"]
-    if path["type"] == "loop":
-        w = 2*math.pi/60.0  # ~60s per loop
-        ph = path["phase"]
-        ax = (RMAXX - RMINX)/2.5
-        ay = (RMAXY - RMINY)/3.0
-        cx = (RMAXX + RMINX)/2.0
-        cy = (RMAXY + RMINY)/2.0
-        newx = cx + ax * math.sin(w*t + ph)
-        newy = cy + ay * math.cos(0.8*w*t + 0.5*ph)
-        dx = newx - x; dy = newy - y
-        x, y = newx, newy
-    elif path["type"] == "rectangle":
-        if "target" not in state:
-            state["target"] = (path["xmin"], path["ymin"])
-        tx, ty = state["target"]
-        dx, dy = tx - x, ty - y
-        dist = math.hypot(dx, dy)
-        if dist < 0.2:
-            corners = [
-                (path["xmin"], path["ymin"]),
-                (path["xmax"], path["ymin"]),
-                (path["xmax"], path["ymax"]),
-                (path["xmin"], path["ymax"]),
-            ]
-            if "corner_idx" not in state: state["corner_idx"] = 0
-            state["corner_idx"] = (state["corner_idx"] + 1) % 4
-            state["target"] = corners[state["corner_idx"]]
-            dx = dy = 0.0
-        else:
-            step = min(speed*DT, dist)
-            if dist > 0:
-                x += dx/dist * step
-                y += dy/dist * step
-    else:  # line
-        if "dir" not in state:
-            state["dir"] = +1
-            state["x"] = RMINX + 2.0
-            state["y"] = path["y"]
-        x += state["dir"] * speed * DT
-        if x > RMAXX - 2.0:
-            x = RMAXX - 2.0; state["dir"] = -1
-        if x < RMINX + 2.0:
-            x = RMINX + 2.0; state["dir"] = +1
-        dx = state["dir"] * speed * DT; dy = 0.0
-
-    theta = yaw_from_y_clockwise(dx, dy)
-    state["x"], state["y"], state["theta"] = x, y, theta
-    return x, y, theta
-
-def run_robot(idx, client, name):
-    random.seed(idx*1337 + 42)
-    state = {
-        "x": random.uniform(RMINX+5, RMAXX-5),
-        "y": random.uniform(RMINY+5, RMAXY-5),
-        "theta": 0.0,
-        "speed": 800 + 200*(idx%3),  # units/sec (faster for visible movement)
-        "path": make_path(PATH_SHAPE, idx),
-        "battery": [79.0, 77.0, 75.0][idx],  # Specific battery levels
+def make_robot(idx):
+    return {
+        "battery": [79.0, 77.0, 75.0][idx % 3],  # Specific battery levels
         "trip_id": 1000 + idx,
         "trip_leg_id": 5000 + idx,
         "mode": "Fleet",
         "error": ""
     }
-    last_pub = 0.0
-    while True:
+
+class FleetPoses:
+    """Steps the whole fleet once per tick; robots publish the latest pose"""
+
+    def __init__(self, n, shape=None, dt=None, seed=42):
+        self.model = FleetModel(n, shapes=shape or PATH_SHAPE, region=(RMINX, RMINY, RMAXX, RMAXY),
+                                waypoints=parse_waypoints(WAYPOINTS), seed=seed)
+        self.dt = dt or DT
+        self.x = self.y = self.theta = None
+        self.step(0.0)
+
+    def step(self, due):
+        x, y, theta = self.model.step(time.time(), self.dt)
+        # Plain lists: per-robot reads are then ordinary float lookups
+        self.x, self.y, self.theta = x.tolist(), y.tolist(), theta.tolist()
+
+def build_payload(name, idx, state, poses):
+    # Keep battery levels constant for demo
+    return {
+        "sherpa_name": name,
+        "mode": state["mode"],
+        "error": state["error"],
+        "disabled": False,
+        "disabled_reason": "",
+        "pose": [poses.x[idx], poses.y[idx], 0.0, 0.0, 0.0, poses.theta[idx]],
+        "battery_status": round(state["battery"], 2),
+        "trip_id": state["trip_id"],
+        "trip_leg_id": state["trip_leg_id"]
+    }
+
+POSE_SLOTS = [("pose", 0), ("pose", 1), ("pose", 5), ("battery_status",)]
+
+def make_publisher(client, name, idx, state, poses):
+    """Per-robot publish callback; template mode checks itself against json.dumps first"""
+    if PAYLOAD_MODE == "template":
+        sample = build_payload(name, idx, state, poses)
+        tpl = PayloadTemplate(sample, POSE_SLOTS)
+        if tpl.matches(sample):
+            render = tpl.render
+            def publish(due):
+                client.publish(TOPIC, render(poses.x[idx], poses.y[idx], poses.theta[idx],
+                                             round(state["battery"], 2)), qos=1, retain=False)
+            return publish
+        print(f"WARN Payload template mismatch for {name}; using json.dumps")
+    return lambda due: client.publish(TOPIC, json.dumps(build_payload(name, idx, state, poses)),
+                                      qos=1, retain=False)
+
+class LaneTraffic:
+    """PATH_SHAPE=lanes: trips along the ATI lane map, published as ATI payloads (meters)"""
+
+    def __init__(self, names, dt=None, seed=42):
+        self.fleet = LaneFleet(LaneMap.load(), names, seed=seed, now=time.time())
+        self.dt = dt or DT
+
+    def step(self, due):
+        self.fleet.step(time.time(), self.dt)
+
+def make_lane_publisher(client, name, idx, traffic):
+    fleet = traffic.fleet
+    if PAYLOAD_MODE == "template":
         now = time.time()
-        if now - last_pub >= DT:
-            last_pub = now
-            x, y, theta = step_position(state)
-            # Keep battery levels constant for demo
-            # state["battery"] = max(0.0, state["battery"] - 0.0005)
-            payload = {
-                "sherpa_name": name,
-                "mode": state["mode"],
-                "error": state["error"],
-                "disabled": False,
-                "disabled_reason": "",
-                "pose": [x, y, 0.0, 0.0, 0.0, theta],
-                "battery_status": round(state["battery"], 2),
-                "trip_id": state["trip_id"],
-                "trip_leg_id": state["trip_leg_id"]
-            }
-            client.publish(TOPIC, json.dumps(payload), qos=1, retain=False)
-        time.sleep(0.002)
+        tpl = PayloadTemplate(fleet.payload(idx, now), LaneFleet.SLOTS)
+        if tpl.matches(fleet.payload(idx, now)):
+            render = tpl.render
+            return lambda due: client.publish(TOPIC, render(*fleet.slot_values(idx, time.time())),
+                                              qos=1, retain=False)
+        print(f"WARN Payload template mismatch for {name}; using json.dumps")
+    return lambda due: client.publish(TOPIC, json.dumps(fleet.payload(idx, time.time())),
+                                      qos=1, retain=False)
 
 def main():
     client = mqtt.Client()
@@ -137,20 +114,34 @@ def main():
     client.connect(HOST, PORT, keepalive=30)
     client.loop_start()
 
+    # One scheduler thread drives every robot; start times are spread over one period
     names = [f"{ROBOT_PREFIX}-{i:02d}" for i in range(1, NUM_ROBOTS+1)]
-    threads = []
-    for idx, name in enumerate(names):
-        th = threading.Thread(target=run_robot, args=(idx, client, name), daemon=True)
-        th.start(); threads.append(th)
+    sched = Scheduler()
+    if PATH_SHAPE == "lanes":
+        traffic = LaneTraffic(names)
+        sched.add("_fleet", HZ if HZ > 0 else 1.0, traffic.step, report=False)
+        for idx, name in enumerate(names):
+            sched.add(name, HZ if HZ > 0 else 1.0, make_lane_publisher(client, name, idx, traffic),
+                      offset=DT * idx / len(names))
+    else:
+        poses = FleetPoses(len(names))
+        sched.add("_fleet", HZ if HZ > 0 else 1.0, poses.step, report=False)
+        for idx, name in enumerate(names):
+            state = make_robot(idx)
+            sched.add(name, HZ if HZ > 0 else 1.0, make_publisher(client, name, idx, state, poses),
+                      offset=DT * idx / len(names))
+    if REPORT_EVERY_S > 0:
+        sched.every(REPORT_EVERY_S, lambda due: print(sched.format_report(per_task=NUM_ROBOTS <= 10)))
 
-    print(f"Publishing {NUM_ROBOTS} robots to mqtt://{HOST}:{PORT} topic '{TOPIC}' at ~{HZ} Hz each. Ctrl+C to stop.")
+    print(f"Publishing {NUM_ROBOTS} robots to mqtt://{HOST}:{PORT} topic '{TOPIC}' at ~{HZ} Hz each "
+          f"({PAYLOAD_MODE} payloads). Ctrl+C to stop.")
     try:
-        while True:
-            time.sleep(1)
+        sched.run()
     except KeyboardInterrupt:
         pass
     finally:
         client.loop_stop()
+        print(sched.format_report(per_task=True))
 
 if __name__ == "__main__":
     main()
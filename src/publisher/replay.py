@@ -0,0 +1,276 @@
+"""
+Replay recorded ATI traffic to an MQTT broker for bridge load testing
+
+Sources:
+  - flight recorder segments (logs/recordings/, exact payload bytes, topic and QoS)
+  - ati_messages rows from logs/ati_data.db (payloads rebuilt in the ATI format)
+
+Messages are republished with their original inter-arrival times divided by
+--speed (1 = real time, 10 = ten times faster, max = as fast as possible).
+Devices are sharded across --connections MQTT clients by sherpa_name, and each
+client publishes its devices' messages in recorded order, so per-device
+ordering holds at any speed. At the end it reports achieved msgs/s and
+publish lag (how late each publish was relative to its scheduled time).
+
+Usage:
+    python -X utf8 src/publisher/replay.py --from "2025-01-15 06:00" --minutes 30 --speed 10
+    python -X utf8 src/publisher/replay.py --source db --speed max --connections 4
+
+Pair with DRY_RUN=true on the bridge to measure bridge throughput without posting to Twinzo.
+"""
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+
+from paho.mqtt import client as mqtt
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+from src.common.flight_recorder import FLIGHT_RECORDER_DIR, iter_records
+from src.common.telemetry import EPOCH_MS_SQL, TELEMETRY_DB
+
+HOST = os.getenv("MQTT_HOST", "localhost")
+PORT = int(os.getenv("MQTT_PORT", "1883"))
+USER = os.getenv("MQTT_USERNAME", "") or None
+PASS = os.getenv("MQTT_PASSWORD", "") or None
+TOPIC = os.getenv("MQTT_TOPIC", "ati_fm/sherpa/status")
+
+REPORT_EVERY_S = 5.0
+
+
+def device_key(topic, payload):
+    """Ordering key: sherpa_name from the payload, the topic if there is none"""
+    try:
+        name = json.loads(payload).get("sherpa_name")
+    except (ValueError, AttributeError):
+        name = None
+    return name or topic
+
+
+def load_recording(directory=None, start_s=None, end_s=None, topic=None):
+    """Recorded messages as (ts_us, topic, qos, retain, payload), time-ordered"""
+    events = [tuple(rec) for rec in iter_records(directory, start_s, end_s, topic=topic)]
+    events.sort(key=lambda e: e[0])  # several recorders may overlap in time
+    return events
+
+
+def load_db(db_path=None, start_s=None, end_s=None, device=None, topic=None):
+    """ati_messages rows rebuilt as ATI payloads, time-ordered"""
+    sql = f"""
+        SELECT {EPOCH_MS_SQL}, device_name, ati_x, ati_y, ati_heading, battery_status, mode
+        FROM ati_messages WHERE 1 = 1
+    """
+    params = []
+    if start_s is not None:
+        sql += " AND timestamp >= ?"
+        params.append(time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start_s)))
+    if end_s is not None:
+        sql += " AND timestamp < ?"
+        params.append(time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(end_s)))
+    if device:
+        sql += " AND device_name = ?"
+        params.append(device)
+    sql += " ORDER BY timestamp, id"
+
+    conn = sqlite3.connect(str(db_path or TELEMETRY_DB))
+    try:
+        events = []
+        for ts_ms, name, x, y, heading, battery, mode in conn.execute(sql, params):
+            payload = {
+                "sherpa_name": name,
+                "mode": mode or "Fleet",
+                "pose": [x, y, 0.0, 0.0, 0.0, heading or 0.0],
+                "battery_status": battery,
+            }
+            events.append((ts_ms * 1000, topic or TOPIC, 1, False, json.dumps(payload).encode()))
+        return events
+    finally:
+        conn.close()
+
+
+def shard(events, shards):
+    """Split events across shards by device; each shard keeps recorded order"""
+    buckets = [[] for _ in range(shards)]
+    for event in events:
+        key = device_key(event[1], event[4])
+        buckets[zlib.crc32(key.encode()) % shards].append(event)
+    return buckets
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+class ReplayStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.errors = 0
+        self.lags = []
+
+    def add(self, sent, errors, lags):
+        with self.lock:
+            self.sent += sent
+            self.errors += errors
+            self.lags.extend(lags)
+
+
+def _publish_shard(client, events, t0, ts0, speed, stats, qos=None):
+    sent = errors = 0
+    lags = []
+    info = None
+    for ts_us, topic, event_qos, retain, payload in events:
+        if speed:
+            scheduled = t0 + (ts_us - ts0) / 1_000_000 / speed
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            lags.append(time.monotonic() - scheduled)
+        info = client.publish(topic, payload, event_qos if qos is None else qos, retain)
+        if info.rc == mqtt.MQTT_ERR_SUCCESS:
+            sent += 1
+        else:
+            errors += 1
+        # Hand over counts regularly so progress reports stay current
+        if len(lags) >= 1000 or (not speed and sent % 1000 == 0):
+            stats.add(sent, errors, lags)
+            sent = errors = 0
+            lags = []
+    stats.add(sent, errors, lags)
+    return info
+
+
+def replay(events, clients, speed=1.0, qos=None, report=True):
+    """
+    Publish events through the given clients (one shard each) and return a
+    summary dict. speed=0 publishes as fast as possible.
+    """
+    if not events:
+        return {"messages": 0, "errors": 0, "duration_s": 0.0, "msgs_per_s": 0.0,
+                "lag_p50_ms": 0.0, "lag_p99_ms": 0.0, "lag_max_ms": 0.0}
+
+    shards = shard(events, len(clients))
+    ts0 = events[0][0]
+    stats = ReplayStats()
+    last_info = [None] * len(clients)
+    t0 = time.monotonic() + 0.1  # let every shard start before the first deadline
+
+    def run(i):
+        last_info[i] = _publish_shard(clients[i], shards[i], t0, ts0, speed, stats, qos)
+
+    threads = [threading.Thread(target=run, args=(i,), daemon=True) for i in range(len(clients))]
+    for th in threads:
+        th.start()
+
+    next_report = time.monotonic() + REPORT_EVERY_S
+    while any(th.is_alive() for th in threads):
+        for th in threads:
+            th.join(0.2)
+        if report and time.monotonic() >= next_report:
+            elapsed = time.monotonic() - t0
+            print(f"  {stats.sent}/{len(events)} published ({stats.sent / elapsed:.0f} msg/s)")
+            next_report += REPORT_EVERY_S
+
+    # QoS > 0: the run ends when the broker has acknowledged the last message
+    for info in last_info:
+        if info is not None and info.rc == mqtt.MQTT_ERR_SUCCESS:
+            try:
+                info.wait_for_publish(timeout=30)
+            except (RuntimeError, ValueError):
+                pass
+    duration = max(time.monotonic() - t0, 1e-9)
+
+    lags = sorted(stats.lags)
+    return {
+        "messages": stats.sent,
+        "errors": stats.errors,
+        "duration_s": round(duration, 3),
+        "msgs_per_s": round(stats.sent / duration, 1),
+        "recorded_span_s": round((events[-1][0] - ts0) / 1_000_000, 3),
+        "lag_p50_ms": round(percentile(lags, 0.50) * 1000, 3),
+        "lag_p99_ms": round(percentile(lags, 0.99) * 1000, 3),
+        "lag_max_ms": round((lags[-1] if lags else 0.0) * 1000, 3),
+    }
+
+
+def connect_clients(count, host=None, port=None):
+    clients = []
+    for i in range(count):
+        client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=f"replay-{os.getpid()}-{i}")
+        if USER:
+            client.username_pw_set(USER, PASS or "")
+        client.max_inflight_messages_set(1000)
+        client.connect(host or HOST, port or PORT, keepalive=30)
+        client.loop_start()
+        clients.append(client)
+    return clients
+
+
+def parse_speed(value):
+    return 0.0 if value == "max" else float(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded ATI MQTT traffic")
+    parser.add_argument("--source", choices=["recording", "db"], default="recording")
+    parser.add_argument("--dir", default=FLIGHT_RECORDER_DIR, help="Recording directory")
+    parser.add_argument("--db", default=TELEMETRY_DB, help="Database for --source db")
+    parser.add_argument("--from", dest="start", help="Start time, UTC 'YYYY-MM-DD HH:MM'")
+    parser.add_argument("--minutes", type=float, help="Length of the window to replay")
+    parser.add_argument("--device", help="Only this device (--source db)")
+    parser.add_argument("--topic", help="Only this topic (recording) / publish topic (db)")
+    parser.add_argument("--speed", type=parse_speed, default=1.0, help="1, N or 'max'")
+    parser.add_argument("--connections", type=int, default=1, help="MQTT clients (devices are sharded)")
+    parser.add_argument("--qos", type=int, choices=[0, 1, 2], help="Override recorded QoS")
+    parser.add_argument("--loop", type=int, default=1, help="Replay the window N times")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    start_s = None
+    if args.start:
+        start_s = datetime.strptime(args.start, "%Y-%m-%d %H:%M").replace(tzinfo=timezone.utc).timestamp()
+    end_s = start_s + args.minutes * 60 if start_s is not None and args.minutes else None
+
+    print(f"Loading {args.source} ...")
+    if args.source == "recording":
+        events = load_recording(args.dir, start_s, end_s, args.topic)
+    else:
+        events = load_db(args.db, start_s, end_s, args.device, args.topic)
+    if not events:
+        print("FAIL No messages found for the selected window")
+        sys.exit(1)
+
+    devices = len({device_key(e[1], e[4]) for e in events})
+    span = (events[-1][0] - events[0][0]) / 1_000_000
+    speed = "max" if not args.speed else f"{args.speed:g}x"
+    print(f"OK {len(events)} messages from {devices} devices over {span:.0f}s; "
+          f"replaying at {speed} to mqtt://{HOST}:{PORT} with {args.connections} connection(s)")
+
+    clients = connect_clients(args.connections)
+    try:
+        for run in range(args.loop):
+            summary = replay(events, clients, args.speed, args.qos)
+            if args.json:
+                print(json.dumps(summary))
+            else:
+                print(f"OK Run {run + 1}: {summary['messages']} messages in {summary['duration_s']}s "
+                      f"({summary['msgs_per_s']} msg/s), errors {summary['errors']}, "
+                      f"lag p50 {summary['lag_p50_ms']}ms p99 {summary['lag_p99_ms']}ms "
+                      f"max {summary['lag_max_ms']}ms")
+    except KeyboardInterrupt:
+        print("\nReplay interrupted")
+    finally:
+        for client in clients:
+            client.loop_stop()
+            client.disconnect()
+
+
+if __name__ == "__main__":
+    main()
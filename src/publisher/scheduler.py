@@ -0,0 +1,172 @@
+"""
+Single-threaded periodic scheduler for the simulators
+
+Drives any number of periodic tasks (one per simulated robot) from one
+thread with a heap of monotonic deadlines. Deadline k of a task is
+start + k * period, so timing never drifts however late a callback runs;
+a task that falls more than a period behind skips the missed ticks
+(counted) instead of bursting to catch up.
+
+Per task it tracks achieved rate, lateness (actual fire time minus the
+deadline) and jitter (standard deviation of lateness).
+
+Usage:
+    sched = Scheduler()
+    for idx, name in enumerate(names):
+        sched.add(name, HZ, lambda due, name=name: publish(name, due), offset=idx / len(names) / HZ)
+    sched.every(10.0, lambda due: print(sched.format_report()))
+    sched.run()
+"""
+import heapq
+import math
+import threading
+import time
+from collections import deque
+
+STATS_WINDOW = 1024  # lateness samples kept per task for percentiles
+
+
+class Task:
+    __slots__ = ("name", "period", "callback", "start", "tick", "count", "missed", "errors",
+                 "first_fire", "last_fire", "late", "report")
+
+    def __init__(self, name, period, callback, start, report):
+        self.name = name
+        self.period = period
+        self.callback = callback
+        self.start = start
+        self.tick = 0
+        self.count = 0
+        self.missed = 0
+        self.errors = 0
+        self.first_fire = None
+        self.last_fire = None
+        self.late = deque(maxlen=STATS_WINDOW)
+        self.report = report
+
+    def due(self):
+        return self.start + self.tick * self.period
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class Scheduler:
+    """Heap of (deadline, seq, task); one thread runs every task"""
+
+    def __init__(self, clock=time.monotonic, sleep=None):
+        self.clock = clock
+        self._sleep = sleep
+        self._heap = []
+        self._seq = 0
+        self._stop = threading.Event()
+        self.tasks = {}
+
+    def add(self, name, hz, callback, offset=0.0, report=True):
+        """
+        Call callback(deadline) at hz, first at now + offset. Spread offsets
+        across one period to avoid every robot firing at the same instant.
+        """
+        task = Task(name, 1.0 / hz, callback, self.clock() + offset, report)
+        self.tasks[name] = task
+        self._push(task)
+        return task
+
+    def every(self, seconds, callback, name=None):
+        """Housekeeping task (status output etc.), excluded from the report"""
+        name = name or f"_every_{self._seq}"
+        return self.add(name, 1.0 / seconds, callback, offset=seconds, report=False)
+
+    def _push(self, task):
+        self._seq += 1
+        heapq.heappush(self._heap, (task.due(), self._seq, task))
+
+    def stop(self):
+        self._stop.set()
+
+    def _wait(self, delay):
+        if self._sleep is not None:
+            self._sleep(delay)
+        else:
+            self._stop.wait(delay)
+
+    def run(self, duration=None):
+        """Run until stop() (or for duration seconds)"""
+        end = None if duration is None else self.clock() + duration
+        heap = self._heap
+        while heap and not self._stop.is_set():
+            due, _, task = heap[0]
+            if end is not None and due >= end:
+                break
+            delay = due - self.clock()
+            if delay > 0:
+                self._wait(delay)
+                continue  # re-check: stop() or an earlier task may have arrived
+            now = self.clock()
+            try:
+                task.callback(due)
+            except Exception as e:
+                task.errors += 1
+                if task.errors == 1 or task.errors % 100 == 0:
+                    print(f"FAIL {task.name}: {e} ({task.errors} errors)")
+            task.count += 1
+            task.late.append(now - due)
+            if task.first_fire is None:
+                task.first_fire = now
+            task.last_fire = now
+
+            task.tick += 1
+            after = self.clock()
+            if task.due() <= after:
+                # Fell behind by more than a period: skip to the next future deadline
+                behind = int((after - task.start) / task.period) + 1
+                task.missed += behind - task.tick
+                task.tick = behind
+            self._seq += 1
+            heapq.heapreplace(heap, (task.due(), self._seq, task))
+
+    def report(self):
+        """{name: stats} for robot tasks"""
+        stats = {}
+        for name, task in self.tasks.items():
+            if not task.report:
+                continue
+            late = sorted(task.late)
+            if task.count > 1 and task.last_fire > task.first_fire:
+                achieved = (task.count - 1) / (task.last_fire - task.first_fire)
+            else:
+                achieved = 0.0
+            mean = sum(late) / len(late) if late else 0.0
+            jitter = math.sqrt(sum((v - mean) ** 2 for v in late) / len(late)) if late else 0.0
+            stats[name] = {
+                "hz_target": 1.0 / task.period,
+                "hz_achieved": achieved,
+                "count": task.count,
+                "missed": task.missed,
+                "errors": task.errors,
+                "late_ms_p50": _percentile(late, 0.50) * 1000,
+                "late_ms_p99": _percentile(late, 0.99) * 1000,
+                "late_ms_max": (late[-1] if late else 0.0) * 1000,
+                "jitter_ms": jitter * 1000,
+            }
+        return stats
+
+    def format_report(self, per_task=False):
+        """One summary line (worst robot), plus one line per robot if per_task"""
+        stats = self.report()
+        if not stats:
+            return "No tasks"
+        rates = [s["hz_achieved"] for s in stats.values()]
+        worst = max(stats.items(), key=lambda kv: kv[1]["late_ms_p99"])
+        lines = [f"{len(stats)} robots: {min(rates):.2f}-{max(rates):.2f} Hz achieved, "
+                 f"missed {sum(s['missed'] for s in stats.values())}, "
+                 f"worst p99 late {worst[1]['late_ms_p99']:.2f} ms ({worst[0]})"]
+        if per_task:
+            for name, s in stats.items():
+                lines.append(f"  {name}: {s['hz_achieved']:.2f}/{s['hz_target']:.2f} Hz, "
+                             f"late p50 {s['late_ms_p50']:.2f} ms p99 {s['late_ms_p99']:.2f} ms, "
+                             f"jitter {s['jitter_ms']:.2f} ms, missed {s['missed']}")
+        return "\n".join(lines)
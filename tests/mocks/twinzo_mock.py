@@ -0,0 +1,283 @@
+"""
+Local Mock of the Twinzo API
+
+Implements the two endpoints the bridges use, so bridges and load tests can
+run against localhost without touching the real platform:
+
+    POST /v3/authorization/authenticate   {"client", "login", "password"} -> Token/Client/Branch/Expiration
+    POST /v3/localization                 list of location samples (Token/Client/Branch/Api-Key headers)
+    POST /v3/localization/batch           [{"Login", "Locations": [...]}]
+
+Faults can be injected to exercise retry and backoff paths:
+
+    latency      "fixed:20" | "uniform:5,50" | "lognormal:20,0.5" | "none" (milliseconds;
+                 lognormal takes the median and sigma)
+    error_rate   fraction of requests answered with 500
+    rate_limit   localization posts per second per device (token bucket, burst = 1 s);
+                 excess requests get 429 with a Retry-After header
+    reset_rate   fraction of requests whose connection is reset without a response
+    token_ttl_s  token lifetime; Expiration is epoch milliseconds like the real API,
+                 expired or unknown tokens get 401
+
+Every accepted sample is recorded as (login, received_at, sample) for assertions.
+
+Usage:
+    mock = MockTwinzo(latency="uniform:5,20", rate_limit=10).start()
+    os.environ["TWINZO_API_BASE"] = mock.url       # before importing a bridge
+    ...
+    assert mock.samples_for("tug-55-tvsmotor-hosur-09")
+    mock.stop()
+
+    # standalone
+    python tests/mocks/twinzo_mock.py --port 8089 --latency lognormal:30,0.6 --error-rate 0.02
+    TWINZO_API_BASE=http://127.0.0.1:8089/v3 python src/bridge/bridge.py
+"""
+import argparse
+import json
+import math
+import random
+import socket
+import struct
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+AUTH_PATH = "/v3/authorization/authenticate"
+LOC_PATH = "/v3/localization"
+BATCH_PATH = "/v3/localization/batch"
+
+
+def parse_latency(spec):
+    """Latency spec -> function returning a delay in seconds"""
+    if not spec or spec == "none":
+        return lambda rng: 0.0
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v.strip()]
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0] / 1000.0
+    if kind == "uniform" and len(values) == 2:
+        lo, hi = values
+        return lambda rng: rng.uniform(lo, hi) / 1000.0
+    if kind == "lognormal" and len(values) == 2:
+        median, sigma = values
+        mu = math.log(median)
+        return lambda rng: rng.lognormvariate(mu, sigma) / 1000.0
+    raise ValueError(f"Bad latency spec {spec!r}; expected fixed:MS, uniform:LO,HI, lognormal:MEDIAN,SIGMA or none")
+
+
+class _Bucket:
+    def __init__(self, rate, now):
+        self.tokens = rate
+        self.stamp = now
+
+    def take(self, rate, now):
+        """True if a token was available; otherwise seconds until the next one"""
+        self.tokens = min(rate, self.tokens + (now - self.stamp) * rate)
+        self.stamp = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return (1.0 - self.tokens) / rate
+
+
+class MockTwinzo:
+    """Threaded mock Twinzo API with latency, error, rate-limit and reset injection"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency="none", error_rate=0.0, rate_limit=0.0,
+                 reset_rate=0.0, token_ttl_s=3600, seed=None):
+        self.host = host
+        self.port = port
+        self.delay = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.reset_rate = reset_rate
+        self.token_ttl_s = token_ttl_s
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.server = None
+        self.thread = None
+        self.reset()
+
+    def reset(self):
+        """Forget recorded samples, counters, tokens and rate-limit state"""
+        with self.lock:
+            self.samples = []
+            self.tokens = {}    # token -> (login, expires_ms)
+            self.buckets = {}   # login -> _Bucket
+            self.counts = {}    # (path, status) -> n
+
+    @property
+    def url(self):
+        """Base URL to use as TWINZO_API_BASE"""
+        return f"http://{self.host}:{self.server.server_address[1]}/v3"
+
+    def start(self):
+        Handler = type("Handler", (_Handler,), {"mock": self})
+        self.server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mock-twinzo", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    # ----- Recording -----
+
+    def count(self, path, status=None):
+        with self.lock:
+            return sum(n for (p, s), n in self.counts.items() if p == path and (status is None or s == status))
+
+    def samples_for(self, login):
+        with self.lock:
+            return [item for who, _, item in self.samples if who == login]
+
+    def _tally(self, path, status):
+        with self.lock:
+            self.counts[(path, status)] = self.counts.get((path, status), 0) + 1
+
+    # ----- Endpoint logic (returns status, headers, body or None to reset) -----
+
+    def handle(self, path, headers, body):
+        with self.lock:
+            roll_reset = self.rng.random() < self.reset_rate
+            roll_error = self.rng.random() < self.error_rate
+            delay = self.delay(self.rng)
+        if delay:
+            time.sleep(delay)
+        if roll_reset:
+            return None
+        if roll_error:
+            return 500, {}, {"Message": "Injected server error"}
+        try:
+            data = json.loads(body or b"null")
+        except ValueError:
+            return 400, {}, {"Message": "Invalid JSON"}
+        if path == AUTH_PATH:
+            return self._authenticate(data)
+        if path in (LOC_PATH, BATCH_PATH):
+            return self._localization(path, headers, data)
+        return 404, {}, {"Message": f"No route {path}"}
+
+    def _authenticate(self, data):
+        if not isinstance(data, dict) or not all(data.get(k) for k in ("client", "login", "password")):
+            return 400, {}, {"Message": "client, login and password are required"}
+        token = uuid.uuid4().hex
+        expires_ms = int((time.time() + self.token_ttl_s) * 1000)
+        with self.lock:
+            self.tokens[token] = (data["login"], expires_ms)
+        return 200, {}, {
+            "Token": token,
+            "Client": str(uuid.uuid5(uuid.NAMESPACE_DNS, data["client"])),
+            "Branch": str(uuid.uuid5(uuid.NAMESPACE_DNS, data["client"] + "/branch")),
+            "Expiration": expires_ms,
+        }
+
+    def _localization(self, path, headers, data):
+        with self.lock:
+            login, expires_ms = self.tokens.get(headers.get("Token"), (None, 0))
+        if login is None or expires_ms <= time.time() * 1000:
+            return 401, {}, {"Message": "Invalid or expired token"}
+        if path == BATCH_PATH:
+            if not isinstance(data, list):
+                return 400, {}, {"Message": "Expected a list of devices"}
+            batches = [(d.get("Login", login), d.get("Locations") or []) for d in data]
+        else:
+            if not isinstance(data, list):
+                return 400, {}, {"Message": "Expected a list of locations"}
+            batches = [(login, data)]
+        now = time.monotonic()
+        if self.rate_limit > 0:
+            with self.lock:
+                bucket = self.buckets.setdefault(login, _Bucket(self.rate_limit, now))
+                ok = bucket.take(self.rate_limit, now)
+            if ok is not True:
+                return 429, {"Retry-After": str(max(1, int(ok + 0.999)))}, {"Message": "Too many requests"}
+        received_at = time.time()
+        accepted = 0
+        with self.lock:
+            for who, items in batches:
+                for item in items:
+                    self.samples.append((who, received_at, item))
+                    accepted += 1
+        return 200, {}, {"Success": True, "Accepted": accepted}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mock = None
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        path = urlparse(self.path).path.rstrip("/")
+        result = self.mock.handle(path, self.headers, body)
+        if result is None:
+            self.mock._tally(path, "reset")
+            self._reset()
+            return
+        status, headers, payload = result
+        self.mock._tally(path, status)
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _reset(self):
+        """Close with RST instead of FIN (SO_LINGER 0), like a dropped upstream connection"""
+        self.close_connection = True
+        try:
+            self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+            self.connection.close()
+        except OSError:
+            pass
+
+    def finish(self):
+        try:
+            super().finish()
+        except OSError:
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock Twinzo API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default="none", help="fixed:MS | uniform:LO,HI | lognormal:MEDIAN,SIGMA | none")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="posts/s per device, 0 = unlimited")
+    parser.add_argument("--reset-rate", type=float, default=0.0)
+    parser.add_argument("--token-ttl", type=float, default=3600)
+    parser.add_argument("--report-every", type=float, default=10.0)
+    args = parser.parse_args()
+
+    mock = MockTwinzo(args.host, args.port, args.latency, args.error_rate, args.rate_limit,
+                      args.reset_rate, args.token_ttl).start()
+    print(f"OK Mock Twinzo API on {mock.url} (set TWINZO_API_BASE to this)")
+    try:
+        while True:
+            time.sleep(args.report_every)
+            with mock.lock:
+                counts = dict(mock.counts)
+                devices = len({who for who, _, _ in mock.samples})
+                total = len(mock.samples)
+            summary = ", ".join(f"{p.rsplit('/', 1)[-1]} {s}: {n}" for (p, s), n in sorted(counts.items(), key=str))
+            print(f"Samples: {total} from {devices} devices | {summary or 'no requests yet'}")
+    except KeyboardInterrupt:
+        mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Add repo root to path so tests can import src.common / src.publisher
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+# Analysis scripts import their shared helpers (log_parser) by module name
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts', 'transformation'))
+# Publisher modules import their siblings by module name (as in the publisher container)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'src', 'publisher'))
@@ -0,0 +1,62 @@
+"""Unit tests for src/common/bridge_log.py"""
+import io
+import json
+
+import pytest
+
+from src.common import bridge_log
+
+
+@pytest.fixture
+def stream():
+    bridge_log.shutdown()
+    out = io.StringIO()
+    bridge_log.setup(stream=out, fmt="json", level="INFO", sample={"pose": 0.25})
+    yield out
+    bridge_log.shutdown()
+    bridge_log.set_level("INFO")
+
+
+def _records(out):
+    bridge_log.shutdown()
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_json_records_carry_category_and_fields(stream):
+    log = bridge_log.get_logger("bridge_old_plant")
+    log.info("post_ok", "Posted to Old Plant", device="tugger-05-old", x=1200, moving=True)
+    log.warn("payload", "Invalid pose", args=[1, 2])  # reserved LogRecord name is renamed
+
+    first, second = _records(stream)
+    assert first["logger"] == "bridge_old_plant"
+    assert first["level"] == "INFO" and first["cat"] == "post_ok"
+    assert (first["device"], first["x"], first["moving"]) == ("tugger-05-old", 1200, True)
+    assert first["ts"].endswith("Z")
+    assert second["level"] == "WARN" and second["args_"] == [1, 2]
+
+
+def test_level_gate_and_sampling(stream):
+    log = bridge_log.get_logger("bridge_old_plant")
+    assert not log.enabled(bridge_log.DEBUG, "raw")
+    assert log.debug("raw", "MQTT message", payload=b"{}") is False
+
+    emitted = [log.info("pose", "AMR pose", i=i) for i in range(8)]
+    assert emitted == [True, False, False, False, True, False, False, False]
+
+    bridge_log.set_level("DEBUG")
+    assert log.debug("raw", "MQTT message", payload=b'{"a": 1}')
+
+    records = _records(stream)
+    assert [r["i"] for r in records if r["cat"] == "pose"] == [0, 4]
+    assert records[-1]["payload"] == '{"a": 1}'
+
+
+def test_full_queue_drops_instead_of_blocking():
+    bridge_log.shutdown()
+    handler = bridge_log.DroppingQueueHandler(bridge_log.queue.Queue(maxsize=2))
+    log = bridge_log.logging.getLogger("drop-test")
+    log.handlers = [handler]
+    log.propagate = False
+    for i in range(5):
+        log.warning("x %s", i)
+    assert handler.dropped == 3
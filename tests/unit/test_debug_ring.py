@@ -0,0 +1,82 @@
+"""Unit tests for src/common/debug_ring.py and src/common/admin_http.py"""
+import json
+import socket
+import urllib.error
+import urllib.request
+
+import pytest
+
+from src.common import admin_http
+from src.common.debug_ring import DebugRing, UNPARSED
+
+
+@pytest.fixture
+def ring(tmp_path):
+    return DebugRing(size=4, pose_fields=("x", "y"), output_fields=("X", "Y"), dump_dir=tmp_path)
+
+
+def test_ring_keeps_last_n_oldest_first(ring):
+    for i in range(6):
+        ring.record("tug-1", 1700000000.0 + i, f'{{"i":{i}}}'.encode(), (i, i), (i * 10, i * 10), 200, "ok")
+    ring.record(None, 1700000009.0, b"not json", status="error: bad json")
+
+    snap = ring.snapshot()
+    entries = snap["tug-1"]
+    assert [e["raw"] for e in entries] == ['{"i":2}', '{"i":3}', '{"i":4}', '{"i":5}']
+    assert entries[0]["pose"] == {"x": 2, "y": 2}
+    assert entries[-1]["output"] == {"X": 50, "Y": 50}
+    assert entries[0]["received_at"] == "2023-11-14T22:13:22.000Z"
+    assert snap[UNPARSED][0]["status"] == "error: bad json"
+
+
+def test_partial_ring_and_device_cap(tmp_path):
+    ring = DebugRing(size=8, dump_dir=tmp_path, max_devices=2)
+    for device in ("a", "b", "c"):
+        ring.record(device, 0.0, b"{}")
+    assert sorted(ring.snapshot()) == ["a", "b"]
+    assert len(ring.snapshot("a")["a"]) == 1
+    assert ring.overflow == 1
+
+
+def test_update_fills_in_status_until_overwritten(ring):
+    slot = ring.record("tug-1", 1.0, b"{}", status="queued")
+    old = ring.record("tug-1", 2.0, b"{}", status="queued")
+    ring.update(slot, 200, "ok")
+    assert [e["status"] for e in ring.snapshot("tug-1")["tug-1"]] == [200, "queued"]
+    for i in range(4):
+        ring.record("tug-1", 3.0 + i, b"{}", status="queued")
+    ring.update(old, 429, "late")                     # its slot now holds a newer message
+    assert [e["status"] for e in ring.snapshot("tug-1")["tug-1"]] == ["queued"] * 4
+    ring.update(None, 200)
+
+
+def test_dump_writes_json_file(ring):
+    ring.record("tug-1", 1.0, b"{}", (1, 2))
+    ring.record("tug-2", 2.0, b"{}")
+    path = ring.dump("tug-1")
+    assert path.name.startswith("ring-tug-1-")
+    data = json.loads(path.read_text())
+    assert list(data["devices"]) == ["tug-1"]
+    assert json.loads(ring.dump().read_text())["devices"].keys() == {"tug-1", "tug-2"}
+
+
+def test_http_endpoints(ring):
+    ring.record("tug-1", 1.0, b'{"sherpa_name":"tug-1"}', status=200)
+    ring.install()
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = admin_http.start(port=port, host="127.0.0.1")
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(base + "/debug/ring?device=tug-1&inline=1") as r:
+            assert json.loads(r.read())["tug-1"][0]["status"] == 200
+        with urllib.request.urlopen(base + "/debug/devices") as r:
+            assert json.loads(r.read()) == {"tug-1": 1}
+        with urllib.request.urlopen(base + "/debug/ring") as r:
+            assert json.loads(r.read())["path"].endswith(".json")
+        with pytest.raises(urllib.error.HTTPError) as err:
+            urllib.request.urlopen(base + "/debug/ring?device=missing")
+        assert err.value.code == 404
+    finally:
+        admin_http.stop()
@@ -0,0 +1,66 @@
+"""Unit tests for src/common/device_watchdog.py"""
+import pytest
+
+from src.common import metrics
+from src.common.device_watchdog import DeviceWatchdog, TimingWheel
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    metrics.clear()
+    yield
+    metrics.clear()
+
+
+def make(events, **kwargs):
+    kwargs.setdefault("offline_s", 0)
+    return DeviceWatchdog(on_offline=lambda k, s, c: events.append(("offline", k, round(s, 1), c)),
+                          on_online=lambda k, s, c: events.append(("online", k, round(s, 1), c)),
+                          factor=5, min_s=2, max_s=60, default_s=30, tick_s=0.5, slots=64, now=0, **kwargs)
+
+
+def test_timing_wheel_expires_in_order_and_after_full_revolution():
+    wheel = TimingWheel(tick_s=1.0, slots=8, now=0)
+    wheel.schedule("a", 3.2)
+    wheel.schedule("b", 20)        # more than one revolution ahead
+    assert wheel.advance(3.5) == []
+    assert wheel.advance(4.0) == [(4, "a")]
+    assert wheel.advance(19) == []
+    assert wheel.advance(100) == [(20, "b")]
+    assert wheel.size == 0
+
+
+def test_silent_device_goes_offline_and_comes_back():
+    events = []
+    watchdog = make(events)
+    for t in range(0, 11):                     # both report at 1 Hz
+        watchdog.touch("tug-55", t, context=("tugger-01", t, 0))
+        watchdog.touch("tug-39", t)
+        watchdog.poll(t)
+    for t in range(11, 30):                    # tug-39 falls silent
+        watchdog.touch("tug-55", t)
+        watchdog.poll(t)
+        watchdog.poll(t + 0.5)
+    # 5 x 1 s cadence = 5 s, detected within one tick, not at the 30 s default
+    assert events == [("offline", "tug-39", 5.0, None)]
+    assert watchdog.status(29)["tug-39"]["state"] == "offline"
+
+    watchdog.touch("tug-39", 40)
+    assert events[-1] == ("online", "tug-39", 30.0, None)
+    text = metrics.render()
+    assert 'bridge_devices{state="online"} 2' in text
+    assert "bridge_device_offline_total 1" in text
+
+
+def test_frequent_touches_do_not_grow_the_wheel():
+    events = []
+    watchdog = make(events, offline_s=10)
+    for i in range(2000):
+        t = i * 0.01
+        watchdog.touch(f"tug-{i % 20}", t)
+        watchdog.poll(t)
+    # One live entry per device, plus at most one superseded/rescheduled one
+    assert watchdog.wheel.size <= 40
+    watchdog.poll(100)
+    assert len(events) == 20
+    assert all(e[0] == "offline" for e in events)
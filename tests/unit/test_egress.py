@@ -0,0 +1,164 @@
+"""Unit tests for src/common/egress.py"""
+import sqlite3
+import threading
+import time
+from functools import partial
+
+import pytest
+
+from src.common import metrics
+from src.common.egress import (DeficitRoundRobin, Delivery, Egress, StateChanges, PRIORITY_POSE,
+                               PRIORITY_STATE)
+from src.common.telemetry import TelemetryWriter
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    metrics.clear()
+    yield
+    metrics.clear()
+
+
+def drain(scheduler):
+    order = []
+    while scheduler.size:
+        key, item = scheduler.get(timeout=0)[:2]
+        scheduler.done(key)
+        order.append(item)
+    return order
+
+
+def test_round_robin_across_devices_and_state_first():
+    scheduler = DeficitRoundRobin(quantum=1, limits=(64, 100))
+    for i in range(50):                       # replay backlog from one device
+        scheduler.put("chatty", f"c{i}")
+    scheduler.put("quiet-1", "q1")
+    scheduler.put("quiet-2", "q2")
+    scheduler.put("quiet-1", "error", PRIORITY_STATE)
+    order = drain(scheduler)
+    assert order[0] == "error"                # transitions jump every queued pose
+    assert order[1:5] == ["c0", "q1", "q2", "c1"]
+    assert order.index("q2") == 3             # not behind the chatty backlog
+    assert len(order) == 53
+
+
+def test_deficit_carries_over_for_costly_items():
+    scheduler = DeficitRoundRobin(quantum=2, limits=(64, 100))
+    for i in range(3):
+        scheduler.put("big", f"b{i}", cost=3)     # two sectors + retry, say
+        scheduler.put("small", f"s{i}", cost=1)
+    scheduler.put("small", "s3", cost=1)
+    # big saves its deficit until it can afford an item, small spends 2 per round
+    assert drain(scheduler) == ["s0", "s1", "b0", "s2", "s3", "b1", "b2"]
+
+
+def test_full_device_queue_drops_oldest_pose():
+    scheduler = DeficitRoundRobin(limits=(2, 3))
+    dropped = [scheduler.put("tug-55", i) for i in range(5)]
+    assert dropped == [None, None, None, 0, 1]
+    assert drain(scheduler) == [2, 3, 4]
+
+    states = StateChanges()
+    assert states.priority("tug-55", {"mode": "Fleet", "error": ""}) == PRIORITY_POSE
+    assert states.priority("tug-55", {"mode": "Fleet", "error": ""}) == PRIORITY_POSE
+    assert states.priority("tug-55", {"mode": "Manual", "error": ""}) == PRIORITY_STATE
+    assert states.priority("tug-39", {"mode": "Fleet", "error": "E-stop"}) == PRIORITY_STATE
+
+
+def test_workers_deliver_and_record_wait():
+    done = threading.Event()
+    delivered = []
+
+    def deliver(key, item):
+        delivered.append((key, item))
+        if len(delivered) == 3:
+            done.set()
+
+    egress = Egress(deliver, workers=1)
+    egress.submit("tug-55", 1)
+    egress.submit("tug-39", 2, PRIORITY_STATE)
+    egress.submit("tug-55", 3)
+    egress.start()
+    assert done.wait(5)
+    egress.stop()
+    assert delivered == [("tug-39", 2), ("tug-55", 1), ("tug-55", 3)]
+    assert 'bridge_egress_wait_seconds_count{class="pose"} 2' in metrics.render()
+
+    inline = []
+    Egress(workers=0).submit("tug-55", lambda: inline.append(1))
+    assert inline == [1]
+
+
+def test_one_worker_per_device_keeps_its_order():
+    scheduler = DeficitRoundRobin(limits=(64, 100))
+    scheduler.put("tug-55", "a1")
+    scheduler.put("tug-55", "a2")
+    scheduler.put("tug-39", "b1")
+    assert scheduler.get(timeout=0)[1] == "a1"
+    assert scheduler.get(timeout=0)[1] == "b1"
+    assert scheduler.get(timeout=0) is None       # a1 still in flight: a2 waits
+    scheduler.done("tug-55")
+    assert scheduler.get(timeout=0)[1] == "a2"
+
+    lock = threading.Lock()
+    active, overlaps, delivered = set(), [], []
+    finished = threading.Event()
+
+    def deliver(key, item):
+        with lock:
+            if key in active:
+                overlaps.append(item)
+            active.add(key)
+        time.sleep(0.002)
+        with lock:
+            active.discard(key)
+            delivered.append((key, item))
+            if len(delivered) == 40:
+                finished.set()
+
+    egress = Egress(deliver, workers=8, scheduler=DeficitRoundRobin(limits=(64, 100)))
+    for i in range(20):
+        egress.submit("tug-55", i)
+        egress.submit("tug-39", i)
+    egress.control.limit.limit = 8
+    egress.start()
+    assert finished.wait(5)
+    egress.stop()
+    assert not overlaps
+    assert [i for key, i in delivered if key == "tug-55"] == list(range(20))
+
+
+def test_every_pose_gets_a_telemetry_row_in_order(tmp_path):
+    db_path = tmp_path / "ati_data.db"
+    writer = TelemetryWriter(db_path=db_path, flush_ms=20).start()
+    taken, release, finished = threading.Event(), threading.Event(), threading.Event()
+    delivered = []
+
+    def deliver(i, row):
+        taken.set()
+        release.wait(5)
+        writer.complete(row, True, "HTTP 200")
+        delivered.append(i)
+        if len(delivered) == 4:
+            finished.set()
+
+    def dropped(row, reason):
+        writer.complete(row, False, None, f"dropped: {reason}")
+
+    egress = Egress(workers=1, scheduler=DeficitRoundRobin(limits=(64, 3))).start()
+    for i in range(10):
+        row = writer.record("tug-55", i, i, 0.0, i, i, received_at=1700000000 + i, pending=True)
+        egress.submit("tug-55", Delivery(partial(deliver, i, row), partial(dropped, row)))
+        if i == 0:
+            assert taken.wait(5)                  # 0 in flight; 1-6 get pushed out of the 3 slots
+    release.set()
+    assert finished.wait(5)
+    egress.stop()
+    writer.stop()
+
+    rows = sqlite3.connect(str(db_path)).execute(
+        "SELECT ati_x, posted_to_api, error FROM ati_messages ORDER BY id").fetchall()
+    assert [r[0] for r in rows] == list(range(10))
+    assert [r[1] for r in rows] == [1, 0, 0, 0, 0, 0, 0, 1, 1, 1]
+    assert rows[1][2] == "dropped: superseded"
+    assert 'bridge_egress_dropped_total{class="pose"} 6' in metrics.render()
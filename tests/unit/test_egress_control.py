@@ -0,0 +1,184 @@
+"""Unit tests for src/common/egress_control.py"""
+import threading
+import time
+from functools import partial
+from types import SimpleNamespace
+
+import pytest
+
+from src.common import metrics
+from src.common.egress import DeficitRoundRobin, Delivery, Egress, Retry, PRIORITY_POSE, PRIORITY_STATE
+from src.common.egress_control import AdaptiveLimit, EgressControl, TokenBucket, parse_retry_after
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    metrics.clear()
+    yield
+    metrics.clear()
+
+
+def pop(scheduler, now):
+    """_pop, with the delivery done at once"""
+    entry, wait = scheduler._pop(now)
+    if entry is not None:
+        scheduler.done(entry[0])
+    return entry, wait
+
+
+def test_retry_after_token_bucket_and_spreading():
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT", now=1445412478) == 2.0
+    assert parse_retry_after("soon") is None and parse_retry_after(None) is None
+
+    bucket = TokenBucket(rate=2, burst=2, now=0)
+    bucket.take()
+    bucket.take()
+    assert bucket.delay(0) == 0.5
+    assert bucket.delay(0.5) == 0
+    bucket.pause(10)
+    assert bucket.delay(4) == 6
+    unlimited = TokenBucket(rate=0, burst=1, now=0)
+    unlimited.take()
+    assert unlimited.delay(0) == 0
+
+    # An ATI burst of 10 every 2 s is paced at 1.25 x 5/s instead of sent at once
+    control = EgressControl(spread=True, headroom=1.25, spread_window_s=2, now=lambda: 0)
+    scheduler = DeficitRoundRobin(control=control)
+    for i in range(10):
+        scheduler.put(f"tug-{i}", i, gate="old-plant", now=0)
+    assert pop(scheduler, 0)[0] is not None       # rate not known yet: no pacing
+    for i in range(10):
+        scheduler.put(f"tug-{i}", i, gate="old-plant", now=2)
+    assert control.pacer.rate == pytest.approx(11 / 2 * 1.25)
+    # 19 queued is more than half a 2 s window at 6.9/s: drain unpaced down to 6, then one bucket token
+    assert all(pop(scheduler, 2)[0] for _ in range(14))
+    entry, wait = pop(scheduler, 2)
+    assert entry is None and wait == pytest.approx(1 / control.pacer.rate)
+    assert pop(scheduler, 2 + wait)[0] is not None
+
+
+def test_limit_follows_latency_gradient_and_backs_off():
+    limit = AdaptiveLimit(initial=2, min_limit=1, max_limit=32, tolerance=1.5, backoff=0.5, short=10, long=600)
+    t = 0.0
+    for i in range(200):                     # steady but noisy latency, busy: grows to the cap
+        t += 0.05
+        limit.on_sample(0.02 if i % 3 else 0.08, limit.limit, False, t)
+    assert limit.limit == 32
+    for _ in range(30):                      # Twinzo queueing: 4x slower, shrinks
+        t += 0.2
+        limit.on_sample(0.2, limit.limit, False, t)
+    assert limit.limit < 12
+    shrunk = limit.limit
+    limit.on_sample(0.2, shrunk, True, t + 1)
+    limit.on_sample(0.2, shrunk, True, t + 1.01)   # same overload, within one RTT: counted once
+    assert limit.limit == pytest.approx(max(1, shrunk * 0.5))
+    idle = limit.limit
+    limit.on_sample(0.05, 0, False, t + 2)        # app-limited: no growth
+    assert limit.limit == idle
+
+
+def test_throttled_device_and_branch_are_skipped_and_retried():
+    control = EgressControl(branch_rate=1, branch_burst=1, spread=False, now=lambda: 0)
+    scheduler = DeficitRoundRobin(control=control)
+    scheduler.put("tug-55", "a1", gate="old-plant", now=0)
+    scheduler.put("tug-55", "a2", gate="old-plant", now=0)
+    scheduler.put("tug-39", "b1", gate="old-plant", now=0)
+    scheduler.put("tug-12", "c1", gate="hitech", now=0)
+    assert pop(scheduler, 0)[0][1] == "a1"
+    assert control.on_response("tug-55", "old-plant", 429, "2", 0.05, 1, 0.1)
+    assert pop(scheduler, 0.2)[0][1] == "c1"   # tug-55 paused, old-plant out of tokens: hitech goes ahead
+    assert pop(scheduler, 1.0)[0][1] == "b1"   # branch refilled; tug-55 still paused
+    entry, wait = pop(scheduler, 1.5)
+    assert entry is None and wait == pytest.approx(0.6)
+    assert pop(scheduler, 2.1)[0][1] == "a2"
+    scheduler.put("tug-55", "a3", gate="old-plant", now=2.1)
+    assert pop(scheduler, 3.0) == (None, pytest.approx(1.1))   # keeps the Retry-After spacing
+    control.on_response("tug-55", "old-plant", 200, None, 0.05, 1, 3.0)
+    assert control.spacing["tug-55"] == pytest.approx(2 * 0.98)
+    assert 'bridge_egress_throttled_total{branch="old-plant"} 1' in metrics.render()
+
+    # End to end: a 429 goes back to the front of the queue and is delivered again
+    responses = [SimpleNamespace(status_code=429, headers={"Retry-After": "0"}),
+                 SimpleNamespace(status_code=200, headers={})]
+    delivered = []
+    done = threading.Event()
+
+    def deliver(key, item):
+        delivered.append(item)
+        if len(delivered) == 2:
+            done.set()
+        return responses[len(delivered) - 1]
+
+    egress = Egress(deliver, workers=2, control=EgressControl(spread=False))
+    egress.submit("tug-55", "stop", PRIORITY_STATE, gate="old-plant")
+    egress.start()
+    assert done.wait(5)
+    egress.stop()
+    assert delivered == ["stop", "stop"]
+    assert "bridge_egress_retries_total 1" in metrics.render()
+
+
+def test_retry_resends_only_the_throttled_part_and_never_an_old_pose():
+    throttled = SimpleNamespace(status_code=429, headers={"Retry-After": "0"})
+    ok = SimpleNamespace(status_code=200, headers={})
+    delivered = []
+    done = threading.Event()
+
+    def deliver(key, item):
+        delivered.append(item)
+        if item == "pose-1":
+            egress.submit("tug-55", "pose-2", PRIORITY_POSE, gate="old-plant")   # newer pose while in flight
+        if item == "state":
+            return Retry(throttled, "state: sector 2 only")
+        if item == "pose-1":
+            return throttled
+        if len(delivered) == 4:
+            done.set()
+        return ok
+
+    egress = Egress(deliver, workers=2, control=EgressControl(spread=False))
+    egress.submit("tug-39", "state", PRIORITY_STATE, gate="old-plant")
+    egress.submit("tug-55", "pose-1", PRIORITY_POSE, gate="old-plant")
+    egress.start()
+    assert done.wait(5)
+    time.sleep(0.05)
+    egress.stop()
+    assert len(delivered) == 4
+    assert delivered.count("state: sector 2 only") == 1 and "state" in delivered
+    assert [item for item in delivered if item.startswith("pose")] == ["pose-1", "pose-2"]
+    assert "bridge_egress_retries_total 1" in metrics.render()
+    assert 'bridge_egress_dropped_total{class="pose"} 1' in metrics.render()
+
+
+def test_retried_sample_hears_its_final_outcome():
+    throttled = SimpleNamespace(status_code=429, headers={"Retry-After": "0"})
+    ok = SimpleNamespace(status_code=200, headers={})
+    outcomes = []
+    done = threading.Event()
+
+    def finish(name, outcome):
+        outcomes.append((name, outcome))
+        if len(outcomes) == 2:
+            done.set()
+
+    def send(name, responses):
+        r = responses.pop(0)
+        if r.status_code == 200:
+            finish(name, "posted")
+            return r
+        return Retry(r, Delivery(partial(send, name, responses), partial(finish, name)))
+
+    egress = Egress(workers=1, control=EgressControl(spread=False))
+    egress.submit("tug-55", Delivery(partial(send, "retried", [throttled, ok]), partial(finish, "retried")),
+                  PRIORITY_STATE)
+    egress.submit("tug-39", Delivery(partial(send, "given-up", [throttled] * 3), partial(finish, "given-up")),
+                  PRIORITY_STATE)
+    egress.start()
+    assert done.wait(5)
+    egress.stop()
+    assert sorted(outcomes) == [("given-up", "out of retries (HTTP 429)"), ("retried", "posted")]
+
+    outcomes.clear()
+    Egress(workers=0).submit("tug-55", Delivery(partial(send, "inline", [throttled]), partial(finish, "inline")))
+    assert outcomes == [("inline", "out of retries (HTTP 429)")]
@@ -0,0 +1,54 @@
+"""Unit tests for src/publisher/fleet_model.py"""
+import numpy as np
+import pytest
+
+from src.publisher.fleet_model import SHAPES, FleetModel, parse_waypoints
+
+REGION = (0.0, 0.0, 1000.0, 500.0)
+
+
+def test_mixed_fleet_stays_in_region_and_moves():
+    fleet = FleetModel(1000, shapes="mixed", region=REGION)
+    for k in range(200):
+        x, y, theta = fleet.step(k * 0.1, 0.1)
+    assert x.shape == (1000,)
+    assert np.all((x >= 0) & (x <= 1000) & (y >= 0) & (y <= 500))
+    assert np.all((theta >= 0) & (theta < 2 * np.pi))
+    assert {int(c) for c in fleet.shape} == set(range(len(SHAPES)))
+
+
+def test_line_bounces_and_heading_follows_direction():
+    fleet = FleetModel(1, shapes="line", region=REGION, speeds=[100.0])
+    fleet.step(0.0, 1.0)
+    assert fleet.x[0] == pytest.approx(102.0)
+    assert fleet.theta[0] == pytest.approx(np.pi / 2)  # +X is 90 degrees clockwise from +Y
+    for _ in range(11):
+        fleet.step(0.0, 1.0)
+    assert fleet.direction[0] == -1.0 and fleet.x[0] < 998.0
+    assert fleet.theta[0] == pytest.approx(3 * np.pi / 2)
+
+
+def test_rectangle_visits_corners_in_order():
+    fleet = FleetModel(1, shapes="rectangle", region=REGION, speeds=[10000.0])
+    corners = []
+    for _ in range(8):
+        fleet.step(0.0, 1.0)
+        corners.append((round(fleet.x[0]), round(fleet.y[0])))
+    assert corners[:2] == [(2, 2), (2, 2)]  # arrive, then pause one tick while turning
+    assert corners[2] == (998, 2)
+    assert corners[4] == (998, 498)
+
+
+def test_waypoints_follow_the_route_and_spread_robots():
+    route = parse_waypoints("0,0;100,0;100,100;0,100")
+    fleet = FleetModel(4, shapes="waypoints", region=REGION, waypoints=route, speeds=[50.0] * 4)
+    assert sorted(zip(fleet.x.round(), fleet.y.round())) == [(0, 0), (0, 100), (100, 0), (100, 100)]
+    fleet.step(0.0, 1.0)
+    assert (fleet.x[0], fleet.y[0]) == (50.0, 0.0)
+    fleet.step(0.0, 3.0)
+    assert (fleet.x[0], fleet.y[0]) == (100.0, 100.0)
+
+
+def test_unknown_shape_is_rejected():
+    with pytest.raises(ValueError):
+        FleetModel(2, shapes="spiral")
@@ -0,0 +1,63 @@
+"""Unit tests for src/common/flight_recorder.py"""
+from src.common import flight_recorder
+from src.common.flight_recorder import FlightRecorder, SegmentReader, iter_records, list_segments
+
+T0 = 1733054400.0  # 2024-12-01 12:00:00 UTC
+
+
+def _record(tmp_path, count, step_s=0.5, **kwargs):
+    recorder = FlightRecorder("test", directory=tmp_path, codec="gzip", block_kb=4, flush_ms=50,
+                              keep_hours=0, **kwargs).start()
+    for i in range(count):
+        payload = f'{{"sherpa_name": "tug-{i % 4}", "seq": {i}}}'.encode()
+        recorder.record("ati_fm/sherpa/status", payload, qos=2, retain=i == 0,
+                        received_at=T0 + i * step_s)
+    recorder.stop()
+    return recorder
+
+
+def test_round_trip_preserves_messages_in_order(tmp_path):
+    recorder = _record(tmp_path, 2000)
+    assert recorder.stats["recorded"] == 2000
+    assert recorder.stats["blocks"] > 10
+
+    records = list(iter_records(tmp_path))
+    assert len(records) == 2000
+    assert records[0].retain and not records[1].retain
+    assert records[0].qos == 2
+    assert records[1999].payload == b'{"sherpa_name": "tug-3", "seq": 1999}'
+    assert [r.ts_us for r in records] == sorted(r.ts_us for r in records)
+
+
+def test_seek_reads_only_the_requested_window(tmp_path):
+    _record(tmp_path, 2000)
+    start = T0 + 300  # minute 5
+    window = list(iter_records(tmp_path, start_s=start, end_s=start + 60))
+    assert len(window) == 120
+    assert window[0].ts_us == int(start * 1_000_000)
+
+    reader = SegmentReader(list_segments(tmp_path)[0])
+    assert reader.starts == sorted(reader.starts)
+
+
+def test_missing_index_is_rebuilt_and_torn_tail_ignored(tmp_path):
+    _record(tmp_path, 500)
+    segment = list_segments(tmp_path)[0]
+    segment.with_suffix(flight_recorder.INDEX_SUFFIX).unlink()
+    with open(segment, "ab") as f:
+        f.write(flight_recorder.BLOCK_MAGIC + b"\x00" * 10)  # crash mid-header
+
+    assert len(list(iter_records(tmp_path))) == 500
+
+
+def test_segments_rotate_by_size(tmp_path):
+    recorder = FlightRecorder("test", directory=tmp_path, codec="gzip", block_kb=1, flush_ms=10,
+                              keep_hours=0)
+    recorder.segment_bytes = 2048
+    recorder.start()
+    for i in range(3000):
+        recorder.record("t", bytes([i % 251]) * 64, received_at=T0 + i)
+    recorder.stop()
+
+    assert len(list_segments(tmp_path)) > 1
+    assert len(list(iter_records(tmp_path))) == 3000
@@ -0,0 +1,77 @@
+"""Unit tests for src/common/history_archive.py"""
+from datetime import date
+
+import numpy as np
+import pytest
+
+from src.common import history_archive
+from src.common.history_archive import archived_days, load_history, roll_closed_days
+from src.common.telemetry import TelemetryWriter
+
+DAY0 = 1733011200  # 2024-12-01 00:00:00 UTC
+
+
+def _fill(db_path, days=3, step_s=600):
+    writer = TelemetryWriter(db_path=db_path, flush_ms=10).start()
+    for t in range(DAY0, DAY0 + days * 86400, step_s):
+        for device in ("tug-55", "tug-39"):
+            writer.record(device, t % 100, 1.0, 0.5, 1000.0, 2000.0,
+                          battery_status=80, posted_to_api=True, received_at=t + 0.25)
+    writer.stop()
+
+
+def test_roll_closed_days_archives_only_closed_days(tmp_path):
+    db_path, archive = tmp_path / "ati_data.db", tmp_path / "archive"
+    _fill(db_path)
+
+    result = roll_closed_days(db_path, archive, before=date(2024, 12, 3))
+    assert sorted(result) == [date(2024, 12, 1), date(2024, 12, 2)]
+    assert result[date(2024, 12, 1)] == 2 * 144
+    assert (archive / "tug-55" / "2024-12-01" / "ts_ms.npy").exists()
+    assert not (archive / "tug-55" / "2024-12-03").exists()
+
+    # Already archived days are skipped
+    assert roll_closed_days(db_path, archive, before=date(2024, 12, 3)) == {}
+
+
+def test_load_history_merges_archive_and_live_rows(tmp_path):
+    db_path, archive = tmp_path / "ati_data.db", tmp_path / "archive"
+    _fill(db_path)
+    roll_closed_days(db_path, archive, before=date(2024, 12, 3))
+
+    start_ms = (DAY0 + 3600) * 1000
+    data = load_history(db_path, "tug-55", start_ms, archive_dir=archive)
+
+    ts = data["ts_ms"]
+    assert ts.dtype == np.int64
+    assert ts[0] == start_ms + 250
+    assert np.all(np.diff(ts) == 600 * 1000)
+    assert len(ts) == 3 * 144 - 6
+    assert data["battery"].dtype == np.float32 and np.all(data["battery"] == 80)
+
+
+def test_day_interrupted_partway_is_redone_and_read_from_sqlite(tmp_path, monkeypatch):
+    db_path, archive = tmp_path / "ati_data.db", tmp_path / "archive"
+    _fill(db_path, days=2)
+    real_write = history_archive.write_segment
+    written = []
+
+    def write_then_die(archive_dir, device, day, columns):
+        if written:
+            raise OSError("No space left on device")
+        written.append(device)
+        return real_write(archive_dir, device, day, columns)
+
+    monkeypatch.setattr(history_archive, "write_segment", write_then_die)
+    with pytest.raises(OSError):
+        roll_closed_days(db_path, archive, before=date(2024, 12, 2))
+    assert archived_days(archive) == set()
+    for device in ("tug-55", "tug-39"):         # the one segment written is ignored, SQLite has the day
+        assert len(load_history(db_path, device, archive_dir=archive)["ts_ms"]) == 2 * 144
+
+    monkeypatch.setattr(history_archive, "write_segment", real_write)
+    assert roll_closed_days(db_path, archive, before=date(2024, 12, 2)) == {date(2024, 12, 1): 2 * 144}
+    assert archived_days(archive) == {date(2024, 12, 1)}
+    for device in ("tug-55", "tug-39"):
+        assert (archive / device / "2024-12-01" / "ts_ms.npy").exists()
+        assert len(load_history(db_path, device, archive_dir=archive)["ts_ms"]) == 2 * 144
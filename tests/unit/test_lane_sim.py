@@ -0,0 +1,87 @@
+"""Unit tests for src/publisher/lane_sim.py"""
+import math
+
+import pytest
+
+from src.common import metrics
+from src.publisher import lane_sim
+from src.publisher.lane_sim import LaneFleet, LaneMap
+
+
+@pytest.fixture(scope="module")
+def lanes():
+    return LaneMap.load(lane_sim.DEFAULT_MAP)
+
+
+def test_map_is_connected_through_junctions(lanes):
+    assert len(lanes.stations) == 23
+    first = lanes.stations[0]["node"]
+    assert all(lanes.reachable(first, st["node"]) for st in lanes.stations)
+
+
+def test_routes_are_shortest_and_cached(lanes):
+    a, b = lanes.stations[0]["node"], lanes.stations[2]["node"]
+    route = lanes.route(a, b)
+    assert route.points[0] == lanes.nodes[a] and route.points[-1] == lanes.nodes[b]
+    assert route.length >= math.dist(lanes.nodes[a], lanes.nodes[b])
+    assert lanes.route(a, b) is route
+    assert lanes.route(b, a).length == pytest.approx(route.length)
+    assert route.at(0.0)[:2] == lanes.nodes[a]
+
+
+def test_junction_split_connects_t_intersections():
+    lanes = LaneMap([((0.0, 0.0), (10.0, 0.0)), ((5.0, 0.01), (5.0, 8.0))],
+                    [{"name": "A pickup", "pose": [0.0, 0.0, 0.0]},
+                     {"name": "A drop", "pose": [5.0, 8.0, 0.0]}])
+    route = lanes.route(lanes.stations[0]["node"], lanes.stations[1]["node"])
+    assert route.length == pytest.approx(5.0 + 7.99)
+
+
+def test_trips_legs_and_payload_format(lanes):
+    fleet = LaneFleet(lanes, ["tug-01"], seed=1)
+    seen = []
+    for k in range(20000):
+        fleet.step(k * 1.0, 1.0)
+        p = fleet.payload(0, k * 1.0)
+        if p["trip_leg_id"] is not None and (not seen or seen[-1] != (p["trip_id"], p["trip_leg_id"])):
+            seen.append((p["trip_id"], p["trip_leg_id"]))
+    assert list(p) == ["sherpa_name", "mode", "error", "disabled", "disabled_reason", "pose",
+                       "battery_status", "trip_id", "trip_leg_id", "timestamp"]
+    assert len(p["pose"]) == 3 and p["timestamp"] == 19999000
+    # Two legs per trip, ids increasing
+    trips = {}
+    for trip_id, leg_id in seen:
+        trips.setdefault(trip_id, []).append(leg_id)
+    assert len(trips) > 5
+    assert all(len(legs) == 2 and legs[1] == legs[0] + 1 for legs in list(trips.values())[:-1])
+
+
+def test_low_battery_goes_charging_then_back_to_work(lanes):
+    fleet = LaneFleet(lanes, ["tug-01"], seed=3)
+    amr = fleet.amrs[0]
+    amr.battery = lane_sim.LANE_LOW_BATTERY - 1
+    modes = []
+    for k in range(20000):
+        fleet.step(k * 1.0, 1.0)
+        mode = fleet.payload(0, k)["mode"]
+        if not modes or modes[-1] != mode:
+            modes.append(mode)
+    assert modes[:3] == ["fleet", "disconnected", "fleet"]
+    assert lanes.stations[fleet.charger]["name"].lower().startswith("charging")
+
+
+def test_bridge_reads_lane_poses(lanes, monkeypatch):
+    # The bridge reads its configuration at import; keep recorders off and egress inline
+    for key, value in {"TELEMETRY_ENABLED": "false", "FLIGHT_RECORDER_ENABLED": "false",
+                       "DEBUG_RING_ENABLED": "false", "EGRESS_WORKERS": "0"}.items():
+        monkeypatch.setenv(key, value)
+    try:
+        from src.bridge import bridge
+    finally:
+        metrics.clear()
+    fleet = LaneFleet(lanes, ["tug-01"], seed=1)
+    fleet.step(10.0, 10.0)
+    payload = fleet.payload(0, 10.0)
+    x, y, heading = payload["pose"]
+    assert bridge.extract_pose(payload) == (x, y, 0.0, heading)
+    assert bridge.extract_pose({"pose": [1, 2, 3, 0, 0, 0.5]}) == (1.0, 2.0, 3.0, 0.5)
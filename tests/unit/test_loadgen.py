@@ -0,0 +1,90 @@
+"""Unit tests for src/publisher/loadgen.py (no broker needed)"""
+import json
+
+import pytest
+
+loadgen = pytest.importorskip("loadgen")
+
+
+class FakeInfo:
+    def __init__(self, rc, mid):
+        self.rc = rc
+        self.mid = mid
+
+
+class FakeClient:
+    """Acknowledges every publish immediately (before publish() returns, like a fast broker)"""
+
+    def __init__(self, refuse_after=None):
+        self.on_publish = None
+        self.on_disconnect = None
+        self.published = []
+        self.refuse_after = refuse_after
+
+    def publish(self, topic, payload, qos=0):
+        if self.refuse_after is not None and len(self.published) >= self.refuse_after:
+            return FakeInfo(loadgen.mqtt.MQTT_ERR_QUEUE_SIZE, 0)
+        self.published.append((topic, payload, qos))
+        mid = len(self.published)
+        self.on_publish(self, None, mid, None, None)
+        return FakeInfo(loadgen.mqtt.MQTT_ERR_SUCCESS, mid)
+
+
+def test_histogram_percentiles_and_merge():
+    a = loadgen.LatencyHistogram()
+    b = loadgen.LatencyHistogram()
+    for ms in range(1, 101):
+        (a if ms % 2 else b).add(ms / 1000)
+    a.merge(b.counts, b.max)
+    assert a.total() == 100
+    assert a.percentile(0.5) == pytest.approx(0.050, rel=0.13)
+    assert a.percentile(0.99) == pytest.approx(0.099, rel=0.13)
+    assert a.percentile(1.0) == a.max == 0.1
+
+
+def test_shards_cover_every_robot_once():
+    shards = loadgen.shard_indices(10, 3)
+    assert sorted(i for s in shards for i in s) == list(range(10))
+    assert shards[0] == [0, 3, 6, 9]
+
+
+def test_ack_tracker_handles_ack_before_publish_returns():
+    tracker = loadgen.AckTracker()
+    tracker.on_publish(None, None, 7)       # ack arrives first
+    tracker.sent(7, 0.0)
+    tracker.sent(8, 0.0)
+    assert tracker.take()[0] == 1
+    assert tracker.pending == {8: 0.0}
+
+
+@pytest.mark.parametrize("shape", ["mixed", "lanes"])
+def test_shard_publisher_sends_valid_payloads_and_counts(shape):
+    config = {"hz": 50.0, "prefix": "load", "shape": shape, "topic": "ati_fm/sherpa/status", "qos": 1}
+    clients = [FakeClient(), FakeClient(refuse_after=3)]
+    shard = loadgen.ShardPublisher(1, [1, 3, 5, 7], config, clients)
+    shard.sched.run(duration=0.2)
+    snap = shard.snapshot()
+
+    names = {json.loads(p)["sherpa_name"] for c in clients for _, p, _ in c.published}
+    assert names == {"load-0002", "load-0004", "load-0006", "load-0008"}
+    assert snap["sent"] == sum(len(c.published) for c in clients) == snap["acked"]
+    assert snap["refused"] > 0 and snap["inflight"] == 0
+    total = loadgen.Aggregate()
+    total.add(snap)
+    summary = total.summary(0.2)
+    assert summary["sent"] == snap["sent"] and summary["refused"] == snap["refused"]
+    assert summary["ack_p99_ms"] >= 0.0
+
+
+@pytest.mark.parametrize("shape", ["mixed", "lanes"])
+def test_shard_publisher_falls_back_to_json_dumps_on_template_mismatch(shape, monkeypatch, capsys):
+    monkeypatch.setattr(loadgen.PayloadTemplate, "matches", lambda self, payload: False)
+    monkeypatch.setattr(loadgen.PayloadTemplate, "render", lambda self, *values: b"not json")
+    config = {"hz": 50.0, "prefix": "load", "shape": shape, "topic": "ati_fm/sherpa/status", "qos": 1}
+    client = FakeClient()
+    shard = loadgen.ShardPublisher(0, [0, 1], config, [client])
+    shard.sched.run(duration=0.1)
+
+    assert "WARN Payload template mismatch for load-0001" in capsys.readouterr().out
+    assert client.published
+    assert {json.loads(p)["sherpa_name"] for _, p, _ in client.published} == {"load-0001", "load-0002"}
@@ -0,0 +1,83 @@
+"""Unit tests for scripts/transformation/log_parser.py"""
+import log_parser
+
+
+def _block(i, tug="tug-55", hosur="09"):
+    return (
+        "=" * 70 + "\n"
+        f"AMR: {tug}-tvsmotor-hosur-{hosur} -> {tug}-hosur-{hosur}\n"
+        f"Time: 2025-01-12T06:30:{i % 60:02d}.500Z\n"
+        f"ATI Raw Coordinates: X={i * 1.5:.2f}m, Y={-i:.2f}m, Heading=1.571rad\n"
+        f"Twinzo Transformed: X={200000 + i}, Y={190000 - i}\n"
+        f"Battery: 85%, Mode: fleet\n"
+        + "=" * 70 + "\n"
+    )
+
+
+def test_parses_blocks_into_columns(tmp_path):
+    log = tmp_path / "bridge.log"
+    log.write_text("starting bridge\n" + "".join(_block(i) for i in range(5)) + _block(9, "tug-39", "01"))
+
+    cols = log_parser.load_points(log, use_cache=False)
+    assert cols["devices"] == ["tug-55", "tug-39"]
+    assert len(cols["ts_ms"]) == 6
+    assert cols["ati_x"][3] == 4.5 and cols["ati_y"][3] == -3.0
+    assert cols["twinzo_x"][5] == 200009
+    assert cols["heading"][0] == 1.571 and cols["battery"][0] == 85
+
+    data = log_parser.parse_log_file(log, use_cache=False)
+    assert data["tug-55"]["twinzo"][0] == (200000.0, 190000.0)
+    assert len(data["tug-39"]["ati"]) == 1
+
+
+def test_rerun_parses_only_appended_tail(tmp_path, monkeypatch):
+    log = tmp_path / "bridge.log"
+    log.write_text("".join(_block(i) for i in range(100)))
+    assert len(log_parser.load_points(log)["ts_ms"]) == 100
+
+    starts = []
+    real_parse = log_parser.parse_stream
+    monkeypatch.setattr(log_parser, "parse_stream",
+                        lambda f, start=0: starts.append(start) or real_parse(f, start))
+
+    # Append a partial block, then complete it
+    with open(log, "a") as f:
+        f.write(_block(100)[:90])
+    assert len(log_parser.load_points(log)["ts_ms"]) == 100
+    with open(log, "a") as f:
+        f.write(_block(100)[90:] + _block(101))
+    cols = log_parser.load_points(log)
+    assert len(cols["ts_ms"]) == 102
+    assert list(cols["twinzo_x"][-3:]) == [200099, 200100, 200101]
+
+    size_before_append = len("".join(_block(i) for i in range(100)).encode())
+    assert all(s >= size_before_append - len(_block(99).encode()) for s in starts)
+
+
+def test_replaced_log_invalidates_cache(tmp_path):
+    log = tmp_path / "bridge.log"
+    log.write_text("".join(_block(i) for i in range(10)))
+    log_parser.load_points(log)
+
+    log.write_text("new run\n" + _block(1, "tug-133", "02"))
+    cols = log_parser.load_points(log)
+    assert cols["devices"] == ["tug-133"]
+    assert len(cols["ts_ms"]) == 1
+
+
+def test_structured_pose_records(tmp_path):
+    log = tmp_path / "bridge.log"
+    lines = [
+        "OK Connected to ATI audit feed",
+        '{"ts":"2025-01-12T06:30:00.500Z","level":"INFO","logger":"audit_feed","cat":"pose",'
+        '"msg":"AMR pose","sherpa":"tug-55-tvsmotor-hosur-09","device":"tug-55-hosur-09",'
+        '"ati_x":12.5,"ati_y":-3.25,"heading":1.571,"twinzo_x":112500,"twinzo_y":96750,'
+        '"battery":85,"mode":"fleet"}',
+        '{"ts":"2025-01-12T06:30:01.000Z","level":"INFO","logger":"audit_feed","cat":"stats","msg":"x"}',
+    ]
+    log.write_text("\n".join(lines) + "\n" + _block(3, "tug-39", "07"))
+
+    cols = log_parser.load_points(log)
+    assert cols["devices"] == ["tug-55", "tug-39"]
+    assert cols["ts_ms"][0] == 1736663400500
+    assert (cols["ati_x"][0], cols["twinzo_y"][0], cols["battery"][0]) == (12.5, 96750, 85)
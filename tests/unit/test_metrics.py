@@ -0,0 +1,125 @@
+"""Unit tests for src/common/metrics.py"""
+import socket
+import threading
+import time
+import urllib.request
+
+import pytest
+
+from src.common import admin_http, metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    metrics.clear()
+    yield
+    metrics.clear()
+
+
+def samples(text):
+    """{'name{labels}': value} for every non-comment line"""
+    out = {}
+    for line in text.splitlines():
+        if line and not line.startswith("#"):
+            key, _, value = line.rpartition(" ")
+            out[key] = float(value)
+    return out
+
+
+def test_counter_and_labels_render():
+    received = metrics.counter("bridge_messages_received_total", "MQTT messages received")
+    failed = metrics.counter("bridge_posts_failed_total", "Failed POSTs", ("status",))
+    received.inc()
+    received.inc(2)
+    failed.labels(429).inc()
+    failed.labels("429").inc()
+    failed.labels('we"ird').inc()
+
+    text = metrics.render()
+    assert "# TYPE bridge_messages_received_total counter" in text
+    s = samples(text)
+    assert s["bridge_messages_received_total"] == 3
+    assert s['bridge_posts_failed_total{status="429"}'] == 2
+    assert s['bridge_posts_failed_total{status="we\\"ird"}'] == 1
+    # Registering the same name again returns the existing metric
+    assert metrics.counter("bridge_messages_received_total", "again") is received
+
+
+def test_histogram_buckets_are_cumulative_and_inclusive():
+    h = metrics.histogram("bridge_post_seconds", "POST latency", buckets=(0.01, 0.1, 1.0))
+    for v in (0.005, 0.01, 0.05, 0.5, 3.0):
+        h.observe(v)
+    s = samples(metrics.render())
+    assert s['bridge_post_seconds_bucket{le="0.01"}'] == 2     # le is inclusive
+    assert s['bridge_post_seconds_bucket{le="0.1"}'] == 3
+    assert s['bridge_post_seconds_bucket{le="1"}'] == 4
+    assert s['bridge_post_seconds_bucket{le="+Inf"}'] == 5
+    assert s["bridge_post_seconds_count"] == 5
+    assert s["bridge_post_seconds_sum"] == pytest.approx(3.565)
+
+    with h.time():
+        pass
+    assert h.counts[0] == 3
+
+
+def test_bridge_metrics_callbacks():
+    stats = metrics.BridgeMetrics()
+    stats.received.inc()
+    stats.filter("unmapped")
+    stats.filter("unmapped")
+    stats.fail("500")
+    stats.last_seen["tug-55"] = time.time() - 2.0
+    stats.queue("telemetry", lambda: 7)
+    stats.queue("broken", lambda: 1 / 0)
+
+    text = metrics.render()
+    s = samples(text)
+    assert s['bridge_messages_filtered_total{reason="unmapped"}'] == 2
+    assert s['bridge_posts_failed_total{status="500"}'] == 1
+    assert 1.9 < s['bridge_device_last_seen_age_seconds{device="tug-55"}'] < 5
+    # A failing callback drops its family's samples, not the whole scrape
+    assert "bridge_queue_depth callback failed" in text
+    assert s["bridge_messages_received_total"] == 1
+
+
+def test_metrics_served_on_admin_http():
+    metrics.counter("bridge_messages_received_total", "MQTT messages received").inc()
+    metrics.install()
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = admin_http.start(port=port, host="127.0.0.1")
+    try:
+        port = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as r:
+            assert r.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert "bridge_messages_received_total 1" in r.read().decode()
+    finally:
+        admin_http.stop()
+
+
+
+def test_threads_update_their_own_cells_and_callbacks_are_unique():
+    posted = metrics.counter("bridge_posts_ok_total", "POSTs accepted")
+    latency = metrics.histogram("bridge_post_seconds", "POST latency", buckets=(0.01, 0.1))
+    start = threading.Barrier(8)
+
+    def worker():
+        start.wait()
+        for _ in range(20000):
+            posted.inc()
+            latency.observe(0.05)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    s = samples(metrics.render())
+    assert s["bridge_posts_ok_total"] == 8 * 20000
+    assert s['bridge_post_seconds_bucket{le="0.1"}'] == 8 * 20000
+    assert s["bridge_post_seconds_sum"] == pytest.approx(8 * 20000 * 0.05)
+
+    metrics.gauge_callback("bridge_devices", "Devices by state", ("state",), lambda: {("online",): 1})
+    with pytest.raises(ValueError):
+        metrics.gauge_callback("bridge_devices", "Devices by state", ("state",), lambda: {})
@@ -0,0 +1,98 @@
+"""Unit tests for tests/mocks/twinzo_mock.py"""
+import random
+import time
+
+import pytest
+import requests
+
+from tests.mocks.twinzo_mock import MockTwinzo, parse_latency, LOC_PATH, BATCH_PATH
+
+LOGIN = "tug-55-tvsmotor-hosur-09"
+SAMPLE = {"Timestamp": 1700000000000, "SectorId": 2, "X": 100.0, "Y": 200.0, "Z": 0,
+          "Interval": 100, "Battery": 80, "IsMoving": True, "LocalizationAreas": [], "NoGoAreas": []}
+
+
+@pytest.fixture
+def start_mock():
+    mocks = []
+
+    def _start(**kwargs):
+        mock = MockTwinzo(seed=1, **kwargs).start()
+        mocks.append(mock)
+        return mock
+    yield _start
+    for mock in mocks:
+        mock.stop()
+
+
+def authenticate(mock, login=LOGIN):
+    r = requests.post(f"{mock.url}/authorization/authenticate",
+                      json={"client": "TVSMotor", "login": login, "password": "pw"}, timeout=5)
+    assert r.status_code == 200
+    return r.json()
+
+
+def post_location(mock, creds, items=(SAMPLE,)):
+    headers = {"Token": creds["Token"], "Client": creds["Client"], "Branch": creds["Branch"], "Api-Key": "k"}
+    return requests.post(f"{mock.url}/localization", headers=headers, json=list(items), timeout=5)
+
+
+def test_auth_and_localization_records_samples(start_mock):
+    mock = start_mock()
+    creds = authenticate(mock)
+    assert creds["Expiration"] > time.time() * 1000 + 3500 * 1000   # epoch ms, like the real API
+
+    r = post_location(mock, creds)
+    assert r.status_code == 200
+    assert mock.samples_for(LOGIN) == [SAMPLE]
+    assert mock.count(LOC_PATH, 200) == 1
+
+    headers = {"Token": creds["Token"], "Client": creds["Client"], "Branch": creds["Branch"], "Api-Key": "k"}
+    r = requests.post(f"{mock.url}/localization/batch", headers=headers,
+                      json=[{"Login": "tug-2", "Locations": [SAMPLE, SAMPLE]}], timeout=5)
+    assert r.json()["Accepted"] == 2
+    assert len(mock.samples_for("tug-2")) == 2
+    assert mock.count(BATCH_PATH) == 1
+
+    mock.reset()
+    assert mock.samples_for(LOGIN) == []
+
+
+def test_invalid_and_expired_tokens_get_401(start_mock):
+    mock = start_mock(token_ttl_s=0.05)
+    assert post_location(mock, {"Token": "nope", "Client": "", "Branch": ""}).status_code == 401
+    creds = authenticate(mock)
+    time.sleep(0.1)
+    assert post_location(mock, creds).status_code == 401
+
+
+def test_rate_limit_returns_429_with_retry_after(start_mock):
+    mock = start_mock(rate_limit=2)
+    creds = authenticate(mock)
+    statuses = [post_location(mock, creds) for _ in range(4)]
+    assert [r.status_code for r in statuses[:2]] == [200, 200]
+    limited = [r for r in statuses if r.status_code == 429]
+    assert limited and int(limited[0].headers["Retry-After"]) >= 1
+    # Another device has its own bucket
+    assert post_location(mock, authenticate(mock, "tug-other")).status_code == 200
+
+
+def test_error_and_reset_injection(start_mock):
+    mock = start_mock(error_rate=1.0)
+    r = requests.post(f"{mock.url}/authorization/authenticate", json={}, timeout=5)
+    assert r.status_code == 500
+
+    mock = start_mock(reset_rate=1.0)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        requests.post(f"{mock.url}/authorization/authenticate", json={}, timeout=5)
+    assert mock.count("/v3/authorization/authenticate", "reset") >= 1
+
+
+def test_parse_latency():
+    rng = random.Random(0)
+    assert parse_latency("none")(rng) == 0.0
+    assert parse_latency("fixed:20")(rng) == pytest.approx(0.02)
+    assert all(0.005 <= parse_latency("uniform:5,50")(rng) <= 0.05 for _ in range(50))
+    assert parse_latency("lognormal:20,0.5")(rng) > 0
+    with pytest.raises(ValueError):
+        parse_latency("gamma:1")
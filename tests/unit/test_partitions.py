@@ -0,0 +1,73 @@
+"""Unit tests for src/common/partitions.py"""
+import sqlite3
+from datetime import date, datetime, timezone
+
+from src.common import partitions
+from src.common.telemetry import open_db, TelemetryWriter
+
+
+def _ts(day):
+    return datetime(day.year, day.month, day.day, 12, tzinfo=timezone.utc).timestamp()
+
+
+def test_writer_routes_rows_to_day_partitions_behind_view(tmp_path):
+    db_path = tmp_path / "ati_data.db"
+    days = [date(2024, 11, 28), date(2024, 11, 29), date(2024, 11, 30)]
+    writer = TelemetryWriter(db_path=db_path, batch_size=50, flush_ms=10).start()
+    for i, day in enumerate(days):
+        for _ in range(i + 1):
+            writer.record("tug-55", 1.0, 2.0, 0.0, 10.0, 20.0, received_at=_ts(day))
+    writer.stop()
+
+    conn = sqlite3.connect(str(db_path))
+    tables = partitions.list_partitions(conn)
+    for day in days:
+        assert partitions.partition_name(day) in tables
+    assert partitions.row_count(conn, "ati_messages_20241130") == 3
+    assert conn.execute("SELECT COUNT(*) FROM ati_messages").fetchone()[0] == 6
+
+
+def test_legacy_table_is_kept_in_view_then_dropped(tmp_path):
+    db_path = tmp_path / "ati_data.db"
+    conn = sqlite3.connect(str(db_path))
+    conn.execute("CREATE TABLE ati_messages (id INTEGER PRIMARY KEY, timestamp TEXT, "
+                 "device_name TEXT, ati_x REAL, ati_y REAL, ati_heading REAL, twinzo_x REAL, "
+                 "twinzo_y REAL, twinzo_heading REAL, battery_status INTEGER, mode TEXT, "
+                 "posted_to_api BOOLEAN, api_response TEXT, error TEXT)")
+    conn.execute("INSERT INTO ati_messages (timestamp, device_name, ati_x, ati_y, twinzo_x, twinzo_y) "
+                 "VALUES ('2024-10-01 08:00:00', 'tug-39', 0, 0, 0, 0)")
+    conn.commit()
+    conn.close()
+
+    conn = open_db(db_path)
+    assert partitions.LEGACY_TABLE in partitions.list_partitions(conn)
+    assert conn.execute("SELECT COUNT(*) FROM ati_messages").fetchone()[0] == 1
+
+    dropped, rows = partitions.drop_expired(conn, 30, today=date(2024, 12, 1))
+    assert dropped == [partitions.LEGACY_TABLE]
+    assert rows == 1
+    assert conn.execute("SELECT COUNT(*) FROM ati_messages").fetchone()[0] == 0
+
+
+def test_drop_expired_keeps_window_and_vacuum_frees_pages(tmp_path):
+    db_path = tmp_path / "ati_data.db"
+    conn = open_db(db_path)
+    old, new = date(2024, 10, 1), date(2024, 11, 30)
+    partitions.ensure_partitions(conn, [old, new])
+    with conn:
+        for day in (old, new):
+            conn.executemany(
+                f"INSERT INTO {partitions.partition_name(day)} "
+                "(timestamp, device_name, ati_x, ati_y, twinzo_x, twinzo_y, api_response) "
+                "VALUES (?, 'tug-55', 0, 0, 0, 0, ?)",
+                [(f"{day} 12:00:00", "x" * 200)] * 2000)
+
+    dropped, rows = partitions.drop_expired(conn, 30, today=date(2024, 12, 1))
+    assert dropped == [partitions.partition_name(old)]
+    assert rows == 2000
+    assert conn.execute("SELECT COUNT(*) FROM ati_messages").fetchone()[0] == 2000
+
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] > 0
+    freed = partitions.incremental_vacuum(conn, pages_per_step=16, pause_ms=0)
+    assert freed > 0
+    assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
@@ -0,0 +1,50 @@
+"""Unit tests for src/publisher/payload_template.py"""
+import json
+import random
+
+from src.publisher.lane_sim import LaneFleet, LaneMap
+from src.publisher import lane_sim
+from src.publisher.payload_template import PayloadTemplate, encode_value
+
+
+def _payload(x, y, theta, battery):
+    return {"sherpa_name": "tugger-01", "mode": "Fleet", "error": "", "disabled": False,
+            "disabled_reason": "", "pose": [x, y, 0.0, 0.0, 0.0, theta],
+            "battery_status": battery, "trip_id": 1000, "trip_leg_id": 5000}
+
+
+def test_render_is_byte_identical_to_json_dumps():
+    rng = random.Random(7)
+    tpl = PayloadTemplate(_payload(1.0, 2.0, 0.5, 79.0),
+                          [("pose", 0), ("pose", 1), ("pose", 5), ("battery_status",)])
+    specials = [0.0, -0.0, 1e16, 1e-7, 123456789.123456789, 5e-324, float("nan"), float("inf"), 3, -42]
+    values = [rng.uniform(-1e6, 1e6) for _ in range(2000)] + specials
+    for v in values:
+        payload = _payload(v, -v, abs(v) if v == v else v, round(rng.uniform(0, 100), 2))
+        assert tpl.render(*tpl.values(payload)) == json.dumps(payload).encode()
+
+
+def test_encode_value_matches_json_for_slot_types():
+    for v in (None, True, False, "fleet", "disconnected", 0, 10 ** 20, 0.1, -1.5e-10, float("-inf")):
+        assert encode_value(v) == json.dumps(v)
+
+
+def test_percent_signs_and_unicode_in_static_text():
+    sample = {"sherpa_name": "tug-%d-ü", "error": "50% \"done\"", "pose": [1.0, 2.0]}
+    tpl = PayloadTemplate(sample, [("pose", 0), ("pose", 1)])
+    assert tpl.matches(sample)
+    sample["pose"] = [3.25, -4.5]
+    assert tpl.matches(sample)
+
+
+def test_lane_fleet_slots_cover_every_changing_field():
+    fleet = LaneFleet(LaneMap.load(lane_sim.DEFAULT_MAP), ["tug-01", "tug-02"], seed=5)
+    tpl = PayloadTemplate(fleet.payload(0, 0.0), LaneFleet.SLOTS)
+    fleet.amrs[1].battery = lane_sim.LANE_LOW_BATTERY - 1  # include charging/disconnected
+    for k in range(6000):
+        fleet.step(k * 1.0, 1.0)
+        if k % 50 == 0:
+            payload = fleet.payload(0, k * 1.0)
+            assert tpl.render(*fleet.slot_values(0, k * 1.0)) == json.dumps(payload).encode()
+    tpl2 = PayloadTemplate(fleet.payload(1, 0.0), LaneFleet.SLOTS)
+    assert tpl2.matches(fleet.payload(1, 1.0))
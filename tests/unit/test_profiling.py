@@ -0,0 +1,88 @@
+"""Unit tests for src/common/profiling.py"""
+import threading
+import time
+
+from src.common import profiling
+
+
+def lookup(device):
+    return device.upper()
+
+
+class Client:
+    def post(self, url):
+        return url
+
+
+def test_stage_timers_patch_only_while_enabled():
+    namespace = {"lookup": lookup}
+    client = Client()
+    stages = profiling.StageTimers()
+    stages.add("credentials", namespace, "lookup").add("post", client, "post").add("off", None, "record")
+
+    stages.enable()
+    assert namespace["lookup"] is not lookup
+    assert namespace["lookup"]("tug-55") == "TUG-55"
+    assert client.post("/v3/localization") == "/v3/localization"
+    stages.observe("callback", 0.002)
+    report = stages.report()
+    assert report["enabled"]
+    assert report["stages"]["credentials"]["count"] == 1
+    assert report["stages"]["callback"]["max_ms"] == 2.0
+
+    stages.disable()
+    assert namespace["lookup"] is lookup
+    assert "post" not in vars(client)           # class method no longer shadowed
+    status, _, body = stages._http({"reset": "1"})
+    assert status == 200 and '"count": 0' in body
+
+
+def slow_handler(release):
+    release.wait(5)
+
+
+def test_watchdog_reports_stack_of_slow_callback():
+    lines = []
+    watchdog = profiling.Watchdog(threshold_ms=20, cooldown_s=0, log=lines.append)
+    release = threading.Event()
+    worker = threading.Thread(target=watchdog.wrap(slow_handler), args=(release,))
+    worker.start()
+    try:
+        time.sleep(0.05)
+        stack = watchdog.check()
+        assert stack and "slow_handler" in stack
+        assert watchdog.check() is None          # reported once per callback
+    finally:
+        release.set()
+        worker.join()
+    assert watchdog.slow == 1
+    assert lines[0].startswith("WARN Slow MQTT callback")
+    assert watchdog.check() is None              # nothing running
+
+
+def busy_loop(stop):
+    while not stop.is_set():
+        sum(range(200))
+
+
+def test_sampling_profiler_writes_collapsed_stacks(tmp_path):
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,), name="busy")
+    worker.start()
+    profiler = profiling.SamplingProfiler(directory=tmp_path, hz=200)
+    try:
+        path = profiler.start(seconds=0.3)
+        assert path is not None
+        assert profiler.start(seconds=0.3) is None     # one profile at a time
+        deadline = time.time() + 5
+        while profiler.running and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        stop.set()
+        worker.join()
+    lines = path.read_text().splitlines()
+    busy = [line for line in lines if line.startswith("busy;")]
+    assert busy and all("test_profiling.py:busy_loop" in line for line in busy)
+    stack, _, count = busy[0].rpartition(" ")
+    assert int(count) > 0
+    assert profiler.last["samples"] >= sum(int(line.rpartition(" ")[2]) for line in busy)
@@ -0,0 +1,56 @@
+"""Unit tests for src/common/rollups.py"""
+import sqlite3
+
+from src.common import rollups
+from src.common.telemetry import TelemetryWriter
+
+NOW = 1733054400  # 2024-12-01 12:00:00 UTC
+
+
+def _write(db_path, rows):
+    writer = TelemetryWriter(db_path=db_path, batch_size=7, flush_ms=10).start()
+    for device, t, x, battery, posted, error in rows:
+        writer.record(device, 0, 0, 0, x, 0, battery_status=battery, posted_to_api=posted,
+                      error=error, received_at=t)
+    writer.stop()
+    return sqlite3.connect(str(db_path))
+
+
+def test_rollups_track_counts_battery_distance_and_movement(tmp_path):
+    # tug-55 moves 100 units every 30 s for 3 hours, tug-39 stands still
+    rows = []
+    for i in range(360):
+        t = NOW - 3 * 3600 + i * 30
+        rows.append(("tug-55", t, i * 100.0, 90 - i // 60, i % 10 != 0, None if i % 20 else "HTTP 500"))
+        rows.append(("tug-39", t, 5000.0, None, True, None))
+    conn = _write(tmp_path / "ati_data.db", rows)
+
+    stats = {r["device_name"]: r for r in rollups.device_stats(conn, hours=24, now=NOW)}
+    tug55 = stats["tug-55"]
+    assert tug55["total_messages"] == 360
+    assert tug55["posted_count"] == 324
+    assert tug55["error_count"] == 18
+    assert (tug55["min_battery"], tug55["max_battery"]) == (85, 90)
+    assert tug55["distance"] == 359 * 100.0
+    assert abs(tug55["moving_fraction"] - 359 / 360) < 1e-9
+    assert stats["tug-39"]["avg_battery"] is None
+    assert stats["tug-39"]["moving_fraction"] == 0
+
+    fleet = rollups.fleet_stats(conn, hours=24, now=NOW)
+    assert fleet["total_messages"] == 720
+
+
+def test_window_combines_minute_and_hour_buckets(tmp_path):
+    # One message per minute for 3 hours; a 90 minute window must count exactly 90
+    rows = [("tug-55", NOW - 3 * 3600 + i * 60, 0.0, 80, True, None) for i in range(180)]
+    conn = _write(tmp_path / "ati_data.db", rows)
+    assert rollups.fleet_stats(conn, hours=1.5, now=NOW)["total_messages"] == 90
+
+
+def test_rebuild_matches_incremental_rollups(tmp_path):
+    rows = [("tug-55", NOW - 7200 + i * 13, float(i * i), 70, True, None) for i in range(400)]
+    conn = _write(tmp_path / "ati_data.db", rows)
+    before = rollups.device_stats(conn, hours=24, now=NOW)
+    rollups.rebuild(conn)
+    after = rollups.device_stats(conn, hours=24, now=NOW)
+    assert before == after
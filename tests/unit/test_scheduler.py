@@ -0,0 +1,66 @@
+"""Unit tests for src/publisher/scheduler.py"""
+import time
+
+from src.publisher.scheduler import Scheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_deadlines_do_not_drift_with_slow_callbacks():
+    clock = FakeClock()
+    sched = Scheduler(clock=clock, sleep=clock.sleep)
+    fired = []
+
+    def work(due):
+        fired.append(due)
+        clock.now += 0.03  # each callback takes 30% of the period
+
+    sched.add("tug-1", 10, work)
+    sched.run(duration=10.0)
+    assert len(fired) == 100
+    assert abs(fired[-1] - fired[0] - 9.9) < 1e-9
+    stats = sched.report()["tug-1"]
+    assert stats["missed"] == 0 and abs(stats["hz_achieved"] - 10) < 1e-6
+
+
+def test_many_tasks_interleave_and_overruns_skip_ticks():
+    clock = FakeClock()
+    sched = Scheduler(clock=clock, sleep=clock.sleep)
+    counts = {}
+    for i in range(50):
+        sched.add(f"tug-{i}", 5, lambda due, i=i: counts.__setitem__(i, counts.get(i, 0) + 1),
+                  offset=0.2 * i / 50)
+
+    def stall(due):
+        clock.now += 0.55  # blocks everything for almost three periods
+    sched.add("slow", 1, stall, offset=0.5)
+    sched.run(duration=2.0)
+
+    assert len(counts) == 50
+    report = sched.report()
+    assert report["slow"]["count"] == 2
+    assert report["tug-0"]["missed"] > 0  # skipped, not bursted
+    assert report["tug-0"]["count"] + report["tug-0"]["missed"] >= 10
+    assert report["tug-0"]["late_ms_max"] > 0
+
+
+def test_every_is_excluded_from_report_and_stop_ends_run():
+    sched = Scheduler()
+    ticks = []
+    sched.add("tug-1", 200, ticks.append)
+    sched.every(0.05, lambda due: sched.stop())
+    start = time.monotonic()
+    sched.run()
+    assert time.monotonic() - start < 1.0
+    assert list(sched.report()) == ["tug-1"]
+    assert len(ticks) >= 5
+    assert "1 robots" in sched.format_report(per_task=True)
@@ -0,0 +1,72 @@
+"""Unit tests for src/common/sector_router.py"""
+import json
+import random
+
+import pytest
+
+from src.common import metrics
+from src.common.sector_router import Polygon, SectorRouter
+
+# Two plants side by side; sector 2 is L-shaped
+CONFIG = {
+    "hysteresis": 1000,
+    "cell_size": 2500,
+    "devices": {"tug-133": 2},
+    "sectors": [
+        {"id": 1, "polygon": [[0, 0], [10000, 0], [10000, 10000], [0, 10000]]},
+        {"id": 2, "polygon": [[10000, 0], [20000, 0], [20000, 4000], [14000, 4000], [14000, 10000], [10000, 10000]]},
+    ],
+}
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    metrics.clear()
+    yield
+    metrics.clear()
+
+
+def test_grid_index_agrees_with_point_in_polygon():
+    router = SectorRouter([1, 2], config=CONFIG)
+    polygons = [p for shapes in router.polygons.values() for p in shapes]
+    rng = random.Random(7)
+    for _ in range(5000):
+        x, y = rng.uniform(-2000, 22000), rng.uniform(-2000, 12000)
+        expected = next((p.sector for p in polygons if p.contains(x, y)), None)
+        assert router._locate(f"probe-{x}", x, y) == expected
+    # Interior cells are marked as fully covered: no point-in-polygon needed there
+    assert any(covers for entries in router.index.cells.values() for _, covers in entries)
+
+
+def test_routes_to_one_sector_with_hysteresis():
+    router = SectorRouter([1, 2], config=CONFIG)
+    assert router.route("tug-55", 5000, 5000) == (1,)
+    assert router.route("tug-55", 10500, 5000) == (1,)     # just over the line: stays
+    assert router.route("tug-55", 9800, 5000) == (1,)
+    assert router.route("tug-55", 11500, 5000) == (2,)     # clearly inside sector 2
+    assert router.route("tug-55", 9500, 5000) == (2,)      # back within the band: stays in 2
+    assert router.route("tug-55", 8000, 5000) == (1,)
+    assert router.route("tug-55", 17000, 8000) == (1,)     # in the L's notch: outside both, keep last
+    assert router.route("new-robot", 17000, 8000) == ()    # no history: dropped
+    assert router.route("tug-133", 100, 100) == (2,)       # registry wins
+    assert router.sectors_for("tug-55") == (1,)
+    text = metrics.render()
+    assert "bridge_sector_switches_total 2" in text
+    assert 'bridge_sector_routed_total{sector="2"}' in text
+
+
+def test_missing_file_broadcasts_and_sector_ids_restrict(tmp_path):
+    router = SectorRouter([1, 2], path=tmp_path / "missing.json")
+    assert not router.enabled
+    assert router.route("tug-55", 5000, 5000) == (1, 2)
+
+    path = tmp_path / "geofences.json"
+    path.write_text(json.dumps(dict(CONFIG, fallback="broadcast")))
+    only_hitech = SectorRouter([1], path=path)
+    assert only_hitech.route("tug-55", 15000, 2000) == (1,)   # sector 2 excluded: broadcast fallback
+    assert only_hitech.route("tug-133", 0, 0) == (1,)         # registry entry for sector 2 ignored
+
+    with pytest.raises(ValueError):
+        SectorRouter([1], config=dict(CONFIG, fallback="nearest"))
+    with pytest.raises(ValueError):
+        Polygon(1, [[0, 0], [1, 1]])
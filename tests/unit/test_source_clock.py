@@ -0,0 +1,73 @@
+"""Unit tests for src/common/source_clock.py"""
+from datetime import datetime, timezone
+
+import pytest
+
+from src.common import metrics
+from src.common.source_clock import SourceClock, parse_offset, parse_timestamp
+
+IST = parse_offset("+05:30")
+
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    metrics.clear()
+    yield
+    metrics.clear()
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc).timestamp()
+
+
+def test_parse_timestamp_corrects_mislabelled_ist():
+    assert parse_offset("-0800") == -8 * 3600
+    assert parse_offset("0") == 0
+    with pytest.raises(ValueError):
+        parse_offset("IST")
+    # ATI: 'Z' but really IST wall time
+    assert parse_timestamp("2025-12-01T13:21:52Z", IST) == utc(2025, 12, 1, 7, 51, 52)
+    assert parse_timestamp("2025-12-01T13:21:52.250", IST) == utc(2025, 12, 1, 7, 51, 52, 250000)
+    # Explicit offsets and epoch numbers are trusted as they are
+    assert parse_timestamp("2025-12-01T13:21:52+01:00", IST) == utc(2025, 12, 1, 12, 21, 52)
+    assert parse_timestamp(1705172345000) == 1705172345.0
+    assert parse_timestamp(1705172345.5) == 1705172345.5
+    for bad in (None, True, "yesterday", {"t": 1}):
+        assert parse_timestamp(bad, IST) is None
+
+
+def test_staleness_histograms_and_skew():
+    clock = SourceClock(default_offset="0", window_s=60, as_timestamp=False)
+    base = 1_800_000_000.0
+    # Source clock 2 s behind; network delay 0.1 .. 0.5 s
+    for i, delay in enumerate((0.5, 0.1, 0.3)):
+        received = base + i
+        source_ts = clock.ingest("tug-55", {"timestamp": (received - 2.0 - delay) * 1000}, received)
+        clock.posted("tug-55", source_ts, posted_at=received + 0.05)
+    assert clock.skew("tug-55") == pytest.approx(2.1)
+    assert clock.ingest("tug-55", {}, base) is None
+
+    child = clock.ingest_seconds.labels("tug-55")
+    assert sum(child.counts) == 3
+    assert child.sum == pytest.approx(2.5 + 2.1 + 2.3)
+    assert clock.post_seconds.labels("tug-55").sum == pytest.approx(2.55 + 2.15 + 2.35)
+    text = metrics.render()
+    assert 'bridge_source_clock_skew_seconds{device="tug-55"} 2.1' in text
+    assert "bridge_source_timestamp_invalid_total 1" in text
+
+    # Two windows later the old minimum has aged out
+    clock.ingest("tug-55", {"timestamp": base + 100}, base + 103)
+    clock.ingest("tug-55", {"timestamp": base + 200}, base + 203)
+    assert clock.skew("tug-55") == pytest.approx(3.0)
+
+
+def test_timestamp_uses_corrected_source_time_when_enabled():
+    received = 1_800_000_000.0
+    off = SourceClock(as_timestamp=False)
+    assert off.timestamp_ms(received - 1, received) == int(received * 1000)
+    metrics.clear()                          # one clock per registry: its skew gauge is a callback
+    on = SourceClock(as_timestamp=True, max_skew_s=300)
+    assert on.timestamp_ms(received - 1.5, received) == int((received - 1.5) * 1000)
+    assert on.timestamp_ms(received + 2, received) == int(received * 1000)      # never in the future
+    assert on.timestamp_ms(received - 19800, received) == int(received * 1000)  # implausible: receive time
+    assert on.timestamp_ms(None, received) == int(received * 1000)
@@ -0,0 +1,54 @@
+"""Unit tests for src/common/telemetry.py"""
+import sqlite3
+
+from src.common.telemetry import NO_OUTCOME, TelemetryWriter, format_timestamp
+
+
+def test_rows_are_written_in_batches(tmp_path):
+    db_path = tmp_path / "ati_data.db"
+    writer = TelemetryWriter(db_path=db_path, batch_size=100, flush_ms=50).start()
+    for i in range(250):
+        assert writer.record("tug-55", i, i, 0.0, i * 1000, i * 1000, battery_status=80,
+                             mode="fleet", posted_to_api=True, received_at=1700000000 + i)
+    writer.stop()
+
+    conn = sqlite3.connect(str(db_path))
+    assert conn.execute("SELECT COUNT(*) FROM ati_messages").fetchone()[0] == 250
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    first = conn.execute("SELECT timestamp FROM ati_messages ORDER BY id LIMIT 1").fetchone()[0]
+    assert first == "2023-11-14 22:13:20.000"
+    assert writer.stats["written"] == 250
+    assert writer.stats["batches"] >= 3
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path):
+    writer = TelemetryWriter(db_path=tmp_path / "ati_data.db", queue_size=2)
+    assert writer.record("tug-55", 0, 0, 0, 0, 0)
+    assert writer.record("tug-55", 0, 0, 0, 0, 0)
+    assert not writer.record("tug-55", 0, 0, 0, 0, 0)
+    assert writer.stats["dropped"] == 1
+
+
+def test_pending_rows_wait_for_earlier_outcomes(tmp_path):
+    db_path = tmp_path / "ati_data.db"
+    writer = TelemetryWriter(db_path=db_path, flush_ms=20).start()
+    first = writer.record("tug-55", 1, 1, 0, 1, 1, received_at=1700000001, pending=True)
+    second = writer.record("tug-55", 2, 2, 0, 2, 2, received_at=1700000002, pending=True)
+    third = writer.record("tug-55", 3, 3, 0, 3, 3, received_at=1700000003, pending=True)
+    writer.record("tug-39", 9, 9, 0, 9, 9, posted_to_api=True, received_at=1700000004)
+    writer.complete(second, False, None, "dropped: superseded")
+    assert list(writer._pending) == ["tug-55"]        # held back behind the first row
+    writer.complete(first, True, "HTTP 200")
+    writer.complete(first, False, None, "late")        # ignored, already complete
+    writer.stop()
+
+    conn = sqlite3.connect(str(db_path))
+    rows = conn.execute("SELECT device_name, ati_x, posted_to_api, api_response, error "
+                        "FROM ati_messages ORDER BY id").fetchall()
+    assert rows == [("tug-39", 9, 1, None, None), ("tug-55", 1, 1, "HTTP 200", None),
+                    ("tug-55", 2, 0, None, "dropped: superseded"), ("tug-55", 3, 0, None, NO_OUTCOME)]
+    assert third.done and not writer._pending
+
+
+def test_format_timestamp_matches_sqlite_datetime():
+    assert format_timestamp(0.5) == "1970-01-01 00:00:00.500"
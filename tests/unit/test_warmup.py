@@ -0,0 +1,84 @@
+"""Unit tests for src/common/warmup.py"""
+import json
+import threading
+import time
+
+import pytest
+import requests
+
+from src.common.warmup import Warmup
+from tests.mocks.twinzo_mock import MockTwinzo
+
+
+@pytest.fixture
+def mock():
+    mock = MockTwinzo(seed=1, latency="fixed:50").start()
+    yield mock
+    mock.stop()
+
+
+def make_authenticate(session, mock, tokens):
+    def authenticate(login):
+        r = session.post(f"{mock.url}/authorization/authenticate",
+                         json={"client": "TVSMotor", "login": login, "password": "pw"}, timeout=5)
+        if r.status_code != 200:
+            return None
+        tokens[login] = r.json()
+        return tokens[login]
+    return authenticate
+
+
+def test_parallel_logins_warm_the_pool_for_posts(mock):
+    session = requests.Session()
+    tokens = {}
+    devices = [f"tug-{i}" for i in range(8)]
+    warmup = Warmup(session, make_authenticate(session, mock, tokens), devices, mock.url,
+                    concurrency=4, connections=2, timeout_s=10, enabled=True)
+    started = time.monotonic()
+    warmup.run()
+    assert time.monotonic() - started < 8 * 0.05       # 4 at a time, not one by one
+    assert sorted(tokens) == devices and warmup.ready.is_set()
+
+    pools = session.get_adapter(mock.url).poolmanager.pools
+    [pool] = [pools[key] for key in pools.keys()]
+    assert pool.num_connections == 4
+    creds = tokens["tug-0"]
+    headers = {"Token": creds["Token"], "Client": creds["Client"], "Branch": creds["Branch"], "Api-Key": "k"}
+    for _ in range(3):
+        r = session.post(f"{mock.url}/localization", headers=headers, json=[{"X": 1, "Y": 2}], timeout=5)
+        assert r.status_code == 200
+    assert pool.num_connections == 4                  # the posts reused warmed connections
+
+
+def test_ready_probe_and_extra_connections(mock):
+    session = requests.Session()
+    warmup = Warmup(session, lambda login: None, ["tug-unknown"], mock.url,
+                    connections=3, timeout_s=10, enabled=True)
+    status, _, body = warmup._http({})
+    assert status == 503 and json.loads(body)["ready"] is False
+    warmup.run()
+    status, _, body = warmup._http({})
+    detail = json.loads(body)
+    assert status == 200
+    assert detail["failed"] == ["tug-unknown"] and detail["authenticated"] == 0
+    assert detail["connections_opened"] == 2          # 3 connections: one login + two HEADs
+
+    disabled = Warmup(session, lambda login: pytest.fail("no logins when disabled"), ["tug-55"], mock.url,
+                      enabled=False).run()
+    assert disabled.ready.is_set()
+
+
+def test_slow_warmup_times_out_and_goes_ready():
+    release = threading.Event()
+
+    def stuck(login):
+        release.wait(5)
+        return None
+
+    warmup = Warmup(None, stuck, ["tug-55", "tug-39"], "http://127.0.0.1:9", connections=0,
+                    timeout_s=0.1, enabled=True)
+    started = time.monotonic()
+    warmup.run()
+    release.set()
+    assert time.monotonic() - started < 2
+    assert warmup.ready.is_set() and warmup.status()["timed_out"]